@@ -0,0 +1,298 @@
+"""
+Ticket Analytics for AutoAssistGroup Support System
+
+Dashboard statistics, warranty analytics and attachment analytics are each
+computed by a single $facet aggregation, so every breakdown comes back from
+one pass over the tickets collection in one round trip instead of a
+count_documents call plus one $group pipeline per breakdown.
+
+The live dashboard KPIs (aged buckets, average resolution time, claim
+outcomes) are computed the same way, so the dashboard routes no longer pull
+every ticket into Python to count them.
+
+Used by MongoDB (database.py) and by the dashboard routes in app.py.
+
+Author: AutoAssistGroup Development Team
+"""
+
+from datetime import datetime
+
+# Values the dashboards show for tickets that lack the field
+DEFAULT_STATUS = 'Unknown'
+DEFAULT_PRIORITY = 'Medium'
+DEFAULT_CLASSIFICATION = 'General'
+
+# Tickets with a warranty form attached are shown as warranty claims whatever their stored classification
+DISPLAY_CLASSIFICATION = {
+    "$cond": [
+        {"$or": [{"$eq": ["$has_warranty_attachment", True]}, {"$eq": ["$has_warranty", True]}]},
+        "Warranty Claim",
+        {"$ifNull": ["$classification", DEFAULT_CLASSIFICATION]}
+    ]
+}
+
+RESOLVED_STATUSES = ['Resolved', 'Closed']
+CLAIM_OUTCOME_STATUSES = {
+    'approved': 'Approved - Revisit Booked',
+    'declined': 'Declined - Not Covered',
+    'referred': 'Referred to Tech Director',
+    'warranty_received': 'Warranty Form Received',
+}
+
+# Some older tickets store dates as strings in this format
+LEGACY_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+MS_PER_HOUR = 60 * 60 * 1000
+MS_PER_DAY = 24 * MS_PER_HOUR
+
+# Fields returned for the "most urgent" overdue tickets
+URGENT_TICKET_FIELDS = {"_id": 0, "ticket_id": 1, "subject": 1, "name": 1, "status": 1, "priority": 1, "created_at": "$_created"}
+
+
+def ticket_date_match(start_date=None, end_date=None):
+    """$match condition on created_at for an optional date range"""
+    created_at = {}
+    if start_date:
+        created_at["$gte"] = start_date
+    if end_date:
+        created_at["$lte"] = end_date
+    return {"created_at": created_at} if created_at else {}
+
+
+def _count_by(expression):
+    return [{"$group": {"_id": expression, "count": {"$sum": 1}}}]
+
+
+def _counts(rows):
+    return {row["_id"]: row["count"] for row in rows}
+
+
+def _facet(collection, match, facets):
+    """Run one $facet pipeline (optionally after a $match) and return its single result document"""
+    pipeline = [{"$match": match}] if match else []
+    pipeline.append({"$facet": facets})
+    result = list(collection.aggregate(pipeline, allowDiskUse=True))
+    return result[0] if result else {name: [] for name in facets}
+
+
+def _total(rows, field="count"):
+    return rows[0][field] if rows else 0
+
+
+def empty_dashboard_stats():
+    return {"total_tickets": 0, "status_counts": {}, "priority_counts": {}, "classification_counts": {}}
+
+
+def _breakdown_facets():
+    return {
+        "total": [{"$count": "count"}],
+        "status": _count_by({"$ifNull": ["$status", DEFAULT_STATUS]}),
+        "priority": _count_by({"$ifNull": ["$priority", DEFAULT_PRIORITY]}),
+        "classification": _count_by(DISPLAY_CLASSIFICATION),
+    }
+
+
+def _breakdowns(result):
+    return {
+        "total_tickets": _total(result["total"]),
+        "status_counts": _counts(result["status"]),
+        "priority_counts": _counts(result["priority"]),
+        "classification_counts": _counts(result["classification"]),
+    }
+
+
+def dashboard_stats(tickets, match=None):
+    """Ticket total plus status, priority and classification counts"""
+    return _breakdowns(_facet(tickets, match, _breakdown_facets()))
+
+
+def _as_date(field):
+    """Expression reading a date field stored either as a date or as a legacy date string"""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$type": field}, "date"]}, "then": field},
+            {"case": {"$eq": [{"$type": field}, "string"]}, "then": {"$dateFromString": {
+                "dateString": field, "format": LEGACY_DATE_FORMAT, "onError": None, "onNull": None
+            }}},
+        ],
+        "default": None
+    }}
+
+
+def _percent(count, total):
+    return (count / total * 100) if total > 0 else 0
+
+
+def dashboard_kpis(tickets, match=None, now=None, urgent_limit=5, breakdowns=None):
+    """Live dashboard KPIs: breakdowns, aged buckets, average resolution time (hours) and claim outcomes
+
+    Pass breakdowns (e.g. from the ticket_stats counters) to skip recomputing the total and counts.
+    """
+    now = now or datetime.now()
+    # Whole days open, truncated like timedelta.days
+    days_open = {"$floor": {"$divide": [{"$subtract": [now, "$_created"]}, MS_PER_DAY]}}
+    facets = {} if breakdowns is not None else _breakdown_facets()
+    facets.update({
+        "aged": [{"$group": {
+            "_id": None,
+            "overdue": {"$sum": {"$cond": [{"$gt": ["$_days_open", 3]}, 1, 0]}},
+            "open_1_3_days": {"$sum": {"$cond": [
+                {"$and": [{"$gte": ["$_days_open", 1]}, {"$lte": ["$_days_open", 3]}]}, 1, 0
+            ]}},
+            "open_today": {"$sum": {"$cond": [{"$eq": ["$_days_open", 0]}, 1, 0]}}
+        }}],
+        "overdue_tickets": [
+            {"$match": {"_days_open": {"$gt": 3}}},
+            {"$sort": {"_created": 1}},
+            {"$limit": urgent_limit},
+            {"$project": URGENT_TICKET_FIELDS}
+        ],
+        "resolution": [
+            {"$match": {"status": {"$in": RESOLVED_STATUSES}}},
+            {"$group": {
+                "_id": None,
+                "resolved_count": {"$sum": 1},
+                # Tickets with unreadable dates count as resolved but add no time, as before
+                "total_hours": {"$sum": {"$ifNull": [
+                    {"$divide": [{"$subtract": ["$_updated", "$_created"]}, MS_PER_HOUR]}, 0
+                ]}}
+            }}
+        ],
+        "declined": [
+            {"$match": {"status": CLAIM_OUTCOME_STATUSES['declined']}},
+            {"$group": {"_id": None, "ticket_ids": {"$push": "$ticket_id"}}}
+        ],
+    })
+    pipeline = [{"$match": match}] if match else []
+    pipeline.extend([
+        {"$project": {
+            "ticket_id": 1, "subject": 1, "name": 1, "status": 1, "priority": 1, "classification": 1,
+            "has_warranty": 1, "has_warranty_attachment": 1,
+            "_created": _as_date("$created_at"), "_updated": _as_date("$updated_at")
+        }},
+        {"$addFields": {"_days_open": days_open}},
+        {"$facet": facets}
+    ])
+    result = list(tickets.aggregate(pipeline, allowDiskUse=True))
+    result = result[0] if result else {name: [] for name in facets}
+
+    kpis = dict(breakdowns) if breakdowns is not None else _breakdowns(result)
+    total_tickets = kpis["total_tickets"]
+    aged = result["aged"][0] if result["aged"] else {}
+    resolution = result["resolution"][0] if result["resolution"] else {}
+    resolved_count = resolution.get("resolved_count", 0)
+    outcomes = {name: kpis["status_counts"].get(status, 0) for name, status in CLAIM_OUTCOME_STATUSES.items()}
+    for name in ('approved', 'declined', 'referred'):
+        outcomes[f"{name}_percent"] = _percent(outcomes[name], total_tickets)
+    kpis.update({
+        "outstanding_claims": {
+            "overdue": aged.get("overdue", 0),
+            "open_1_3_days": aged.get("open_1_3_days", 0),
+            "open_today": aged.get("open_today", 0),
+            "overdue_tickets": result["overdue_tickets"]
+        },
+        "resolution_metrics": {
+            "avg_resolution_time": resolution.get("total_hours", 0) / resolved_count if resolved_count else 0,
+            "resolved_count": resolved_count
+        },
+        "claim_outcomes": outcomes,
+        "declined_ticket_ids": result["declined"][0]["ticket_ids"] if result["declined"] else [],
+    })
+    return kpis
+
+
+def empty_warranty_analytics():
+    return {
+        "total_tickets": 0,
+        "warranty_tickets": 0,
+        "attachment_tickets": 0,
+        "warranty_percentage": 0,
+        "attachment_percentage": 0,
+        "warranty_forms_distribution": [],
+        "processing_methods": [],
+        "monthly_warranty_trend": [],
+        "warranty_by_status": []
+    }
+
+
+def warranty_analytics(tickets, match=None):
+    """Warranty detection totals, form distribution, processing methods, monthly trend and status breakdown"""
+    is_warranty = {"$eq": ["$has_warranty", True]}
+    result = _facet(tickets, match, {
+        "totals": [{"$group": {
+            "_id": None,
+            "total_tickets": {"$sum": 1},
+            "warranty_tickets": {"$sum": {"$cond": [is_warranty, 1, 0]}},
+            "attachment_tickets": {"$sum": {"$cond": [{"$eq": ["$has_attachments", True]}, 1, 0]}}
+        }}],
+        "warranty_forms_distribution": [
+            {"$match": {"has_warranty": True}},
+            {"$group": {"_id": "$warranty_forms_count", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ],
+        "processing_methods": [
+            {"$group": {
+                "_id": "$processing_method",
+                "count": {"$sum": 1},
+                "warranty_count": {"$sum": {"$cond": [is_warranty, 1, 0]}}
+            }}
+        ],
+        "monthly_warranty_trend": [
+            {"$match": {"has_warranty": True}},
+            {"$group": {
+                "_id": {"year": {"$year": "$created_at"}, "month": {"$month": "$created_at"}},
+                "count": {"$sum": 1}
+            }},
+            {"$sort": {"_id.year": -1, "_id.month": -1}},
+            {"$limit": 12}
+        ],
+        "warranty_by_status": [
+            {"$match": {"has_warranty": True}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ],
+    })
+    totals = result["totals"][0] if result["totals"] else {}
+    total_tickets = totals.get("total_tickets", 0)
+    warranty_tickets = totals.get("warranty_tickets", 0)
+    attachment_tickets = totals.get("attachment_tickets", 0)
+    return {
+        "total_tickets": total_tickets,
+        "warranty_tickets": warranty_tickets,
+        "attachment_tickets": attachment_tickets,
+        "warranty_percentage": (warranty_tickets / total_tickets * 100) if total_tickets > 0 else 0,
+        "attachment_percentage": (attachment_tickets / total_tickets * 100) if total_tickets > 0 else 0,
+        "warranty_forms_distribution": result["warranty_forms_distribution"],
+        "processing_methods": result["processing_methods"],
+        "monthly_warranty_trend": result["monthly_warranty_trend"],
+        "warranty_by_status": result["warranty_by_status"]
+    }
+
+
+def empty_attachment_analytics():
+    return {"size_statistics": {}, "attachment_count_distribution": []}
+
+
+def attachment_analytics(tickets, match=None):
+    """Attachment size statistics and attachment count distribution"""
+    attachment_match = {"has_attachments": True}
+    if match:
+        attachment_match = {"$and": [match, attachment_match]}
+    result = _facet(tickets, attachment_match, {
+        "size_statistics": [
+            {"$group": {
+                "_id": None,
+                "total_size": {"$sum": "$attachment_total_size"},
+                "avg_size": {"$avg": "$attachment_total_size"},
+                "max_size": {"$max": "$attachment_total_size"},
+                "total_tickets": {"$sum": 1}
+            }}
+        ],
+        "attachment_count_distribution": [
+            {"$group": {"_id": "$total_attachments", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ],
+    })
+    return {
+        "size_statistics": result["size_statistics"][0] if result["size_statistics"] else {},
+        "attachment_count_distribution": result["attachment_count_distribution"]
+    }
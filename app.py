@@ -21,7 +21,7 @@ Author: AutoAssistGroup Development Team
 Version: 2.0
 """
 
-from flask import Flask, render_template, jsonify, redirect, request, url_for, send_from_directory, session, flash, Response, make_response, render_template_string
+from flask import Flask, render_template, jsonify, redirect, request, url_for, send_from_directory, session, flash, Response, make_response, render_template_string, stream_with_context
 from flask_cors import CORS
 import os
 import logging
@@ -48,8 +48,19 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import FileWrapper, get_input_stream
+from werkzeug.exceptions import RequestedRangeNotSatisfiable, RequestEntityTooLarge
 from collections import defaultdict
-from database import get_db
+from database import get_db, ticket_projection, encode_ticket_cursor, AssignmentConflictError
+from metadata_store import decode_value
+from migrations import SCHEMA_VERSION, MigrationError, MigrationRunner
+from mongo_connection import connections
+import request_cache
+import live_events
+import n8n_ingest
+from ttl_cache import APP_CACHE_COLLECTION, cache_from_environment
+from throttle import THROTTLE_COLLECTION, throttle_from_environment
+from ticket_changes import CHANGE_FEED_LAG, decode_change_cursor, encode_change_cursor
 from bson.objectid import ObjectId
 import base64
 import mimetypes
@@ -131,6 +142,11 @@ def set_security_headers(response):
     # Removed strict security headers to prevent session issues
     return response
 
+@app.teardown_request
+def finish_request_cache(exc=None):
+    """Record how many entity fetches the request identity map saved (see request_cache.py)"""
+    request_cache.finish_request()
+
 # Enhanced session timeout configuration
 app.permanent_session_lifetime = timedelta(days=30)  # 30 days - very permissive for better user experience
 
@@ -312,53 +328,48 @@ def validate_ticket_id(ticket_id):
         return False
     return str(ticket_id).replace(' ', '') == str(ticket_id)  # No spaces allowed
 
+# Rate limits and duplicate-submission checks shared by all gunicorn workers (see throttle.py)
+throttle = throttle_from_environment(lambda: get_db().db[THROTTLE_COLLECTION])
+
 def rate_limit_check(key, limit=10, window=60):
-    """Simple in-memory rate limiting (for production, use Redis)"""
-    import time
-    current_time = time.time()
-    
-    # For simplicity, using a global dict (in production, use proper cache)
-    if not hasattr(rate_limit_check, 'cache'):
-        rate_limit_check.cache = {}
-    
-    if key not in rate_limit_check.cache:
-        rate_limit_check.cache[key] = []
-    
-    # Remove old entries
-    rate_limit_check.cache[key] = [
-        timestamp for timestamp in rate_limit_check.cache[key] 
-        if current_time - timestamp < window
-    ]
-    
-    if len(rate_limit_check.cache[key]) >= limit:
-        return False
-    
-    rate_limit_check.cache[key].append(current_time)
-    return True
+    """Sliding-window rate limit: True while key has made fewer than limit calls in the last window seconds"""
+    return throttle.allow(key, limit, window)
+
+# Bounded, thread-safe LRU+TTL cache for hot read paths (see ttl_cache.py);
+# APP_CACHE_BACKEND=mongodb shares entries between gunicorn workers
+read_cache = cache_from_environment(lambda: get_db().db[APP_CACHE_COLLECTION])
+
+# Short lifetimes: these numbers move as tickets are created and updated
+TICKET_COUNT_CACHE_SECONDS = 30
+DASHBOARD_KPI_CACHE_SECONDS = 30
 
-# Simple caching mechanism (in production, use Redis/Memcached)
 def cache_get(key, default=None):
     """Get value from cache"""
-    if not hasattr(cache_get, 'cache'):
-        cache_get.cache = {}
-    
-    if key in cache_get.cache:
-        value, expires = cache_get.cache[key]
-        if time.time() < expires:
-            return value
-        else:
-            del cache_get.cache[key]
-    
-    return default
+    return read_cache.get(key, default)
 
 def cache_set(key, value, expires_in=300):
     """Set value in cache with expiration (default 5 minutes)"""
-    import time
-    if not hasattr(cache_get, 'cache'):
-        cache_get.cache = {}
-    
-    expires_at = time.time() + expires_in
-    cache_get.cache[key] = (value, expires_at)
+    read_cache.set(key, value, ttl=expires_in)
+
+def cached_tickets_count(db, status_filter=None, priority_filter=None, search_query=None):
+    """get_tickets_count shared by every page view asking for the same filters for a few seconds"""
+    return read_cache.get_or_load(
+        f"tickets_count:{status_filter}:{priority_filter}:{search_query}",
+        lambda: db.get_tickets_count(
+            status_filter=status_filter,
+            priority_filter=priority_filter,
+            search_query=search_query
+        ),
+        ttl=TICKET_COUNT_CACHE_SECONDS
+    )
+
+def cached_dashboard_kpis(db, start_date=None, end_date=None):
+    """get_dashboard_kpis shared by every dashboard poll for the same date range for a few seconds"""
+    return read_cache.get_or_load(
+        f"dashboard_kpis:{start_date}:{end_date}",
+        lambda: db.get_dashboard_kpis(start_date, end_date),
+        ttl=DASHBOARD_KPI_CACHE_SECONDS
+    )
 
 # File upload configuration for serverless environments
 if is_production:
@@ -398,6 +409,8 @@ else:
 
 app.config['DEBUG'] = os.environ.get('FLASK_ENV') != 'production'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# n8n email payloads are parsed as they stream in (n8n_ingest), so they get their own, larger limit
+N8N_MAX_PAYLOAD_BYTES = int(os.environ.get('N8N_MAX_PAYLOAD_MB', 50)) * 1024 * 1024
 
 # Add these constants after existing app configuration
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'txt', 'csv'}
@@ -993,10 +1006,10 @@ def enhanced_process_email_attachments(attachments_data):
                     app.logger.info(f"Nested item {j}: {type(nested_item)} - Keys: {list(nested_item.keys()) if isinstance(nested_item, dict) else 'Not a dict'}")
                     if isinstance(nested_item, dict):
                         # Handle nested JSON string data
-                        if 'data' in nested_item and isinstance(nested_item['data'], str):
+                        if 'data' in nested_item and isinstance(nested_item['data'], (str, dict)):
                             app.logger.info(f"Case 1a: Found JSON string data")
                             try:
-                                parsed_att = json.loads(nested_item['data'])
+                                parsed_att = n8n_ingest.load_embedded_json(nested_item['data'])
                                 app.logger.info(f"Parsed attachment data: {list(parsed_att.keys()) if isinstance(parsed_att, dict) else 'Not a dict'}")
                                 attachment = process_single_attachment(parsed_att)
                                 if attachment:
@@ -1004,7 +1017,7 @@ def enhanced_process_email_attachments(attachments_data):
                                     processed_attachments.append(attachment)
                                     if attachment.get('is_warranty', False):
                                         warranty_detected = True
-                            except json.JSONDecodeError as e:
+                            except ValueError as e:
                                 app.logger.error(f"JSON decode error: {e}")
                                 continue
                         else:
@@ -1018,15 +1031,15 @@ def enhanced_process_email_attachments(attachments_data):
                                     warranty_detected = True
             
             # Case 2: Handle JSON string data
-            elif 'data' in att_data and isinstance(att_data['data'], str):
+            elif 'data' in att_data and isinstance(att_data['data'], (str, dict)):
                 try:
-                    parsed_att = json.loads(att_data['data'])
+                    parsed_att = n8n_ingest.load_embedded_json(att_data['data'])
                     attachment = process_single_attachment(parsed_att)
                     if attachment:
                         processed_attachments.append(attachment)
                         if attachment.get('is_warranty', False):
                             warranty_detected = True
-                except json.JSONDecodeError:
+                except ValueError:
                     attachment = process_single_attachment(att_data)
                     if attachment:
                         processed_attachments.append(attachment)
@@ -1036,10 +1049,10 @@ def enhanced_process_email_attachments(attachments_data):
             # Case 3: Direct attachment data
             else:
                 attachment = process_single_attachment(att_data)
-            if attachment:
-                processed_attachments.append(attachment)
-                if attachment.get('is_warranty', False):
-                    warranty_detected = True
+                if attachment:
+                    processed_attachments.append(attachment)
+                    if attachment.get('is_warranty', False):
+                        warranty_detected = True
     
     # Final debugging summary
     app.logger.info(f"[TARGET] Enhanced attachment processing complete:")
@@ -1086,7 +1099,10 @@ def process_single_attachment(att_data):
     
     # Calculate file size
     file_size = 0
-    if file_data:
+    stored_blob = file_data if isinstance(file_data, n8n_ingest.StoredBlob) else None
+    if stored_blob is not None:
+        file_size = stored_blob['size']
+    elif file_data:
         try:
             file_size = len(base64.b64decode(file_data))
         except:
@@ -1109,6 +1125,10 @@ def process_single_attachment(att_data):
         'index': att_data.get('index', 0),
         'processed_at': datetime.now().isoformat()
     }
+    if stored_blob is not None:
+        # Decoded into the attachment store while the request was parsed (n8n_ingest)
+        attachment.pop('data')
+        attachment.update({'gridfs_id': stored_blob['gridfs_id'], 'blob_field': 'data'})
     
     # Add file type analysis
     try:
@@ -1179,9 +1199,9 @@ def enhanced_process_complex_email_data(raw_data):
                         main_ticket = item
                         
                     # Check if item has direct data field with JSON
-                    elif 'data' in item and isinstance(item['data'], str):
+                    elif 'data' in item and isinstance(item['data'], (str, dict)):
                         try:
-                            parsed_data = json.loads(item['data'])
+                            parsed_data = n8n_ingest.load_embedded_json(item['data'])
                             if 'fileName' in parsed_data:
                                 attachment = process_single_attachment(parsed_data)
                                 if attachment:
@@ -1190,7 +1210,7 @@ def enhanced_process_complex_email_data(raw_data):
                                         warranty_detected = True
                             else:
                                 main_ticket = parsed_data
-                        except json.JSONDecodeError:
+                        except ValueError:
                             pass
                     
                     # [FIX] CRITICAL FIX: Check for flat attachment structure BEFORE treating as main ticket
@@ -1533,9 +1553,26 @@ def n8n_email_tickets():
     """
     New endpoint specifically designed for n8n email data with proper attachment handling
     """
+    stored_blobs = []
+    created_records = []
     try:
-        # Get JSON data from request
-        data = request.json
+        if not request.is_json:
+            return jsonify({'status': 'error', 'message': 'No data provided'}), 400
+        
+        # Parse the body as it arrives instead of loading it whole: attachment payloads are
+        # decoded chunk by chunk straight into the attachment store (see n8n_ingest)
+        try:
+            data, stored_blobs = n8n_ingest.parse_stream(
+                get_input_stream(request.environ, max_content_length=N8N_MAX_PAYLOAD_BYTES),
+                get_db().attachment_store
+            )
+        except RequestEntityTooLarge:
+            return jsonify({
+                'status': 'error',
+                'message': f'Payload exceeds {N8N_MAX_PAYLOAD_BYTES // (1024 * 1024)}MB'
+            }), 413
+        except n8n_ingest.PayloadError as e:
+            return jsonify({'status': 'error', 'message': f'Invalid JSON: {e}'}), 400
         if not data:
             return jsonify({'status': 'error', 'message': 'No data provided'}), 400
         
@@ -1583,6 +1620,7 @@ def n8n_email_tickets():
         
         for ticket in processed_tickets:
             try:
+                ticket_id = None
                 # [FIX] Use n8n provided ticket_id if available, otherwise generate one
                 n8n_ticket_id = ticket.get('ticket_id', '').strip()
                 
@@ -1597,29 +1635,15 @@ def n8n_email_tickets():
                         # Fall through to generate new ID
                         ticket_id = None
                 if not ticket_id:
-                    # Generate unique ticket ID with collision protection as fallback
-                    max_attempts = 20
-                    ticket_id = None
-                    
-                    for attempt in range(max_attempts):
-                        # Generate unique ticket ID
-                        timestamp = datetime.now()
-                        potential_id = f"N8N{timestamp.strftime('%H%M%S')}{random.randint(1000, 9999)}"
-                        
-                        # Check if ID already exists
-                        if not db.ticket_id_exists(potential_id):
-                            ticket_id = potential_id
-                            break
-                        app.logger.debug(f"Ticket ID collision {potential_id}, retrying...")
+                    # Allocate a 6-character email ticket ID from the atomic counter as fallback
+                    ticket_id = generate_email_ticket_id(
+                        ticket.get('from', ''), ticket.get('name', 'Unknown'), ticket.get('Classification', 'General'), db
+                    )
                     
                     if n8n_ticket_id:
                         app.logger.warning(f"[N8N_TICKET_ID] N8N ticket ID {n8n_ticket_id} already exists, using generated ID: {ticket_id}")
                     else:
                         app.logger.info(f"[N8N_TICKET_ID] No n8n ticket ID provided, using generated ID: {ticket_id}")
-                    
-                    if not ticket_id:
-                        app.logger.error(f"Failed to generate unique ticket ID after {max_attempts} attempts")
-                        continue
                 
                 # Prepare ticket data for database (matching database schema)
                 # Fix total_attachments calculation issue - always use actual attachment count
@@ -1637,6 +1661,7 @@ def n8n_email_tickets():
                 app.logger.info(f"[INFO] Ticket {ticket_id} - has_attachments: {ticket.get('has_attachments')}, total_attachments: {total_attachments}, attachments array length: {len(attachments_array)}")
                 
                 # Generate unique thread_id to avoid conflicts (never use incoming threadI data)
+                timestamp = datetime.now()
                 thread_id = f"THREAD_{ticket_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}_{random.randint(100, 999)}"
                 
                 # AUTO-CONFIRM WARRANTY: If warranty detected in email, set status directly to "Warranty Form Received"
@@ -1665,6 +1690,8 @@ def n8n_email_tickets():
                     'warranty_forms_count': ticket.get('warranty_forms_count', 0) or 0,
                     'total_attachments': total_attachments or 0,
                     'attachment_total_size': ticket.get('attachment_total_size', 0) or 0,
+                    # Streamed payloads are already stored; create_ticket offloads the inline ones
+                    'attachments': attachments_array,
                     'processing_method': 'n8n_email_processor'
                 }
                 
@@ -1734,57 +1761,7 @@ def n8n_email_tickets():
                     app.logger.error(f"Full traceback: {traceback.format_exc()}")
                     raise db_error
                 
-                # Process and SAVE attachments to disk for proper download
-                total_ticket_attachments = ticket.get('attachments', [])
-                app.logger.info(f"FOLDER PROCESSING {len(total_ticket_attachments)} ATTACHMENTS for ticket {ticket_id}")
-                
-                if total_ticket_attachments:
-                    for i, attachment in enumerate(total_ticket_attachments):
-                        try:
-                            filename = attachment.get('filename', f'attachment_{i}')
-                            file_data = attachment.get('data', '')
-                            is_warranty = attachment.get('is_warranty', False)
-                            
-                            app.logger.info(f"💾 PROCESSING ATTACHMENT {i+1}/{len(total_ticket_attachments)}: {filename} (warranty: {is_warranty})")
-                            
-                            # SAVE FILE TO DISK for download functionality
-                            file_path = None
-                            if file_data:
-                                try:
-                                    # Decode base64 and save to uploads directory
-                                    decoded_data = base64.b64decode(file_data)
-                                    safe_filename = secure_filename(filename)
-                                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                    unique_filename = f"{timestamp}_{ticket_id}_{safe_filename}"
-                                    
-                                    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                                    with open(file_path, 'wb') as f:
-                                        f.write(decoded_data)
-                                    
-                                    app.logger.info(f" SAVED ATTACHMENT to disk: {file_path} ({len(decoded_data)} bytes)")
-                                    
-                                except Exception as save_error:
-                                    app.logger.error(f" Failed to save attachment {filename}: {save_error}")
-                                    file_path = None
-                            else:
-                                app.logger.warning(f" NO FILE DATA for attachment {filename}")
-                            
-                            # Store both metadata AND file path for download
-                            attachment_metadata = {
-                                'key': f'attachment_{i}',
-                                'filename': filename,
-                                'file_path': file_path,  # ADD: Path to saved file
-                                'data': file_data,       # Keep base64 data as backup
-                                'is_warranty': attachment.get('is_warranty', False),
-                                'size': attachment.get('size', 0),
-                                'file_type': attachment.get('file_type', 'unknown'),
-                                'saved_to_disk': bool(file_path)  # Track if file was saved
-                            }
-                            db.add_ticket_metadata(ticket_id, f'attachment_{i}', json.dumps(attachment_metadata))
-                            app.logger.info(f"COMPLETE: Saved attachment {filename} - disk:{bool(file_path)} metadata:✓")
-                            
-                        except Exception as att_error:
-                            app.logger.error(f"Error processing attachment {i}: {att_error}")
+                created_records.append(ticket_data)
                 
                 created_tickets.append({
                     'ticket_id': ticket_id,
@@ -1841,6 +1818,10 @@ def n8n_email_tickets():
             'status': 'error',
             'message': f'Server error: {str(e)}'
         }), 500
+    finally:
+        # Payloads stored while parsing that did not end up on a created ticket
+        if stored_blobs:
+            n8n_ingest.release_unused(get_db().attachment_store, stored_blobs, created_records)
 
 @app.route('/api/n8n/simple-test', methods=['POST'])
 def n8n_simple_test():
@@ -1922,14 +1903,15 @@ def warranty_form_submission():
         # Connect to database first
         db = get_db()
         
-        # Create unique warranty ticket ID with race condition protection
-        max_attempts = 50
+        # Warranty ticket IDs come from the atomic counter (W + 5 hex characters); the retry only
+        # covers an ID inserted by another path between the allocator's check and this insert
+        max_attempts = 3
         ticket_id = None
         # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
         thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
         
         for attempt in range(max_attempts):
-            potential_id = f"W{str(uuid.uuid4())[:5].upper()}"
+            potential_id = db.allocate_ticket_id('W')
             
             try:
                 # Try to create ticket with this ID - will fail if duplicate
@@ -1970,14 +1952,14 @@ def warranty_form_submission():
         if not ticket_id:
             return jsonify({'status': 'error', 'message': 'Failed to generate unique ticket ID. Please try again.'}), 500
         
-        # Store vehicle registration
+        # Store vehicle registration and any additional form fields as metadata
+        form_metadata = {
+            key: str(value) for key, value in data.items()
+            if key not in ['customer_name', 'customer_email', 'customer_phone', 'vehicle_registration', 'warranty_details']
+        }
         if registration:
-            db.add_ticket_metadata(ticket_id, 'vehicle_registration', registration)
-        
-        # Store any additional form fields as metadata
-        for key, value in data.items():
-            if key not in ['customer_name', 'customer_email', 'customer_phone', 'vehicle_registration', 'warranty_details']:
-                db.add_ticket_metadata(ticket_id, key, str(value))
+            form_metadata['vehicle_registration'] = registration
+        db.set_ticket_metadata_many(ticket_id, form_metadata)
         
         # Create a reply indicating this was an automatic submission
         reply_data = {
@@ -2047,6 +2029,8 @@ def health_check():
             'message': 'Application is running',
             'environment': os.environ.get('FLASK_ENV', 'development'),
             'database': 'connected',
+            'schema_version': db.schema_version,
+            'schema_up_to_date': db.schema_version >= SCHEMA_VERSION,
             'upload_folder': UPLOAD_FOLDER,
             'version': 'v2.0-comprehensive-assignment',  # Added version tag
             'last_updated': '2025-07-26'
@@ -3329,48 +3313,16 @@ def get_email_classification_code(classification):
 def generate_email_ticket_id(email, name, classification, db):
     """
     [TARGET] Generate email ticket ID in SAME format as manual tickets: E{type_code}{4 digits}
-    Uses identical deterministic calculation as manual tickets for consistency
+    Allocated from the same atomic per-prefix counter as manual tickets
     """
     # Get classification code (similar to manual ticket type codes)
     type_code = get_email_classification_code(classification)
     
-    max_attempts = 100
-    ticket_id = None
-    
     app.logger.info(f"[TARGET] Generating email ticket ID for: {email}, classification: {classification} -> {type_code}")
     
-    for attempt in range(max_attempts):
-        # Generate 4-digit code using SAME logic as manual tickets
-        seed_string = f"{email}{name}{datetime.now().isoformat()}"
-        
-        # Calculate sum of character codes (identical to manual ticket logic)
-        sum_chars = 0
-        for char in seed_string:
-            sum_chars += ord(char)
-        
-        # Generate 4-digit number (same as manual: sum % 10000)
-        four_digit_code = sum_chars % 10000
-        four_digit_str = f"{four_digit_code:04d}"  # Ensure 4 digits with leading zeros
-        
-        potential_id = f"E{type_code}{four_digit_str}"  # Exactly 6 chars: E + 1 + 4 digits
-        
-        app.logger.info(f"? Attempting email ticket ID: {potential_id} (attempt {attempt + 1}/{max_attempts})")
-        app.logger.debug(f"? Email calculation: seed='{seed_string[:50]}...', sum_chars={sum_chars}, 4-digit={four_digit_code}")
-        
-        # Check if ID already exists (same check as manual tickets)
-        if not db.ticket_id_exists(potential_id):
-            ticket_id = potential_id
-            app.logger.info(f"[SUCCESS] Generated unique email ticket ID: {ticket_id}")
-            break
-        else:
-            app.logger.debug(f"[RETRY] Email ticket ID collision: {potential_id}, retrying...")
-            # Add small random variation to avoid infinite loops with same data
-            import time
-            time.sleep(0.001)  # 1ms delay to change timestamp
-    
-    if not ticket_id:
-        app.logger.error(f"[ERROR] Failed to generate unique email ticket ID after {max_attempts} attempts")
-        raise Exception(f"Failed to generate unique email ticket ID after {max_attempts} attempts")
+    # One atomic counter update per ID: unique across gunicorn workers without retry loops
+    ticket_id = db.allocate_ticket_id(f"E{type_code}")  # Exactly 6 chars: E + 1 + 4 digits
+    app.logger.info(f"[SUCCESS] Generated unique email ticket ID: {ticket_id}")
     
     return ticket_id
 
@@ -3595,19 +3547,13 @@ def dashboard():
         if current_user_role == 'Technical Director':
             return redirect(url_for('tech_director_dashboard'))
         
-        # CRITICAL FIX: Ensure all tickets have has_unread_reply field before processing
-        try:
-            db.migrate_has_unread_reply_field()
-            app.logger.info("[DASHBOARD] has_unread_reply field migration completed")
-        except Exception as migration_error:
-            app.logger.warning(f"[DASHBOARD] has_unread_reply migration failed: {migration_error}")
-        
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         status_filter = request.args.get('status', 'All')
         priority_filter = request.args.get('priority', 'All')
         search_query = request.args.get('search', '')
+        after = request.args.get('after')
         
         # Get paginated tickets with assignment info
         tickets = db.get_tickets_with_assignments(
@@ -3615,11 +3561,16 @@ def dashboard():
             per_page=per_page, 
             status_filter=status_filter,
             priority_filter=priority_filter,
-            search_query=search_query
+            search_query=search_query,
+            after=after
         )
         
+        # Keyset token for the following page (links pass it as ?after= so deep pages skip nothing)
+        next_cursor = encode_ticket_cursor(tickets[-1]) if len(tickets) == per_page else None
+        
         # Get total count for pagination
-        total_tickets = db.get_tickets_count(
+        total_tickets = cached_tickets_count(
+            db,
             status_filter=status_filter,
             priority_filter=priority_filter,
             search_query=search_query
@@ -3720,52 +3671,9 @@ def dashboard():
                     except:
                         ticket['formatted_date'] = str(ticket['created_at'])
             
-            # Get technician information for this ticket
-            ticket_id = ticket.get('ticket_id')
-            if ticket_id:
-                try:
-                    # Check if database is actually working
-                    if not hasattr(db, 'ticket_metadata') or not db.ticket_metadata:
-                        app.logger.warning(f"Database not properly initialized for ticket {ticket_id}")
-                        ticket['technician_name'] = None
-                        ticket['technician_id'] = None
-                    else:
-                        metadata = db.get_ticket_metadata(ticket_id)
-                        app.logger.info(f" Retrieved metadata for ticket {ticket_id}: {metadata}")
-                        if metadata:
-                            app.logger.info(f"Found {len(metadata)} metadata entries for ticket {ticket_id}")
-                            for meta in metadata:
-                                app.logger.info(f"  - Key: '{meta.get('key')}', Value: '{meta.get('value')}'")
-                                if meta.get('key') == 'technician_name':
-                                    ticket['technician_name'] = meta.get('value')
-                                    app.logger.info(f" Set technician_name to: {meta.get('value')}")
-                                    break
-                                elif meta.get('key') == 'technician_id':
-                                    ticket['technician_id'] = meta.get('value')
-                                    app.logger.info(f" Set technician_id to: {meta.get('value')}")
-                                    break
-                        else:
-                            app.logger.info(f" No metadata found for ticket {ticket_id}")
-                            ticket['technician_name'] = None
-                            ticket['technician_id'] = None
-                        
-                        # Ensure technician fields are explicitly set to None if not found
-                        if 'technician_name' not in ticket or ticket['technician_name'] is None:
-                            ticket['technician_name'] = None
-                            app.logger.info(f"🔧 Explicitly set technician_name to None for ticket {ticket_id}")
-                        if 'technician_id' not in ticket or ticket['technician_id'] is None:
-                            ticket['technician_id'] = None
-                            app.logger.info(f"🔧 Explicitly set technician_id to None for ticket {ticket_id}")
-                except Exception as e:
-                    app.logger.debug(f"Error getting technician info for ticket {ticket_id}: {e}")
-                    ticket['technician_name'] = None
-                    ticket['technician_id'] = None
-                
-                # Final fallback: ensure technician fields are always set
-                if 'technician_name' not in ticket:
-                    ticket['technician_name'] = None
-                if 'technician_id' not in ticket:
-                    ticket['technician_id'] = None
+            # Technician fields are denormalized onto the ticket document
+            ticket['technician_name'] = ticket.get('technician_name')
+            ticket['technician_id'] = ticket.get('technician_id')
             
             # Check if this ticket is forwarded to current user
             is_forwarded_to_current_user = (
@@ -3804,89 +3712,10 @@ def dashboard():
             app.logger.info(f" Final technician data for ticket {ticket_id}: technician_name='{ticket.get('technician_name')}', technician_id='{ticket.get('technician_id')}'")
             app.logger.info(f" Ticket {ticket_id} keys: {list(ticket.keys())}")
             
-            # Double-check: if we still don't have technician data, try one more time
-            if not ticket.get('technician_name') and not ticket.get('technician_id'):
-                app.logger.warning(f" Ticket {ticket_id} still missing technician data, trying one more retrieval...")
-                try:
-                    final_metadata = db.get_ticket_metadata(ticket_id)
-                    for meta in final_metadata:
-                        if meta.get('key') == 'technician_name':
-                            ticket['technician_name'] = meta.get('value')
-                            app.logger.info(f"🔄 Final attempt: Set technician_name to: {meta.get('value')}")
-                            break
-                except Exception as e:
-                    app.logger.error(f" Final attempt failed for ticket {ticket_id}: {e}")
-        
-        #  DYNAMIC WARRANTY CLASSIFICATION: Update classification for tickets with warranty attachments
+        #  DYNAMIC WARRANTY CLASSIFICATION: Tickets with warranty attachments are shown as "Warranty Claim"
         for ticket_dict in formatted_tickets:
-            ticket_id = ticket_dict.get('ticket_id')
-            if ticket_id:
-                try:
-                    # Check if ticket has warranty attachments
-                    metadata = db.get_ticket_metadata(ticket_id)
-                    has_warranty_attachment = False
-                    
-                    if metadata:
-                        for meta in metadata:
-                            try:
-                                # Ensure meta is a dictionary
-                                if not isinstance(meta, dict):
-                                    continue
-                                
-                                meta_value = meta.get('value')
-                                if isinstance(meta_value, str):
-                                    # Handle potential malformed JSON
-                                    if meta_value.strip() and meta_value.strip() not in ['{}', '']:
-                                        try:
-                                            # Clean JSON before parsing
-                                            clean_json = meta_value.strip()
-                                            # Remove trailing commas and fix common JSON issues
-                                            if clean_json.endswith(',}'):
-                                                clean_json = clean_json[:-2] + '}'
-                                            elif clean_json.endswith(',]'):
-                                                clean_json = clean_json[:-2] + ']'
-                                            # Remove any leading/trailing whitespace and quotes
-                                            clean_json = clean_json.strip().strip('"\'')
-                                            # Skip if still empty after cleaning
-                                            if not clean_json or clean_json in ['{}', '[]', 'null', 'undefined']:
-                                                meta_data = {}
-                                            else:
-                                                meta_data = json.loads(clean_json)
-                                        except json.JSONDecodeError as json_err:
-                                            # Only log if it's actually malformed, not just empty
-                                            if meta_value.strip() and meta_value.strip() not in ['{}', '[]', 'null', 'undefined', '']:
-                                                app.logger.debug(f"Skipping malformed JSON in metadata: {json_err} - Value: {meta_value[:50]}")
-                                            meta_data = {}
-                                    else:
-                                        meta_data = {}
-                                elif isinstance(meta_value, dict):
-                                    meta_data = meta_value
-                                else:
-                                    meta_data = {}
-                                
-                                # Check if this attachment is warranty-related
-                                if isinstance(meta_data, dict):
-                                    is_warranty = meta_data.get('is_warranty', False)
-                                    if is_warranty:
-                                        has_warranty_attachment = True
-                                        break
-                            except (json.JSONDecodeError, TypeError, AttributeError) as e:
-                                app.logger.warning(f"Error processing metadata for ticket {ticket_id}: {e}")
-                                continue
-                    
-                    # Also check direct has_warranty flag on ticket
-                    has_warranty_flag = ticket_dict.get('has_warranty', False)
-                    
-                    # If ticket has warranty attachments or warranty flag, ensure classification is "Warranty Claim"
-                    if has_warranty_attachment or has_warranty_flag:
-                        original_classification = ticket_dict.get('classification')
-                        ticket_dict['classification'] = 'Warranty Claim'
-                        
-                        if original_classification != 'Warranty Claim':
-                            app.logger.info(f" DYNAMIC WARRANTY CLASSIFICATION: Ticket {ticket_id} updated from '{original_classification}' to 'Warranty Claim' (warranty_attachment: {has_warranty_attachment}, warranty_flag: {has_warranty_flag})")
-                
-                except Exception as e:
-                    app.logger.error(f"Error checking warranty status for ticket {ticket_id}: {e}")
+            if ticket_dict.get('has_warranty_attachment') or ticket_dict.get('has_warranty', False):
+                ticket_dict['classification'] = 'Warranty Claim'
         
         # Group tickets by date
         tickets_grouped = group_tickets_by_date(formatted_tickets)
@@ -3931,6 +3760,7 @@ def dashboard():
             'has_next': has_next,
             'prev_page': prev_page,
             'next_page': next_page,
+            'next_cursor': next_cursor,
             'status_filter': status_filter,
             'priority_filter': priority_filter,
             'search_query': search_query
@@ -4163,7 +3993,7 @@ def admin_panel():
         
         # Calculate stats - FIXED: Use database total count
         # total_tickets should come from database.get_tickets_count() not len(tickets)
-        total_tickets = db.get_tickets_count()
+        total_tickets = cached_tickets_count(db)
         open_tickets = len([t for t in tickets if t.get('status') == 'Open'])
         resolved_tickets = len([t for t in tickets if t.get('status') == 'Resolved'])
         
@@ -4282,6 +4112,7 @@ def manage_member(member_id):
                 {'_id': ObjectId(member_id)},
                 {'$set': update_data}
             )
+            db.invalidate_members(member_id)
             return jsonify({'status': 'success'})
         except Exception as e:
             return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -4306,6 +4137,7 @@ def manage_member(member_id):
                 return jsonify({'status': 'error', 'message': 'Cannot delete protected administrator or technical director accounts'}), 403
             
             result = db.members.delete_one({'_id': ObjectId(member_id)})
+            db.invalidate_members(member_id)
             if result.deleted_count > 0:
                 app.logger.info(f"[DELETE] Successfully deleted member {member_id}")
                 return jsonify({'status': 'success', 'message': 'Member deleted successfully'})
@@ -4609,9 +4441,11 @@ def trigger_tech_director_webhook_async(ticket_id, ticket_data, assignment_metho
                 app.logger.info(f"[SUCCESS] Response: {response.status_code} - {response.text[:100]}...")
                 
                 # Store success metadata
-                db.add_ticket_metadata(ticket_id, 'async_webhook_triggered', datetime.now().isoformat())
-                db.add_ticket_metadata(ticket_id, 'webhook_attempts', str(attempt + 1))
-                db.add_ticket_metadata(ticket_id, 'webhook_method', assignment_method)
+                db.set_ticket_metadata_many(ticket_id, {
+                    'async_webhook_triggered': datetime.now().isoformat(),
+                    'webhook_attempts': str(attempt + 1),
+                    'webhook_method': assignment_method
+                })
                 
                 return  # Success - exit retry loop
                 
@@ -4626,9 +4460,11 @@ def trigger_tech_director_webhook_async(ticket_id, ticket_data, assignment_metho
                     # Final attempt failed
                     app.logger.error(f"[ERROR] ASYNC WEBHOOK FINAL FAILURE - Ticket {ticket_id} after {max_retries} attempts")
                     try:
-                        db.add_ticket_metadata(ticket_id, 'async_webhook_failed', datetime.now().isoformat())
-                        db.add_ticket_metadata(ticket_id, 'webhook_attempts', str(max_retries))
-                        db.add_ticket_metadata(ticket_id, 'webhook_error', str(e))
+                        db.set_ticket_metadata_many(ticket_id, {
+                            'async_webhook_failed': datetime.now().isoformat(),
+                            'webhook_attempts': str(max_retries),
+                            'webhook_error': str(e)
+                        })
                     except:
                         pass  # Don't fail if metadata storage fails
     
@@ -4770,10 +4606,12 @@ def trigger_tech_director_webhook(ticket_id, ticket_data, assignment_method='ref
         
         # Store webhook metadata
         app.logger.info(f"[DEBUG] Storing webhook metadata for ticket {ticket_id}")
-        db.add_ticket_metadata(ticket_id, 'webhook_triggered', datetime.now().isoformat())
-        db.add_ticket_metadata(ticket_id, 'webhook_url', WEBHOOK_URL)
-        db.add_ticket_metadata(ticket_id, 'webhook_method', assignment_method)
-        db.add_ticket_metadata(ticket_id, 'referred_by', webhook_payload['referred_by'])
+        db.set_ticket_metadata_many(ticket_id, {
+            'webhook_triggered': datetime.now().isoformat(),
+            'webhook_url': WEBHOOK_URL,
+            'webhook_method': assignment_method,
+            'referred_by': webhook_payload['referred_by']
+        })
         
         app.logger.info(f"[DEBUG] Webhook metadata stored successfully for ticket {ticket_id}")
         return True
@@ -5069,9 +4907,11 @@ def refer_to_tech_director(ticket_id):
         # Note: webhook_queued is always True for async - actual result happens in background
         
         # Add metadata to track the referral
-        db.add_ticket_metadata(ticket_id, 'referred_by_manual_button', referrer_name)
-        db.add_ticket_metadata(ticket_id, 'referral_method', 'manual_button')
-        db.add_ticket_metadata(ticket_id, 'referral_timestamp', datetime.now().isoformat())
+        db.set_ticket_metadata_many(ticket_id, {
+            'referred_by_manual_button': referrer_name,
+            'referral_method': 'manual_button',
+            'referral_timestamp': datetime.now().isoformat()
+        })
         
         return jsonify({
             'status': 'success',
@@ -5850,60 +5690,11 @@ def tech_director_dashboard():
                 except Exception:
                     ticket_dict['formatted_date'] = str(created_at_value)
             
-            # Get vehicle registration from metadata
-            metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-            ticket_dict['vehicle_registration'] = 'Not specified'
-            has_warranty_attachment = False
-            
-            for meta in metadata:
-                try:
-                    if isinstance(meta, dict):
-                        meta_key = meta.get('key')
-                        meta_value = meta.get('value')
-                    else:
-                        meta_key = None
-                        meta_value = None
-                except (AttributeError, TypeError):
-                    meta_key = None
-                    meta_value = None
+            # Vehicle registration and warranty flag are denormalized onto the ticket document
+            ticket_dict['vehicle_registration'] = ticket_dict.get('vehicle_registration') or 'Not specified'
 
-                if meta_key == 'vehicle_registration':
-                    ticket_dict['vehicle_registration'] = meta_value if isinstance(meta_value, str) else str(meta_value)
-                
-                #  DYNAMIC WARRANTY CLASSIFICATION: Check for warranty attachments
-                try:
-                    if isinstance(meta_value, str):
-                        # Clean JSON before parsing
-                        clean_json = meta_value.strip()
-                        # Remove trailing commas and fix common JSON issues
-                        if clean_json.endswith(',}'):
-                            clean_json = clean_json[:-2] + '}'
-                        elif clean_json.endswith(',]'):
-                            clean_json = clean_json[:-2] + ']'
-                        # Remove any leading/trailing whitespace and quotes
-                        clean_json = clean_json.strip().strip('"\'')
-                        # Skip if still empty after cleaning
-                        if not clean_json or clean_json in ['{}', '[]', 'null', 'undefined']:
-                            meta_data = {}
-                        else:
-                            meta_data = json.loads(clean_json)
-                    elif isinstance(meta_value, dict):
-                        meta_data = meta_value
-                    else:
-                        meta_data = {}
-                    
-                    # Check if this attachment is warranty-related
-                    is_warranty = meta_data.get('is_warranty', False) if isinstance(meta_data, dict) else False
-                    if is_warranty:
-                        has_warranty_attachment = True
-                except (json.JSONDecodeError, TypeError, ValueError) as e:
-                    # Only log if it's actually malformed, not just empty
-                    if isinstance(meta_value, str) and meta_value.strip() and meta_value.strip() not in ['{}', '[]', 'null', 'undefined', '']:
-                        app.logger.debug(f"JSON parse error in TD dashboard: {e} - Value: {meta_value[:50]}")
-                    meta_data = {}
-            
             # Update classification if warranty attachment found
-            if has_warranty_attachment or ticket_dict.get('has_warranty', False):
+            if ticket_dict.get('has_warranty_attachment') or ticket_dict.get('has_warranty', False):
                 original_classification = ticket_dict.get('classification')
                 ticket_dict['classification'] = 'Warranty Claim'
                 
@@ -6143,11 +5934,8 @@ def submit_tech_director_feedback(ticket_id):
         if recommended_action:
             metadata_updates.append(('recommended_action', recommended_action))
         
-        for key, value in metadata_updates:
-            # Remove existing entry first
-            db.ticket_metadata.delete_many({'ticket_id': ticket_id, 'key': key})
-            # Add new entry
-            db.add_ticket_metadata(ticket_id, key, str(value))
+        # Replaces any existing entries for these keys
+        db.set_ticket_metadata_many(ticket_id, {key: str(value) for key, value in metadata_updates})
         
         # Create a reply with the Tech Director's assessment
         reply_data = {
@@ -6249,23 +6037,6 @@ def assign_ticket(ticket_id):
         app.logger.error(f"[ALERT] ASSIGN INIT ERROR: {debug_error}")
         return jsonify({'status': 'error', 'message': 'Request processing error'}), 500
     
-    # Technical Director can only forward tickets, not take them over
-    db = get_db()
-    current_member = db.get_member_by_id(session['member_id'])
-    is_tech_director = current_member and current_member['role'] == 'Technical Director'
-    
-    if is_tech_director:
-        # Technical Director can only forward, check if this is a forward operation
-        data = request.json
-        is_forwarded = data.get('is_forwarded', False)
-        if not is_forwarded:
-            return jsonify({'status': 'error', 'message': 'Technical Director can only forward tickets, not take them over.'}), 403
-        
-        # Ensure the ticket is referred to Technical Director
-        ticket = db.get_ticket_by_id(ticket_id)
-        if not ticket or ticket.get('status') != 'Referred to Tech Director':
-            return jsonify({'status': 'error', 'message': 'You can only forward tickets that have been referred to you.'}), 403
-    
     # Step 1: Authentication Check
     if 'member_id' not in session:
         app.logger.warning(f"Unauthorized assignment attempt for ticket {ticket_id}")
@@ -6310,42 +6081,11 @@ def assign_ticket(ticket_id):
             'error_code': 'INVALID_JSON'
         }), 400
     
-    # Step 3: Database Connection
-    try:
-        db = get_db()
-        app.logger.info(f"Database connection established for ticket {ticket_id}")
-        
-        # Check if ticket exists first
-        ticket = db.tickets.find_one({'ticket_id': ticket_id})
-        if not ticket:
-            app.logger.error(f"Ticket not found: {ticket_id}")
-            app.logger.info(f"Available tickets sample: {[t['ticket_id'] for t in db.tickets.find().limit(5)]}")
-            return jsonify({
-                'status': 'error',
-                'message': f'Ticket {ticket_id} not found. Please verify the ticket ID.',
-                'error_code': 'TICKET_NOT_FOUND'
-            }), 404
-    except Exception as e:
-        app.logger.error(f"Database connection failed for ticket {ticket_id}: {str(e)}")
-        return jsonify({
-            'status': 'error',
-            'message': 'Database connection failed',
-            'error_code': 'DB_CONNECTION_FAILED'
-        }), 500
-    
-    # Step 4: Validate and Process Member ID
+    # Step 3: Validate and Process Member ID
     try:
         member_id_raw = data.get('member_id')
         app.logger.info(f"Processing member_id: '{member_id_raw}' (type: {type(member_id_raw)})")
         
-        # Clean and validate member_id
-        if not member_id_raw:
-            return jsonify({
-                'status': 'error',
-                'message': 'member_id cannot be empty',
-                'error_code': 'EMPTY_MEMBER_ID'
-            }), 400
-            
         member_id_str = str(member_id_raw).strip()
         if not member_id_str:
             return jsonify({
@@ -6364,7 +6104,6 @@ def assign_ticket(ticket_id):
             }), 400
             
         member_id_obj = ObjectId(member_id_str)
-        app.logger.info(f"Valid ObjectId created: {member_id_obj}")
         
     except Exception as e:
         app.logger.error(f"Member ID processing error: {str(e)}")
@@ -6374,123 +6113,91 @@ def assign_ticket(ticket_id):
             'error_code': 'MEMBER_ID_PROCESSING_ERROR'
         }), 400
     
-    # Step 5: Validate Member Exists
+    # Step 4: Ticket, current assignment and the members involved in one request-scoped fetch
+    is_forwarded = data.get('is_forwarded', False)
+    forwarded_from_raw = data.get('forwarded_from') if is_forwarded else None
     try:
-        member = db.get_member_by_id(member_id_str)
-        if not member:
-            app.logger.error(f"Member not found: {member_id_str}")
+        db = get_db()
+        context = db.get_assignment_context(ticket_id, [session['member_id'], member_id_str, forwarded_from_raw])
+        if not context:
+            app.logger.error(f"Ticket not found: {ticket_id}")
             return jsonify({
                 'status': 'error',
-                'message': f'Member not found: {member_id_str}',
-                'error_code': 'MEMBER_NOT_FOUND'
+                'message': f'Ticket {ticket_id} not found. Please verify the ticket ID.',
+                'error_code': 'TICKET_NOT_FOUND'
             }), 404
-        # [ALERT] CRITICAL DEBUG: Member analysis
-        member_role = member.get('role', 'NO_ROLE')
-        member_name = member.get('name', 'NO_NAME')
-        
-        print("-" * 60)
-        print(f"[ALERT] MEMBER FOUND: {member_name}")
-        print(f"[ALERT] MEMBER ROLE: '{member_role}'")
-        print(f"[ALERT] CURRENT USER is_tech_director: {is_tech_director}")
-        print(f"[ALERT] ROLE CHECK: '{member_role}' == 'Technical Director' ? {member_role == 'Technical Director'}")
-        print(f"[ALERT] USER CHECK: not is_tech_director ? {not is_tech_director}")
-        print(f"[ALERT] WEBHOOK TRIGGER CONDITION: {member_role == 'Technical Director' and not is_tech_director}")
-        print("-" * 60)
-        
-        app.logger.info(f"Member found: {member_name} (Role: {member_role}) - Webhook condition: {member_role == 'Technical Director' and not is_tech_director}")
-        
-        # Also check if Tech Director exists in database
-        try:
-            db_tech_directors = list(db.members.find({"role": "Technical Director"}))
-            print(f"[ALERT] TECH DIRECTORS IN DB: {len(db_tech_directors)}")
-            for td in db_tech_directors:
-                print(f"[ALERT]   - {td.get('name', 'NO_NAME')} (ID: {str(td.get('_id', 'NO_ID'))}, Role: '{td.get('role', 'NO_ROLE')}')")
-        except Exception as db_check_error:
-            print(f"[ALERT] DB CHECK ERROR: {db_check_error}")
-        
     except Exception as e:
-        app.logger.error(f"Member lookup error for {member_id_str}: {str(e)}")
+        app.logger.error(f"Database connection failed for ticket {ticket_id}: {str(e)}")
         return jsonify({
             'status': 'error',
-            'message': f'Error finding member: {str(e)}',
-            'error_code': 'MEMBER_LOOKUP_ERROR'
+            'message': 'Database connection failed',
+            'error_code': 'DB_CONNECTION_FAILED'
         }), 500
     
-    # Step 7: Handle Existing Assignments - FIXED TRANSACTION LOGIC
-    try:
-        existing_assignment = db.get_assignment_by_ticket(ticket_id)
-        app.logger.info(f"[DEBUG] EXISTING ASSIGNMENT CHECK - Ticket: {ticket_id}, Assignment: {existing_assignment}")
+    ticket = context['ticket']
+    members = context['members']
+    existing_assignment = context['assignment']
+    
+    # Technical Director can only forward tickets, not take them over
+    current_member = members.get(str(session['member_id']))
+    is_tech_director = current_member and current_member['role'] == 'Technical Director'
+    
+    if is_tech_director:
+        if not is_forwarded:
+            return jsonify({'status': 'error', 'message': 'Technical Director can only forward tickets, not take them over.'}), 403
         
-        if existing_assignment:
-            existing_member_id = str(existing_assignment.get('member_id'))
-            target_member_id_str = str(member_id_obj)
-            
-            app.logger.info(f"[INFO] ASSIGNMENT COMPARISON - Existing: {existing_member_id}, Target: {target_member_id_str}")
-            
-            # [FIX] Allow forwarding back to same user - only block if it's NOT a forward operation
-            is_forwarding_to_same_user = (str(existing_assignment['member_id']) == member_id_str)
-            is_forward_operation = data.get('is_forwarded', False)
-            
-            if is_forwarding_to_same_user and not is_forward_operation:
-                # Only block if trying to assign to same user AND it's not a forward operation
-                return jsonify({
-                    'status': 'error',
-                    'message': f'Ticket already assigned to {member["name"]}',
-                    'error_code': 'ALREADY_ASSIGNED'
-                }), 400
-            elif is_forwarding_to_same_user and is_forward_operation:
-                # Allow forwarding back to same user - this is valid
-                app.logger.info(f"[FORWARD] Allowing forward back to same user: {member['name']}")
-            
-            # Remove existing assignment for reassignment (including forward to same user)
-            result = db.ticket_assignments.delete_one({'ticket_id': ticket_id})
-            app.logger.info(f"Removed existing assignment: {result.deleted_count} records")
-        else:
-            app.logger.info(f"No existing assignment for ticket {ticket_id}")
-            
-    except Exception as e:
-        app.logger.error(f"Assignment check error for ticket {ticket_id}: {str(e)}")
+        # Ensure the ticket is referred to Technical Director
+        if ticket.get('status') != 'Referred to Tech Director':
+            return jsonify({'status': 'error', 'message': 'You can only forward tickets that have been referred to you.'}), 403
+    
+    # Step 5: Validate Member Exists
+    member = members.get(member_id_str)
+    if not member:
+        app.logger.error(f"Member not found: {member_id_str}")
         return jsonify({
             'status': 'error',
-            'message': f'Error checking existing assignments: {str(e)}',
-            'error_code': 'ASSIGNMENT_CHECK_ERROR'
-        }), 500
+            'message': f'Member not found: {member_id_str}',
+            'error_code': 'MEMBER_NOT_FOUND'
+        }), 404
+    app.logger.info(f"Member found: {member.get('name')} (Role: {member.get('role')}) - Webhook condition: {member.get('role') == 'Technical Director' and not is_tech_director}")
     
-    # Step 8: Handle Forwarding Logic
-    is_forwarded = data.get('is_forwarded', False)
-    forwarded_from = None
+    # Step 6: Existing Assignment - replaced atomically below, so no delete here
+    if existing_assignment:
+        # [FIX] Allow forwarding back to same user - only block if it's NOT a forward operation
+        is_forwarding_to_same_user = (str(existing_assignment['member_id']) == member_id_str)
+        if is_forwarding_to_same_user and not is_forwarded:
+            return jsonify({
+                'status': 'error',
+                'message': f'Ticket already assigned to {member["name"]}',
+                'error_code': 'ALREADY_ASSIGNED'
+            }), 400
+        elif is_forwarding_to_same_user:
+            app.logger.info(f"[FORWARD] Allowing forward back to same user: {member['name']}")
+    
+    # Optimistic concurrency: the version the client saw, else the one just read
+    try:
+        expected_version = int(data['version']) if data.get('version') is not None else \
+            (existing_assignment or {}).get('version', 0)
+    except (TypeError, ValueError):
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid assignment version: {data.get('version')}",
+            'error_code': 'INVALID_VERSION'
+        }), 400
     
+    # Step 7: Handle Forwarding Logic
+    forwarded_from = None
     if is_forwarded:
-        try:
-            # Try to get forwarded_from from request
-            forwarded_from_raw = data.get('forwarded_from')
-            if forwarded_from_raw and ObjectId.is_valid(str(forwarded_from_raw)):
-                forwarded_from = ObjectId(str(forwarded_from_raw))
-                # Verify the forwarded_from member exists and log their role
-                forwarded_member = db.get_member_by_id(forwarded_from)
-                if forwarded_member:
-                    app.logger.info(f"Using provided forwarded_from: {forwarded_from} ({forwarded_member.get('name')} - {forwarded_member.get('role')})")
-                else:
-                    app.logger.warning(f"Provided forwarded_from ID {forwarded_from} does not exist, using session user")
-                    forwarded_from = ObjectId(session['member_id']) if session.get('member_id') else None
-            
+        if forwarded_from_raw and str(forwarded_from_raw) in members:
+            forwarded_from = ObjectId(str(forwarded_from_raw))
+        else:
+            if forwarded_from_raw:
+                app.logger.warning(f"Provided forwarded_from ID {forwarded_from_raw} does not exist, using session user")
             # Fallback to current session user
-            elif session.get('member_id') and ObjectId.is_valid(session['member_id']):
-                forwarded_from = ObjectId(session['member_id'])
-                # Log the session user's role for clarity
-                session_member = db.get_member_by_id(forwarded_from)
-                if session_member:
-                    app.logger.info(f"Using session user as forwarded_from: {forwarded_from} ({session_member.get('name')} - {session_member.get('role')})")
-                else:
-                    app.logger.warning(f"Session member {forwarded_from} not found!")
-            
-            app.logger.info(f"Final forwarded_from value: {forwarded_from}")
-            
-        except Exception as e:
-            app.logger.warning(f"Forwarding logic error (non-critical): {str(e)}")
-            forwarded_from = None
+            forwarded_from = ObjectId(session['member_id']) if ObjectId.is_valid(session.get('member_id', '')) else None
+        app.logger.info(f"Final forwarded_from value: {forwarded_from}")
 
-    # Step 9: Create New Assignment
+    # Step 8: Create New Assignment
     try:
         assignment_data = {
             'ticket_id': ticket_id,
@@ -6502,30 +6209,17 @@ def assign_ticket(ticket_id):
             'assigned_by': ObjectId(session['member_id']) if ObjectId.is_valid(session.get('member_id', '')) else None
         }
         
-        app.logger.info(f"[ASSIGNMENT] Creating assignment with data: ticket_id={ticket_id}, member_id={member_id_obj} (type: {type(member_id_obj).__name__}), is_forwarded={is_forwarded}")
-        app.logger.info(f"[ASSIGNMENT] Full assignment_data: {assignment_data}")
-        
-        # CRITICAL DEBUG: Check if the member actually exists
-        test_member = db.get_member_by_id(str(member_id_obj))
-        app.logger.info(f"[ASSIGNMENT] Member verification: member_id={member_id_obj}, exists={test_member is not None}, name={test_member.get('name') if test_member else 'NOT_FOUND'}")
-        
-        assignment_id = db.assign_ticket(assignment_data)
-        app.logger.info(f"[SUCCESS] Assignment created with ID: {assignment_id}")
-        
-        # IMMEDIATE VERIFICATION: Check if assignment can be retrieved AND if member lookup works
         try:
-            verification_check = db.get_assignment_by_ticket(ticket_id)
-            if verification_check:
-                app.logger.info(f"[VERIFY] Assignment immediately retrievable: {verification_check.get('_id')}")
-                # Test the exact same lookup that dashboard uses
-                stored_member_id = verification_check.get('member_id')
-                app.logger.info(f"[VERIFY] Stored member_id: {stored_member_id} (type: {type(stored_member_id).__name__})")
-                lookup_member = db.get_member_by_id(str(stored_member_id))
-                app.logger.info(f"[VERIFY] Member lookup result: {lookup_member.get('name') if lookup_member else 'LOOKUP_FAILED'}")
-            else:
-                app.logger.error(f"[VERIFY] WARNING: Assignment not immediately retrievable after creation!")
-        except Exception as verify_error:
-            app.logger.error(f"[VERIFY] Error checking assignment: {verify_error}")
+            assignment = db.assign_ticket(assignment_data, expected_version=expected_version)
+        except AssignmentConflictError as e:
+            app.logger.warning(f"Assignment conflict for ticket {ticket_id}: {e}")
+            return jsonify({
+                'status': 'error',
+                'message': 'This ticket was reassigned by someone else. Please refresh and try again.',
+                'error_code': 'ASSIGNMENT_CONFLICT'
+            }), 409
+        assignment_id = assignment['_id']
+        app.logger.info(f"[SUCCESS] Assignment stored with ID: {assignment_id} (version {assignment['version']})")
         
         # [NEW] COMPREHENSIVE DEBUG LOGGING BEFORE WEBHOOK LOGIC
         app.logger.info(f"[DEBUG] WEBHOOK TRIGGER ANALYSIS - Ticket: {ticket_id}")
@@ -6561,8 +6255,6 @@ def assign_ticket(ticket_id):
             app.logger.info(f"[SUCCESS] Updated ticket {ticket_id} status to 'Referred to Tech Director'")
             
             # [LAUNCH] TRIGGER ASYNC WEBHOOK - Real-time behavior for assignments
-            # Get ticket data for reminder
-            ticket = db.get_ticket_by_id(ticket_id)
             
             # 🚨 TEMPORARILY DISABLED: Tech Director webhook causing automatic replies
             # webhook_queued = trigger_tech_director_webhook_async(ticket_id, ticket, 'assignment', session.get('member_name', 'Support Team'))
@@ -6650,6 +6342,7 @@ def assign_ticket(ticket_id):
 
             'message': success_message,
             'assignment_id': str(assignment_id),
+            'version': assignment['version'],
             'action': action_type
         }), 200
         
@@ -6784,8 +6477,8 @@ def ticket_detail(ticket_id):
                     # Mark as read only if viewing the ticket page (not just passing through)
                     db.update_ticket(ticket_id, {'has_unread_reply': False})
         
-        # Get ticket with assignment info
-        ticket = db.get_ticket_by_id(ticket_id)
+        # Get ticket with assignment info (the page embeds attachment data for forwarding)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
 
         # Debug: Check for ticket ID consistency
         if ticket:
@@ -6998,20 +6691,16 @@ def ticket_detail(ticket_id):
         clean_under_warranty = None
         outcome_notes = None
         
-        # Get metadata for this ticket
-        metadata = db.get_ticket_metadata(ticket_id)
+        # Get metadata for this ticket (one document; attachment metadata is already parsed)
+        metadata = db.get_ticket_metadata_fields(ticket_id)
         
         # Process metadata attachments for manually created tickets
         metadata_attachments = []
         app.logger.info(f"DEBUG: Processing metadata for ticket {ticket_id} - Found {len(metadata)} metadata entries")
         
-        for meta in metadata:
-            app.logger.info(f"DEBUG: Processing metadata key: {meta.get('key')}")
-            if meta.get('key', '').startswith('attachment_'):
-                app.logger.info(f"DEBUG: Found attachment metadata: {meta.get('key')} = {meta.get('value')}")
+        for meta_key, attachment_data in metadata.items():
+            if meta_key.startswith('attachment_'):
                 try:
-                    attachment_data = json.loads(meta.get('value', '{}'))
-                    app.logger.info(f"DEBUG: Parsed attachment data: {attachment_data}")
                     if attachment_data and isinstance(attachment_data, dict):
                         # FIXED: Convert metadata attachment to standard attachment format with base64 data
                         metadata_attachments.append({
@@ -7027,11 +6716,9 @@ def ticket_detail(ticket_id):
                         app.logger.info(f"SUCCESS: Added metadata attachment: {attachment_data.get('original_name', 'Unknown')} (base64: {len(attachment_data.get('data', ''))} chars)")
                     else:
                         app.logger.warning(f"WARNING: Attachment data is empty or not a dict: {attachment_data}")
-                except (json.JSONDecodeError, TypeError) as e:
-                    app.logger.warning(f"ERROR: Failed to parse attachment metadata for {meta.get('key')}: {e}")
+                except (AttributeError, TypeError) as e:
+                    app.logger.warning(f"ERROR: Failed to read attachment metadata for {meta_key}: {e}")
                     continue
-            else:
-                app.logger.info(f"DEBUG: Non-attachment metadata: {meta.get('key')} = {meta.get('value')}")
         
         # Process main ticket document attachments (for manual tickets)
         ticket_attachments = []
@@ -7099,10 +6786,7 @@ def ticket_detail(ticket_id):
             app.logger.info(f"DEBUG: Ticket document attachment {i}: {att}")
             
         metadata_dict = {}
-        for item in metadata:
-            key = item['key']
-            value = item['value']
-            
+        for key, value in metadata.items():
             if key == 'vehicle_registration':
                 vehicle_registration = value
             elif key == 'service_date':
@@ -7554,26 +7238,14 @@ def send_reply(ticket_id):
         if len(response_text) > 10000:  # Reasonable limit
             return jsonify({'status': 'error', 'message': 'Response text too long'}), 400
 
-        # ANTI-SPAM: Check for duplicate submissions within last 5 seconds
+        # ANTI-SPAM: Check for duplicate submissions within last 5 seconds (across all workers)
         member_id = session['member_id']
-        current_time = datetime.now()
         cache_key = f"reply_spam_{ticket_id}_{member_id}_{response_text[:50]}"
         
-        # Simple in-memory cache for spam prevention
-        if not hasattr(app, '_reply_cache'):
-            app._reply_cache = {}
-        
-        # Clean old entries (older than 5 seconds)
-        app._reply_cache = {k: v for k, v in app._reply_cache.items() 
-                           if (current_time - v).total_seconds() < 5}
-        
-        if cache_key in app._reply_cache:
+        if not throttle.claim(cache_key, 5):
             app.logger.warning(f"🚫 SPAM BLOCKED - Duplicate reply attempt for ticket {ticket_id} by member {member_id}")
             return jsonify({'status': 'error', 'message': 'Duplicate submission detected. Please wait before sending again.'}), 429
         
-        # Record this submission to prevent duplicates
-        app._reply_cache[cache_key] = current_time
-        
         app.logger.info(f" PROCESSING REPLY - Ticket: {ticket_id}, Member: {member_id}, Text: {response_text[:30]}...")
 
         db = get_db()
@@ -7760,10 +7432,7 @@ def send_reply(ticket_id):
             for i, att in enumerate(attachments):
                 app.logger.info(f"📎 Attachment {i+1}: {att.get('name', 'Unknown')} - Type: {att.get('type', 'file')}")
             
-            result = db.replies.update_one(
-                {'_id': reply_id},
-                {'$set': {'attachments': attachments}}
-            )
+            result = db.set_reply_attachments(reply_id, attachments)
             app.logger.info(f"📎 Database update result: {result.modified_count} modified")
         else:
             app.logger.info("📎 No attachments to save to reply")
@@ -8017,9 +7686,11 @@ def update_ticket_technician(ticket_id):
             # Update ticket metadata with technician information
             try:
                 app.logger.info(f"💾 Setting metadata for ticket {ticket_id}: technician_id={technician_id}, technician_name={technician['name']}")
-                result1 = db.set_ticket_metadata(ticket_id, 'technician_id', technician_id)
-                result2 = db.set_ticket_metadata(ticket_id, 'technician_name', technician['name'])
-                app.logger.info(f" Metadata set results: technician_id={result1}, technician={result2}")
+                result = db.set_ticket_metadata_many(ticket_id, {
+                    'technician_id': technician_id,
+                    'technician_name': technician['name']
+                })
+                app.logger.info(f" Metadata set result: {result}")
                 
                 # Verify the metadata was saved by retrieving it
                 verification_metadata = db.get_ticket_metadata(ticket_id)
@@ -8084,16 +7755,14 @@ def get_all_technician_assignments():
     try:
         db = get_db()
         
-        # Get all technician metadata from database
-        all_metadata = list(db.ticket_metadata.find({"key": {"$in": ["technician_id", "technician_name"]}}))
-        
-        # Group by ticket_id
-        assignments = {}
-        for meta in all_metadata:
-            ticket_id = meta.get('ticket_id')
-            if ticket_id not in assignments:
-                assignments[ticket_id] = {}
-            assignments[ticket_id][meta.get('key')] = meta.get('value')
+        # Technician metadata is denormalized onto each ticket, grouped here by ticket_id
+        assignments = {
+            ticket['ticket_id']: {key: ticket[key] for key in ('technician_id', 'technician_name') if key in ticket}
+            for ticket in db.tickets.find(
+                {"$or": [{"technician_id": {"$exists": True}}, {"technician_name": {"$exists": True}}]},
+                {"_id": 0, "ticket_id": 1, "technician_id": 1, "technician_name": 1}
+            )
+        }
         
         # Get ticket details for each assignment
         result = []
@@ -8554,13 +8223,24 @@ def download_common_document(document_id):
         db = get_db()
         
         # First, let's check if the document exists at all
-        document_exists = db.get_common_document_by_id(document_id)
+        document_exists = db.get_common_document_by_id(document_id, hydrate_blobs=False)
         if not document_exists:
             app.logger.error(f"Document {document_id} not found in database")
             return jsonify({'status': 'error', 'message': 'Document not found'}), 404
         
         app.logger.info(f"Document found: {document_exists.get('name', 'Unknown')}")
         
+        # Documents moved to GridFS are streamed straight from the attachment store
+        if document_exists.get('gridfs_id'):
+            response = send_stored_attachment(
+                document_exists['gridfs_id'],
+                document_exists.get('file_name', 'document'),
+                mimetype=document_exists.get('file_type')
+            )
+            if response is not None:
+                db.increment_document_download_count(document_id)
+                return response
+        
         # 🚀 ENHANCED: Get file content using priority-based retrieval (like tickets)
         file_data = db.get_document_file_content(document_id)
         
@@ -9317,15 +8997,13 @@ def update_ticket_outcome(ticket_id):
             {'key': 'outcome_notes', 'value': outcome_notes}
         ]
         
+        # Set the non-empty values in one write and remove the cleared ones
+        db.set_ticket_metadata_many(ticket_id, {
+            metadata['key']: metadata['value'] for metadata in outcome_metadata if metadata['value']
+        })
         for metadata in outcome_metadata:
-            # Remove existing entry
-            db.ticket_metadata.delete_many({
-                'ticket_id': ticket_id,
-                'key': metadata['key']
-            })
-            # Add updated entry if value is not empty
-            if metadata['value']:
-                db.add_ticket_metadata(ticket_id, metadata['key'], metadata['value'])
+            if not metadata['value']:
+                db.delete_ticket_metadata(ticket_id, metadata['key'])
         
         # Update ticket timestamp
         db.update_ticket(ticket_id, {'updated_at': datetime.now()})
@@ -9689,6 +9367,78 @@ def reset_creation_methods():
         app.logger.error(f"Error resetting creation methods: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/admin/attachment-store-stats')
+def attachment_store_stats():
+    """Unique attachment bytes stored versus bytes referenced by tickets, replies and documents"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        db = get_db()
+        return jsonify({'status': 'success', 'stats': db.attachment_store.dedup_stats()})
+        
+    except Exception as e:
+        app.logger.error(f"Error getting attachment store stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/schema-migrations', methods=['GET', 'POST'])
+def schema_migrations():
+    """List schema migrations (GET) or apply the pending ones (POST) - same as `python migrate.py`"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    if request.method == 'POST' and session.get('member_role', '') != 'Administrator':
+        return jsonify({'status': 'error', 'message': 'Administrator access required'}), 403
+    
+    try:
+        runner = MigrationRunner(get_db())
+        
+        if request.method == 'GET':
+            return jsonify({'status': 'success', 'migrations': runner.status()})
+        
+        applied = runner.run()
+        return jsonify({
+            'status': 'success',
+            'message': f'Applied {len(applied)} migrations',
+            'applied': applied
+        })
+        
+    except MigrationError as e:
+        app.logger.error(f"Schema migration failed: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    except Exception as e:
+        app.logger.error(f"Error running schema migrations: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/db-pool', methods=['GET'])
+def db_pool_stats():
+    """MongoDB connection pool size, checkouts and wait times for this worker process"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({'status': 'success', 'pool': connections.stats()})
+    except Exception as e:
+        app.logger.error(f"Error reading connection pool stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/request-cache', methods=['GET'])
+def request_cache_stats():
+    """Fetches saved by the request identity map, the reference data cache and the read cache in this worker process"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({
+            'status': 'success',
+            'identity_map': request_cache.totals.snapshot(),
+            'reference_cache': get_db().reference_cache.stats(),
+            'read_cache': read_cache.stats()
+        })
+    except Exception as e:
+        app.logger.error(f"Error reading request cache stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/status')
 def status_dashboard():
     """Dedicated status dashboard page"""
@@ -9704,6 +9454,7 @@ def status_dashboard():
         status_filter = request.args.get('status', 'All')
         priority_filter = request.args.get('priority', 'All')
         search_query = request.args.get('search', '')
+        after = request.args.get('after')
         
         # Get paginated tickets with assignment info
         tickets = db.get_tickets_with_assignments(
@@ -9711,11 +9462,16 @@ def status_dashboard():
             per_page=per_page, 
             status_filter=status_filter,
             priority_filter=priority_filter,
-            search_query=search_query
+            search_query=search_query,
+            after=after
         )
         
+        # Keyset token for the following page (links pass it as ?after= so deep pages skip nothing)
+        next_cursor = encode_ticket_cursor(tickets[-1]) if len(tickets) == per_page else None
+        
         # Get total count for pagination
-        total_tickets = db.get_tickets_count(
+        total_tickets = cached_tickets_count(
+            db,
             status_filter=status_filter,
             priority_filter=priority_filter,
             search_query=search_query
@@ -9819,6 +9575,7 @@ def status_dashboard():
             'has_next': has_next,
             'prev_page': prev_page,
             'next_page': next_page,
+            'next_cursor': next_cursor,
             'status_filter': status_filter,
             'priority_filter': priority_filter,
             'search_query': search_query
@@ -10172,6 +9929,7 @@ def live_dashboard():
         status_filter = request.args.get('status', 'All')
         priority_filter = request.args.get('priority', 'All')
         search_query = request.args.get('search', '')
+        after = request.args.get('after')
         
         # Get paginated tickets with assignment info
         try:
@@ -10180,7 +9938,8 @@ def live_dashboard():
                 per_page=per_page, 
                 status_filter=status_filter,
                 priority_filter=priority_filter,
-                search_query=search_query
+                search_query=search_query,
+                after=after
             )
             if not tickets:
                 app.logger.warning("No tickets found in database")
@@ -10189,9 +9948,13 @@ def live_dashboard():
             app.logger.error(f"Error getting tickets: {e}")
             tickets = []
         
+        # Keyset token for the following page (links pass it as ?after= so deep pages skip nothing)
+        next_cursor = encode_ticket_cursor(tickets[-1]) if len(tickets) == per_page else None
+        
         # Get total count for pagination
         try:
-            total_tickets = db.get_tickets_count(
+            total_tickets = cached_tickets_count(
+                db,
                 status_filter=status_filter,
                 priority_filter=priority_filter,
                 search_query=search_query
@@ -10230,16 +9993,8 @@ def live_dashboard():
                 ticket_dict['assigned_at'] = ''
                 ticket_dict['is_forwarded'] = False
             
-            # Get vehicle registration from metadata
-            try:
-                metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-                for meta in metadata:
-                    if meta['key'] == 'vehicle_registration':
-                        ticket_dict['vehicle_registration'] = meta['value']
-                        break
-            except Exception as e:
-                app.logger.warning(f"Error getting metadata for ticket {ticket_dict.get('ticket_id')}: {e}")
-                ticket_dict['vehicle_registration'] = ''
+            # Vehicle registration is denormalized onto the ticket document
+            ticket_dict.setdefault('vehicle_registration', '')
             
             # Set default values for missing fields that template expects
             ticket_dict.setdefault('has_warranty', False)
@@ -10264,73 +10019,19 @@ def live_dashboard():
             
             all_tickets.append(ticket_dict)
         
-        # 1. Ticket Status Breakdown (Live Count)
-        status_counts = {}
-        for ticket in all_tickets:
-            status = ticket.get('status', 'Unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        # 2. Outstanding Claims (Aged Tickets)
-        now = datetime.now()
-        overdue_tickets = []
-        open_1_3_days = []
-        open_today = []
-        
-        for ticket in all_tickets:
-            # Handle both datetime objects (from MongoDB) and string dates
-            if isinstance(ticket['created_at'], datetime):
-                created_at = ticket['created_at']
-            else:
-                try:
-                    created_at = datetime.strptime(str(ticket['created_at']), "%Y-%m-%d %H:%M:%S")
-                except:
-                    continue  # Skip tickets with invalid dates
-            
-            days_open = (now - created_at).days
-            
-            if days_open > 3:
-                overdue_tickets.append(ticket)
-            elif 1 <= days_open <= 3:
-                open_1_3_days.append(ticket)
-            elif days_open == 0:
-                open_today.append(ticket)
-        
-        # 3. Average Resolution Time
-        resolved_tickets = [t for t in all_tickets if t['status'] == 'Resolved' or t['status'] == 'Closed']
-        total_resolution_time = 0
-        for ticket in resolved_tickets:
-            try:
-                # Handle both datetime objects (from MongoDB) and string dates
-                if isinstance(ticket['created_at'], datetime):
-                    created_at = ticket['created_at']
-                else:
-                    created_at = datetime.strptime(str(ticket['created_at']), "%Y-%m-%d %H:%M:%S")
-                
-                if isinstance(ticket['updated_at'], datetime):
-                    updated_at = ticket['updated_at']
-                else:
-                    updated_at = datetime.strptime(str(ticket['updated_at']), "%Y-%m-%d %H:%M:%S")
-                
-                resolution_time = (updated_at - created_at).total_seconds() / 3600  # in hours
-                total_resolution_time += resolution_time
-            except:
-                continue  # Skip tickets with invalid dates
-        
-        avg_resolution_time = 0
-        if resolved_tickets:
-            avg_resolution_time = total_resolution_time / len(resolved_tickets)
-        
-        # 4. Claim Outcomes Summary
-        total_claims = len(all_tickets)
-        approved_claims = len([t for t in all_tickets if t['status'] == 'Approved - Revisit Booked'])
-        declined_claims = len([t for t in all_tickets if t['status'] == 'Declined - Not Covered'])
-        referred_claims = len([t for t in all_tickets if t['status'] == 'Referred to Tech Director'])
-        
-        approved_percent = (approved_claims / total_claims * 100) if total_claims > 0 else 0
-        declined_percent = (declined_claims / total_claims * 100) if total_claims > 0 else 0
-        referred_percent = (referred_claims / total_claims * 100) if total_claims > 0 else 0
+        # 1-4. Status breakdown, aged claims, resolution time and claim outcomes, computed by MongoDB
+        kpis = cached_dashboard_kpis(db)
+        status_counts = kpis['status_counts']
+        outstanding_claims = kpis['outstanding_claims']
+        avg_resolution_time = kpis['resolution_metrics']['avg_resolution_time']
+        claim_outcomes = kpis['claim_outcomes']
+        total_claims = kpis['total_tickets']
         
         # 5. Advisory-Related Rejections
+        declined_ticket_ids = kpis['declined_ticket_ids']
+        metadata_by_ticket = db.get_metadata_for_tickets(
+            declined_ticket_ids, keys=['advisories_followed', 'new_fault_codes', 'within_warranty']
+        )
         # Get rejection reasons from metadata
         rejection_reasons = {
             'uncompleted_advisories': 0,
@@ -10338,18 +10039,15 @@ def live_dashboard():
             'warranty_expired': 0
         }
         
-        for ticket in all_tickets:
-            if ticket.get('status') == 'Declined - Not Covered':
-                # Check metadata for rejection reasons
-                metadata = db.get_ticket_metadata(ticket['ticket_id'])
-                
-                for meta in metadata:
-                    if meta['key'] == 'advisories_followed' and meta['value'] == '0':
-                        rejection_reasons['uncompleted_advisories'] += 1
-                    elif meta['key'] == 'new_fault_codes' and meta['value'] == '0':
-                        rejection_reasons['no_fault_code'] += 1
-                    elif meta['key'] == 'within_warranty' and meta['value'] == '0':
-                        rejection_reasons['warranty_expired'] += 1
+        for ticket_id in declined_ticket_ids:
+            # Check metadata for rejection reasons
+            for meta in metadata_by_ticket.get(ticket_id, []):
+                if meta['key'] == 'advisories_followed' and meta['value'] == '0':
+                    rejection_reasons['uncompleted_advisories'] += 1
+                elif meta['key'] == 'new_fault_codes' and meta['value'] == '0':
+                    rejection_reasons['no_fault_code'] += 1
+                elif meta['key'] == 'within_warranty' and meta['value'] == '0':
+                    rejection_reasons['warranty_expired'] += 1
         
         # 6. Team Performance
         team_performance = {}
@@ -10418,6 +10116,7 @@ def live_dashboard():
             'has_next': has_next,
             'prev_page': prev_page,
             'next_page': next_page,
+            'next_cursor': next_cursor,
             'status_filter': status_filter,
             'priority_filter': priority_filter,
             'search_query': search_query
@@ -10425,17 +10124,16 @@ def live_dashboard():
         
         return render_template('dashboard.html',
                             status_counts=status_counts,
-                            overdue_tickets=overdue_tickets,
-                            open_1_3_days=open_1_3_days,
-                            open_today=open_today,
+                            outstanding_claims=outstanding_claims,
+                            overdue_tickets=outstanding_claims['overdue_tickets'],
                             avg_resolution_time=avg_resolution_time,
                             total_claims=total_claims,
-                            approved_claims=approved_claims,
-                            declined_claims=declined_claims,
-                            referred_claims=referred_claims,
-                            approved_percent=approved_percent,
-                            declined_percent=declined_percent,
-                            referred_percent=referred_percent,
+                            approved_claims=claim_outcomes['approved'],
+                            declined_claims=claim_outcomes['declined'],
+                            referred_claims=claim_outcomes['referred'],
+                            approved_percent=claim_outcomes['approved_percent'],
+                            declined_percent=claim_outcomes['declined_percent'],
+                            referred_percent=claim_outcomes['referred_percent'],
                             rejection_reasons=rejection_reasons,
                             team_performance=team_performance,
                             all_tickets=all_tickets,
@@ -10482,13 +10180,8 @@ def export_csv():
                 ticket_dict['assigned_at'] = ''
                 ticket_dict['is_forwarded'] = False
             
-            # Get vehicle registration from metadata
-            ticket_dict['vehicle_registration'] = ''
-            metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-            for meta in metadata:
-                if meta['key'] == 'vehicle_registration':
-                    ticket_dict['vehicle_registration'] = meta['value']
-                    break
+            # Vehicle registration is denormalized onto the ticket document
+            ticket_dict.setdefault('vehicle_registration', '')
             
             all_tickets.append(ticket_dict)
         
@@ -10572,13 +10265,8 @@ def export_pdf():
                 ticket_dict['assigned_to_gender'] = ''
                 ticket_dict['assigned_at'] = ''
             
-            # Get vehicle registration from metadata
-            ticket_dict['vehicle_registration'] = ''
-            metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-            for meta in metadata:
-                if meta['key'] == 'vehicle_registration':
-                    ticket_dict['vehicle_registration'] = meta['value']
-                    break
+            # Vehicle registration is denormalized onto the ticket document
+            ticket_dict.setdefault('vehicle_registration', '')
             
             all_tickets.append(ticket_dict)
         
@@ -10800,373 +10488,52 @@ def dashboard_data():
             start_date = None
             end_date = None
         
-        # Get all tickets with assignment info with error handling
+        # Every KPI is computed in one aggregation over the date-filtered tickets
         try:
-            app.logger.info("API: Attempting to get tickets with assignments")
-            tickets = db.get_tickets_with_assignments()
-            if not tickets:
-                app.logger.warning("API: No tickets found in database")
-                tickets = []
-            else:
-                app.logger.info(f"API: Successfully retrieved {len(tickets)} tickets with assignments")
+            kpis = cached_dashboard_kpis(db, start_date, end_date)
         except Exception as e:
-            app.logger.error(f"API: Failed to get tickets with assignments: {e}")
-            # Fallback to simple ticket fetch
-            try:
-                app.logger.info("API: Attempting fallback ticket fetch")
-                tickets = list(db.tickets.find().sort([("created_at", -1)]))
-                app.logger.info(f"API: Fallback ticket fetch returned {len(tickets)} tickets")
-            except Exception as fallback_error:
-                app.logger.error(f"API: Fallback ticket fetch also failed: {fallback_error}")
-                # Return empty response instead of crashing
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Database temporarily unavailable. Please try again later.',
-                    'data': {
-                        'total_tickets': 0,
-                        'status_counts': {},
-                        'priority_counts': {},
-                        'classification_counts': {},
-                        'outstanding_claims': {'overdue': 0, 'open_1_3_days': 0, 'open_today': 0, 'overdue_tickets': []},
-                        'resolution_metrics': {'avg_resolution_time': 0, 'resolved_count': 0},
-                        'claim_outcomes': {'approved': 0, 'declined': 0, 'referred': 0, 'warranty_received': 0, 'approved_percent': 0, 'declined_percent': 0, 'referred_percent': 0},
-                        'date_range': {'start_date': start_date_str, 'end_date': end_date_str, 'filtered': False}
-                    }
-                }), 503
-        
-        # Convert to dict format and apply date filtering
-        app.logger.info(f"API: Processing {len(tickets)} tickets")
-        all_tickets = []
-        for ticket in tickets:
-            ticket_dict = dict(ticket)
-            
-            # Convert ObjectId to string
-            ticket_dict['_id'] = str(ticket_dict['_id'])
-            
-            # Convert any other ObjectId fields that might cause JSON serialization issues
-            if 'member_id' in ticket_dict and hasattr(ticket_dict['member_id'], '__class__') and ticket_dict['member_id'].__class__.__name__ == 'ObjectId':
-                ticket_dict['member_id'] = str(ticket_dict['member_id'])
-            
-            # Handle assignment ObjectIds
-            if 'assignment' in ticket_dict and isinstance(ticket_dict['assignment'], list):
-                for assignment in ticket_dict['assignment']:
-                    if isinstance(assignment, dict):
-                        if 'member_id' in assignment and hasattr(assignment['member_id'], '__class__') and assignment['member_id'].__class__.__name__ == 'ObjectId':
-                            assignment['member_id'] = str(assignment['member_id'])
-                        if 'forwarded_from' in assignment and hasattr(assignment['forwarded_from'], '__class__') and assignment['forwarded_from'].__class__.__name__ == 'ObjectId':
-                            assignment['forwarded_from'] = str(assignment['forwarded_from'])
-            
-            # Handle assigned_member ObjectIds
-            if 'assigned_member' in ticket_dict and isinstance(ticket_dict['assigned_member'], list):
-                for member in ticket_dict['assigned_member']:
-                    if isinstance(member, dict) and '_id' in member and hasattr(member['_id'], '__class__') and member['_id'].__class__.__name__ == 'ObjectId':
-                        member['_id'] = str(member['_id'])
-            
-            # Handle forwarded_from_member ObjectIds
-            if 'forwarded_from_member' in ticket_dict and isinstance(ticket_dict['forwarded_from_member'], list):
-                for member in ticket_dict['forwarded_from_member']:
-                    if isinstance(member, dict) and '_id' in member and hasattr(member['_id'], '__class__') and member['_id'].__class__.__name__ == 'ObjectId':
-                        member['_id'] = str(member['_id'])
-            
-            # Handle assignment info
-            if ticket_dict.get('assignment') and len(ticket_dict['assignment']) > 0:
-                assignment = ticket_dict['assignment'][0]
-                if ticket_dict.get('assigned_member') and len(ticket_dict['assigned_member']) > 0:
-                    member = ticket_dict['assigned_member'][0]
-                    ticket_dict['assigned_to'] = member.get('name', 'Unassigned')
-                    ticket_dict['assigned_to_gender'] = member.get('gender', '')
-                else:
-                    ticket_dict['assigned_to'] = 'Unassigned'
-                    ticket_dict['assigned_to_gender'] = ''
-                ticket_dict['assigned_at'] = assignment.get('assigned_at', '')
-                ticket_dict['is_forwarded'] = assignment.get('is_forwarded', False)
-                
-                # Handle forwarded from member info
-                if ticket_dict['is_forwarded'] and ticket_dict.get('forwarded_from_member') and len(ticket_dict['forwarded_from_member']) > 0:
-                    forwarded_member = ticket_dict['forwarded_from_member'][0]
-                    ticket_dict['forwarded_from_name'] = forwarded_member.get('name')
-            else:
-                ticket_dict['assigned_to'] = 'Unassigned'
-                ticket_dict['assigned_to_gender'] = ''
-                ticket_dict['assigned_at'] = ''
-                ticket_dict['is_forwarded'] = False
-            
-            # Get vehicle registration from metadata
-            try:
-                metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-                for meta in metadata:
-                    if meta['key'] == 'vehicle_registration':
-                        ticket_dict['vehicle_registration'] = meta['value']
-                        break
-            except Exception as e:
-                app.logger.warning(f"Error getting metadata for API ticket {ticket_dict.get('ticket_id')}: {e}")
-                ticket_dict['vehicle_registration'] = ''
-            
-            # Set default values for missing fields that template expects
-            ticket_dict.setdefault('has_warranty', False)
-            ticket_dict.setdefault('has_attachments', False)
-            ticket_dict.setdefault('attachments', [])
-            ticket_dict.setdefault('priority', 'Medium')
-            ticket_dict.setdefault('classification', 'General')
-            ticket_dict.setdefault('subject', ticket_dict.get('body', '')[:100] if ticket_dict.get('body') else 'No Subject')
-            ticket_dict.setdefault('body', 'No description available')
-            ticket_dict.setdefault('warranty_forms_count', 0)
-            ticket_dict.setdefault('creation_method', 'auto-detect')
-            ticket_dict.setdefault('thread_id', None)
-            ticket_dict.setdefault('email', None)
-            
-            # Check if ticket has attachments
-            if ticket_dict.get('attachments') and len(ticket_dict['attachments']) > 0:
-                ticket_dict['has_attachments'] = True
-            
-            # Check if ticket has warranty (basic check)
-            if ticket_dict.get('classification') == 'Warranty Claim':
-                ticket_dict['has_warranty'] = True
-            
-            # Parse created_at for filtering
-            if 'created_at' in ticket_dict and ticket_dict['created_at']:
-                if isinstance(ticket_dict['created_at'], datetime):
-                    created_at = ticket_dict['created_at']
-                else:
-                    try:
-                        created_at = datetime.strptime(str(ticket_dict['created_at']), "%Y-%m-%d %H:%M:%S")
-                    except:
-                        continue  # Skip tickets with invalid dates
-                
-                # Apply date filtering
-                if start_date and created_at < start_date:
-                    continue
-                if end_date and created_at > end_date:
-                    continue
-                
-                ticket_dict['formatted_date'] = created_at.strftime("%b %d, %I:%M %p")
-                ticket_dict['created_at_dt'] = created_at
-            
-            all_tickets.append(ticket_dict)
-        
-        #  DYNAMIC WARRANTY CLASSIFICATION: Update classification for tickets with warranty attachments
-        for ticket_dict in all_tickets:
-            ticket_id = ticket_dict.get('ticket_id')
-            if ticket_id:
-                try:
-                    # Check if ticket has warranty attachments
-                    metadata = db.get_ticket_metadata(ticket_id)
-                    has_warranty_attachment = False
-                    
-                    if metadata:
-                        for meta in metadata:
-                            try:
-                                # Ensure meta is a dictionary
-                                if not isinstance(meta, dict):
-                                    continue
-                                
-                                meta_value = meta.get('value')
-                                if isinstance(meta_value, str):
-                                    # Handle potential malformed JSON
-                                    if meta_value.strip() and meta_value.strip() not in ['{}', '']:
-                                        try:
-                                            # Clean JSON before parsing
-                                            clean_json = meta_value.strip()
-                                            # Remove trailing commas and fix common JSON issues
-                                            if clean_json.endswith(',}'):
-                                                clean_json = clean_json[:-2] + '}'
-                                            elif clean_json.endswith(',]'):
-                                                clean_json = clean_json[:-2] + ']'
-                                            # Remove any leading/trailing whitespace and quotes
-                                            clean_json = clean_json.strip().strip('"\'')
-                                            # Skip if still empty after cleaning
-                                            if not clean_json or clean_json in ['{}', '[]', 'null', 'undefined']:
-                                                meta_data = {}
-                                            else:
-                                                meta_data = json.loads(clean_json)
-                                        except json.JSONDecodeError as json_err:
-                                            # Only log if it's actually malformed, not just empty
-                                            if meta_value.strip() and meta_value.strip() not in ['{}', '[]', 'null', 'undefined', '']:
-                                                app.logger.debug(f"Skipping malformed JSON in API metadata: {json_err} - Value: {meta_value[:50]}")
-                                            meta_data = {}
-                                    else:
-                                        meta_data = {}
-                                elif isinstance(meta_value, dict):
-                                    meta_data = meta_value
-                                else:
-                                    meta_data = {}
-                                
-                                # Check if this attachment is warranty-related
-                                if isinstance(meta_data, dict):
-                                    is_warranty = meta_data.get('is_warranty', False)
-                                    if is_warranty:
-                                        has_warranty_attachment = True
-                                        break
-                            except (json.JSONDecodeError, TypeError, AttributeError) as e:
-                                app.logger.warning(f"Error processing API metadata for ticket {ticket_id}: {e}")
-                                continue
-                    
-                    # Also check direct has_warranty flag on ticket
-                    has_warranty_flag = ticket_dict.get('has_warranty', False)
-                    
-                    # If ticket has warranty attachments or warranty flag, ensure classification is "Warranty Claim"
-                    if has_warranty_attachment or has_warranty_flag:
-                        original_classification = ticket_dict.get('classification')
-                        ticket_dict['classification'] = 'Warranty Claim'
-                        
-                        if original_classification != 'Warranty Claim':
-                            app.logger.info(f" API DASHBOARD WARRANTY CLASSIFICATION: Ticket {ticket_id} updated from '{original_classification}' to 'Warranty Claim'")
-                
-                except Exception as e:
-                    app.logger.error(f"Error checking warranty status for API ticket {ticket_id}: {e}")
-        
-        # Calculate comprehensive statistics - FIXED: Use database total count
-        # total_tickets should come from database.get_tickets_count() not len(all_tickets)
-        
-        # 1. Ticket Status Breakdown
-        status_counts = {}
-        for ticket in all_tickets:
-            status = ticket.get('status', 'Unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        # 2. Priority Breakdown
-        priority_counts = {}
-        for ticket in all_tickets:
-            priority = ticket.get('priority', 'Medium')
-            priority_counts[priority] = priority_counts.get(priority, 0) + 1
-        
-        # 3. Classification Breakdown
-        classification_counts = {}
-        for ticket in all_tickets:
-            classification = ticket.get('classification', 'General')
-            classification_counts[classification] = classification_counts.get(classification, 0) + 1
-        
-        # 4. Outstanding Claims Analysis
-        now = datetime.now()
-        overdue_tickets = []
-        open_1_3_days = []
-        open_today = []
-        
-        for ticket in all_tickets:
-            if 'created_at_dt' in ticket:
-                days_open = (now - ticket['created_at_dt']).days
-                
-                if days_open > 3:
-                    overdue_tickets.append(ticket)
-                elif 1 <= days_open <= 3:
-                    open_1_3_days.append(ticket)
-                elif days_open == 0:
-                    open_today.append(ticket)
-        
-        # 5. Average Resolution Time
-        resolved_tickets = [t for t in all_tickets if t.get('status') in ['Resolved', 'Closed']]
-        avg_resolution_time = 0
-        total_resolution_time = 0
-        
-        for ticket in resolved_tickets:
-            try:
-                if 'created_at_dt' in ticket and 'updated_at' in ticket:
-                    created_at = ticket['created_at_dt']
-                    
-                    if isinstance(ticket['updated_at'], datetime):
-                        updated_at = ticket['updated_at']
-                    else:
-                        updated_at = datetime.strptime(str(ticket['updated_at']), "%Y-%m-%d %H:%M:%S")
-                    
-                    resolution_time = (updated_at - created_at).total_seconds() / 3600  # in hours
-                    total_resolution_time += resolution_time
-            except:
-                continue
-        
-        if resolved_tickets:
-            avg_resolution_time = total_resolution_time / len(resolved_tickets)
-        
-        # 6. Claim Outcomes
-        approved_claims = len([t for t in all_tickets if t.get('status') == 'Approved - Revisit Booked'])
-        declined_claims = len([t for t in all_tickets if t.get('status') == 'Declined - Not Covered'])
-        referred_claims = len([t for t in all_tickets if t.get('status') == 'Referred to Tech Director'])
-        warranty_received = len([t for t in all_tickets if t.get('status') == 'Warranty Form Received'])
+            app.logger.error(f"API: Failed to compute dashboard KPIs: {e}")
+            return jsonify({
+                'status': 'error',
+                'message': 'Database temporarily unavailable. Please try again later.',
+                'data': {
+                    'total_tickets': 0,
+                    'status_counts': {},
+                    'priority_counts': {},
+                    'classification_counts': {},
+                    'outstanding_claims': {'overdue': 0, 'open_1_3_days': 0, 'open_today': 0, 'overdue_tickets': []},
+                    'resolution_metrics': {'avg_resolution_time': 0, 'resolved_count': 0},
+                    'claim_outcomes': {'approved': 0, 'declined': 0, 'referred': 0, 'warranty_received': 0, 'approved_percent': 0, 'declined_percent': 0, 'referred_percent': 0},
+                    'date_range': {'start_date': start_date_str, 'end_date': end_date_str, 'filtered': False}
+                }
+            }), 503
         
-        # Calculate percentages
-        approved_percent = (approved_claims / total_tickets * 100) if total_tickets > 0 else 0
-        declined_percent = (declined_claims / total_tickets * 100) if total_tickets > 0 else 0
-        referred_percent = (referred_claims / total_tickets * 100) if total_tickets > 0 else 0
+        # Most urgent overdue tickets: dates as strings so the response is plain JSON
+        for ticket in kpis['outstanding_claims']['overdue_tickets']:
+            created_at = ticket.get('created_at')
+            if isinstance(created_at, datetime):
+                ticket['formatted_date'] = created_at.strftime("%b %d, %I:%M %p")
+                ticket['created_at'] = created_at.isoformat()
         
-        app.logger.info(f"API: Successfully processed dashboard data - {total_tickets} tickets")
+        app.logger.info(f"API: Successfully processed dashboard data - {kpis['total_tickets']} tickets")
         
-        # Final safety check: ensure no ObjectIds remain in the response data
-        try:
-            response_data = {
-                'status': 'success',
-                'data': {
-                    'total_tickets': total_tickets,
-                    'status_counts': status_counts,
-                    'priority_counts': priority_counts,
-                    'classification_counts': classification_counts,
-                    'outstanding_claims': {
-                        'overdue': len(overdue_tickets),
-                        'open_1_3_days': len(open_1_3_days),
-                        'open_today': len(open_today),
-                        'overdue_tickets': overdue_tickets[:5]  # Top 5 most urgent
-                    },
-                    'resolution_metrics': {
-                        'avg_resolution_time': avg_resolution_time,
-                        'resolved_count': len(resolved_tickets)
-                    },
-                    'claim_outcomes': {
-                        'approved': approved_claims,
-                        'declined': declined_claims,
-                        'referred': referred_claims,
-                        'warranty_received': warranty_received,
-                        'approved_percent': approved_percent,
-                        'declined_percent': declined_percent,
-                        'referred_percent': referred_percent
-                    },
-                    'date_range': {
-                        'start_date': start_date_str,
-                        'end_date': end_date_str,
-                        'filtered': bool(start_date_str or end_date_str)
-                    }
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'total_tickets': kpis['total_tickets'],
+                'status_counts': kpis['status_counts'],
+                'priority_counts': kpis['priority_counts'],
+                'classification_counts': kpis['classification_counts'],
+                'outstanding_claims': kpis['outstanding_claims'],
+                'resolution_metrics': kpis['resolution_metrics'],
+                'claim_outcomes': kpis['claim_outcomes'],
+                'date_range': {
+                    'start_date': start_date_str,
+                    'end_date': end_date_str,
+                    'filtered': bool(start_date_str or end_date_str)
                 }
             }
-            
-            # Test JSON serialization to catch any remaining ObjectIds
-            json.dumps(response_data)
-            app.logger.info("API: JSON serialization test passed")
-            
-            return jsonify(response_data)
-            
-        except TypeError as e:
-            app.logger.error(f"API: JSON serialization failed due to ObjectId: {e}")
-            # Return a simplified response without problematic data
-            return jsonify({
-                'status': 'success',
-                'data': {
-                    'total_tickets': total_tickets,
-                    'status_counts': status_counts,
-                    'priority_counts': priority_counts,
-                    'classification_counts': classification_counts,
-                    'outstanding_claims': {
-                        'overdue': len(overdue_tickets),
-                        'open_1_3_days': len(open_1_3_days),
-                        'open_today': len(open_today),
-                        'overdue_tickets': []  # Skip detailed ticket data to avoid ObjectId issues
-                    },
-                    'resolution_metrics': {
-                        'avg_resolution_time': avg_resolution_time,
-                        'resolved_count': len(resolved_tickets)
-                    },
-                    'claim_outcomes': {
-                        'approved': approved_claims,
-                        'declined': declined_claims,
-                        'referred': referred_claims,
-                        'warranty_received': warranty_received,
-                        'approved_percent': approved_percent,
-                        'declined_percent': declined_percent,
-                        'referred_percent': referred_percent
-                    },
-                    'date_range': {
-                        'start_date': start_date_str,
-                        'end_date': end_date_str,
-                        'filtered': bool(start_date_str or end_date_str)
-                    }
-                }
-            })
+        })
     except Exception as e:
         app.logger.error(f"Error getting dashboard data: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -11373,7 +10740,8 @@ def create_ticket_form():
 def dashboard_updates():
     """
     API endpoint to provide real-time dashboard updates
-    Returns only changed data to minimize bandwidth and improve performance
+    Returns only the tickets created, changed or removed since the client's cursor,
+    so the work and the payload scale with the changes rather than the ticket table
     """
     try:
         # Enhanced session validation with automatic restoration
@@ -11390,93 +10758,53 @@ def dashboard_updates():
         # Sessions are permanent - no timeout checks needed
         # Users stay logged in forever
         
-        data = request.json
-        if not data:
+        data = request.get_json(silent=True)
+        if data is None:
             return jsonify({'status': 'error', 'message': 'Invalid request data'}), 400
-            
-        last_update = data.get('last_update', 0)
-        current_tickets = data.get('current_tickets', [])
         
-        # Convert timestamp to datetime
-        last_update_dt = datetime.fromtimestamp(last_update / 1000) if last_update > 0 else datetime.min
+        # 'cursor' is what the previous response returned; 'last_update' (ms timestamp) is the older name for it
+        cursor = data.get('cursor', data.get('last_update'))
         
         db = get_db()
         
-        # Get all tickets with assignments
-        all_tickets = db.get_tickets_with_assignments()
+        # One indexed range scan over tickets changed since the cursor, plus delete tombstones (see ticket_changes)
+        changes = db.get_ticket_changes(cursor)
+        new_tickets = changes['new_tickets']
+        updated_tickets = changes['updated_tickets']
+        removed_tickets = changes['removed_tickets']
         
-        # Check for new tickets
-        new_tickets = []
-        updated_tickets = []
-        removed_tickets = []
+        has_updates = bool(new_tickets or updated_tickets or removed_tickets)
         
-        # Process tickets to find changes
-        for ticket in all_tickets:
-            ticket_id = ticket.get('ticket_id')
-            created_at = ticket.get('created_at')
-            
-            if created_at and created_at > last_update_dt:
-                # New ticket
-                new_tickets.append({
-                    'ticket_id': ticket_id,
-                    'name': ticket.get('name', 'Unknown'),
-                    'subject': ticket.get('subject', 'No Subject'),
-                    'body': ticket.get('body', ''),
-                    'priority': ticket.get('priority', 'Medium'),
-                    'classification': ticket.get('classification', 'General'),
-                    'status': ticket.get('status', 'New'),
-                    'has_attachments': ticket.get('has_attachments', False),
-                    'has_warranty': ticket.get('has_warranty', False),
-                    'has_unread_reply': ticket.get('has_unread_reply', False),
-                    'created_at': created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at),
-                    'date': created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at)
-                })
-            elif ticket_id in current_tickets:
-                # Check if existing ticket has updates
-                # For now, we'll consider all existing tickets as potentially updated
-                # In a more sophisticated implementation, you could track modification times
-                pass
+        app.logger.debug(f"Dashboard updates API: {len(new_tickets)} new, {len(updated_tickets)} updated, {len(removed_tickets)} removed tickets for user {session.get('member_name', 'Unknown')}")
         
-        # Calculate current stats - FIXED: Use database total count
-        # total_tickets should come from database.get_tickets_count() not len(all_tickets)
-        open_tickets = len([t for t in all_tickets if t.get('status') == 'Open'])
-        resolved_tickets = len([t for t in all_tickets if t.get('status') == 'Resolved'])
-        waiting_tickets = len([t for t in all_tickets if t.get('status') == 'Waiting for Response'])
-        
-        # Calculate breakdowns
-        priorities = {}
-        classifications = {}
-        for ticket in all_tickets:
-            priority = ticket.get('priority', 'Medium')
-            classification = ticket.get('classification', 'General')
-            
-            priorities[priority] = priorities.get(priority, 0) + 1
-            classifications[classification] = classifications.get(classification, 0) + 1
-        
-        has_updates = len(new_tickets) > 0 or len(updated_tickets) > 0 or len(removed_tickets) > 0
-        
-        app.logger.debug(f"Dashboard updates API: {len(new_tickets)} new, {len(updated_tickets)} updated tickets for user {session.get('member_name', 'Unknown')}")
-        
-        return jsonify({
+        response = {
             'status': 'success',
             'has_updates': has_updates,
-            'stats': {
-                'total_tickets': total_tickets,
-                'open_tickets': open_tickets,
-                'resolved_tickets': resolved_tickets,
-                'waiting_tickets': waiting_tickets
-            },
+            'resync': changes['resync'],
+            'cursor': changes['cursor'],
             'tickets': {
                 'new_tickets': new_tickets,
                 'updated_tickets': updated_tickets,
                 'removed_tickets': removed_tickets
             },
-            'breakdowns': {
-                'priorities': priorities,
-                'classifications': classifications
-            },
             'timestamp': datetime.now().isoformat()
-        })
+        }
+        if has_updates:
+            # Counters only move when tickets do; read them from the materialized stats (see ticket_stats)
+            stats = db.get_dashboard_stats()
+            status_counts = stats.get('status_counts', {})
+            response['stats'] = {
+                'total_tickets': stats.get('total_tickets', 0),
+                'open_tickets': status_counts.get('Open', 0),
+                'resolved_tickets': status_counts.get('Resolved', 0),
+                'waiting_tickets': status_counts.get('Waiting for Response', 0)
+            }
+            response['breakdowns'] = {
+                'priorities': stats.get('priority_counts', {}),
+                'classifications': stats.get('classification_counts', {})
+            }
+        
+        return jsonify(response)
         
     except Exception as e:
         app.logger.error(f"Error in dashboard updates: {e}")
@@ -12035,7 +11363,7 @@ def download_email_attachment(ticket_id, attachment_id):
     """Download email attachment by ticket ID and attachment ID"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -12055,7 +11383,7 @@ def download_email_attachment(ticket_id, attachment_id):
             for meta in metadata:
                 if meta.get('key', '').startswith('attachment_'):
                     try:
-                        attachment_data = json.loads(meta.get('value', '{}'))
+                        attachment_data = decode_value(meta.get('value', '{}'))
                         if attachment_data and isinstance(attachment_data, dict):
                             # Check if this is the attachment we're looking for
                             metadata_index = meta.get('key', '').replace('attachment_', '')
@@ -12068,6 +11396,13 @@ def download_email_attachment(ticket_id, attachment_id):
         if not target_attachment:
             return jsonify({'error': 'Attachment not found'}), 404
         
+        # Attachments moved to GridFS are streamed instead of decoded in memory
+        if target_attachment.get('gridfs_id'):
+            filename = target_attachment.get('filename', target_attachment.get('original_name', 'attachment'))
+            response = send_stored_attachment(target_attachment['gridfs_id'], filename)
+            if response is not None:
+                return response
+        
         # Decode base64 file data
         file_data = target_attachment.get('data', '')
         if not file_data:
@@ -12134,7 +11469,7 @@ def preview_attachment(ticket_id, attachment_index):
     """Preview attachment by ticket ID and attachment index from multiple sources"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -12151,6 +11486,11 @@ def preview_attachment(ticket_id, attachment_index):
                 filename = attachment.get('filename', 'unknown_file')
                 file_data = attachment.get('data', '')
                 
+                if attachment.get('gridfs_id'):
+                    response = send_stored_attachment(attachment['gridfs_id'], filename, as_attachment=False)
+                    if response is not None:
+                        return response
+                
                 if file_data:
                     app.logger.info(f" Previewing base64 attachment: {filename}")
                     try:
@@ -12235,16 +11575,10 @@ def preview_attachment(ticket_id, attachment_index):
                 app.logger.warning(f" Reply file not found for preview: {file_path}")
         
         # METHOD 3: Check metadata collection for file attachments
-        ticket_metadata = db.get_ticket_metadata(ticket_id)
-        attachment_files = []
-        
-        for metadata_entry in ticket_metadata:
-            if metadata_entry['key'].startswith('attachment_'):
-                try:
-                    attachment_data = json.loads(metadata_entry['value'])
-                    attachment_files.append(attachment_data)
-                except:
-                    continue
+        attachment_files = [
+            attachment_data for key, attachment_data in db.get_ticket_metadata_fields(ticket_id).items()
+            if key.startswith('attachment_') and isinstance(attachment_data, dict)
+        ]
         
         app.logger.info(f"Found {len(attachment_files)} metadata attachments")
         
@@ -12368,7 +11702,7 @@ def download_file_system_attachment(ticket_id, attachment_key):
     """Download file system attachment by ticket ID and attachment key (from metadata)"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
@@ -12457,7 +11791,7 @@ def preview_file_system_attachment(ticket_id, attachment_key):
     """Preview file system attachment by ticket ID and attachment key (from metadata)"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
@@ -12775,7 +12109,10 @@ def debug_ticket_data(ticket_id):
             
             # Try to parse the value if it's JSON
             try:
-                if isinstance(item['value'], str) and item['value'].strip():
+                if isinstance(item['value'], dict):
+                    metadata_item['parsed_value'] = item['value']
+                    metadata_item['is_attachment'] = 'file_path' in item['value'] or 'filename' in item['value']
+                elif isinstance(item['value'], str) and item['value'].strip():
                     # Clean the JSON string before parsing
                     clean_value = item['value'].strip()
                     # Remove trailing commas and fix common JSON issues
@@ -13789,7 +13126,7 @@ def api_create_ticket():
                 'error_type': 'DatabaseConnectionError'
             }), 500
         
-        # Generate automatic ticket ID for manual tickets (6 chars total: M + type + 4 random)
+        # Generate automatic ticket ID for manual tickets (6 chars total: M + type + 4 digits)
         type_code_mapping = {
             'DPF Clean - Premium': 'P',  # Premium
             'DPF Clean-Standard': 'S',   # Standard
@@ -13807,118 +13144,71 @@ def api_create_ticket():
         import uuid
         
         ticket_id = None
-        max_attempts = 100
-        
-        # Log current ticket statistics for debugging
-        try:
-            manual_ticket_count = db.tickets.count_documents({'ticket_id': {'$regex': f'^M{type_code}'}})
-            total_ticket_count = db.tickets.count_documents({})
-            app.logger.info(f"Current database state: {total_ticket_count} total tickets, {manual_ticket_count} with prefix M{type_code}")
-        except Exception as e:
-            app.logger.warning(f"Could not get ticket statistics: {e}")
+        max_attempts = 5  # Retries only cover thread_id clashes and IDs taken between allocation and insert
         
         for attempt in range(max_attempts):
             try:
-                # Generate 4-digit code using same logic as email tickets (deterministic based on customer data)
-                # Use customer email + timestamp to create unique seed for calculation
-                seed_string = f"{email}{customer_full_name}{datetime.now().isoformat()}"
+                # Allocate the next ID from the atomic per-prefix counter (one round trip,
+                # unique across workers): exactly 6 chars, M + type + 4 digits
+                potential_id = db.allocate_ticket_id(f"M{type_code}")
+                app.logger.info(f"Allocated ticket ID: {potential_id} (attempt {attempt + 1}/{max_attempts})")
                 
-                # Calculate sum of character codes (same logic as email system)
-                sum_chars = 0
-                for char in seed_string:
-                    sum_chars += ord(char)
+                # Generate unique thread_id for manual tickets (required due to unique index)
+                # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
+                thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
                 
-                # Generate 4-digit number (same as email system: sum % 10000)
-                four_digit_code = sum_chars % 10000
-                four_digit_str = f"{four_digit_code:04d}"  # Ensure 4 digits with leading zeros
-                
-                potential_id = f"M{type_code}{four_digit_str}"  # Exactly 6 chars: M + 1 + 4 digits
-                
-                app.logger.info(f"Attempting ticket ID: {potential_id} (attempt {attempt + 1}/{max_attempts})")
-                app.logger.debug(f"? Calculation details: seed='{seed_string[:50]}...', sum_chars={sum_chars}, 4-digit={four_digit_code}")
+                ticket_data = {
+                    'ticket_id': potential_id,
+                    'email': email,
+                    'name': customer_full_name,
+                    'subject': subject,
+                    'body': description,
+                    'status': 'Open',
+                    'priority': priority,
+                    'classification': type_of_claim,
+                    'technician': technician,
+                    'vehicle_registration': vehicle_registration,
+                    'service_date': service_date,
+                    'claim_date': claim_date,
+                    'creation_method': 'manual',
+                    'thread_id': thread_id,  # CRITICAL: Must be unique due to database constraint
+                    'created_at': datetime.now(),
+                    'updated_at': datetime.now()
+                }
                 
-                # Use dedicated ticket_id_exists method for faster checking
-                app.logger.debug(f"[DEBUG] Checking if ticket ID {potential_id} exists...")
+                # Add created_by only if we have a session
+                if session.get('member_id'):
+                    ticket_data['created_by'] = session.get('member_id')
                 
                 try:
-                    exists = db.ticket_id_exists(potential_id)
-                    app.logger.debug(f"[SUCCESS] Database check complete: {potential_id} exists = {exists}")
-                except Exception as db_check_error:
-                    app.logger.error(f"[ERROR] Database check failed for {potential_id}: {db_check_error}")
-                    # On database connectivity issues, wait briefly and retry the same ID
-                    import time
-                    time.sleep(0.1)  # Brief pause to allow for database recovery
-                    try:
-                        # Retry the database check once more
-                        exists = db.ticket_id_exists(potential_id)
-                        app.logger.info(f"[SUCCESS] Database check retry successful: {potential_id} exists = {exists}")
-                    except Exception as retry_error:
-                        app.logger.error(f"[ERROR] Database check retry also failed: {retry_error}")
-                        # Skip this attempt and try the next ID
-                        continue
-                
-                if not exists:
-                    # ID is unique, create the ticket
-                    # Generate unique thread_id for manual tickets (required due to unique index)
-                    # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
-                    thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
-                    
-                    ticket_data = {
-                        'ticket_id': potential_id,
-                        'email': email,
-                        'name': customer_full_name,
-                        'subject': subject,
-                        'body': description,
-                        'status': 'Open',
-                        'priority': priority,
-                        'classification': type_of_claim,
-                        'technician': technician,
-                        'vehicle_registration': vehicle_registration,
-                        'service_date': service_date,
-                        'claim_date': claim_date,
-                        'creation_method': 'manual',
-                        'thread_id': thread_id,  # CRITICAL: Must be unique due to database constraint
-                        'created_at': datetime.now(),
-                        'updated_at': datetime.now()
-                    }
-                    
-                    # Add created_by only if we have a session
-                    if session.get('member_id'):
-                        ticket_data['created_by'] = session.get('member_id')
+                    app.logger.debug(f"? Attempting to create ticket with ID {potential_id}, thread_id {thread_id}")
+                    result = db.create_ticket(ticket_data)
+                    ticket_id = potential_id
+                    app.logger.info(f"[SUCCESS] Successfully created manual ticket with ID: {ticket_id} on attempt {attempt + 1}")
+                    app.logger.info(f"? Ticket data: email={email}, name={customer_full_name[:20]}..., thread_id={thread_id}")
+                    break
                     
-                    try:
-                        app.logger.debug(f"? Attempting to create ticket with ID {potential_id}, thread_id {thread_id}")
-                        result = db.create_ticket(ticket_data)
-                        ticket_id = potential_id
-                        app.logger.info(f"[SUCCESS] Successfully created manual ticket with ID: {ticket_id} on attempt {attempt + 1}")
-                        app.logger.info(f"? Ticket data: email={email}, name={customer_full_name[:20]}..., thread_id={thread_id}")
-                        break
-                        
-                    except ValueError as e:
-                        error_str = str(e)
-                        if "Ticket ID already exists" in error_str:
-                            app.logger.warning(f"[WARNING] Race condition detected for ticket ID {potential_id}, retrying (attempt {attempt + 1})")
-                            continue  # Race condition, try again
-                        elif "Thread ID already exists" in error_str:
-                            app.logger.warning(f"[WARNING] Thread ID collision detected, generating new thread_id and retrying (attempt {attempt + 1})")
-                            # Generate a new thread_id and try again with the same ticket_id
-                            # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
-                            thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
-                            continue
-                        else:
-                            # Different ValueError, log and re-raise
-                            app.logger.error(f"[ERROR] ValueError creating ticket {potential_id}: {e}")
-                            raise e
-                    except Exception as e:
-                        app.logger.error(f"[ERROR] Unexpected error creating ticket with ID {potential_id}: {e}")
-                        app.logger.error(f"[DEBUG] Full error details: {type(e).__name__}: {str(e)}")
-                        import traceback
-                        app.logger.error(f"? Stack trace: {traceback.format_exc()}")
+                except ValueError as e:
+                    error_str = str(e)
+                    if "Ticket ID already exists" in error_str:
+                        app.logger.warning(f"[WARNING] Race condition detected for ticket ID {potential_id}, retrying (attempt {attempt + 1})")
+                        continue  # Race condition, try again
+                    elif "Thread ID already exists" in error_str:
+                        app.logger.warning(f"[WARNING] Thread ID collision detected, generating new thread_id and retrying (attempt {attempt + 1})")
+                        # Generate a new thread_id and try again with the same ticket_id
+                        # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
+                        thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
+                        continue
+                    else:
+                        # Different ValueError, log and re-raise
+                        app.logger.error(f"[ERROR] ValueError creating ticket {potential_id}: {e}")
                         raise e
-                else:
-                    # ID already exists
-                    app.logger.debug(f"[RETRY] Ticket ID {potential_id} already exists, retrying (attempt {attempt + 1})")
-                    continue
+                except Exception as e:
+                    app.logger.error(f"[ERROR] Unexpected error creating ticket with ID {potential_id}: {e}")
+                    app.logger.error(f"[DEBUG] Full error details: {type(e).__name__}: {str(e)}")
+                    import traceback
+                    app.logger.error(f"? Stack trace: {traceback.format_exc()}")
+                    raise e
                         
             except Exception as e:
                 app.logger.error(f"[ERROR] Error during ticket ID generation attempt {attempt + 1}: {str(e)}")
@@ -14121,6 +13411,9 @@ def api_create_ticket():
         if vhc_link:
             metadata_entries.append({'ticket_id': ticket_id, 'key': 'vhc_link', 'value': vhc_link})
         
+        # Move the payloads to GridFS; tickets and metadata keep only the gridfs_id reference
+        uploaded_files, _ = db.attachment_store.offload_attachments(uploaded_files)
+        
         # Add attachment metadata
         for i, file_info in enumerate(uploaded_files):
             metadata_entries.append({
@@ -14142,7 +13435,7 @@ def api_create_ticket():
         if uploaded_files:
             app.logger.info(f"DEBUG: Creating attachments array for {len(uploaded_files)} files")
             
-            # Create attachments array for the ticket - FIXED: Include base64 data
+            # Create attachments array for the ticket, referencing the stored payloads
             attachments_array = []
             for file_info in uploaded_files:
                 attachment_data = {
@@ -14155,11 +13448,11 @@ def api_create_ticket():
                     'uploaded_at': datetime.now().isoformat(),
                     'source': 'manual_upload',
                     'path': file_info['path'],  # Full path for file operations
-                    'type': 'file',  # Ensure type is set for template compatibility
-                    'data': file_info['data']  # FIXED: Include base64 data for database storage
+                    'type': 'file'  # Ensure type is set for template compatibility
                 }
+                attachment_data.update({key: file_info[key] for key in ('gridfs_id', 'blob_field', 'data') if key in file_info})
                 attachments_array.append(attachment_data)
-                app.logger.info(f"DEBUG: Added attachment to array: {file_info['original_name']} (base64: {len(file_info['data'])} chars)")
+                app.logger.info(f"DEBUG: Added attachment to array: {file_info['original_name']} (gridfs_id: {file_info.get('gridfs_id')})")
             
             # Update ticket with attachment information - ENHANCED UPDATE
             update_data = {
@@ -14178,16 +13471,11 @@ def api_create_ticket():
                 
                 # Also ensure the attachments are properly indexed in the database
                 # This helps with search and retrieval
-                for i, attachment in enumerate(attachments_array):
-                    # Store each attachment as individual metadata for better retrieval
-                    # FIXED: Include base64 data in metadata for complete storage
-                    attachment_metadata = {
-                        'ticket_id': ticket_id,
-                        'key': f'file_attachment_{i+1}',
-                        'value': json.dumps(attachment)
-                    }
-                    db.add_ticket_metadata(ticket_id, f'file_attachment_{i+1}', json.dumps(attachment))
-                    app.logger.info(f"SUCCESS: Stored attachment {i+1} metadata for ticket {ticket_id} (base64: {len(attachment.get('data', ''))} chars)")
+                # Store each attachment as individual metadata for better retrieval
+                db.set_ticket_metadata_many(ticket_id, {
+                    f'file_attachment_{i+1}': json.dumps(attachment) for i, attachment in enumerate(attachments_array)
+                })
+                app.logger.info(f"SUCCESS: Stored {len(attachments_array)} attachment metadata entries for ticket {ticket_id}")
                 
             except Exception as update_error:
                 app.logger.error(f"ERROR: Failed to update ticket {ticket_id} with attachment info: {update_error}")
@@ -14197,28 +13485,30 @@ def api_create_ticket():
         
         # Save additional metadata for the ticket
         try:
+            # Form fields, saved together with the technician below in one write
+            form_metadata = {
+                'customer_title': customer_title,
+                'customer_first_name': customer_first_name,
+                'customer_surname': customer_surname,
+                'type_of_claim': type_of_claim,
+                'vehicle_registration': vehicle_registration,
+                'service_date': service_date,
+                'claim_date': claim_date,
+                'vhc_link': vhc_link
+            }
+            
             # Save technician information to metadata
             if technician:
-                db.add_ticket_metadata(ticket_id, 'technician_name', technician)
-                app.logger.info(f"Saved technician name to metadata: {technician}")
+                form_metadata['technician_name'] = technician
                 
                 # Also get and save technician ID for proper assignment
                 technician_data = db.get_technician_by_name(technician)
                 if technician_data:
-                    db.add_ticket_metadata(ticket_id, 'technician_id', str(technician_data['_id']))
-                    app.logger.info(f"Saved technician ID to metadata: {technician_data['_id']}")
+                    form_metadata['technician_id'] = str(technician_data['_id'])
                 else:
                     app.logger.warning(f"Technician '{technician}' not found in database")
             
-            # Save other form fields to metadata
-            db.add_ticket_metadata(ticket_id, 'customer_title', customer_title)
-            db.add_ticket_metadata(ticket_id, 'customer_first_name', customer_first_name)
-            db.add_ticket_metadata(ticket_id, 'customer_surname', customer_surname)
-            db.add_ticket_metadata(ticket_id, 'type_of_claim', type_of_claim)
-            db.add_ticket_metadata(ticket_id, 'vehicle_registration', vehicle_registration)
-            db.add_ticket_metadata(ticket_id, 'service_date', service_date)
-            db.add_ticket_metadata(ticket_id, 'claim_date', claim_date)
-            db.add_ticket_metadata(ticket_id, 'vhc_link', vhc_link)
+            db.set_ticket_metadata_many(ticket_id, form_metadata)
             
             app.logger.info(f"Successfully saved all metadata for ticket {ticket_id}")
         except Exception as metadata_error:
@@ -14349,33 +13639,21 @@ def send_template_email():
         if not ticket_id:
             return jsonify({'status': 'error', 'message': 'Ticket ID required'}), 400
 
-        # ANTI-SPAM: Check for duplicate email template submissions
+        # ANTI-SPAM: Check for duplicate email template submissions within 10 seconds (across all workers)
         member_id = session['member_id']
-        current_time = datetime.now()
         cache_key = f"email_template_spam_{ticket_id}_{member_id}_{custom_subject[:30]}"
         
-        # Use the same cache as reply anti-spam
-        if not hasattr(app, '_reply_cache'):
-            app._reply_cache = {}
-        
-        # Clean old entries (older than 10 seconds for email templates)
-        app._reply_cache = {k: v for k, v in app._reply_cache.items() 
-                           if (current_time - v).total_seconds() < 10}
-        
-        if cache_key in app._reply_cache:
+        if not throttle.claim(cache_key, 10):
             app.logger.warning(f"🚫 EMAIL TEMPLATE SPAM BLOCKED - Duplicate email attempt for ticket {ticket_id} by member {member_id}")
             return jsonify({'status': 'error', 'message': 'Duplicate email submission detected. Please wait before sending again.'}), 429
         
-        # Record this submission to prevent duplicates
-        app._reply_cache[cache_key] = current_time
-        
         app.logger.info(f" PROCESSING EMAIL TEMPLATE - Ticket: {ticket_id}, Member: {member_id}, Subject: {custom_subject[:50]}...")
         
         # Get ticket information
         try:
             db = get_db()
             app.logger.info(f" DEBUG: Got database connection for ticket {ticket_id}")
-            ticket = db.get_ticket_by_id(ticket_id)
+            ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
             app.logger.info(f" DEBUG: Retrieved ticket data: {ticket is not None}")
             if not ticket:
                 return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
@@ -14464,7 +13742,7 @@ def send_template_email():
             for meta in metadata:
                 if meta.get('key', '').startswith('attachment_'):
                     try:
-                        attachment_data = json.loads(meta.get('value', '{}'))
+                        attachment_data = decode_value(meta.get('value', '{}'))
                         if attachment_data and isinstance(attachment_data, dict):
                             # Read file from disk and convert to base64
                             file_path = attachment_data.get('path', '')
@@ -15303,7 +14581,7 @@ def load_email_template(template_type, ticket_id):
         
         # Get ticket data
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             app.logger.error(f"❌ TICKET NOT FOUND - URL Ticket ID: {ticket_id}")
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
@@ -15516,7 +14794,7 @@ def load_email_template(template_type, ticket_id):
                 if meta.get('key', '').startswith('attachment_'):
                     try:
                         app.logger.info(f"📎 PROCESSING METADATA KEY: {meta.get('key')}")
-                        attachment_data = json.loads(meta.get('value', '{}'))
+                        attachment_data = decode_value(meta.get('value', '{}'))
                         if attachment_data and isinstance(attachment_data, dict):
                             app.logger.info(f"📎 ATTACHMENT DATA KEYS: {list(attachment_data.keys())}")
                             
@@ -15862,7 +15140,7 @@ def debug_attachments(ticket_id):
     
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
         
@@ -15873,15 +15151,15 @@ def debug_attachments(ticket_id):
         
         for meta in metadata:
             if meta.get('key', '').startswith('attachment_'):
-                try:
-                    attachment_data = json.loads(meta.get('value', '{}'))
-                    if attachment_data and isinstance(attachment_data, dict):
-                        metadata_attachments.append({
-                            'key': meta.get('key'),
-                            'data': attachment_data,
-                            'parsed_successfully': True
-                        })
-                except (json.JSONDecodeError, TypeError):
+                # Sub-documents come back native; only an unparseable legacy string stays a string
+                attachment_data = decode_value(meta.get('value', '{}'))
+                if attachment_data and isinstance(attachment_data, dict):
+                    metadata_attachments.append({
+                        'key': meta.get('key'),
+                        'data': attachment_data,
+                        'parsed_successfully': True
+                    })
+                elif not isinstance(attachment_data, dict):
                     metadata_attachments.append({
                         'key': meta.get('key'),
                         'data': meta.get('value'),
@@ -16211,6 +15489,7 @@ def download_reply_attachment(reply_id, attachment_index):
                 att.get('source') in ['webhook_base64', 'webhook', 'simple_attachments'] or 
                 att.get('fileData') or  # Check for fileData (base64 content)
                 att.get('data') or      # Check for data field
+                att.get('gridfs_id') or # Payload moved to the GridFS attachment store
                 not att.get('type')     # Fallback for attachments without type
             )
             
@@ -16247,7 +15526,7 @@ def download_reply_attachment(reply_id, attachment_index):
                     'description': attachment.get('description', '')
                 }
             }), 400
-        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data'):
+        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data') and not attachment.get('gridfs_id'):
             # Only reject if no fileData or data is present
             app.logger.error(f" Invalid attachment type: {attachment_type}. Expected 'file' or 'webhook_base64' or attachment with fileData")
             app.logger.error(f" Full attachment data: {attachment}")
@@ -16259,6 +15538,12 @@ def download_reply_attachment(reply_id, attachment_index):
         # Check for base64 data in multiple possible fields
         base64_data = attachment.get('data', '') or attachment.get('fileData', '')
         
+        # Attachments moved to GridFS are streamed in chunks
+        if attachment.get('gridfs_id'):
+            response = send_stored_attachment(attachment['gridfs_id'], filename)
+            if response is not None:
+                return response
+        
 
         
         # FIXED: Priority 1 - Use base64 data if available (most reliable)
@@ -16359,6 +15644,7 @@ def preview_reply_attachment(reply_id, attachment_index):
                 att.get('source') in ['webhook_base64', 'webhook', 'simple_attachments'] or 
                 att.get('fileData') or  # Check for fileData (base64 content)
                 att.get('data') or      # Check for data field
+                att.get('gridfs_id') or # Payload moved to the GridFS attachment store
                 not att.get('type')     # Fallback for attachments without type
             )
             
@@ -16395,7 +15681,7 @@ def preview_reply_attachment(reply_id, attachment_index):
                     'description': attachment.get('description', '')
                 }
             }), 400
-        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data'):
+        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data') and not attachment.get('gridfs_id'):
             # Only reject if no fileData or data is present
             app.logger.error(f" Invalid attachment type: {attachment_type}. Expected 'file' or 'webhook_base64' or attachment with fileData")
             app.logger.error(f" Full attachment data: {attachment}")
@@ -16415,6 +15701,11 @@ def preview_reply_attachment(reply_id, attachment_index):
             app.logger.error(f"📎 File type not previewable: {file_ext}")
             return jsonify({'error': f'File type {file_ext} not previewable'}), 400
         
+        if attachment.get('gridfs_id'):
+            response = send_stored_attachment(attachment['gridfs_id'], filename, as_attachment=False)
+            if response is not None:
+                return response
+        
 
         
         # FIXED: Priority 1 - Use base64 data if available (most reliable)
@@ -16485,9 +15776,8 @@ def get_reply_count(ticket_id):
     try:
         db = get_db()
         
-        # Get ticket to verify it exists
-        ticket = db.tickets.find_one({'ticket_id': ticket_id})
-        if not ticket:
+        # Verify the ticket exists without loading the document
+        if not db.ticket_id_exists(ticket_id):
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
         
         # Count replies for this ticket
@@ -16503,6 +15793,129 @@ def get_reply_count(ticket_id):
         app.logger.error(f"Error getting reply count for ticket {ticket_id}: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to get reply count'}), 500
 
+# Most tickets one reply-state request may ask about (a ticket list page is 20-50)
+REPLY_STATE_BATCH_LIMIT = 200
+
+@app.route('/api/tickets/reply-state', methods=['POST'])
+def get_reply_states():
+    """Reply counts, last reply times and unread flags for many tickets in one call
+
+    Body: {"ticket_ids": [...], "since": cursor}. new_replies counts the replies since the
+    cursor of the previous response; tickets that do not exist are left out.
+    """
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    ticket_ids = data.get('ticket_ids')
+    if not isinstance(ticket_ids, list) or not all(isinstance(ticket_id, str) for ticket_id in ticket_ids):
+        return jsonify({'status': 'error', 'message': 'ticket_ids must be a list of ticket IDs'}), 400
+    if len(ticket_ids) > REPLY_STATE_BATCH_LIMIT:
+        return jsonify({'status': 'error', 'message': f'At most {REPLY_STATE_BATCH_LIMIT} ticket IDs per request'}), 400
+    
+    try:
+        # Same cursor scheme as /api/dashboard/updates: replies younger than the lag are left for the next call
+        until = datetime.now() - CHANGE_FEED_LAG
+        since = decode_change_cursor(data.get('since'))
+        if since is not None:
+            until = max(until, since)
+        states = get_db().get_reply_states(set(ticket_ids), since=since, until=until) if ticket_ids else {}
+        for state in states.values():
+            if state['last_reply_at']:
+                state['last_reply_at'] = state['last_reply_at'].isoformat()
+        
+        return jsonify({
+            'status': 'success',
+            'tickets': states,
+            'cursor': encode_change_cursor(until)
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Error getting reply states for {len(ticket_ids)} tickets: {e}")
+        return jsonify({'status': 'error', 'message': 'Failed to get reply states'}), 500
+
+# Live events (see live_events.py): streams end after a minute and the browser reconnects with
+# Last-Event-ID, so request threads are handed back regularly and sessions stay refreshed
+LIVE_STREAM_SECONDS = 55
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_POLL_SECONDS = 25
+
+def format_live_event(event):
+    """One Server-Sent Events message"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.route('/api/events/stream', methods=['GET'])
+def live_event_stream():
+    """Server-Sent Events: new tickets, new replies, unread flags, status and assignment changes"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    if not live_events.slots.acquire(blocking=False):
+        # Every stream slot of this worker is taken; the page falls back to /api/events/poll
+        return jsonify({'status': 'error', 'message': 'Live updates busy', 'fallback': url_for('live_event_poll')}), 503
+    
+    try:
+        # gunicorn starts the feed in post_fork; this starts it under the development server
+        live_events.feed.ensure_started(lambda: get_db().db)
+    except Exception as e:
+        app.logger.warning(f"Live events feed not started: {e}")
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('after') or live_events.broker.latest_cursor()
+    
+    def generate(cursor):
+        deadline = time.monotonic() + LIVE_STREAM_SECONDS
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            events, resync = live_events.broker.wait(cursor, LIVE_KEEPALIVE_SECONDS)
+            if resync:
+                cursor = live_events.broker.latest_cursor()
+                yield f"id: {cursor}\nevent: resync\ndata: {{}}\n\n"
+            for event in events:
+                cursor = event['id']
+                yield format_live_event(event)
+            if not events and not resync:
+                yield ": keepalive\n\n"
+    
+    response = Response(stream_with_context(generate(cursor)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx must not buffer the stream
+    response.call_on_close(live_events.slots.release)
+    return response
+
+@app.route('/api/events/poll', methods=['GET'])
+def live_event_poll():
+    """Long-poll fallback for /api/events/stream: events after ?after=<cursor>, waiting up to 25 seconds"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        # gunicorn starts the feed in post_fork; this starts it under the development server
+        live_events.feed.ensure_started(lambda: get_db().db)
+    except Exception as e:
+        app.logger.warning(f"Live events feed not started: {e}")
+    
+    after = request.args.get('after')
+    if not after:
+        # First poll only establishes where this page starts
+        return jsonify({'status': 'success', 'events': [], 'resync': False, 'waited': False,
+                        'cursor': live_events.broker.latest_cursor()})
+    
+    waited = live_events.slots.acquire(blocking=False)
+    try:
+        if waited:
+            events, resync = live_events.broker.wait(after, LIVE_POLL_SECONDS)
+        else:
+            # No slot free: answer now and let the page come back after its poll interval
+            events, resync = live_events.broker.events_after(after)
+    finally:
+        if waited:
+            live_events.slots.release()
+    
+    if events:
+        cursor = events[-1]['id']
+    else:
+        cursor = live_events.broker.latest_cursor() if resync else after
+    return jsonify({'status': 'success', 'events': events, 'resync': resync, 'waited': waited, 'cursor': cursor})
+
 
 
 @app.route('/webhook/reply', methods=['POST'])
@@ -16697,10 +16110,8 @@ def webhook_reply():
             # Save attachments to reply
             all_attachments = attachments + file_attachments
             if all_attachments:
-                db.replies.update_one(
-                    {'_id': reply_id},
-                    {'$set': {'attachments': all_attachments}}
-                )
+                # Payloads go to GridFS like create_reply's, not inline on the reply
+                db.set_reply_attachments(reply_id, all_attachments)
             
             # Update ticket status
             update_data = {
@@ -16775,7 +16186,7 @@ def get_simple_attachment(attachment_id):
         db = get_db()
         
         # Get ticket data
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         if not ticket:
             app.logger.error(f"Ticket not found: {ticket_id}")
             return jsonify({'error': 'Ticket not found'}), 404
@@ -16792,6 +16203,13 @@ def get_simple_attachment(attachment_id):
                 filename = attachment.get('filename', 'unknown_file')
                 file_data = attachment.get('data', '')
                 
+                if attachment.get('gridfs_id'):
+                    response = send_stored_attachment(
+                        attachment['gridfs_id'], filename, as_attachment=request.args.get('preview') != 'true'
+                    )
+                    if response is not None:
+                        return response
+                
                 app.logger.info(f"? Processing attachment: {filename}, data length: {len(file_data)}")
                 
                 if file_data:
@@ -16878,7 +16296,7 @@ def download_attachment(ticket_id, attachment_index):
         db = get_db()
         
         # Get ticket data
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
@@ -16893,6 +16311,12 @@ def download_attachment(ticket_id, attachment_index):
                 attachment = attachments[attachment_index]
                 filename = attachment.get('filename', attachment.get('original_name', 'unknown_file'))
                 
+                # Attachments moved to GridFS are streamed in chunks
+                if attachment.get('gridfs_id'):
+                    response = send_stored_attachment(attachment['gridfs_id'], filename)
+                    if response is not None:
+                        return response
+                
                 # FIXED: PRIORITY 1 - Check for base64 data first (most reliable)
                 file_data = attachment.get('data', '')
                 if file_data:
@@ -17013,16 +16437,10 @@ def download_attachment(ticket_id, attachment_index):
                 app.logger.warning(f" Reply file not found: {file_path}")
         
         # METHOD 3: Check metadata collection for file attachments (both email and manual tickets)
-        ticket_metadata = db.get_ticket_metadata(ticket_id)
-        attachment_files = []
-        
-        for metadata_entry in ticket_metadata:
-            if metadata_entry['key'].startswith('attachment_'):
-                try:
-                    attachment_data = json.loads(metadata_entry['value'])
-                    attachment_files.append(attachment_data)
-                except:
-                    continue
+        attachment_files = [
+            attachment_data for key, attachment_data in db.get_ticket_metadata_fields(ticket_id).items()
+            if key.startswith('attachment_') and isinstance(attachment_data, dict)
+        ]
         
         app.logger.info(f"Found {len(attachment_files)} metadata attachments")
         
@@ -17137,6 +16555,39 @@ def get_mime_type(filename):
     
     return mime_types.get(ext, 'application/octet-stream')
 
+def send_stored_attachment(gridfs_id, filename, as_attachment=True, mimetype=None):
+    """Stream an attachment from the GridFS store with Range, ETag and Last-Modified support"""
+    db = get_db()
+    grid_out = db.attachment_store.open(gridfs_id)
+    if grid_out is None:
+        return None
+    
+    # Office documents keep the "cannot be previewed" page instead of an inline stream
+    if not as_attachment and filename.lower().endswith(('.doc', '.docx', '.xls', '.xlsx')):
+        grid_out.close()
+        return create_preview_response(b'', filename)
+    
+    # Read one GridFS chunk at a time; werkzeug seeks the file for Range requests
+    response = Response(
+        FileWrapper(grid_out, buffer_size=grid_out.chunk_size),
+        mimetype=mimetype or get_mime_type(filename),
+        direct_passthrough=True
+    )
+    response.content_length = grid_out.length
+    response.last_modified = grid_out.upload_date
+    response.set_etag(str(grid_out._id))
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    disposition = 'attachment' if as_attachment else 'inline'
+    response.headers['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=grid_out.length)
+    except RequestedRangeNotSatisfiable as e:
+        grid_out.close()
+        return e.get_response()
+
 @app.route('/api/tickets/<ticket_id>/attachments')
 def get_ticket_attachments(ticket_id):
     """
@@ -17277,7 +16728,7 @@ def get_single_ticket(ticket_id):
     
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         
         if not ticket:
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
@@ -17309,8 +16760,11 @@ def get_all_tickets():
         db = get_db()
         
         # Get all tickets with attachment info
-        tickets = list(db.tickets.find({}).sort([('_id', -1)]).limit(50))
+        tickets = list(db.tickets.find({}, ticket_projection()).sort([('_id', -1)]).limit(50))
         
+        # Load metadata for every ticket on the page in one query instead of per ticket
+        metadata_by_ticket = db.get_metadata_fields_for_tickets([t.get('ticket_id') for t in tickets])
+
         # Convert to frontend-friendly format
         formatted_tickets = []
         for ticket in tickets:
@@ -17338,13 +16792,12 @@ def get_all_tickets():
                     attachments.append(attachment)
             
             # METHOD 2: Also check metadata collection (manual tickets)
-            ticket_metadata = db.get_ticket_metadata(ticket['ticket_id'])
+            ticket_metadata = metadata_by_ticket.get(ticket['ticket_id'], {})
             metadata_attachments = []
             
-            for metadata_entry in ticket_metadata:
-                if metadata_entry['key'].startswith('attachment_'):
+            for meta_key, attachment_data in ticket_metadata.items():
+                if meta_key.startswith('attachment_'):
                     try:
-                        attachment_data = json.loads(metadata_entry['value'])
                         # Convert metadata back to attachment format
                         attachment = {
                             'index': len(attachments) + len(metadata_attachments),
@@ -17357,8 +16810,8 @@ def get_all_tickets():
                             'source': 'manual'  # Mark as manual attachment
                         }
                         metadata_attachments.append(attachment)
-                    except (json.JSONDecodeError, KeyError) as e:
-                        app.logger.warning(f"Failed to parse attachment metadata for {ticket['ticket_id']}: {e}")
+                    except (AttributeError, KeyError) as e:
+                        app.logger.warning(f"Failed to read attachment metadata for {ticket['ticket_id']}: {e}")
             
             # Combine both types of attachments
             attachments.extend(metadata_attachments)
@@ -17939,13 +17392,10 @@ def cleanup_old_data():
         deleted_count = 0
         
         # Clean up old ticket metadata
-        result = db.ticket_metadata.delete_many({
-            'created_at': {'$lt': cutoff_date}
-        })
-        deleted_count += result.deleted_count
+        deleted_count += db.delete_ticket_metadata_before(cutoff_date)
         
         # Clean up old replies for deleted tickets
-        result = db.replies.delete_many({
+        result = db.delete_replies({
             'created_at': {'$lt': cutoff_date},
             'ticket_id': {'$regex': '^deleted_'}
         })
@@ -18285,7 +17735,7 @@ def regenerate_attachment_base64_data(ticket_id):
     try:
         app.logger.info(f"🔄 REGENERATING BASE64 DATA FOR TICKET {ticket_id}")
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         
         if not ticket:
             app.logger.error(f"❌ TICKET NOT FOUND: {ticket_id}")
@@ -18306,7 +17756,7 @@ def regenerate_attachment_base64_data(ticket_id):
         for meta in metadata:
             if meta.get('key', '').startswith('attachment_'):
                 try:
-                    attachment_data = json.loads(meta.get('value', '{}'))
+                    attachment_data = decode_value(meta.get('value', '{}'))
                     if attachment_data and isinstance(attachment_data, dict):
                         attachment_name = attachment_data.get('original_name', attachment_data.get('filename', 'Unknown File'))
                         
@@ -18444,7 +17894,7 @@ def regenerate_webhook_attachments(ticket_id):
                 app.logger.info(f"🔄 Checking reply {reply_id} with {len(attachments)} attachments")
                 
                 for i, attachment in enumerate(attachments):
-                    if attachment.get('type') == 'file':
+                    if attachment.get('type') == 'file' and not attachment.get('gridfs_id'):
                         # Check if attachment has malformed base64 data or is missing data
                         existing_data = attachment.get('data', '')
                         file_path = attachment.get('path', '')
@@ -18461,13 +17911,11 @@ def regenerate_webhook_attachments(ticket_id):
                                 # Try to fix the malformed data
                                 fixed_data, error = fix_malformed_base64_data(existing_data)
                                 if fixed_data:
-                                    # Update with fixed base64 data
-                                    db.replies.update_one(
-                                        {'_id': reply_id, f'attachments.{i}.path': file_path},
-                                        {'$set': {
-                                            f'attachments.{i}.data': fixed_data,
-                                            f'attachments.{i}.has_data': True
-                                        }}
+                                    # Store the repaired bytes in GridFS in place of the malformed inline data
+                                    db.store_reply_attachment(
+                                        reply_id, i, base64.b64decode(fixed_data),
+                                        attachment.get('filename') or attachment.get('name'),
+                                        match={f'attachments.{i}.path': file_path}
                                     )
                                     app.logger.info(f"✅ Fixed malformed base64 data for attachment {i} in reply {reply_id}")
                                     regenerated_count += 1
@@ -18480,16 +17928,11 @@ def regenerate_webhook_attachments(ticket_id):
                                 # Read file and convert to base64
                                 with open(file_path, 'rb') as f:
                                     file_content = f.read()
-                                    base64_data = base64.b64encode(file_content).decode('utf-8')
                                 
-                                # Update attachment with base64 data
-                                db.replies.update_one(
-                                    {'_id': reply_id, f'attachments.{i}.path': file_path},
-                                    {'$set': {
-                                        f'attachments.{i}.data': base64_data,
-                                        f'attachments.{i}.has_data': True,
-                                        f'attachments.{i}.size': len(file_content)
-                                    }}
+                                # Point the attachment at the file's bytes in GridFS
+                                db.store_reply_attachment(
+                                    reply_id, i, file_content, attachment.get('filename') or attachment.get('name'),
+                                    match={f'attachments.{i}.path': file_path}
                                 )
                                 
                                 app.logger.info(f"✅ Regenerated base64 data for attachment {i} in reply {reply_id}")
@@ -18698,7 +18141,7 @@ Author: AutoAssistGroup Development Team
 Version: 2.0
 """
 
-from flask import Flask, render_template, jsonify, redirect, request, url_for, send_from_directory, session, flash, Response, make_response, render_template_string
+from flask import Flask, render_template, jsonify, redirect, request, url_for, send_from_directory, session, flash, Response, make_response, render_template_string, stream_with_context
 from flask_cors import CORS
 import os
 import logging
@@ -18725,8 +18168,19 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import FileWrapper, get_input_stream
+from werkzeug.exceptions import RequestedRangeNotSatisfiable, RequestEntityTooLarge
 from collections import defaultdict
-from database import get_db
+from database import get_db, ticket_projection, encode_ticket_cursor, AssignmentConflictError
+from metadata_store import decode_value
+from migrations import SCHEMA_VERSION, MigrationError, MigrationRunner
+from mongo_connection import connections
+import request_cache
+import live_events
+import n8n_ingest
+from ttl_cache import APP_CACHE_COLLECTION, cache_from_environment
+from throttle import THROTTLE_COLLECTION, throttle_from_environment
+from ticket_changes import CHANGE_FEED_LAG, decode_change_cursor, encode_change_cursor
 from bson.objectid import ObjectId
 import base64
 import mimetypes
@@ -18793,6 +18247,11 @@ def set_security_headers(response):
     # Removed strict security headers to prevent session issues
     return response
 
+@app.teardown_request
+def finish_request_cache(exc=None):
+    """Record how many entity fetches the request identity map saved (see request_cache.py)"""
+    request_cache.finish_request()
+
 # Enhanced session timeout configuration
 app.permanent_session_lifetime = timedelta(days=30)  # 30 days - very permissive for better user experience
 
@@ -18974,53 +18433,48 @@ def validate_ticket_id(ticket_id):
         return False
     return str(ticket_id).replace(' ', '') == str(ticket_id)  # No spaces allowed
 
+# Rate limits and duplicate-submission checks shared by all gunicorn workers (see throttle.py)
+throttle = throttle_from_environment(lambda: get_db().db[THROTTLE_COLLECTION])
+
 def rate_limit_check(key, limit=10, window=60):
-    """Simple in-memory rate limiting (for production, use Redis)"""
-    import time
-    current_time = time.time()
-    
-    # For simplicity, using a global dict (in production, use proper cache)
-    if not hasattr(rate_limit_check, 'cache'):
-        rate_limit_check.cache = {}
-    
-    if key not in rate_limit_check.cache:
-        rate_limit_check.cache[key] = []
-    
-    # Remove old entries
-    rate_limit_check.cache[key] = [
-        timestamp for timestamp in rate_limit_check.cache[key] 
-        if current_time - timestamp < window
-    ]
-    
-    if len(rate_limit_check.cache[key]) >= limit:
-        return False
-    
-    rate_limit_check.cache[key].append(current_time)
-    return True
+    """Sliding-window rate limit: True while key has made fewer than limit calls in the last window seconds"""
+    return throttle.allow(key, limit, window)
+
+# Bounded, thread-safe LRU+TTL cache for hot read paths (see ttl_cache.py);
+# APP_CACHE_BACKEND=mongodb shares entries between gunicorn workers
+read_cache = cache_from_environment(lambda: get_db().db[APP_CACHE_COLLECTION])
+
+# Short lifetimes: these numbers move as tickets are created and updated
+TICKET_COUNT_CACHE_SECONDS = 30
+DASHBOARD_KPI_CACHE_SECONDS = 30
 
-# Simple caching mechanism (in production, use Redis/Memcached)
 def cache_get(key, default=None):
     """Get value from cache"""
-    if not hasattr(cache_get, 'cache'):
-        cache_get.cache = {}
-    
-    if key in cache_get.cache:
-        value, expires = cache_get.cache[key]
-        if time.time() < expires:
-            return value
-        else:
-            del cache_get.cache[key]
-    
-    return default
+    return read_cache.get(key, default)
 
 def cache_set(key, value, expires_in=300):
     """Set value in cache with expiration (default 5 minutes)"""
-    import time
-    if not hasattr(cache_get, 'cache'):
-        cache_get.cache = {}
-    
-    expires_at = time.time() + expires_in
-    cache_get.cache[key] = (value, expires_at)
+    read_cache.set(key, value, ttl=expires_in)
+
+def cached_tickets_count(db, status_filter=None, priority_filter=None, search_query=None):
+    """get_tickets_count shared by every page view asking for the same filters for a few seconds"""
+    return read_cache.get_or_load(
+        f"tickets_count:{status_filter}:{priority_filter}:{search_query}",
+        lambda: db.get_tickets_count(
+            status_filter=status_filter,
+            priority_filter=priority_filter,
+            search_query=search_query
+        ),
+        ttl=TICKET_COUNT_CACHE_SECONDS
+    )
+
+def cached_dashboard_kpis(db, start_date=None, end_date=None):
+    """get_dashboard_kpis shared by every dashboard poll for the same date range for a few seconds"""
+    return read_cache.get_or_load(
+        f"dashboard_kpis:{start_date}:{end_date}",
+        lambda: db.get_dashboard_kpis(start_date, end_date),
+        ttl=DASHBOARD_KPI_CACHE_SECONDS
+    )
 
 # File upload configuration for serverless environments
 if is_production:
@@ -19060,6 +18514,8 @@ else:
 
 app.config['DEBUG'] = os.environ.get('FLASK_ENV') != 'production'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# n8n email payloads are parsed as they stream in (n8n_ingest), so they get their own, larger limit
+N8N_MAX_PAYLOAD_BYTES = int(os.environ.get('N8N_MAX_PAYLOAD_MB', 50)) * 1024 * 1024
 
 # Add these constants after existing app configuration
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'txt', 'csv'}
@@ -19656,10 +19112,10 @@ def enhanced_process_email_attachments(attachments_data):
                     app.logger.info(f"Nested item {j}: {type(nested_item)} - Keys: {list(nested_item.keys()) if isinstance(nested_item, dict) else 'Not a dict'}")
                     if isinstance(nested_item, dict):
                         # Handle nested JSON string data
-                        if 'data' in nested_item and isinstance(nested_item['data'], str):
+                        if 'data' in nested_item and isinstance(nested_item['data'], (str, dict)):
                             app.logger.info(f"Case 1a: Found JSON string data")
                             try:
-                                parsed_att = json.loads(nested_item['data'])
+                                parsed_att = n8n_ingest.load_embedded_json(nested_item['data'])
                                 app.logger.info(f"Parsed attachment data: {list(parsed_att.keys()) if isinstance(parsed_att, dict) else 'Not a dict'}")
                                 attachment = process_single_attachment(parsed_att)
                                 if attachment:
@@ -19667,7 +19123,7 @@ def enhanced_process_email_attachments(attachments_data):
                                     processed_attachments.append(attachment)
                                     if attachment.get('is_warranty', False):
                                         warranty_detected = True
-                            except json.JSONDecodeError as e:
+                            except ValueError as e:
                                 app.logger.error(f"JSON decode error: {e}")
                                 continue
                         else:
@@ -19681,15 +19137,15 @@ def enhanced_process_email_attachments(attachments_data):
                                     warranty_detected = True
             
             # Case 2: Handle JSON string data
-            elif 'data' in att_data and isinstance(att_data['data'], str):
+            elif 'data' in att_data and isinstance(att_data['data'], (str, dict)):
                 try:
-                    parsed_att = json.loads(att_data['data'])
+                    parsed_att = n8n_ingest.load_embedded_json(att_data['data'])
                     attachment = process_single_attachment(parsed_att)
                     if attachment:
                         processed_attachments.append(attachment)
                         if attachment.get('is_warranty', False):
                             warranty_detected = True
-                except json.JSONDecodeError:
+                except ValueError:
                     attachment = process_single_attachment(att_data)
                     if attachment:
                         processed_attachments.append(attachment)
@@ -19699,10 +19155,10 @@ def enhanced_process_email_attachments(attachments_data):
             # Case 3: Direct attachment data
             else:
                 attachment = process_single_attachment(att_data)
-            if attachment:
-                processed_attachments.append(attachment)
-                if attachment.get('is_warranty', False):
-                    warranty_detected = True
+                if attachment:
+                    processed_attachments.append(attachment)
+                    if attachment.get('is_warranty', False):
+                        warranty_detected = True
     
     # Final debugging summary
     app.logger.info(f"[TARGET] Enhanced attachment processing complete:")
@@ -19749,7 +19205,10 @@ def process_single_attachment(att_data):
     
     # Calculate file size
     file_size = 0
-    if file_data:
+    stored_blob = file_data if isinstance(file_data, n8n_ingest.StoredBlob) else None
+    if stored_blob is not None:
+        file_size = stored_blob['size']
+    elif file_data:
         try:
             file_size = len(base64.b64decode(file_data))
         except:
@@ -19772,6 +19231,10 @@ def process_single_attachment(att_data):
         'index': att_data.get('index', 0),
         'processed_at': datetime.now().isoformat()
     }
+    if stored_blob is not None:
+        # Decoded into the attachment store while the request was parsed (n8n_ingest)
+        attachment.pop('data')
+        attachment.update({'gridfs_id': stored_blob['gridfs_id'], 'blob_field': 'data'})
     
     # Add file type analysis
     try:
@@ -19842,9 +19305,9 @@ def enhanced_process_complex_email_data(raw_data):
                         main_ticket = item
                         
                     # Check if item has direct data field with JSON
-                    elif 'data' in item and isinstance(item['data'], str):
+                    elif 'data' in item and isinstance(item['data'], (str, dict)):
                         try:
-                            parsed_data = json.loads(item['data'])
+                            parsed_data = n8n_ingest.load_embedded_json(item['data'])
                             if 'fileName' in parsed_data:
                                 attachment = process_single_attachment(parsed_data)
                                 if attachment:
@@ -19853,7 +19316,7 @@ def enhanced_process_complex_email_data(raw_data):
                                         warranty_detected = True
                             else:
                                 main_ticket = parsed_data
-                        except json.JSONDecodeError:
+                        except ValueError:
                             pass
                     
                     # [FIX] CRITICAL FIX: Check for flat attachment structure BEFORE treating as main ticket
@@ -20196,9 +19659,26 @@ def n8n_email_tickets():
     """
     New endpoint specifically designed for n8n email data with proper attachment handling
     """
+    stored_blobs = []
+    created_records = []
     try:
-        # Get JSON data from request
-        data = request.json
+        if not request.is_json:
+            return jsonify({'status': 'error', 'message': 'No data provided'}), 400
+        
+        # Parse the body as it arrives instead of loading it whole: attachment payloads are
+        # decoded chunk by chunk straight into the attachment store (see n8n_ingest)
+        try:
+            data, stored_blobs = n8n_ingest.parse_stream(
+                get_input_stream(request.environ, max_content_length=N8N_MAX_PAYLOAD_BYTES),
+                get_db().attachment_store
+            )
+        except RequestEntityTooLarge:
+            return jsonify({
+                'status': 'error',
+                'message': f'Payload exceeds {N8N_MAX_PAYLOAD_BYTES // (1024 * 1024)}MB'
+            }), 413
+        except n8n_ingest.PayloadError as e:
+            return jsonify({'status': 'error', 'message': f'Invalid JSON: {e}'}), 400
         if not data:
             return jsonify({'status': 'error', 'message': 'No data provided'}), 400
         
@@ -20246,6 +19726,7 @@ def n8n_email_tickets():
         
         for ticket in processed_tickets:
             try:
+                ticket_id = None
                 # [FIX] Use n8n provided ticket_id if available, otherwise generate one
                 n8n_ticket_id = ticket.get('ticket_id', '').strip()
                 
@@ -20260,29 +19741,15 @@ def n8n_email_tickets():
                         # Fall through to generate new ID
                         ticket_id = None
                 if not ticket_id:
-                    # Generate unique ticket ID with collision protection as fallback
-                    max_attempts = 20
-                    ticket_id = None
-                    
-                    for attempt in range(max_attempts):
-                        # Generate unique ticket ID
-                        timestamp = datetime.now()
-                        potential_id = f"N8N{timestamp.strftime('%H%M%S')}{random.randint(1000, 9999)}"
-                        
-                        # Check if ID already exists
-                        if not db.ticket_id_exists(potential_id):
-                            ticket_id = potential_id
-                            break
-                        app.logger.debug(f"Ticket ID collision {potential_id}, retrying...")
+                    # Allocate a 6-character email ticket ID from the atomic counter as fallback
+                    ticket_id = generate_email_ticket_id(
+                        ticket.get('from', ''), ticket.get('name', 'Unknown'), ticket.get('Classification', 'General'), db
+                    )
                     
                     if n8n_ticket_id:
                         app.logger.warning(f"[N8N_TICKET_ID] N8N ticket ID {n8n_ticket_id} already exists, using generated ID: {ticket_id}")
                     else:
                         app.logger.info(f"[N8N_TICKET_ID] No n8n ticket ID provided, using generated ID: {ticket_id}")
-                    
-                    if not ticket_id:
-                        app.logger.error(f"Failed to generate unique ticket ID after {max_attempts} attempts")
-                        continue
                 
                 # Prepare ticket data for database (matching database schema)
                 # Fix total_attachments calculation issue - always use actual attachment count
@@ -20300,6 +19767,7 @@ def n8n_email_tickets():
                 app.logger.info(f"[INFO] Ticket {ticket_id} - has_attachments: {ticket.get('has_attachments')}, total_attachments: {total_attachments}, attachments array length: {len(attachments_array)}")
                 
                 # Generate unique thread_id to avoid conflicts (never use incoming threadI data)
+                timestamp = datetime.now()
                 thread_id = f"THREAD_{ticket_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}_{random.randint(100, 999)}"
                 
                 # AUTO-CONFIRM WARRANTY: If warranty detected in email, set status directly to "Warranty Form Received"
@@ -20328,6 +19796,8 @@ def n8n_email_tickets():
                     'warranty_forms_count': ticket.get('warranty_forms_count', 0) or 0,
                     'total_attachments': total_attachments or 0,
                     'attachment_total_size': ticket.get('attachment_total_size', 0) or 0,
+                    # Streamed payloads are already stored; create_ticket offloads the inline ones
+                    'attachments': attachments_array,
                     'processing_method': 'n8n_email_processor'
                 }
                 
@@ -20397,57 +19867,7 @@ def n8n_email_tickets():
                     app.logger.error(f"Full traceback: {traceback.format_exc()}")
                     raise db_error
                 
-                # Process and SAVE attachments to disk for proper download
-                total_ticket_attachments = ticket.get('attachments', [])
-                app.logger.info(f"FOLDER PROCESSING {len(total_ticket_attachments)} ATTACHMENTS for ticket {ticket_id}")
-                
-                if total_ticket_attachments:
-                    for i, attachment in enumerate(total_ticket_attachments):
-                        try:
-                            filename = attachment.get('filename', f'attachment_{i}')
-                            file_data = attachment.get('data', '')
-                            is_warranty = attachment.get('is_warranty', False)
-                            
-                            app.logger.info(f"💾 PROCESSING ATTACHMENT {i+1}/{len(total_ticket_attachments)}: {filename} (warranty: {is_warranty})")
-                            
-                            # SAVE FILE TO DISK for download functionality
-                            file_path = None
-                            if file_data:
-                                try:
-                                    # Decode base64 and save to uploads directory
-                                    decoded_data = base64.b64decode(file_data)
-                                    safe_filename = secure_filename(filename)
-                                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                    unique_filename = f"{timestamp}_{ticket_id}_{safe_filename}"
-                                    
-                                    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                                    with open(file_path, 'wb') as f:
-                                        f.write(decoded_data)
-                                    
-                                    app.logger.info(f" SAVED ATTACHMENT to disk: {file_path} ({len(decoded_data)} bytes)")
-                                    
-                                except Exception as save_error:
-                                    app.logger.error(f" Failed to save attachment {filename}: {save_error}")
-                                    file_path = None
-                            else:
-                                app.logger.warning(f" NO FILE DATA for attachment {filename}")
-                            
-                            # Store both metadata AND file path for download
-                            attachment_metadata = {
-                                'key': f'attachment_{i}',
-                                'filename': filename,
-                                'file_path': file_path,  # ADD: Path to saved file
-                                'data': file_data,       # Keep base64 data as backup
-                                'is_warranty': attachment.get('is_warranty', False),
-                                'size': attachment.get('size', 0),
-                                'file_type': attachment.get('file_type', 'unknown'),
-                                'saved_to_disk': bool(file_path)  # Track if file was saved
-                            }
-                            db.add_ticket_metadata(ticket_id, f'attachment_{i}', json.dumps(attachment_metadata))
-                            app.logger.info(f"COMPLETE: Saved attachment {filename} - disk:{bool(file_path)} metadata:✓")
-                            
-                        except Exception as att_error:
-                            app.logger.error(f"Error processing attachment {i}: {att_error}")
+                created_records.append(ticket_data)
                 
                 created_tickets.append({
                     'ticket_id': ticket_id,
@@ -20504,6 +19924,10 @@ def n8n_email_tickets():
             'status': 'error',
             'message': f'Server error: {str(e)}'
         }), 500
+    finally:
+        # Payloads stored while parsing that did not end up on a created ticket
+        if stored_blobs:
+            n8n_ingest.release_unused(get_db().attachment_store, stored_blobs, created_records)
 
 @app.route('/api/n8n/simple-test', methods=['POST'])
 def n8n_simple_test():
@@ -20585,14 +20009,15 @@ def warranty_form_submission():
         # Connect to database first
         db = get_db()
         
-        # Create unique warranty ticket ID with race condition protection
-        max_attempts = 50
+        # Warranty ticket IDs come from the atomic counter (W + 5 hex characters); the retry only
+        # covers an ID inserted by another path between the allocator's check and this insert
+        max_attempts = 3
         ticket_id = None
         # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
         thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
         
         for attempt in range(max_attempts):
-            potential_id = f"W{str(uuid.uuid4())[:5].upper()}"
+            potential_id = db.allocate_ticket_id('W')
             
             try:
                 # Try to create ticket with this ID - will fail if duplicate
@@ -20633,14 +20058,14 @@ def warranty_form_submission():
         if not ticket_id:
             return jsonify({'status': 'error', 'message': 'Failed to generate unique ticket ID. Please try again.'}), 500
         
-        # Store vehicle registration
+        # Store vehicle registration and any additional form fields as metadata
+        form_metadata = {
+            key: str(value) for key, value in data.items()
+            if key not in ['customer_name', 'customer_email', 'customer_phone', 'vehicle_registration', 'warranty_details']
+        }
         if registration:
-            db.add_ticket_metadata(ticket_id, 'vehicle_registration', registration)
-        
-        # Store any additional form fields as metadata
-        for key, value in data.items():
-            if key not in ['customer_name', 'customer_email', 'customer_phone', 'vehicle_registration', 'warranty_details']:
-                db.add_ticket_metadata(ticket_id, key, str(value))
+            form_metadata['vehicle_registration'] = registration
+        db.set_ticket_metadata_many(ticket_id, form_metadata)
         
         # Create a reply indicating this was an automatic submission
         reply_data = {
@@ -20710,6 +20135,8 @@ def health_check():
             'message': 'Application is running',
             'environment': os.environ.get('FLASK_ENV', 'development'),
             'database': 'connected',
+            'schema_version': db.schema_version,
+            'schema_up_to_date': db.schema_version >= SCHEMA_VERSION,
             'upload_folder': UPLOAD_FOLDER,
             'version': 'v2.0-comprehensive-assignment',  # Added version tag
             'last_updated': '2025-07-26'
@@ -21992,48 +21419,16 @@ def get_email_classification_code(classification):
 def generate_email_ticket_id(email, name, classification, db):
     """
     [TARGET] Generate email ticket ID in SAME format as manual tickets: E{type_code}{4 digits}
-    Uses identical deterministic calculation as manual tickets for consistency
+    Allocated from the same atomic per-prefix counter as manual tickets
     """
     # Get classification code (similar to manual ticket type codes)
     type_code = get_email_classification_code(classification)
     
-    max_attempts = 100
-    ticket_id = None
-    
     app.logger.info(f"[TARGET] Generating email ticket ID for: {email}, classification: {classification} -> {type_code}")
     
-    for attempt in range(max_attempts):
-        # Generate 4-digit code using SAME logic as manual tickets
-        seed_string = f"{email}{name}{datetime.now().isoformat()}"
-        
-        # Calculate sum of character codes (identical to manual ticket logic)
-        sum_chars = 0
-        for char in seed_string:
-            sum_chars += ord(char)
-        
-        # Generate 4-digit number (same as manual: sum % 10000)
-        four_digit_code = sum_chars % 10000
-        four_digit_str = f"{four_digit_code:04d}"  # Ensure 4 digits with leading zeros
-        
-        potential_id = f"E{type_code}{four_digit_str}"  # Exactly 6 chars: E + 1 + 4 digits
-        
-        app.logger.info(f"? Attempting email ticket ID: {potential_id} (attempt {attempt + 1}/{max_attempts})")
-        app.logger.debug(f"? Email calculation: seed='{seed_string[:50]}...', sum_chars={sum_chars}, 4-digit={four_digit_code}")
-        
-        # Check if ID already exists (same check as manual tickets)
-        if not db.ticket_id_exists(potential_id):
-            ticket_id = potential_id
-            app.logger.info(f"[SUCCESS] Generated unique email ticket ID: {ticket_id}")
-            break
-        else:
-            app.logger.debug(f"[RETRY] Email ticket ID collision: {potential_id}, retrying...")
-            # Add small random variation to avoid infinite loops with same data
-            import time
-            time.sleep(0.001)  # 1ms delay to change timestamp
-    
-    if not ticket_id:
-        app.logger.error(f"[ERROR] Failed to generate unique email ticket ID after {max_attempts} attempts")
-        raise Exception(f"Failed to generate unique email ticket ID after {max_attempts} attempts")
+    # One atomic counter update per ID: unique across gunicorn workers without retry loops
+    ticket_id = db.allocate_ticket_id(f"E{type_code}")  # Exactly 6 chars: E + 1 + 4 digits
+    app.logger.info(f"[SUCCESS] Generated unique email ticket ID: {ticket_id}")
     
     return ticket_id
 
@@ -22258,19 +21653,13 @@ def dashboard():
         if current_user_role == 'Technical Director':
             return redirect(url_for('tech_director_dashboard'))
         
-        # CRITICAL FIX: Ensure all tickets have has_unread_reply field before processing
-        try:
-            db.migrate_has_unread_reply_field()
-            app.logger.info("[DASHBOARD] has_unread_reply field migration completed")
-        except Exception as migration_error:
-            app.logger.warning(f"[DASHBOARD] has_unread_reply migration failed: {migration_error}")
-        
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         status_filter = request.args.get('status', 'All')
         priority_filter = request.args.get('priority', 'All')
         search_query = request.args.get('search', '')
+        after = request.args.get('after')
         
         # Get paginated tickets with assignment info
         tickets = db.get_tickets_with_assignments(
@@ -22278,11 +21667,16 @@ def dashboard():
             per_page=per_page, 
             status_filter=status_filter,
             priority_filter=priority_filter,
-            search_query=search_query
+            search_query=search_query,
+            after=after
         )
         
+        # Keyset token for the following page (links pass it as ?after= so deep pages skip nothing)
+        next_cursor = encode_ticket_cursor(tickets[-1]) if len(tickets) == per_page else None
+        
         # Get total count for pagination
-        total_tickets = db.get_tickets_count(
+        total_tickets = cached_tickets_count(
+            db,
             status_filter=status_filter,
             priority_filter=priority_filter,
             search_query=search_query
@@ -22383,52 +21777,9 @@ def dashboard():
                     except:
                         ticket['formatted_date'] = str(ticket['created_at'])
             
-            # Get technician information for this ticket
-            ticket_id = ticket.get('ticket_id')
-            if ticket_id:
-                try:
-                    # Check if database is actually working
-                    if not hasattr(db, 'ticket_metadata') or not db.ticket_metadata:
-                        app.logger.warning(f"Database not properly initialized for ticket {ticket_id}")
-                        ticket['technician_name'] = None
-                        ticket['technician_id'] = None
-                    else:
-                        metadata = db.get_ticket_metadata(ticket_id)
-                        app.logger.info(f" Retrieved metadata for ticket {ticket_id}: {metadata}")
-                        if metadata:
-                            app.logger.info(f"Found {len(metadata)} metadata entries for ticket {ticket_id}")
-                            for meta in metadata:
-                                app.logger.info(f"  - Key: '{meta.get('key')}', Value: '{meta.get('value')}'")
-                                if meta.get('key') == 'technician_name':
-                                    ticket['technician_name'] = meta.get('value')
-                                    app.logger.info(f" Set technician_name to: {meta.get('value')}")
-                                    break
-                                elif meta.get('key') == 'technician_id':
-                                    ticket['technician_id'] = meta.get('value')
-                                    app.logger.info(f" Set technician_id to: {meta.get('value')}")
-                                    break
-                        else:
-                            app.logger.info(f" No metadata found for ticket {ticket_id}")
-                            ticket['technician_name'] = None
-                            ticket['technician_id'] = None
-                        
-                        # Ensure technician fields are explicitly set to None if not found
-                        if 'technician_name' not in ticket or ticket['technician_name'] is None:
-                            ticket['technician_name'] = None
-                            app.logger.info(f"🔧 Explicitly set technician_name to None for ticket {ticket_id}")
-                        if 'technician_id' not in ticket or ticket['technician_id'] is None:
-                            ticket['technician_id'] = None
-                            app.logger.info(f"🔧 Explicitly set technician_id to None for ticket {ticket_id}")
-                except Exception as e:
-                    app.logger.debug(f"Error getting technician info for ticket {ticket_id}: {e}")
-                    ticket['technician_name'] = None
-                    ticket['technician_id'] = None
-                
-                # Final fallback: ensure technician fields are always set
-                if 'technician_name' not in ticket:
-                    ticket['technician_name'] = None
-                if 'technician_id' not in ticket:
-                    ticket['technician_id'] = None
+            # Technician fields are denormalized onto the ticket document
+            ticket['technician_name'] = ticket.get('technician_name')
+            ticket['technician_id'] = ticket.get('technician_id')
             
             # Check if this ticket is forwarded to current user
             is_forwarded_to_current_user = (
@@ -22467,89 +21818,10 @@ def dashboard():
             app.logger.info(f" Final technician data for ticket {ticket_id}: technician_name='{ticket.get('technician_name')}', technician_id='{ticket.get('technician_id')}'")
             app.logger.info(f" Ticket {ticket_id} keys: {list(ticket.keys())}")
             
-            # Double-check: if we still don't have technician data, try one more time
-            if not ticket.get('technician_name') and not ticket.get('technician_id'):
-                app.logger.warning(f" Ticket {ticket_id} still missing technician data, trying one more retrieval...")
-                try:
-                    final_metadata = db.get_ticket_metadata(ticket_id)
-                    for meta in final_metadata:
-                        if meta.get('key') == 'technician_name':
-                            ticket['technician_name'] = meta.get('value')
-                            app.logger.info(f"🔄 Final attempt: Set technician_name to: {meta.get('value')}")
-                            break
-                except Exception as e:
-                    app.logger.error(f" Final attempt failed for ticket {ticket_id}: {e}")
-        
-        #  DYNAMIC WARRANTY CLASSIFICATION: Update classification for tickets with warranty attachments
+        #  DYNAMIC WARRANTY CLASSIFICATION: Tickets with warranty attachments are shown as "Warranty Claim"
         for ticket_dict in formatted_tickets:
-            ticket_id = ticket_dict.get('ticket_id')
-            if ticket_id:
-                try:
-                    # Check if ticket has warranty attachments
-                    metadata = db.get_ticket_metadata(ticket_id)
-                    has_warranty_attachment = False
-                    
-                    if metadata:
-                        for meta in metadata:
-                            try:
-                                # Ensure meta is a dictionary
-                                if not isinstance(meta, dict):
-                                    continue
-                                
-                                meta_value = meta.get('value')
-                                if isinstance(meta_value, str):
-                                    # Handle potential malformed JSON
-                                    if meta_value.strip() and meta_value.strip() not in ['{}', '']:
-                                        try:
-                                            # Clean JSON before parsing
-                                            clean_json = meta_value.strip()
-                                            # Remove trailing commas and fix common JSON issues
-                                            if clean_json.endswith(',}'):
-                                                clean_json = clean_json[:-2] + '}'
-                                            elif clean_json.endswith(',]'):
-                                                clean_json = clean_json[:-2] + ']'
-                                            # Remove any leading/trailing whitespace and quotes
-                                            clean_json = clean_json.strip().strip('"\'')
-                                            # Skip if still empty after cleaning
-                                            if not clean_json or clean_json in ['{}', '[]', 'null', 'undefined']:
-                                                meta_data = {}
-                                            else:
-                                                meta_data = json.loads(clean_json)
-                                        except json.JSONDecodeError as json_err:
-                                            # Only log if it's actually malformed, not just empty
-                                            if meta_value.strip() and meta_value.strip() not in ['{}', '[]', 'null', 'undefined', '']:
-                                                app.logger.debug(f"Skipping malformed JSON in metadata: {json_err} - Value: {meta_value[:50]}")
-                                            meta_data = {}
-                                    else:
-                                        meta_data = {}
-                                elif isinstance(meta_value, dict):
-                                    meta_data = meta_value
-                                else:
-                                    meta_data = {}
-                                
-                                # Check if this attachment is warranty-related
-                                if isinstance(meta_data, dict):
-                                    is_warranty = meta_data.get('is_warranty', False)
-                                    if is_warranty:
-                                        has_warranty_attachment = True
-                                        break
-                            except (json.JSONDecodeError, TypeError, AttributeError) as e:
-                                app.logger.warning(f"Error processing metadata for ticket {ticket_id}: {e}")
-                                continue
-                    
-                    # Also check direct has_warranty flag on ticket
-                    has_warranty_flag = ticket_dict.get('has_warranty', False)
-                    
-                    # If ticket has warranty attachments or warranty flag, ensure classification is "Warranty Claim"
-                    if has_warranty_attachment or has_warranty_flag:
-                        original_classification = ticket_dict.get('classification')
-                        ticket_dict['classification'] = 'Warranty Claim'
-                        
-                        if original_classification != 'Warranty Claim':
-                            app.logger.info(f" DYNAMIC WARRANTY CLASSIFICATION: Ticket {ticket_id} updated from '{original_classification}' to 'Warranty Claim' (warranty_attachment: {has_warranty_attachment}, warranty_flag: {has_warranty_flag})")
-                
-                except Exception as e:
-                    app.logger.error(f"Error checking warranty status for ticket {ticket_id}: {e}")
+            if ticket_dict.get('has_warranty_attachment') or ticket_dict.get('has_warranty', False):
+                ticket_dict['classification'] = 'Warranty Claim'
         
         # Group tickets by date
         tickets_grouped = group_tickets_by_date(formatted_tickets)
@@ -22594,6 +21866,7 @@ def dashboard():
             'has_next': has_next,
             'prev_page': prev_page,
             'next_page': next_page,
+            'next_cursor': next_cursor,
             'status_filter': status_filter,
             'priority_filter': priority_filter,
             'search_query': search_query
@@ -22826,7 +22099,7 @@ def admin_panel():
         
         # Calculate stats - FIXED: Use database total count
         # total_tickets should come from database.get_tickets_count() not len(tickets)
-        total_tickets = db.get_tickets_count()
+        total_tickets = cached_tickets_count(db)
         open_tickets = len([t for t in tickets if t.get('status') == 'Open'])
         resolved_tickets = len([t for t in tickets if t.get('status') == 'Resolved'])
         
@@ -22945,6 +22218,7 @@ def manage_member(member_id):
                 {'_id': ObjectId(member_id)},
                 {'$set': update_data}
             )
+            db.invalidate_members(member_id)
             return jsonify({'status': 'success'})
         except Exception as e:
             return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -22969,6 +22243,7 @@ def manage_member(member_id):
                 return jsonify({'status': 'error', 'message': 'Cannot delete protected administrator or technical director accounts'}), 403
             
             result = db.members.delete_one({'_id': ObjectId(member_id)})
+            db.invalidate_members(member_id)
             if result.deleted_count > 0:
                 app.logger.info(f"[DELETE] Successfully deleted member {member_id}")
                 return jsonify({'status': 'success', 'message': 'Member deleted successfully'})
@@ -23272,9 +22547,11 @@ def trigger_tech_director_webhook_async(ticket_id, ticket_data, assignment_metho
                 app.logger.info(f"[SUCCESS] Response: {response.status_code} - {response.text[:100]}...")
                 
                 # Store success metadata
-                db.add_ticket_metadata(ticket_id, 'async_webhook_triggered', datetime.now().isoformat())
-                db.add_ticket_metadata(ticket_id, 'webhook_attempts', str(attempt + 1))
-                db.add_ticket_metadata(ticket_id, 'webhook_method', assignment_method)
+                db.set_ticket_metadata_many(ticket_id, {
+                    'async_webhook_triggered': datetime.now().isoformat(),
+                    'webhook_attempts': str(attempt + 1),
+                    'webhook_method': assignment_method
+                })
                 
                 return  # Success - exit retry loop
                 
@@ -23289,9 +22566,11 @@ def trigger_tech_director_webhook_async(ticket_id, ticket_data, assignment_metho
                     # Final attempt failed
                     app.logger.error(f"[ERROR] ASYNC WEBHOOK FINAL FAILURE - Ticket {ticket_id} after {max_retries} attempts")
                     try:
-                        db.add_ticket_metadata(ticket_id, 'async_webhook_failed', datetime.now().isoformat())
-                        db.add_ticket_metadata(ticket_id, 'webhook_attempts', str(max_retries))
-                        db.add_ticket_metadata(ticket_id, 'webhook_error', str(e))
+                        db.set_ticket_metadata_many(ticket_id, {
+                            'async_webhook_failed': datetime.now().isoformat(),
+                            'webhook_attempts': str(max_retries),
+                            'webhook_error': str(e)
+                        })
                     except:
                         pass  # Don't fail if metadata storage fails
     
@@ -23433,10 +22712,12 @@ def trigger_tech_director_webhook(ticket_id, ticket_data, assignment_method='ref
         
         # Store webhook metadata
         app.logger.info(f"[DEBUG] Storing webhook metadata for ticket {ticket_id}")
-        db.add_ticket_metadata(ticket_id, 'webhook_triggered', datetime.now().isoformat())
-        db.add_ticket_metadata(ticket_id, 'webhook_url', WEBHOOK_URL)
-        db.add_ticket_metadata(ticket_id, 'webhook_method', assignment_method)
-        db.add_ticket_metadata(ticket_id, 'referred_by', webhook_payload['referred_by'])
+        db.set_ticket_metadata_many(ticket_id, {
+            'webhook_triggered': datetime.now().isoformat(),
+            'webhook_url': WEBHOOK_URL,
+            'webhook_method': assignment_method,
+            'referred_by': webhook_payload['referred_by']
+        })
         
         app.logger.info(f"[DEBUG] Webhook metadata stored successfully for ticket {ticket_id}")
         return True
@@ -23732,9 +23013,11 @@ def refer_to_tech_director(ticket_id):
         # Note: webhook_queued is always True for async - actual result happens in background
         
         # Add metadata to track the referral
-        db.add_ticket_metadata(ticket_id, 'referred_by_manual_button', referrer_name)
-        db.add_ticket_metadata(ticket_id, 'referral_method', 'manual_button')
-        db.add_ticket_metadata(ticket_id, 'referral_timestamp', datetime.now().isoformat())
+        db.set_ticket_metadata_many(ticket_id, {
+            'referred_by_manual_button': referrer_name,
+            'referral_method': 'manual_button',
+            'referral_timestamp': datetime.now().isoformat()
+        })
         
         return jsonify({
             'status': 'success',
@@ -24513,60 +23796,11 @@ def tech_director_dashboard():
                 except Exception:
                     ticket_dict['formatted_date'] = str(created_at_value)
             
-            # Get vehicle registration from metadata
-            metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-            ticket_dict['vehicle_registration'] = 'Not specified'
-            has_warranty_attachment = False
-            
-            for meta in metadata:
-                try:
-                    if isinstance(meta, dict):
-                        meta_key = meta.get('key')
-                        meta_value = meta.get('value')
-                    else:
-                        meta_key = None
-                        meta_value = None
-                except (AttributeError, TypeError):
-                    meta_key = None
-                    meta_value = None
+            # Vehicle registration and warranty flag are denormalized onto the ticket document
+            ticket_dict['vehicle_registration'] = ticket_dict.get('vehicle_registration') or 'Not specified'
 
-                if meta_key == 'vehicle_registration':
-                    ticket_dict['vehicle_registration'] = meta_value if isinstance(meta_value, str) else str(meta_value)
-                
-                #  DYNAMIC WARRANTY CLASSIFICATION: Check for warranty attachments
-                try:
-                    if isinstance(meta_value, str):
-                        # Clean JSON before parsing
-                        clean_json = meta_value.strip()
-                        # Remove trailing commas and fix common JSON issues
-                        if clean_json.endswith(',}'):
-                            clean_json = clean_json[:-2] + '}'
-                        elif clean_json.endswith(',]'):
-                            clean_json = clean_json[:-2] + ']'
-                        # Remove any leading/trailing whitespace and quotes
-                        clean_json = clean_json.strip().strip('"\'')
-                        # Skip if still empty after cleaning
-                        if not clean_json or clean_json in ['{}', '[]', 'null', 'undefined']:
-                            meta_data = {}
-                        else:
-                            meta_data = json.loads(clean_json)
-                    elif isinstance(meta_value, dict):
-                        meta_data = meta_value
-                    else:
-                        meta_data = {}
-                    
-                    # Check if this attachment is warranty-related
-                    is_warranty = meta_data.get('is_warranty', False) if isinstance(meta_data, dict) else False
-                    if is_warranty:
-                        has_warranty_attachment = True
-                except (json.JSONDecodeError, TypeError, ValueError) as e:
-                    # Only log if it's actually malformed, not just empty
-                    if isinstance(meta_value, str) and meta_value.strip() and meta_value.strip() not in ['{}', '[]', 'null', 'undefined', '']:
-                        app.logger.debug(f"JSON parse error in TD dashboard: {e} - Value: {meta_value[:50]}")
-                    meta_data = {}
-            
             # Update classification if warranty attachment found
-            if has_warranty_attachment or ticket_dict.get('has_warranty', False):
+            if ticket_dict.get('has_warranty_attachment') or ticket_dict.get('has_warranty', False):
                 original_classification = ticket_dict.get('classification')
                 ticket_dict['classification'] = 'Warranty Claim'
                 
@@ -24806,11 +24040,8 @@ def submit_tech_director_feedback(ticket_id):
         if recommended_action:
             metadata_updates.append(('recommended_action', recommended_action))
         
-        for key, value in metadata_updates:
-            # Remove existing entry first
-            db.ticket_metadata.delete_many({'ticket_id': ticket_id, 'key': key})
-            # Add new entry
-            db.add_ticket_metadata(ticket_id, key, str(value))
+        # Replaces any existing entries for these keys
+        db.set_ticket_metadata_many(ticket_id, {key: str(value) for key, value in metadata_updates})
         
         # Create a reply with the Tech Director's assessment
         reply_data = {
@@ -24912,23 +24143,6 @@ def assign_ticket(ticket_id):
         app.logger.error(f"[ALERT] ASSIGN INIT ERROR: {debug_error}")
         return jsonify({'status': 'error', 'message': 'Request processing error'}), 500
     
-    # Technical Director can only forward tickets, not take them over
-    db = get_db()
-    current_member = db.get_member_by_id(session['member_id'])
-    is_tech_director = current_member and current_member['role'] == 'Technical Director'
-    
-    if is_tech_director:
-        # Technical Director can only forward, check if this is a forward operation
-        data = request.json
-        is_forwarded = data.get('is_forwarded', False)
-        if not is_forwarded:
-            return jsonify({'status': 'error', 'message': 'Technical Director can only forward tickets, not take them over.'}), 403
-        
-        # Ensure the ticket is referred to Technical Director
-        ticket = db.get_ticket_by_id(ticket_id)
-        if not ticket or ticket.get('status') != 'Referred to Tech Director':
-            return jsonify({'status': 'error', 'message': 'You can only forward tickets that have been referred to you.'}), 403
-    
     # Step 1: Authentication Check
     if 'member_id' not in session:
         app.logger.warning(f"Unauthorized assignment attempt for ticket {ticket_id}")
@@ -24973,42 +24187,11 @@ def assign_ticket(ticket_id):
             'error_code': 'INVALID_JSON'
         }), 400
     
-    # Step 3: Database Connection
-    try:
-        db = get_db()
-        app.logger.info(f"Database connection established for ticket {ticket_id}")
-        
-        # Check if ticket exists first
-        ticket = db.tickets.find_one({'ticket_id': ticket_id})
-        if not ticket:
-            app.logger.error(f"Ticket not found: {ticket_id}")
-            app.logger.info(f"Available tickets sample: {[t['ticket_id'] for t in db.tickets.find().limit(5)]}")
-            return jsonify({
-                'status': 'error',
-                'message': f'Ticket {ticket_id} not found. Please verify the ticket ID.',
-                'error_code': 'TICKET_NOT_FOUND'
-            }), 404
-    except Exception as e:
-        app.logger.error(f"Database connection failed for ticket {ticket_id}: {str(e)}")
-        return jsonify({
-            'status': 'error',
-            'message': 'Database connection failed',
-            'error_code': 'DB_CONNECTION_FAILED'
-        }), 500
-    
-    # Step 4: Validate and Process Member ID
+    # Step 3: Validate and Process Member ID
     try:
         member_id_raw = data.get('member_id')
         app.logger.info(f"Processing member_id: '{member_id_raw}' (type: {type(member_id_raw)})")
         
-        # Clean and validate member_id
-        if not member_id_raw:
-            return jsonify({
-                'status': 'error',
-                'message': 'member_id cannot be empty',
-                'error_code': 'EMPTY_MEMBER_ID'
-            }), 400
-            
         member_id_str = str(member_id_raw).strip()
         if not member_id_str:
             return jsonify({
@@ -25027,7 +24210,6 @@ def assign_ticket(ticket_id):
             }), 400
             
         member_id_obj = ObjectId(member_id_str)
-        app.logger.info(f"Valid ObjectId created: {member_id_obj}")
         
     except Exception as e:
         app.logger.error(f"Member ID processing error: {str(e)}")
@@ -25037,123 +24219,91 @@ def assign_ticket(ticket_id):
             'error_code': 'MEMBER_ID_PROCESSING_ERROR'
         }), 400
     
-    # Step 5: Validate Member Exists
+    # Step 4: Ticket, current assignment and the members involved in one request-scoped fetch
+    is_forwarded = data.get('is_forwarded', False)
+    forwarded_from_raw = data.get('forwarded_from') if is_forwarded else None
     try:
-        member = db.get_member_by_id(member_id_str)
-        if not member:
-            app.logger.error(f"Member not found: {member_id_str}")
+        db = get_db()
+        context = db.get_assignment_context(ticket_id, [session['member_id'], member_id_str, forwarded_from_raw])
+        if not context:
+            app.logger.error(f"Ticket not found: {ticket_id}")
             return jsonify({
                 'status': 'error',
-                'message': f'Member not found: {member_id_str}',
-                'error_code': 'MEMBER_NOT_FOUND'
+                'message': f'Ticket {ticket_id} not found. Please verify the ticket ID.',
+                'error_code': 'TICKET_NOT_FOUND'
             }), 404
-        # [ALERT] CRITICAL DEBUG: Member analysis
-        member_role = member.get('role', 'NO_ROLE')
-        member_name = member.get('name', 'NO_NAME')
-        
-        print("-" * 60)
-        print(f"[ALERT] MEMBER FOUND: {member_name}")
-        print(f"[ALERT] MEMBER ROLE: '{member_role}'")
-        print(f"[ALERT] CURRENT USER is_tech_director: {is_tech_director}")
-        print(f"[ALERT] ROLE CHECK: '{member_role}' == 'Technical Director' ? {member_role == 'Technical Director'}")
-        print(f"[ALERT] USER CHECK: not is_tech_director ? {not is_tech_director}")
-        print(f"[ALERT] WEBHOOK TRIGGER CONDITION: {member_role == 'Technical Director' and not is_tech_director}")
-        print("-" * 60)
-        
-        app.logger.info(f"Member found: {member_name} (Role: {member_role}) - Webhook condition: {member_role == 'Technical Director' and not is_tech_director}")
-        
-        # Also check if Tech Director exists in database
-        try:
-            db_tech_directors = list(db.members.find({"role": "Technical Director"}))
-            print(f"[ALERT] TECH DIRECTORS IN DB: {len(db_tech_directors)}")
-            for td in db_tech_directors:
-                print(f"[ALERT]   - {td.get('name', 'NO_NAME')} (ID: {str(td.get('_id', 'NO_ID'))}, Role: '{td.get('role', 'NO_ROLE')}')")
-        except Exception as db_check_error:
-            print(f"[ALERT] DB CHECK ERROR: {db_check_error}")
-        
     except Exception as e:
-        app.logger.error(f"Member lookup error for {member_id_str}: {str(e)}")
+        app.logger.error(f"Database connection failed for ticket {ticket_id}: {str(e)}")
         return jsonify({
             'status': 'error',
-            'message': f'Error finding member: {str(e)}',
-            'error_code': 'MEMBER_LOOKUP_ERROR'
+            'message': 'Database connection failed',
+            'error_code': 'DB_CONNECTION_FAILED'
         }), 500
     
-    # Step 7: Handle Existing Assignments - FIXED TRANSACTION LOGIC
-    try:
-        existing_assignment = db.get_assignment_by_ticket(ticket_id)
-        app.logger.info(f"[DEBUG] EXISTING ASSIGNMENT CHECK - Ticket: {ticket_id}, Assignment: {existing_assignment}")
+    ticket = context['ticket']
+    members = context['members']
+    existing_assignment = context['assignment']
+    
+    # Technical Director can only forward tickets, not take them over
+    current_member = members.get(str(session['member_id']))
+    is_tech_director = current_member and current_member['role'] == 'Technical Director'
+    
+    if is_tech_director:
+        if not is_forwarded:
+            return jsonify({'status': 'error', 'message': 'Technical Director can only forward tickets, not take them over.'}), 403
         
-        if existing_assignment:
-            existing_member_id = str(existing_assignment.get('member_id'))
-            target_member_id_str = str(member_id_obj)
-            
-            app.logger.info(f"[INFO] ASSIGNMENT COMPARISON - Existing: {existing_member_id}, Target: {target_member_id_str}")
-            
-            # [FIX] Allow forwarding back to same user - only block if it's NOT a forward operation
-            is_forwarding_to_same_user = (str(existing_assignment['member_id']) == member_id_str)
-            is_forward_operation = data.get('is_forwarded', False)
-            
-            if is_forwarding_to_same_user and not is_forward_operation:
-                # Only block if trying to assign to same user AND it's not a forward operation
-                return jsonify({
-                    'status': 'error',
-                    'message': f'Ticket already assigned to {member["name"]}',
-                    'error_code': 'ALREADY_ASSIGNED'
-                }), 400
-            elif is_forwarding_to_same_user and is_forward_operation:
-                # Allow forwarding back to same user - this is valid
-                app.logger.info(f"[FORWARD] Allowing forward back to same user: {member['name']}")
-            
-            # Remove existing assignment for reassignment (including forward to same user)
-            result = db.ticket_assignments.delete_one({'ticket_id': ticket_id})
-            app.logger.info(f"Removed existing assignment: {result.deleted_count} records")
-        else:
-            app.logger.info(f"No existing assignment for ticket {ticket_id}")
-            
-    except Exception as e:
-        app.logger.error(f"Assignment check error for ticket {ticket_id}: {str(e)}")
+        # Ensure the ticket is referred to Technical Director
+        if ticket.get('status') != 'Referred to Tech Director':
+            return jsonify({'status': 'error', 'message': 'You can only forward tickets that have been referred to you.'}), 403
+    
+    # Step 5: Validate Member Exists
+    member = members.get(member_id_str)
+    if not member:
+        app.logger.error(f"Member not found: {member_id_str}")
         return jsonify({
             'status': 'error',
-            'message': f'Error checking existing assignments: {str(e)}',
-            'error_code': 'ASSIGNMENT_CHECK_ERROR'
-        }), 500
+            'message': f'Member not found: {member_id_str}',
+            'error_code': 'MEMBER_NOT_FOUND'
+        }), 404
+    app.logger.info(f"Member found: {member.get('name')} (Role: {member.get('role')}) - Webhook condition: {member.get('role') == 'Technical Director' and not is_tech_director}")
     
-    # Step 8: Handle Forwarding Logic
-    is_forwarded = data.get('is_forwarded', False)
-    forwarded_from = None
+    # Step 6: Existing Assignment - replaced atomically below, so no delete here
+    if existing_assignment:
+        # [FIX] Allow forwarding back to same user - only block if it's NOT a forward operation
+        is_forwarding_to_same_user = (str(existing_assignment['member_id']) == member_id_str)
+        if is_forwarding_to_same_user and not is_forwarded:
+            return jsonify({
+                'status': 'error',
+                'message': f'Ticket already assigned to {member["name"]}',
+                'error_code': 'ALREADY_ASSIGNED'
+            }), 400
+        elif is_forwarding_to_same_user:
+            app.logger.info(f"[FORWARD] Allowing forward back to same user: {member['name']}")
     
+    # Optimistic concurrency: the version the client saw, else the one just read
+    try:
+        expected_version = int(data['version']) if data.get('version') is not None else \
+            (existing_assignment or {}).get('version', 0)
+    except (TypeError, ValueError):
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid assignment version: {data.get('version')}",
+            'error_code': 'INVALID_VERSION'
+        }), 400
+    
+    # Step 7: Handle Forwarding Logic
+    forwarded_from = None
     if is_forwarded:
-        try:
-            # Try to get forwarded_from from request
-            forwarded_from_raw = data.get('forwarded_from')
-            if forwarded_from_raw and ObjectId.is_valid(str(forwarded_from_raw)):
-                forwarded_from = ObjectId(str(forwarded_from_raw))
-                # Verify the forwarded_from member exists and log their role
-                forwarded_member = db.get_member_by_id(forwarded_from)
-                if forwarded_member:
-                    app.logger.info(f"Using provided forwarded_from: {forwarded_from} ({forwarded_member.get('name')} - {forwarded_member.get('role')})")
-                else:
-                    app.logger.warning(f"Provided forwarded_from ID {forwarded_from} does not exist, using session user")
-                    forwarded_from = ObjectId(session['member_id']) if session.get('member_id') else None
-            
+        if forwarded_from_raw and str(forwarded_from_raw) in members:
+            forwarded_from = ObjectId(str(forwarded_from_raw))
+        else:
+            if forwarded_from_raw:
+                app.logger.warning(f"Provided forwarded_from ID {forwarded_from_raw} does not exist, using session user")
             # Fallback to current session user
-            elif session.get('member_id') and ObjectId.is_valid(session['member_id']):
-                forwarded_from = ObjectId(session['member_id'])
-                # Log the session user's role for clarity
-                session_member = db.get_member_by_id(forwarded_from)
-                if session_member:
-                    app.logger.info(f"Using session user as forwarded_from: {forwarded_from} ({session_member.get('name')} - {session_member.get('role')})")
-                else:
-                    app.logger.warning(f"Session member {forwarded_from} not found!")
-            
-            app.logger.info(f"Final forwarded_from value: {forwarded_from}")
-            
-        except Exception as e:
-            app.logger.warning(f"Forwarding logic error (non-critical): {str(e)}")
-            forwarded_from = None
+            forwarded_from = ObjectId(session['member_id']) if ObjectId.is_valid(session.get('member_id', '')) else None
+        app.logger.info(f"Final forwarded_from value: {forwarded_from}")
 
-    # Step 9: Create New Assignment
+    # Step 8: Create New Assignment
     try:
         assignment_data = {
             'ticket_id': ticket_id,
@@ -25165,30 +24315,17 @@ def assign_ticket(ticket_id):
             'assigned_by': ObjectId(session['member_id']) if ObjectId.is_valid(session.get('member_id', '')) else None
         }
         
-        app.logger.info(f"[ASSIGNMENT] Creating assignment with data: ticket_id={ticket_id}, member_id={member_id_obj} (type: {type(member_id_obj).__name__}), is_forwarded={is_forwarded}")
-        app.logger.info(f"[ASSIGNMENT] Full assignment_data: {assignment_data}")
-        
-        # CRITICAL DEBUG: Check if the member actually exists
-        test_member = db.get_member_by_id(str(member_id_obj))
-        app.logger.info(f"[ASSIGNMENT] Member verification: member_id={member_id_obj}, exists={test_member is not None}, name={test_member.get('name') if test_member else 'NOT_FOUND'}")
-        
-        assignment_id = db.assign_ticket(assignment_data)
-        app.logger.info(f"[SUCCESS] Assignment created with ID: {assignment_id}")
-        
-        # IMMEDIATE VERIFICATION: Check if assignment can be retrieved AND if member lookup works
         try:
-            verification_check = db.get_assignment_by_ticket(ticket_id)
-            if verification_check:
-                app.logger.info(f"[VERIFY] Assignment immediately retrievable: {verification_check.get('_id')}")
-                # Test the exact same lookup that dashboard uses
-                stored_member_id = verification_check.get('member_id')
-                app.logger.info(f"[VERIFY] Stored member_id: {stored_member_id} (type: {type(stored_member_id).__name__})")
-                lookup_member = db.get_member_by_id(str(stored_member_id))
-                app.logger.info(f"[VERIFY] Member lookup result: {lookup_member.get('name') if lookup_member else 'LOOKUP_FAILED'}")
-            else:
-                app.logger.error(f"[VERIFY] WARNING: Assignment not immediately retrievable after creation!")
-        except Exception as verify_error:
-            app.logger.error(f"[VERIFY] Error checking assignment: {verify_error}")
+            assignment = db.assign_ticket(assignment_data, expected_version=expected_version)
+        except AssignmentConflictError as e:
+            app.logger.warning(f"Assignment conflict for ticket {ticket_id}: {e}")
+            return jsonify({
+                'status': 'error',
+                'message': 'This ticket was reassigned by someone else. Please refresh and try again.',
+                'error_code': 'ASSIGNMENT_CONFLICT'
+            }), 409
+        assignment_id = assignment['_id']
+        app.logger.info(f"[SUCCESS] Assignment stored with ID: {assignment_id} (version {assignment['version']})")
         
         # [NEW] COMPREHENSIVE DEBUG LOGGING BEFORE WEBHOOK LOGIC
         app.logger.info(f"[DEBUG] WEBHOOK TRIGGER ANALYSIS - Ticket: {ticket_id}")
@@ -25224,8 +24361,6 @@ def assign_ticket(ticket_id):
             app.logger.info(f"[SUCCESS] Updated ticket {ticket_id} status to 'Referred to Tech Director'")
             
             # [LAUNCH] TRIGGER ASYNC WEBHOOK - Real-time behavior for assignments
-            # Get ticket data for reminder
-            ticket = db.get_ticket_by_id(ticket_id)
             
             # 🚨 TEMPORARILY DISABLED: Tech Director webhook causing automatic replies
             # webhook_queued = trigger_tech_director_webhook_async(ticket_id, ticket, 'assignment', session.get('member_name', 'Support Team'))
@@ -25313,6 +24448,7 @@ def assign_ticket(ticket_id):
 
             'message': success_message,
             'assignment_id': str(assignment_id),
+            'version': assignment['version'],
             'action': action_type
         }), 200
         
@@ -25447,8 +24583,8 @@ def ticket_detail(ticket_id):
                     # Mark as read only if viewing the ticket page (not just passing through)
                     db.update_ticket(ticket_id, {'has_unread_reply': False})
         
-        # Get ticket with assignment info
-        ticket = db.get_ticket_by_id(ticket_id)
+        # Get ticket with assignment info (the page embeds attachment data for forwarding)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
 
         # Debug: Check for ticket ID consistency
         if ticket:
@@ -25661,20 +24797,16 @@ def ticket_detail(ticket_id):
         clean_under_warranty = None
         outcome_notes = None
         
-        # Get metadata for this ticket
-        metadata = db.get_ticket_metadata(ticket_id)
+        # Get metadata for this ticket (one document; attachment metadata is already parsed)
+        metadata = db.get_ticket_metadata_fields(ticket_id)
         
         # Process metadata attachments for manually created tickets
         metadata_attachments = []
         app.logger.info(f"DEBUG: Processing metadata for ticket {ticket_id} - Found {len(metadata)} metadata entries")
         
-        for meta in metadata:
-            app.logger.info(f"DEBUG: Processing metadata key: {meta.get('key')}")
-            if meta.get('key', '').startswith('attachment_'):
-                app.logger.info(f"DEBUG: Found attachment metadata: {meta.get('key')} = {meta.get('value')}")
+        for meta_key, attachment_data in metadata.items():
+            if meta_key.startswith('attachment_'):
                 try:
-                    attachment_data = json.loads(meta.get('value', '{}'))
-                    app.logger.info(f"DEBUG: Parsed attachment data: {attachment_data}")
                     if attachment_data and isinstance(attachment_data, dict):
                         # FIXED: Convert metadata attachment to standard attachment format with base64 data
                         metadata_attachments.append({
@@ -25690,11 +24822,9 @@ def ticket_detail(ticket_id):
                         app.logger.info(f"SUCCESS: Added metadata attachment: {attachment_data.get('original_name', 'Unknown')} (base64: {len(attachment_data.get('data', ''))} chars)")
                     else:
                         app.logger.warning(f"WARNING: Attachment data is empty or not a dict: {attachment_data}")
-                except (json.JSONDecodeError, TypeError) as e:
-                    app.logger.warning(f"ERROR: Failed to parse attachment metadata for {meta.get('key')}: {e}")
+                except (AttributeError, TypeError) as e:
+                    app.logger.warning(f"ERROR: Failed to read attachment metadata for {meta_key}: {e}")
                     continue
-            else:
-                app.logger.info(f"DEBUG: Non-attachment metadata: {meta.get('key')} = {meta.get('value')}")
         
         # Process main ticket document attachments (for manual tickets)
         ticket_attachments = []
@@ -25762,10 +24892,7 @@ def ticket_detail(ticket_id):
             app.logger.info(f"DEBUG: Ticket document attachment {i}: {att}")
             
         metadata_dict = {}
-        for item in metadata:
-            key = item['key']
-            value = item['value']
-            
+        for key, value in metadata.items():
             if key == 'vehicle_registration':
                 vehicle_registration = value
             elif key == 'service_date':
@@ -26217,26 +25344,14 @@ def send_reply(ticket_id):
         if len(response_text) > 10000:  # Reasonable limit
             return jsonify({'status': 'error', 'message': 'Response text too long'}), 400
 
-        # ANTI-SPAM: Check for duplicate submissions within last 5 seconds
+        # ANTI-SPAM: Check for duplicate submissions within last 5 seconds (across all workers)
         member_id = session['member_id']
-        current_time = datetime.now()
         cache_key = f"reply_spam_{ticket_id}_{member_id}_{response_text[:50]}"
         
-        # Simple in-memory cache for spam prevention
-        if not hasattr(app, '_reply_cache'):
-            app._reply_cache = {}
-        
-        # Clean old entries (older than 5 seconds)
-        app._reply_cache = {k: v for k, v in app._reply_cache.items() 
-                           if (current_time - v).total_seconds() < 5}
-        
-        if cache_key in app._reply_cache:
+        if not throttle.claim(cache_key, 5):
             app.logger.warning(f"🚫 SPAM BLOCKED - Duplicate reply attempt for ticket {ticket_id} by member {member_id}")
             return jsonify({'status': 'error', 'message': 'Duplicate submission detected. Please wait before sending again.'}), 429
         
-        # Record this submission to prevent duplicates
-        app._reply_cache[cache_key] = current_time
-        
         app.logger.info(f" PROCESSING REPLY - Ticket: {ticket_id}, Member: {member_id}, Text: {response_text[:30]}...")
 
         db = get_db()
@@ -26423,10 +25538,7 @@ def send_reply(ticket_id):
             for i, att in enumerate(attachments):
                 app.logger.info(f"📎 Attachment {i+1}: {att.get('name', 'Unknown')} - Type: {att.get('type', 'file')}")
             
-            result = db.replies.update_one(
-                {'_id': reply_id},
-                {'$set': {'attachments': attachments}}
-            )
+            result = db.set_reply_attachments(reply_id, attachments)
             app.logger.info(f"📎 Database update result: {result.modified_count} modified")
         else:
             app.logger.info("📎 No attachments to save to reply")
@@ -26680,9 +25792,11 @@ def update_ticket_technician(ticket_id):
             # Update ticket metadata with technician information
             try:
                 app.logger.info(f"💾 Setting metadata for ticket {ticket_id}: technician_id={technician_id}, technician_name={technician['name']}")
-                result1 = db.set_ticket_metadata(ticket_id, 'technician_id', technician_id)
-                result2 = db.set_ticket_metadata(ticket_id, 'technician_name', technician['name'])
-                app.logger.info(f" Metadata set results: technician_id={result1}, technician={result2}")
+                result = db.set_ticket_metadata_many(ticket_id, {
+                    'technician_id': technician_id,
+                    'technician_name': technician['name']
+                })
+                app.logger.info(f" Metadata set result: {result}")
                 
                 # Verify the metadata was saved by retrieving it
                 verification_metadata = db.get_ticket_metadata(ticket_id)
@@ -26747,16 +25861,14 @@ def get_all_technician_assignments():
     try:
         db = get_db()
         
-        # Get all technician metadata from database
-        all_metadata = list(db.ticket_metadata.find({"key": {"$in": ["technician_id", "technician_name"]}}))
-        
-        # Group by ticket_id
-        assignments = {}
-        for meta in all_metadata:
-            ticket_id = meta.get('ticket_id')
-            if ticket_id not in assignments:
-                assignments[ticket_id] = {}
-            assignments[ticket_id][meta.get('key')] = meta.get('value')
+        # Technician metadata is denormalized onto each ticket, grouped here by ticket_id
+        assignments = {
+            ticket['ticket_id']: {key: ticket[key] for key in ('technician_id', 'technician_name') if key in ticket}
+            for ticket in db.tickets.find(
+                {"$or": [{"technician_id": {"$exists": True}}, {"technician_name": {"$exists": True}}]},
+                {"_id": 0, "ticket_id": 1, "technician_id": 1, "technician_name": 1}
+            )
+        }
         
         # Get ticket details for each assignment
         result = []
@@ -27217,13 +26329,24 @@ def download_common_document(document_id):
         db = get_db()
         
         # First, let's check if the document exists at all
-        document_exists = db.get_common_document_by_id(document_id)
+        document_exists = db.get_common_document_by_id(document_id, hydrate_blobs=False)
         if not document_exists:
             app.logger.error(f"Document {document_id} not found in database")
             return jsonify({'status': 'error', 'message': 'Document not found'}), 404
         
         app.logger.info(f"Document found: {document_exists.get('name', 'Unknown')}")
         
+        # Documents moved to GridFS are streamed straight from the attachment store
+        if document_exists.get('gridfs_id'):
+            response = send_stored_attachment(
+                document_exists['gridfs_id'],
+                document_exists.get('file_name', 'document'),
+                mimetype=document_exists.get('file_type')
+            )
+            if response is not None:
+                db.increment_document_download_count(document_id)
+                return response
+        
         # 🚀 ENHANCED: Get file content using priority-based retrieval (like tickets)
         file_data = db.get_document_file_content(document_id)
         
@@ -27980,15 +27103,13 @@ def update_ticket_outcome(ticket_id):
             {'key': 'outcome_notes', 'value': outcome_notes}
         ]
         
+        # Set the non-empty values in one write and remove the cleared ones
+        db.set_ticket_metadata_many(ticket_id, {
+            metadata['key']: metadata['value'] for metadata in outcome_metadata if metadata['value']
+        })
         for metadata in outcome_metadata:
-            # Remove existing entry
-            db.ticket_metadata.delete_many({
-                'ticket_id': ticket_id,
-                'key': metadata['key']
-            })
-            # Add updated entry if value is not empty
-            if metadata['value']:
-                db.add_ticket_metadata(ticket_id, metadata['key'], metadata['value'])
+            if not metadata['value']:
+                db.delete_ticket_metadata(ticket_id, metadata['key'])
         
         # Update ticket timestamp
         db.update_ticket(ticket_id, {'updated_at': datetime.now()})
@@ -28352,6 +27473,78 @@ def reset_creation_methods():
         app.logger.error(f"Error resetting creation methods: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/admin/attachment-store-stats')
+def attachment_store_stats():
+    """Unique attachment bytes stored versus bytes referenced by tickets, replies and documents"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        db = get_db()
+        return jsonify({'status': 'success', 'stats': db.attachment_store.dedup_stats()})
+        
+    except Exception as e:
+        app.logger.error(f"Error getting attachment store stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/schema-migrations', methods=['GET', 'POST'])
+def schema_migrations():
+    """List schema migrations (GET) or apply the pending ones (POST) - same as `python migrate.py`"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    if request.method == 'POST' and session.get('member_role', '') != 'Administrator':
+        return jsonify({'status': 'error', 'message': 'Administrator access required'}), 403
+    
+    try:
+        runner = MigrationRunner(get_db())
+        
+        if request.method == 'GET':
+            return jsonify({'status': 'success', 'migrations': runner.status()})
+        
+        applied = runner.run()
+        return jsonify({
+            'status': 'success',
+            'message': f'Applied {len(applied)} migrations',
+            'applied': applied
+        })
+        
+    except MigrationError as e:
+        app.logger.error(f"Schema migration failed: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    except Exception as e:
+        app.logger.error(f"Error running schema migrations: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/db-pool', methods=['GET'])
+def db_pool_stats():
+    """MongoDB connection pool size, checkouts and wait times for this worker process"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({'status': 'success', 'pool': connections.stats()})
+    except Exception as e:
+        app.logger.error(f"Error reading connection pool stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/request-cache', methods=['GET'])
+def request_cache_stats():
+    """Fetches saved by the request identity map, the reference data cache and the read cache in this worker process"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({
+            'status': 'success',
+            'identity_map': request_cache.totals.snapshot(),
+            'reference_cache': get_db().reference_cache.stats(),
+            'read_cache': read_cache.stats()
+        })
+    except Exception as e:
+        app.logger.error(f"Error reading request cache stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/status')
 def status_dashboard():
     """Dedicated status dashboard page"""
@@ -28367,6 +27560,7 @@ def status_dashboard():
         status_filter = request.args.get('status', 'All')
         priority_filter = request.args.get('priority', 'All')
         search_query = request.args.get('search', '')
+        after = request.args.get('after')
         
         # Get paginated tickets with assignment info
         tickets = db.get_tickets_with_assignments(
@@ -28374,11 +27568,16 @@ def status_dashboard():
             per_page=per_page, 
             status_filter=status_filter,
             priority_filter=priority_filter,
-            search_query=search_query
+            search_query=search_query,
+            after=after
         )
         
+        # Keyset token for the following page (links pass it as ?after= so deep pages skip nothing)
+        next_cursor = encode_ticket_cursor(tickets[-1]) if len(tickets) == per_page else None
+        
         # Get total count for pagination
-        total_tickets = db.get_tickets_count(
+        total_tickets = cached_tickets_count(
+            db,
             status_filter=status_filter,
             priority_filter=priority_filter,
             search_query=search_query
@@ -28482,6 +27681,7 @@ def status_dashboard():
             'has_next': has_next,
             'prev_page': prev_page,
             'next_page': next_page,
+            'next_cursor': next_cursor,
             'status_filter': status_filter,
             'priority_filter': priority_filter,
             'search_query': search_query
@@ -28835,6 +28035,7 @@ def live_dashboard():
         status_filter = request.args.get('status', 'All')
         priority_filter = request.args.get('priority', 'All')
         search_query = request.args.get('search', '')
+        after = request.args.get('after')
         
         # Get paginated tickets with assignment info
         try:
@@ -28843,7 +28044,8 @@ def live_dashboard():
                 per_page=per_page, 
                 status_filter=status_filter,
                 priority_filter=priority_filter,
-                search_query=search_query
+                search_query=search_query,
+                after=after
             )
             if not tickets:
                 app.logger.warning("No tickets found in database")
@@ -28852,9 +28054,13 @@ def live_dashboard():
             app.logger.error(f"Error getting tickets: {e}")
             tickets = []
         
+        # Keyset token for the following page (links pass it as ?after= so deep pages skip nothing)
+        next_cursor = encode_ticket_cursor(tickets[-1]) if len(tickets) == per_page else None
+        
         # Get total count for pagination
         try:
-            total_tickets = db.get_tickets_count(
+            total_tickets = cached_tickets_count(
+                db,
                 status_filter=status_filter,
                 priority_filter=priority_filter,
                 search_query=search_query
@@ -28893,16 +28099,8 @@ def live_dashboard():
                 ticket_dict['assigned_at'] = ''
                 ticket_dict['is_forwarded'] = False
             
-            # Get vehicle registration from metadata
-            try:
-                metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-                for meta in metadata:
-                    if meta['key'] == 'vehicle_registration':
-                        ticket_dict['vehicle_registration'] = meta['value']
-                        break
-            except Exception as e:
-                app.logger.warning(f"Error getting metadata for ticket {ticket_dict.get('ticket_id')}: {e}")
-                ticket_dict['vehicle_registration'] = ''
+            # Vehicle registration is denormalized onto the ticket document
+            ticket_dict.setdefault('vehicle_registration', '')
             
             # Set default values for missing fields that template expects
             ticket_dict.setdefault('has_warranty', False)
@@ -28927,73 +28125,19 @@ def live_dashboard():
             
             all_tickets.append(ticket_dict)
         
-        # 1. Ticket Status Breakdown (Live Count)
-        status_counts = {}
-        for ticket in all_tickets:
-            status = ticket.get('status', 'Unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        # 2. Outstanding Claims (Aged Tickets)
-        now = datetime.now()
-        overdue_tickets = []
-        open_1_3_days = []
-        open_today = []
-        
-        for ticket in all_tickets:
-            # Handle both datetime objects (from MongoDB) and string dates
-            if isinstance(ticket['created_at'], datetime):
-                created_at = ticket['created_at']
-            else:
-                try:
-                    created_at = datetime.strptime(str(ticket['created_at']), "%Y-%m-%d %H:%M:%S")
-                except:
-                    continue  # Skip tickets with invalid dates
-            
-            days_open = (now - created_at).days
-            
-            if days_open > 3:
-                overdue_tickets.append(ticket)
-            elif 1 <= days_open <= 3:
-                open_1_3_days.append(ticket)
-            elif days_open == 0:
-                open_today.append(ticket)
-        
-        # 3. Average Resolution Time
-        resolved_tickets = [t for t in all_tickets if t['status'] == 'Resolved' or t['status'] == 'Closed']
-        total_resolution_time = 0
-        for ticket in resolved_tickets:
-            try:
-                # Handle both datetime objects (from MongoDB) and string dates
-                if isinstance(ticket['created_at'], datetime):
-                    created_at = ticket['created_at']
-                else:
-                    created_at = datetime.strptime(str(ticket['created_at']), "%Y-%m-%d %H:%M:%S")
-                
-                if isinstance(ticket['updated_at'], datetime):
-                    updated_at = ticket['updated_at']
-                else:
-                    updated_at = datetime.strptime(str(ticket['updated_at']), "%Y-%m-%d %H:%M:%S")
-                
-                resolution_time = (updated_at - created_at).total_seconds() / 3600  # in hours
-                total_resolution_time += resolution_time
-            except:
-                continue  # Skip tickets with invalid dates
-        
-        avg_resolution_time = 0
-        if resolved_tickets:
-            avg_resolution_time = total_resolution_time / len(resolved_tickets)
-        
-        # 4. Claim Outcomes Summary
-        total_claims = len(all_tickets)
-        approved_claims = len([t for t in all_tickets if t['status'] == 'Approved - Revisit Booked'])
-        declined_claims = len([t for t in all_tickets if t['status'] == 'Declined - Not Covered'])
-        referred_claims = len([t for t in all_tickets if t['status'] == 'Referred to Tech Director'])
-        
-        approved_percent = (approved_claims / total_claims * 100) if total_claims > 0 else 0
-        declined_percent = (declined_claims / total_claims * 100) if total_claims > 0 else 0
-        referred_percent = (referred_claims / total_claims * 100) if total_claims > 0 else 0
+        # 1-4. Status breakdown, aged claims, resolution time and claim outcomes, computed by MongoDB
+        kpis = cached_dashboard_kpis(db)
+        status_counts = kpis['status_counts']
+        outstanding_claims = kpis['outstanding_claims']
+        avg_resolution_time = kpis['resolution_metrics']['avg_resolution_time']
+        claim_outcomes = kpis['claim_outcomes']
+        total_claims = kpis['total_tickets']
         
         # 5. Advisory-Related Rejections
+        declined_ticket_ids = kpis['declined_ticket_ids']
+        metadata_by_ticket = db.get_metadata_for_tickets(
+            declined_ticket_ids, keys=['advisories_followed', 'new_fault_codes', 'within_warranty']
+        )
         # Get rejection reasons from metadata
         rejection_reasons = {
             'uncompleted_advisories': 0,
@@ -29001,18 +28145,15 @@ def live_dashboard():
             'warranty_expired': 0
         }
         
-        for ticket in all_tickets:
-            if ticket.get('status') == 'Declined - Not Covered':
-                # Check metadata for rejection reasons
-                metadata = db.get_ticket_metadata(ticket['ticket_id'])
-                
-                for meta in metadata:
-                    if meta['key'] == 'advisories_followed' and meta['value'] == '0':
-                        rejection_reasons['uncompleted_advisories'] += 1
-                    elif meta['key'] == 'new_fault_codes' and meta['value'] == '0':
-                        rejection_reasons['no_fault_code'] += 1
-                    elif meta['key'] == 'within_warranty' and meta['value'] == '0':
-                        rejection_reasons['warranty_expired'] += 1
+        for ticket_id in declined_ticket_ids:
+            # Check metadata for rejection reasons
+            for meta in metadata_by_ticket.get(ticket_id, []):
+                if meta['key'] == 'advisories_followed' and meta['value'] == '0':
+                    rejection_reasons['uncompleted_advisories'] += 1
+                elif meta['key'] == 'new_fault_codes' and meta['value'] == '0':
+                    rejection_reasons['no_fault_code'] += 1
+                elif meta['key'] == 'within_warranty' and meta['value'] == '0':
+                    rejection_reasons['warranty_expired'] += 1
         
         # 6. Team Performance
         team_performance = {}
@@ -29081,6 +28222,7 @@ def live_dashboard():
             'has_next': has_next,
             'prev_page': prev_page,
             'next_page': next_page,
+            'next_cursor': next_cursor,
             'status_filter': status_filter,
             'priority_filter': priority_filter,
             'search_query': search_query
@@ -29088,17 +28230,16 @@ def live_dashboard():
         
         return render_template('dashboard.html',
                             status_counts=status_counts,
-                            overdue_tickets=overdue_tickets,
-                            open_1_3_days=open_1_3_days,
-                            open_today=open_today,
+                            outstanding_claims=outstanding_claims,
+                            overdue_tickets=outstanding_claims['overdue_tickets'],
                             avg_resolution_time=avg_resolution_time,
                             total_claims=total_claims,
-                            approved_claims=approved_claims,
-                            declined_claims=declined_claims,
-                            referred_claims=referred_claims,
-                            approved_percent=approved_percent,
-                            declined_percent=declined_percent,
-                            referred_percent=referred_percent,
+                            approved_claims=claim_outcomes['approved'],
+                            declined_claims=claim_outcomes['declined'],
+                            referred_claims=claim_outcomes['referred'],
+                            approved_percent=claim_outcomes['approved_percent'],
+                            declined_percent=claim_outcomes['declined_percent'],
+                            referred_percent=claim_outcomes['referred_percent'],
                             rejection_reasons=rejection_reasons,
                             team_performance=team_performance,
                             all_tickets=all_tickets,
@@ -29145,13 +28286,8 @@ def export_csv():
                 ticket_dict['assigned_at'] = ''
                 ticket_dict['is_forwarded'] = False
             
-            # Get vehicle registration from metadata
-            ticket_dict['vehicle_registration'] = ''
-            metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-            for meta in metadata:
-                if meta['key'] == 'vehicle_registration':
-                    ticket_dict['vehicle_registration'] = meta['value']
-                    break
+            # Vehicle registration is denormalized onto the ticket document
+            ticket_dict.setdefault('vehicle_registration', '')
             
             all_tickets.append(ticket_dict)
         
@@ -29235,13 +28371,8 @@ def export_pdf():
                 ticket_dict['assigned_to_gender'] = ''
                 ticket_dict['assigned_at'] = ''
             
-            # Get vehicle registration from metadata
-            ticket_dict['vehicle_registration'] = ''
-            metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-            for meta in metadata:
-                if meta['key'] == 'vehicle_registration':
-                    ticket_dict['vehicle_registration'] = meta['value']
-                    break
+            # Vehicle registration is denormalized onto the ticket document
+            ticket_dict.setdefault('vehicle_registration', '')
             
             all_tickets.append(ticket_dict)
         
@@ -29463,373 +28594,52 @@ def dashboard_data():
             start_date = None
             end_date = None
         
-        # Get all tickets with assignment info with error handling
+        # Every KPI is computed in one aggregation over the date-filtered tickets
         try:
-            app.logger.info("API: Attempting to get tickets with assignments")
-            tickets = db.get_tickets_with_assignments()
-            if not tickets:
-                app.logger.warning("API: No tickets found in database")
-                tickets = []
-            else:
-                app.logger.info(f"API: Successfully retrieved {len(tickets)} tickets with assignments")
+            kpis = cached_dashboard_kpis(db, start_date, end_date)
         except Exception as e:
-            app.logger.error(f"API: Failed to get tickets with assignments: {e}")
-            # Fallback to simple ticket fetch
-            try:
-                app.logger.info("API: Attempting fallback ticket fetch")
-                tickets = list(db.tickets.find().sort([("created_at", -1)]))
-                app.logger.info(f"API: Fallback ticket fetch returned {len(tickets)} tickets")
-            except Exception as fallback_error:
-                app.logger.error(f"API: Fallback ticket fetch also failed: {fallback_error}")
-                # Return empty response instead of crashing
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Database temporarily unavailable. Please try again later.',
-                    'data': {
-                        'total_tickets': 0,
-                        'status_counts': {},
-                        'priority_counts': {},
-                        'classification_counts': {},
-                        'outstanding_claims': {'overdue': 0, 'open_1_3_days': 0, 'open_today': 0, 'overdue_tickets': []},
-                        'resolution_metrics': {'avg_resolution_time': 0, 'resolved_count': 0},
-                        'claim_outcomes': {'approved': 0, 'declined': 0, 'referred': 0, 'warranty_received': 0, 'approved_percent': 0, 'declined_percent': 0, 'referred_percent': 0},
-                        'date_range': {'start_date': start_date_str, 'end_date': end_date_str, 'filtered': False}
-                    }
-                }), 503
-        
-        # Convert to dict format and apply date filtering
-        app.logger.info(f"API: Processing {len(tickets)} tickets")
-        all_tickets = []
-        for ticket in tickets:
-            ticket_dict = dict(ticket)
-            
-            # Convert ObjectId to string
-            ticket_dict['_id'] = str(ticket_dict['_id'])
-            
-            # Convert any other ObjectId fields that might cause JSON serialization issues
-            if 'member_id' in ticket_dict and hasattr(ticket_dict['member_id'], '__class__') and ticket_dict['member_id'].__class__.__name__ == 'ObjectId':
-                ticket_dict['member_id'] = str(ticket_dict['member_id'])
-            
-            # Handle assignment ObjectIds
-            if 'assignment' in ticket_dict and isinstance(ticket_dict['assignment'], list):
-                for assignment in ticket_dict['assignment']:
-                    if isinstance(assignment, dict):
-                        if 'member_id' in assignment and hasattr(assignment['member_id'], '__class__') and assignment['member_id'].__class__.__name__ == 'ObjectId':
-                            assignment['member_id'] = str(assignment['member_id'])
-                        if 'forwarded_from' in assignment and hasattr(assignment['forwarded_from'], '__class__') and assignment['forwarded_from'].__class__.__name__ == 'ObjectId':
-                            assignment['forwarded_from'] = str(assignment['forwarded_from'])
-            
-            # Handle assigned_member ObjectIds
-            if 'assigned_member' in ticket_dict and isinstance(ticket_dict['assigned_member'], list):
-                for member in ticket_dict['assigned_member']:
-                    if isinstance(member, dict) and '_id' in member and hasattr(member['_id'], '__class__') and member['_id'].__class__.__name__ == 'ObjectId':
-                        member['_id'] = str(member['_id'])
-            
-            # Handle forwarded_from_member ObjectIds
-            if 'forwarded_from_member' in ticket_dict and isinstance(ticket_dict['forwarded_from_member'], list):
-                for member in ticket_dict['forwarded_from_member']:
-                    if isinstance(member, dict) and '_id' in member and hasattr(member['_id'], '__class__') and member['_id'].__class__.__name__ == 'ObjectId':
-                        member['_id'] = str(member['_id'])
-            
-            # Handle assignment info
-            if ticket_dict.get('assignment') and len(ticket_dict['assignment']) > 0:
-                assignment = ticket_dict['assignment'][0]
-                if ticket_dict.get('assigned_member') and len(ticket_dict['assigned_member']) > 0:
-                    member = ticket_dict['assigned_member'][0]
-                    ticket_dict['assigned_to'] = member.get('name', 'Unassigned')
-                    ticket_dict['assigned_to_gender'] = member.get('gender', '')
-                else:
-                    ticket_dict['assigned_to'] = 'Unassigned'
-                    ticket_dict['assigned_to_gender'] = ''
-                ticket_dict['assigned_at'] = assignment.get('assigned_at', '')
-                ticket_dict['is_forwarded'] = assignment.get('is_forwarded', False)
-                
-                # Handle forwarded from member info
-                if ticket_dict['is_forwarded'] and ticket_dict.get('forwarded_from_member') and len(ticket_dict['forwarded_from_member']) > 0:
-                    forwarded_member = ticket_dict['forwarded_from_member'][0]
-                    ticket_dict['forwarded_from_name'] = forwarded_member.get('name')
-            else:
-                ticket_dict['assigned_to'] = 'Unassigned'
-                ticket_dict['assigned_to_gender'] = ''
-                ticket_dict['assigned_at'] = ''
-                ticket_dict['is_forwarded'] = False
-            
-            # Get vehicle registration from metadata
-            try:
-                metadata = db.get_ticket_metadata(ticket_dict['ticket_id'])
-                for meta in metadata:
-                    if meta['key'] == 'vehicle_registration':
-                        ticket_dict['vehicle_registration'] = meta['value']
-                        break
-            except Exception as e:
-                app.logger.warning(f"Error getting metadata for API ticket {ticket_dict.get('ticket_id')}: {e}")
-                ticket_dict['vehicle_registration'] = ''
-            
-            # Set default values for missing fields that template expects
-            ticket_dict.setdefault('has_warranty', False)
-            ticket_dict.setdefault('has_attachments', False)
-            ticket_dict.setdefault('attachments', [])
-            ticket_dict.setdefault('priority', 'Medium')
-            ticket_dict.setdefault('classification', 'General')
-            ticket_dict.setdefault('subject', ticket_dict.get('body', '')[:100] if ticket_dict.get('body') else 'No Subject')
-            ticket_dict.setdefault('body', 'No description available')
-            ticket_dict.setdefault('warranty_forms_count', 0)
-            ticket_dict.setdefault('creation_method', 'auto-detect')
-            ticket_dict.setdefault('thread_id', None)
-            ticket_dict.setdefault('email', None)
-            
-            # Check if ticket has attachments
-            if ticket_dict.get('attachments') and len(ticket_dict['attachments']) > 0:
-                ticket_dict['has_attachments'] = True
-            
-            # Check if ticket has warranty (basic check)
-            if ticket_dict.get('classification') == 'Warranty Claim':
-                ticket_dict['has_warranty'] = True
-            
-            # Parse created_at for filtering
-            if 'created_at' in ticket_dict and ticket_dict['created_at']:
-                if isinstance(ticket_dict['created_at'], datetime):
-                    created_at = ticket_dict['created_at']
-                else:
-                    try:
-                        created_at = datetime.strptime(str(ticket_dict['created_at']), "%Y-%m-%d %H:%M:%S")
-                    except:
-                        continue  # Skip tickets with invalid dates
-                
-                # Apply date filtering
-                if start_date and created_at < start_date:
-                    continue
-                if end_date and created_at > end_date:
-                    continue
-                
-                ticket_dict['formatted_date'] = created_at.strftime("%b %d, %I:%M %p")
-                ticket_dict['created_at_dt'] = created_at
-            
-            all_tickets.append(ticket_dict)
-        
-        #  DYNAMIC WARRANTY CLASSIFICATION: Update classification for tickets with warranty attachments
-        for ticket_dict in all_tickets:
-            ticket_id = ticket_dict.get('ticket_id')
-            if ticket_id:
-                try:
-                    # Check if ticket has warranty attachments
-                    metadata = db.get_ticket_metadata(ticket_id)
-                    has_warranty_attachment = False
-                    
-                    if metadata:
-                        for meta in metadata:
-                            try:
-                                # Ensure meta is a dictionary
-                                if not isinstance(meta, dict):
-                                    continue
-                                
-                                meta_value = meta.get('value')
-                                if isinstance(meta_value, str):
-                                    # Handle potential malformed JSON
-                                    if meta_value.strip() and meta_value.strip() not in ['{}', '']:
-                                        try:
-                                            # Clean JSON before parsing
-                                            clean_json = meta_value.strip()
-                                            # Remove trailing commas and fix common JSON issues
-                                            if clean_json.endswith(',}'):
-                                                clean_json = clean_json[:-2] + '}'
-                                            elif clean_json.endswith(',]'):
-                                                clean_json = clean_json[:-2] + ']'
-                                            # Remove any leading/trailing whitespace and quotes
-                                            clean_json = clean_json.strip().strip('"\'')
-                                            # Skip if still empty after cleaning
-                                            if not clean_json or clean_json in ['{}', '[]', 'null', 'undefined']:
-                                                meta_data = {}
-                                            else:
-                                                meta_data = json.loads(clean_json)
-                                        except json.JSONDecodeError as json_err:
-                                            # Only log if it's actually malformed, not just empty
-                                            if meta_value.strip() and meta_value.strip() not in ['{}', '[]', 'null', 'undefined', '']:
-                                                app.logger.debug(f"Skipping malformed JSON in API metadata: {json_err} - Value: {meta_value[:50]}")
-                                            meta_data = {}
-                                    else:
-                                        meta_data = {}
-                                elif isinstance(meta_value, dict):
-                                    meta_data = meta_value
-                                else:
-                                    meta_data = {}
-                                
-                                # Check if this attachment is warranty-related
-                                if isinstance(meta_data, dict):
-                                    is_warranty = meta_data.get('is_warranty', False)
-                                    if is_warranty:
-                                        has_warranty_attachment = True
-                                        break
-                            except (json.JSONDecodeError, TypeError, AttributeError) as e:
-                                app.logger.warning(f"Error processing API metadata for ticket {ticket_id}: {e}")
-                                continue
-                    
-                    # Also check direct has_warranty flag on ticket
-                    has_warranty_flag = ticket_dict.get('has_warranty', False)
-                    
-                    # If ticket has warranty attachments or warranty flag, ensure classification is "Warranty Claim"
-                    if has_warranty_attachment or has_warranty_flag:
-                        original_classification = ticket_dict.get('classification')
-                        ticket_dict['classification'] = 'Warranty Claim'
-                        
-                        if original_classification != 'Warranty Claim':
-                            app.logger.info(f" API DASHBOARD WARRANTY CLASSIFICATION: Ticket {ticket_id} updated from '{original_classification}' to 'Warranty Claim'")
-                
-                except Exception as e:
-                    app.logger.error(f"Error checking warranty status for API ticket {ticket_id}: {e}")
-        
-        # Calculate comprehensive statistics - FIXED: Use database total count
-        # total_tickets should come from database.get_tickets_count() not len(all_tickets)
-        
-        # 1. Ticket Status Breakdown
-        status_counts = {}
-        for ticket in all_tickets:
-            status = ticket.get('status', 'Unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        # 2. Priority Breakdown
-        priority_counts = {}
-        for ticket in all_tickets:
-            priority = ticket.get('priority', 'Medium')
-            priority_counts[priority] = priority_counts.get(priority, 0) + 1
-        
-        # 3. Classification Breakdown
-        classification_counts = {}
-        for ticket in all_tickets:
-            classification = ticket.get('classification', 'General')
-            classification_counts[classification] = classification_counts.get(classification, 0) + 1
-        
-        # 4. Outstanding Claims Analysis
-        now = datetime.now()
-        overdue_tickets = []
-        open_1_3_days = []
-        open_today = []
-        
-        for ticket in all_tickets:
-            if 'created_at_dt' in ticket:
-                days_open = (now - ticket['created_at_dt']).days
-                
-                if days_open > 3:
-                    overdue_tickets.append(ticket)
-                elif 1 <= days_open <= 3:
-                    open_1_3_days.append(ticket)
-                elif days_open == 0:
-                    open_today.append(ticket)
-        
-        # 5. Average Resolution Time
-        resolved_tickets = [t for t in all_tickets if t.get('status') in ['Resolved', 'Closed']]
-        avg_resolution_time = 0
-        total_resolution_time = 0
-        
-        for ticket in resolved_tickets:
-            try:
-                if 'created_at_dt' in ticket and 'updated_at' in ticket:
-                    created_at = ticket['created_at_dt']
-                    
-                    if isinstance(ticket['updated_at'], datetime):
-                        updated_at = ticket['updated_at']
-                    else:
-                        updated_at = datetime.strptime(str(ticket['updated_at']), "%Y-%m-%d %H:%M:%S")
-                    
-                    resolution_time = (updated_at - created_at).total_seconds() / 3600  # in hours
-                    total_resolution_time += resolution_time
-            except:
-                continue
-        
-        if resolved_tickets:
-            avg_resolution_time = total_resolution_time / len(resolved_tickets)
-        
-        # 6. Claim Outcomes
-        approved_claims = len([t for t in all_tickets if t.get('status') == 'Approved - Revisit Booked'])
-        declined_claims = len([t for t in all_tickets if t.get('status') == 'Declined - Not Covered'])
-        referred_claims = len([t for t in all_tickets if t.get('status') == 'Referred to Tech Director'])
-        warranty_received = len([t for t in all_tickets if t.get('status') == 'Warranty Form Received'])
+            app.logger.error(f"API: Failed to compute dashboard KPIs: {e}")
+            return jsonify({
+                'status': 'error',
+                'message': 'Database temporarily unavailable. Please try again later.',
+                'data': {
+                    'total_tickets': 0,
+                    'status_counts': {},
+                    'priority_counts': {},
+                    'classification_counts': {},
+                    'outstanding_claims': {'overdue': 0, 'open_1_3_days': 0, 'open_today': 0, 'overdue_tickets': []},
+                    'resolution_metrics': {'avg_resolution_time': 0, 'resolved_count': 0},
+                    'claim_outcomes': {'approved': 0, 'declined': 0, 'referred': 0, 'warranty_received': 0, 'approved_percent': 0, 'declined_percent': 0, 'referred_percent': 0},
+                    'date_range': {'start_date': start_date_str, 'end_date': end_date_str, 'filtered': False}
+                }
+            }), 503
         
-        # Calculate percentages
-        approved_percent = (approved_claims / total_tickets * 100) if total_tickets > 0 else 0
-        declined_percent = (declined_claims / total_tickets * 100) if total_tickets > 0 else 0
-        referred_percent = (referred_claims / total_tickets * 100) if total_tickets > 0 else 0
+        # Most urgent overdue tickets: dates as strings so the response is plain JSON
+        for ticket in kpis['outstanding_claims']['overdue_tickets']:
+            created_at = ticket.get('created_at')
+            if isinstance(created_at, datetime):
+                ticket['formatted_date'] = created_at.strftime("%b %d, %I:%M %p")
+                ticket['created_at'] = created_at.isoformat()
         
-        app.logger.info(f"API: Successfully processed dashboard data - {total_tickets} tickets")
+        app.logger.info(f"API: Successfully processed dashboard data - {kpis['total_tickets']} tickets")
         
-        # Final safety check: ensure no ObjectIds remain in the response data
-        try:
-            response_data = {
-                'status': 'success',
-                'data': {
-                    'total_tickets': total_tickets,
-                    'status_counts': status_counts,
-                    'priority_counts': priority_counts,
-                    'classification_counts': classification_counts,
-                    'outstanding_claims': {
-                        'overdue': len(overdue_tickets),
-                        'open_1_3_days': len(open_1_3_days),
-                        'open_today': len(open_today),
-                        'overdue_tickets': overdue_tickets[:5]  # Top 5 most urgent
-                    },
-                    'resolution_metrics': {
-                        'avg_resolution_time': avg_resolution_time,
-                        'resolved_count': len(resolved_tickets)
-                    },
-                    'claim_outcomes': {
-                        'approved': approved_claims,
-                        'declined': declined_claims,
-                        'referred': referred_claims,
-                        'warranty_received': warranty_received,
-                        'approved_percent': approved_percent,
-                        'declined_percent': declined_percent,
-                        'referred_percent': referred_percent
-                    },
-                    'date_range': {
-                        'start_date': start_date_str,
-                        'end_date': end_date_str,
-                        'filtered': bool(start_date_str or end_date_str)
-                    }
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'total_tickets': kpis['total_tickets'],
+                'status_counts': kpis['status_counts'],
+                'priority_counts': kpis['priority_counts'],
+                'classification_counts': kpis['classification_counts'],
+                'outstanding_claims': kpis['outstanding_claims'],
+                'resolution_metrics': kpis['resolution_metrics'],
+                'claim_outcomes': kpis['claim_outcomes'],
+                'date_range': {
+                    'start_date': start_date_str,
+                    'end_date': end_date_str,
+                    'filtered': bool(start_date_str or end_date_str)
                 }
             }
-            
-            # Test JSON serialization to catch any remaining ObjectIds
-            json.dumps(response_data)
-            app.logger.info("API: JSON serialization test passed")
-            
-            return jsonify(response_data)
-            
-        except TypeError as e:
-            app.logger.error(f"API: JSON serialization failed due to ObjectId: {e}")
-            # Return a simplified response without problematic data
-            return jsonify({
-                'status': 'success',
-                'data': {
-                    'total_tickets': total_tickets,
-                    'status_counts': status_counts,
-                    'priority_counts': priority_counts,
-                    'classification_counts': classification_counts,
-                    'outstanding_claims': {
-                        'overdue': len(overdue_tickets),
-                        'open_1_3_days': len(open_1_3_days),
-                        'open_today': len(open_today),
-                        'overdue_tickets': []  # Skip detailed ticket data to avoid ObjectId issues
-                    },
-                    'resolution_metrics': {
-                        'avg_resolution_time': avg_resolution_time,
-                        'resolved_count': len(resolved_tickets)
-                    },
-                    'claim_outcomes': {
-                        'approved': approved_claims,
-                        'declined': declined_claims,
-                        'referred': referred_claims,
-                        'warranty_received': warranty_received,
-                        'approved_percent': approved_percent,
-                        'declined_percent': declined_percent,
-                        'referred_percent': referred_percent
-                    },
-                    'date_range': {
-                        'start_date': start_date_str,
-                        'end_date': end_date_str,
-                        'filtered': bool(start_date_str or end_date_str)
-                    }
-                }
-            })
+        })
     except Exception as e:
         app.logger.error(f"Error getting dashboard data: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -30036,7 +28846,8 @@ def create_ticket_form():
 def dashboard_updates():
     """
     API endpoint to provide real-time dashboard updates
-    Returns only changed data to minimize bandwidth and improve performance
+    Returns only the tickets created, changed or removed since the client's cursor,
+    so the work and the payload scale with the changes rather than the ticket table
     """
     try:
         # Enhanced session validation with automatic restoration
@@ -30053,93 +28864,53 @@ def dashboard_updates():
         # Sessions are permanent - no timeout checks needed
         # Users stay logged in forever
         
-        data = request.json
-        if not data:
+        data = request.get_json(silent=True)
+        if data is None:
             return jsonify({'status': 'error', 'message': 'Invalid request data'}), 400
-            
-        last_update = data.get('last_update', 0)
-        current_tickets = data.get('current_tickets', [])
         
-        # Convert timestamp to datetime
-        last_update_dt = datetime.fromtimestamp(last_update / 1000) if last_update > 0 else datetime.min
+        # 'cursor' is what the previous response returned; 'last_update' (ms timestamp) is the older name for it
+        cursor = data.get('cursor', data.get('last_update'))
         
         db = get_db()
         
-        # Get all tickets with assignments
-        all_tickets = db.get_tickets_with_assignments()
+        # One indexed range scan over tickets changed since the cursor, plus delete tombstones (see ticket_changes)
+        changes = db.get_ticket_changes(cursor)
+        new_tickets = changes['new_tickets']
+        updated_tickets = changes['updated_tickets']
+        removed_tickets = changes['removed_tickets']
         
-        # Check for new tickets
-        new_tickets = []
-        updated_tickets = []
-        removed_tickets = []
+        has_updates = bool(new_tickets or updated_tickets or removed_tickets)
         
-        # Process tickets to find changes
-        for ticket in all_tickets:
-            ticket_id = ticket.get('ticket_id')
-            created_at = ticket.get('created_at')
-            
-            if created_at and created_at > last_update_dt:
-                # New ticket
-                new_tickets.append({
-                    'ticket_id': ticket_id,
-                    'name': ticket.get('name', 'Unknown'),
-                    'subject': ticket.get('subject', 'No Subject'),
-                    'body': ticket.get('body', ''),
-                    'priority': ticket.get('priority', 'Medium'),
-                    'classification': ticket.get('classification', 'General'),
-                    'status': ticket.get('status', 'New'),
-                    'has_attachments': ticket.get('has_attachments', False),
-                    'has_warranty': ticket.get('has_warranty', False),
-                    'has_unread_reply': ticket.get('has_unread_reply', False),
-                    'created_at': created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at),
-                    'date': created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at)
-                })
-            elif ticket_id in current_tickets:
-                # Check if existing ticket has updates
-                # For now, we'll consider all existing tickets as potentially updated
-                # In a more sophisticated implementation, you could track modification times
-                pass
-        
-        # Calculate current stats - FIXED: Use database total count
-        # total_tickets should come from database.get_tickets_count() not len(all_tickets)
-        open_tickets = len([t for t in all_tickets if t.get('status') == 'Open'])
-        resolved_tickets = len([t for t in all_tickets if t.get('status') == 'Resolved'])
-        waiting_tickets = len([t for t in all_tickets if t.get('status') == 'Waiting for Response'])
-        
-        # Calculate breakdowns
-        priorities = {}
-        classifications = {}
-        for ticket in all_tickets:
-            priority = ticket.get('priority', 'Medium')
-            classification = ticket.get('classification', 'General')
-            
-            priorities[priority] = priorities.get(priority, 0) + 1
-            classifications[classification] = classifications.get(classification, 0) + 1
-        
-        has_updates = len(new_tickets) > 0 or len(updated_tickets) > 0 or len(removed_tickets) > 0
-        
-        app.logger.debug(f"Dashboard updates API: {len(new_tickets)} new, {len(updated_tickets)} updated tickets for user {session.get('member_name', 'Unknown')}")
+        app.logger.debug(f"Dashboard updates API: {len(new_tickets)} new, {len(updated_tickets)} updated, {len(removed_tickets)} removed tickets for user {session.get('member_name', 'Unknown')}")
         
-        return jsonify({
+        response = {
             'status': 'success',
             'has_updates': has_updates,
-            'stats': {
-                'total_tickets': total_tickets,
-                'open_tickets': open_tickets,
-                'resolved_tickets': resolved_tickets,
-                'waiting_tickets': waiting_tickets
-            },
+            'resync': changes['resync'],
+            'cursor': changes['cursor'],
             'tickets': {
                 'new_tickets': new_tickets,
                 'updated_tickets': updated_tickets,
                 'removed_tickets': removed_tickets
             },
-            'breakdowns': {
-                'priorities': priorities,
-                'classifications': classifications
-            },
             'timestamp': datetime.now().isoformat()
-        })
+        }
+        if has_updates:
+            # Counters only move when tickets do; read them from the materialized stats (see ticket_stats)
+            stats = db.get_dashboard_stats()
+            status_counts = stats.get('status_counts', {})
+            response['stats'] = {
+                'total_tickets': stats.get('total_tickets', 0),
+                'open_tickets': status_counts.get('Open', 0),
+                'resolved_tickets': status_counts.get('Resolved', 0),
+                'waiting_tickets': status_counts.get('Waiting for Response', 0)
+            }
+            response['breakdowns'] = {
+                'priorities': stats.get('priority_counts', {}),
+                'classifications': stats.get('classification_counts', {})
+            }
+        
+        return jsonify(response)
         
     except Exception as e:
         app.logger.error(f"Error in dashboard updates: {e}")
@@ -30704,7 +29475,7 @@ def download_email_attachment(ticket_id, attachment_id):
     """Download email attachment by ticket ID and attachment ID"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -30724,7 +29495,7 @@ def download_email_attachment(ticket_id, attachment_id):
             for meta in metadata:
                 if meta.get('key', '').startswith('attachment_'):
                     try:
-                        attachment_data = json.loads(meta.get('value', '{}'))
+                        attachment_data = decode_value(meta.get('value', '{}'))
                         if attachment_data and isinstance(attachment_data, dict):
                             # Check if this is the attachment we're looking for
                             metadata_index = meta.get('key', '').replace('attachment_', '')
@@ -30737,6 +29508,13 @@ def download_email_attachment(ticket_id, attachment_id):
         if not target_attachment:
             return jsonify({'error': 'Attachment not found'}), 404
         
+        # Attachments moved to GridFS are streamed instead of decoded in memory
+        if target_attachment.get('gridfs_id'):
+            filename = target_attachment.get('filename', target_attachment.get('original_name', 'attachment'))
+            response = send_stored_attachment(target_attachment['gridfs_id'], filename)
+            if response is not None:
+                return response
+        
         # Decode base64 file data
         file_data = target_attachment.get('data', '')
         if not file_data:
@@ -30803,7 +29581,7 @@ def preview_attachment(ticket_id, attachment_index):
     """Preview attachment by ticket ID and attachment index from multiple sources"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -30820,6 +29598,11 @@ def preview_attachment(ticket_id, attachment_index):
                 filename = attachment.get('filename', 'unknown_file')
                 file_data = attachment.get('data', '')
                 
+                if attachment.get('gridfs_id'):
+                    response = send_stored_attachment(attachment['gridfs_id'], filename, as_attachment=False)
+                    if response is not None:
+                        return response
+                
                 if file_data:
                     app.logger.info(f" Previewing base64 attachment: {filename}")
                     try:
@@ -30904,16 +29687,10 @@ def preview_attachment(ticket_id, attachment_index):
                 app.logger.warning(f" Reply file not found for preview: {file_path}")
         
         # METHOD 3: Check metadata collection for file attachments
-        ticket_metadata = db.get_ticket_metadata(ticket_id)
-        attachment_files = []
-        
-        for metadata_entry in ticket_metadata:
-            if metadata_entry['key'].startswith('attachment_'):
-                try:
-                    attachment_data = json.loads(metadata_entry['value'])
-                    attachment_files.append(attachment_data)
-                except:
-                    continue
+        attachment_files = [
+            attachment_data for key, attachment_data in db.get_ticket_metadata_fields(ticket_id).items()
+            if key.startswith('attachment_') and isinstance(attachment_data, dict)
+        ]
         
         app.logger.info(f"Found {len(attachment_files)} metadata attachments")
         
@@ -31037,7 +29814,7 @@ def download_file_system_attachment(ticket_id, attachment_key):
     """Download file system attachment by ticket ID and attachment key (from metadata)"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
@@ -31126,7 +29903,7 @@ def preview_file_system_attachment(ticket_id, attachment_key):
     """Preview file system attachment by ticket ID and attachment key (from metadata)"""
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
@@ -31444,7 +30221,10 @@ def debug_ticket_data(ticket_id):
             
             # Try to parse the value if it's JSON
             try:
-                if isinstance(item['value'], str) and item['value'].strip():
+                if isinstance(item['value'], dict):
+                    metadata_item['parsed_value'] = item['value']
+                    metadata_item['is_attachment'] = 'file_path' in item['value'] or 'filename' in item['value']
+                elif isinstance(item['value'], str) and item['value'].strip():
                     # Clean the JSON string before parsing
                     clean_value = item['value'].strip()
                     # Remove trailing commas and fix common JSON issues
@@ -32458,7 +31238,7 @@ def api_create_ticket():
                 'error_type': 'DatabaseConnectionError'
             }), 500
         
-        # Generate automatic ticket ID for manual tickets (6 chars total: M + type + 4 random)
+        # Generate automatic ticket ID for manual tickets (6 chars total: M + type + 4 digits)
         type_code_mapping = {
             'DPF Clean - Premium': 'P',  # Premium
             'DPF Clean-Standard': 'S',   # Standard
@@ -32476,118 +31256,71 @@ def api_create_ticket():
         import uuid
         
         ticket_id = None
-        max_attempts = 100
-        
-        # Log current ticket statistics for debugging
-        try:
-            manual_ticket_count = db.tickets.count_documents({'ticket_id': {'$regex': f'^M{type_code}'}})
-            total_ticket_count = db.tickets.count_documents({})
-            app.logger.info(f"Current database state: {total_ticket_count} total tickets, {manual_ticket_count} with prefix M{type_code}")
-        except Exception as e:
-            app.logger.warning(f"Could not get ticket statistics: {e}")
+        max_attempts = 5  # Retries only cover thread_id clashes and IDs taken between allocation and insert
         
         for attempt in range(max_attempts):
             try:
-                # Generate 4-digit code using same logic as email tickets (deterministic based on customer data)
-                # Use customer email + timestamp to create unique seed for calculation
-                seed_string = f"{email}{customer_full_name}{datetime.now().isoformat()}"
-                
-                # Calculate sum of character codes (same logic as email system)
-                sum_chars = 0
-                for char in seed_string:
-                    sum_chars += ord(char)
+                # Allocate the next ID from the atomic per-prefix counter (one round trip,
+                # unique across workers): exactly 6 chars, M + type + 4 digits
+                potential_id = db.allocate_ticket_id(f"M{type_code}")
+                app.logger.info(f"Allocated ticket ID: {potential_id} (attempt {attempt + 1}/{max_attempts})")
                 
-                # Generate 4-digit number (same as email system: sum % 10000)
-                four_digit_code = sum_chars % 10000
-                four_digit_str = f"{four_digit_code:04d}"  # Ensure 4 digits with leading zeros
+                # Generate unique thread_id for manual tickets (required due to unique index)
+                # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
+                thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
                 
-                potential_id = f"M{type_code}{four_digit_str}"  # Exactly 6 chars: M + 1 + 4 digits
-                
-                app.logger.info(f"Attempting ticket ID: {potential_id} (attempt {attempt + 1}/{max_attempts})")
-                app.logger.debug(f"? Calculation details: seed='{seed_string[:50]}...', sum_chars={sum_chars}, 4-digit={four_digit_code}")
+                ticket_data = {
+                    'ticket_id': potential_id,
+                    'email': email,
+                    'name': customer_full_name,
+                    'subject': subject,
+                    'body': description,
+                    'status': 'Open',
+                    'priority': priority,
+                    'classification': type_of_claim,
+                    'technician': technician,
+                    'vehicle_registration': vehicle_registration,
+                    'service_date': service_date,
+                    'claim_date': claim_date,
+                    'creation_method': 'manual',
+                    'thread_id': thread_id,  # CRITICAL: Must be unique due to database constraint
+                    'created_at': datetime.now(),
+                    'updated_at': datetime.now()
+                }
                 
-                # Use dedicated ticket_id_exists method for faster checking
-                app.logger.debug(f"[DEBUG] Checking if ticket ID {potential_id} exists...")
+                # Add created_by only if we have a session
+                if session.get('member_id'):
+                    ticket_data['created_by'] = session.get('member_id')
                 
                 try:
-                    exists = db.ticket_id_exists(potential_id)
-                    app.logger.debug(f"[SUCCESS] Database check complete: {potential_id} exists = {exists}")
-                except Exception as db_check_error:
-                    app.logger.error(f"[ERROR] Database check failed for {potential_id}: {db_check_error}")
-                    # On database connectivity issues, wait briefly and retry the same ID
-                    import time
-                    time.sleep(0.1)  # Brief pause to allow for database recovery
-                    try:
-                        # Retry the database check once more
-                        exists = db.ticket_id_exists(potential_id)
-                        app.logger.info(f"[SUCCESS] Database check retry successful: {potential_id} exists = {exists}")
-                    except Exception as retry_error:
-                        app.logger.error(f"[ERROR] Database check retry also failed: {retry_error}")
-                        # Skip this attempt and try the next ID
-                        continue
-                
-                if not exists:
-                    # ID is unique, create the ticket
-                    # Generate unique thread_id for manual tickets (required due to unique index)
-                    # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
-                    thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
-                    
-                    ticket_data = {
-                        'ticket_id': potential_id,
-                        'email': email,
-                        'name': customer_full_name,
-                        'subject': subject,
-                        'body': description,
-                        'status': 'Open',
-                        'priority': priority,
-                        'classification': type_of_claim,
-                        'technician': technician,
-                        'vehicle_registration': vehicle_registration,
-                        'service_date': service_date,
-                        'claim_date': claim_date,
-                        'creation_method': 'manual',
-                        'thread_id': thread_id,  # CRITICAL: Must be unique due to database constraint
-                        'created_at': datetime.now(),
-                        'updated_at': datetime.now()
-                    }
-                    
-                    # Add created_by only if we have a session
-                    if session.get('member_id'):
-                        ticket_data['created_by'] = session.get('member_id')
+                    app.logger.debug(f"? Attempting to create ticket with ID {potential_id}, thread_id {thread_id}")
+                    result = db.create_ticket(ticket_data)
+                    ticket_id = potential_id
+                    app.logger.info(f"[SUCCESS] Successfully created manual ticket with ID: {ticket_id} on attempt {attempt + 1}")
+                    app.logger.info(f"? Ticket data: email={email}, name={customer_full_name[:20]}..., thread_id={thread_id}")
+                    break
                     
-                    try:
-                        app.logger.debug(f"? Attempting to create ticket with ID {potential_id}, thread_id {thread_id}")
-                        result = db.create_ticket(ticket_data)
-                        ticket_id = potential_id
-                        app.logger.info(f"[SUCCESS] Successfully created manual ticket with ID: {ticket_id} on attempt {attempt + 1}")
-                        app.logger.info(f"? Ticket data: email={email}, name={customer_full_name[:20]}..., thread_id={thread_id}")
-                        break
-                        
-                    except ValueError as e:
-                        error_str = str(e)
-                        if "Ticket ID already exists" in error_str:
-                            app.logger.warning(f"[WARNING] Race condition detected for ticket ID {potential_id}, retrying (attempt {attempt + 1})")
-                            continue  # Race condition, try again
-                        elif "Thread ID already exists" in error_str:
-                            app.logger.warning(f"[WARNING] Thread ID collision detected, generating new thread_id and retrying (attempt {attempt + 1})")
-                            # Generate a new thread_id and try again with the same ticket_id
-                            # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
-                            thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
-                            continue
-                        else:
-                            # Different ValueError, log and re-raise
-                            app.logger.error(f"[ERROR] ValueError creating ticket {potential_id}: {e}")
-                            raise e
-                    except Exception as e:
-                        app.logger.error(f"[ERROR] Unexpected error creating ticket with ID {potential_id}: {e}")
-                        app.logger.error(f"[DEBUG] Full error details: {type(e).__name__}: {str(e)}")
-                        import traceback
-                        app.logger.error(f"? Stack trace: {traceback.format_exc()}")
+                except ValueError as e:
+                    error_str = str(e)
+                    if "Ticket ID already exists" in error_str:
+                        app.logger.warning(f"[WARNING] Race condition detected for ticket ID {potential_id}, retrying (attempt {attempt + 1})")
+                        continue  # Race condition, try again
+                    elif "Thread ID already exists" in error_str:
+                        app.logger.warning(f"[WARNING] Thread ID collision detected, generating new thread_id and retrying (attempt {attempt + 1})")
+                        # Generate a new thread_id and try again with the same ticket_id
+                        # Generate completely unique thread_id to prevent attachment collisions (same as enhanced email processor)
+                        thread_id = f"TH_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}_{random.randint(10000,99999)}"
+                        continue
+                    else:
+                        # Different ValueError, log and re-raise
+                        app.logger.error(f"[ERROR] ValueError creating ticket {potential_id}: {e}")
                         raise e
-                else:
-                    # ID already exists
-                    app.logger.debug(f"[RETRY] Ticket ID {potential_id} already exists, retrying (attempt {attempt + 1})")
-                    continue
+                except Exception as e:
+                    app.logger.error(f"[ERROR] Unexpected error creating ticket with ID {potential_id}: {e}")
+                    app.logger.error(f"[DEBUG] Full error details: {type(e).__name__}: {str(e)}")
+                    import traceback
+                    app.logger.error(f"? Stack trace: {traceback.format_exc()}")
+                    raise e
                         
             except Exception as e:
                 app.logger.error(f"[ERROR] Error during ticket ID generation attempt {attempt + 1}: {str(e)}")
@@ -32790,6 +31523,9 @@ def api_create_ticket():
         if vhc_link:
             metadata_entries.append({'ticket_id': ticket_id, 'key': 'vhc_link', 'value': vhc_link})
         
+        # Move the payloads to GridFS; tickets and metadata keep only the gridfs_id reference
+        uploaded_files, _ = db.attachment_store.offload_attachments(uploaded_files)
+        
         # Add attachment metadata
         for i, file_info in enumerate(uploaded_files):
             metadata_entries.append({
@@ -32811,7 +31547,7 @@ def api_create_ticket():
         if uploaded_files:
             app.logger.info(f"DEBUG: Creating attachments array for {len(uploaded_files)} files")
             
-            # Create attachments array for the ticket - FIXED: Include base64 data
+            # Create attachments array for the ticket, referencing the stored payloads
             attachments_array = []
             for file_info in uploaded_files:
                 attachment_data = {
@@ -32824,11 +31560,11 @@ def api_create_ticket():
                     'uploaded_at': datetime.now().isoformat(),
                     'source': 'manual_upload',
                     'path': file_info['path'],  # Full path for file operations
-                    'type': 'file',  # Ensure type is set for template compatibility
-                    'data': file_info['data']  # FIXED: Include base64 data for database storage
+                    'type': 'file'  # Ensure type is set for template compatibility
                 }
+                attachment_data.update({key: file_info[key] for key in ('gridfs_id', 'blob_field', 'data') if key in file_info})
                 attachments_array.append(attachment_data)
-                app.logger.info(f"DEBUG: Added attachment to array: {file_info['original_name']} (base64: {len(file_info['data'])} chars)")
+                app.logger.info(f"DEBUG: Added attachment to array: {file_info['original_name']} (gridfs_id: {file_info.get('gridfs_id')})")
             
             # Update ticket with attachment information - ENHANCED UPDATE
             update_data = {
@@ -32847,16 +31583,11 @@ def api_create_ticket():
                 
                 # Also ensure the attachments are properly indexed in the database
                 # This helps with search and retrieval
-                for i, attachment in enumerate(attachments_array):
-                    # Store each attachment as individual metadata for better retrieval
-                    # FIXED: Include base64 data in metadata for complete storage
-                    attachment_metadata = {
-                        'ticket_id': ticket_id,
-                        'key': f'file_attachment_{i+1}',
-                        'value': json.dumps(attachment)
-                    }
-                    db.add_ticket_metadata(ticket_id, f'file_attachment_{i+1}', json.dumps(attachment))
-                    app.logger.info(f"SUCCESS: Stored attachment {i+1} metadata for ticket {ticket_id} (base64: {len(attachment.get('data', ''))} chars)")
+                # Store each attachment as individual metadata for better retrieval
+                db.set_ticket_metadata_many(ticket_id, {
+                    f'file_attachment_{i+1}': json.dumps(attachment) for i, attachment in enumerate(attachments_array)
+                })
+                app.logger.info(f"SUCCESS: Stored {len(attachments_array)} attachment metadata entries for ticket {ticket_id}")
                 
             except Exception as update_error:
                 app.logger.error(f"ERROR: Failed to update ticket {ticket_id} with attachment info: {update_error}")
@@ -32866,28 +31597,30 @@ def api_create_ticket():
         
         # Save additional metadata for the ticket
         try:
+            # Form fields, saved together with the technician below in one write
+            form_metadata = {
+                'customer_title': customer_title,
+                'customer_first_name': customer_first_name,
+                'customer_surname': customer_surname,
+                'type_of_claim': type_of_claim,
+                'vehicle_registration': vehicle_registration,
+                'service_date': service_date,
+                'claim_date': claim_date,
+                'vhc_link': vhc_link
+            }
+            
             # Save technician information to metadata
             if technician:
-                db.add_ticket_metadata(ticket_id, 'technician_name', technician)
-                app.logger.info(f"Saved technician name to metadata: {technician}")
+                form_metadata['technician_name'] = technician
                 
                 # Also get and save technician ID for proper assignment
                 technician_data = db.get_technician_by_name(technician)
                 if technician_data:
-                    db.add_ticket_metadata(ticket_id, 'technician_id', str(technician_data['_id']))
-                    app.logger.info(f"Saved technician ID to metadata: {technician_data['_id']}")
+                    form_metadata['technician_id'] = str(technician_data['_id'])
                 else:
                     app.logger.warning(f"Technician '{technician}' not found in database")
             
-            # Save other form fields to metadata
-            db.add_ticket_metadata(ticket_id, 'customer_title', customer_title)
-            db.add_ticket_metadata(ticket_id, 'customer_first_name', customer_first_name)
-            db.add_ticket_metadata(ticket_id, 'customer_surname', customer_surname)
-            db.add_ticket_metadata(ticket_id, 'type_of_claim', type_of_claim)
-            db.add_ticket_metadata(ticket_id, 'vehicle_registration', vehicle_registration)
-            db.add_ticket_metadata(ticket_id, 'service_date', service_date)
-            db.add_ticket_metadata(ticket_id, 'claim_date', claim_date)
-            db.add_ticket_metadata(ticket_id, 'vhc_link', vhc_link)
+            db.set_ticket_metadata_many(ticket_id, form_metadata)
             
             app.logger.info(f"Successfully saved all metadata for ticket {ticket_id}")
         except Exception as metadata_error:
@@ -33018,33 +31751,21 @@ def send_template_email():
         if not ticket_id:
             return jsonify({'status': 'error', 'message': 'Ticket ID required'}), 400
 
-        # ANTI-SPAM: Check for duplicate email template submissions
+        # ANTI-SPAM: Check for duplicate email template submissions within 10 seconds (across all workers)
         member_id = session['member_id']
-        current_time = datetime.now()
         cache_key = f"email_template_spam_{ticket_id}_{member_id}_{custom_subject[:30]}"
         
-        # Use the same cache as reply anti-spam
-        if not hasattr(app, '_reply_cache'):
-            app._reply_cache = {}
-        
-        # Clean old entries (older than 10 seconds for email templates)
-        app._reply_cache = {k: v for k, v in app._reply_cache.items() 
-                           if (current_time - v).total_seconds() < 10}
-        
-        if cache_key in app._reply_cache:
+        if not throttle.claim(cache_key, 10):
             app.logger.warning(f"🚫 EMAIL TEMPLATE SPAM BLOCKED - Duplicate email attempt for ticket {ticket_id} by member {member_id}")
             return jsonify({'status': 'error', 'message': 'Duplicate email submission detected. Please wait before sending again.'}), 429
         
-        # Record this submission to prevent duplicates
-        app._reply_cache[cache_key] = current_time
-        
         app.logger.info(f" PROCESSING EMAIL TEMPLATE - Ticket: {ticket_id}, Member: {member_id}, Subject: {custom_subject[:50]}...")
         
         # Get ticket information
         try:
             db = get_db()
             app.logger.info(f" DEBUG: Got database connection for ticket {ticket_id}")
-            ticket = db.get_ticket_by_id(ticket_id)
+            ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
             app.logger.info(f" DEBUG: Retrieved ticket data: {ticket is not None}")
             if not ticket:
                 return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
@@ -33133,7 +31854,7 @@ def send_template_email():
             for meta in metadata:
                 if meta.get('key', '').startswith('attachment_'):
                     try:
-                        attachment_data = json.loads(meta.get('value', '{}'))
+                        attachment_data = decode_value(meta.get('value', '{}'))
                         if attachment_data and isinstance(attachment_data, dict):
                             # Read file from disk and convert to base64
                             file_path = attachment_data.get('path', '')
@@ -33972,7 +32693,7 @@ def load_email_template(template_type, ticket_id):
         
         # Get ticket data
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             app.logger.error(f"❌ TICKET NOT FOUND - URL Ticket ID: {ticket_id}")
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
@@ -34185,7 +32906,7 @@ def load_email_template(template_type, ticket_id):
                 if meta.get('key', '').startswith('attachment_'):
                     try:
                         app.logger.info(f"📎 PROCESSING METADATA KEY: {meta.get('key')}")
-                        attachment_data = json.loads(meta.get('value', '{}'))
+                        attachment_data = decode_value(meta.get('value', '{}'))
                         if attachment_data and isinstance(attachment_data, dict):
                             app.logger.info(f"📎 ATTACHMENT DATA KEYS: {list(attachment_data.keys())}")
                             
@@ -34531,7 +33252,7 @@ def debug_attachments(ticket_id):
     
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         if not ticket:
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
         
@@ -34542,15 +33263,15 @@ def debug_attachments(ticket_id):
         
         for meta in metadata:
             if meta.get('key', '').startswith('attachment_'):
-                try:
-                    attachment_data = json.loads(meta.get('value', '{}'))
-                    if attachment_data and isinstance(attachment_data, dict):
-                        metadata_attachments.append({
-                            'key': meta.get('key'),
-                            'data': attachment_data,
-                            'parsed_successfully': True
-                        })
-                except (json.JSONDecodeError, TypeError):
+                # Sub-documents come back native; only an unparseable legacy string stays a string
+                attachment_data = decode_value(meta.get('value', '{}'))
+                if attachment_data and isinstance(attachment_data, dict):
+                    metadata_attachments.append({
+                        'key': meta.get('key'),
+                        'data': attachment_data,
+                        'parsed_successfully': True
+                    })
+                elif not isinstance(attachment_data, dict):
                     metadata_attachments.append({
                         'key': meta.get('key'),
                         'data': meta.get('value'),
@@ -34880,6 +33601,7 @@ def download_reply_attachment(reply_id, attachment_index):
                 att.get('source') in ['webhook_base64', 'webhook', 'simple_attachments'] or 
                 att.get('fileData') or  # Check for fileData (base64 content)
                 att.get('data') or      # Check for data field
+                att.get('gridfs_id') or # Payload moved to the GridFS attachment store
                 not att.get('type')     # Fallback for attachments without type
             )
             
@@ -34916,7 +33638,7 @@ def download_reply_attachment(reply_id, attachment_index):
                     'description': attachment.get('description', '')
                 }
             }), 400
-        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data'):
+        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data') and not attachment.get('gridfs_id'):
             # Only reject if no fileData or data is present
             app.logger.error(f" Invalid attachment type: {attachment_type}. Expected 'file' or 'webhook_base64' or attachment with fileData")
             app.logger.error(f" Full attachment data: {attachment}")
@@ -34928,6 +33650,12 @@ def download_reply_attachment(reply_id, attachment_index):
         # Check for base64 data in multiple possible fields
         base64_data = attachment.get('data', '') or attachment.get('fileData', '')
         
+        # Attachments moved to GridFS are streamed in chunks
+        if attachment.get('gridfs_id'):
+            response = send_stored_attachment(attachment['gridfs_id'], filename)
+            if response is not None:
+                return response
+        
 
         
         # FIXED: Priority 1 - Use base64 data if available (most reliable)
@@ -35028,6 +33756,7 @@ def preview_reply_attachment(reply_id, attachment_index):
                 att.get('source') in ['webhook_base64', 'webhook', 'simple_attachments'] or 
                 att.get('fileData') or  # Check for fileData (base64 content)
                 att.get('data') or      # Check for data field
+                att.get('gridfs_id') or # Payload moved to the GridFS attachment store
                 not att.get('type')     # Fallback for attachments without type
             )
             
@@ -35064,7 +33793,7 @@ def preview_reply_attachment(reply_id, attachment_index):
                     'description': attachment.get('description', '')
                 }
             }), 400
-        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data'):
+        elif attachment_type not in ['file', 'webhook_base64'] and not attachment.get('fileData') and not attachment.get('data') and not attachment.get('gridfs_id'):
             # Only reject if no fileData or data is present
             app.logger.error(f" Invalid attachment type: {attachment_type}. Expected 'file' or 'webhook_base64' or attachment with fileData")
             app.logger.error(f" Full attachment data: {attachment}")
@@ -35084,6 +33813,11 @@ def preview_reply_attachment(reply_id, attachment_index):
             app.logger.error(f"📎 File type not previewable: {file_ext}")
             return jsonify({'error': f'File type {file_ext} not previewable'}), 400
         
+        if attachment.get('gridfs_id'):
+            response = send_stored_attachment(attachment['gridfs_id'], filename, as_attachment=False)
+            if response is not None:
+                return response
+        
 
         
         # FIXED: Priority 1 - Use base64 data if available (most reliable)
@@ -35154,9 +33888,8 @@ def get_reply_count(ticket_id):
     try:
         db = get_db()
         
-        # Get ticket to verify it exists
-        ticket = db.tickets.find_one({'ticket_id': ticket_id})
-        if not ticket:
+        # Verify the ticket exists without loading the document
+        if not db.ticket_id_exists(ticket_id):
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
         
         # Count replies for this ticket
@@ -35172,6 +33905,129 @@ def get_reply_count(ticket_id):
         app.logger.error(f"Error getting reply count for ticket {ticket_id}: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to get reply count'}), 500
 
+# Most tickets one reply-state request may ask about (a ticket list page is 20-50)
+REPLY_STATE_BATCH_LIMIT = 200
+
+@app.route('/api/tickets/reply-state', methods=['POST'])
+def get_reply_states():
+    """Reply counts, last reply times and unread flags for many tickets in one call
+
+    Body: {"ticket_ids": [...], "since": cursor}. new_replies counts the replies since the
+    cursor of the previous response; tickets that do not exist are left out.
+    """
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    ticket_ids = data.get('ticket_ids')
+    if not isinstance(ticket_ids, list) or not all(isinstance(ticket_id, str) for ticket_id in ticket_ids):
+        return jsonify({'status': 'error', 'message': 'ticket_ids must be a list of ticket IDs'}), 400
+    if len(ticket_ids) > REPLY_STATE_BATCH_LIMIT:
+        return jsonify({'status': 'error', 'message': f'At most {REPLY_STATE_BATCH_LIMIT} ticket IDs per request'}), 400
+    
+    try:
+        # Same cursor scheme as /api/dashboard/updates: replies younger than the lag are left for the next call
+        until = datetime.now() - CHANGE_FEED_LAG
+        since = decode_change_cursor(data.get('since'))
+        if since is not None:
+            until = max(until, since)
+        states = get_db().get_reply_states(set(ticket_ids), since=since, until=until) if ticket_ids else {}
+        for state in states.values():
+            if state['last_reply_at']:
+                state['last_reply_at'] = state['last_reply_at'].isoformat()
+        
+        return jsonify({
+            'status': 'success',
+            'tickets': states,
+            'cursor': encode_change_cursor(until)
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Error getting reply states for {len(ticket_ids)} tickets: {e}")
+        return jsonify({'status': 'error', 'message': 'Failed to get reply states'}), 500
+
+# Live events (see live_events.py): streams end after a minute and the browser reconnects with
+# Last-Event-ID, so request threads are handed back regularly and sessions stay refreshed
+LIVE_STREAM_SECONDS = 55
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_POLL_SECONDS = 25
+
+def format_live_event(event):
+    """One Server-Sent Events message"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.route('/api/events/stream', methods=['GET'])
+def live_event_stream():
+    """Server-Sent Events: new tickets, new replies, unread flags, status and assignment changes"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    if not live_events.slots.acquire(blocking=False):
+        # Every stream slot of this worker is taken; the page falls back to /api/events/poll
+        return jsonify({'status': 'error', 'message': 'Live updates busy', 'fallback': url_for('live_event_poll')}), 503
+    
+    try:
+        # gunicorn starts the feed in post_fork; this starts it under the development server
+        live_events.feed.ensure_started(lambda: get_db().db)
+    except Exception as e:
+        app.logger.warning(f"Live events feed not started: {e}")
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('after') or live_events.broker.latest_cursor()
+    
+    def generate(cursor):
+        deadline = time.monotonic() + LIVE_STREAM_SECONDS
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            events, resync = live_events.broker.wait(cursor, LIVE_KEEPALIVE_SECONDS)
+            if resync:
+                cursor = live_events.broker.latest_cursor()
+                yield f"id: {cursor}\nevent: resync\ndata: {{}}\n\n"
+            for event in events:
+                cursor = event['id']
+                yield format_live_event(event)
+            if not events and not resync:
+                yield ": keepalive\n\n"
+    
+    response = Response(stream_with_context(generate(cursor)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx must not buffer the stream
+    response.call_on_close(live_events.slots.release)
+    return response
+
+@app.route('/api/events/poll', methods=['GET'])
+def live_event_poll():
+    """Long-poll fallback for /api/events/stream: events after ?after=<cursor>, waiting up to 25 seconds"""
+    if 'member_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        # gunicorn starts the feed in post_fork; this starts it under the development server
+        live_events.feed.ensure_started(lambda: get_db().db)
+    except Exception as e:
+        app.logger.warning(f"Live events feed not started: {e}")
+    
+    after = request.args.get('after')
+    if not after:
+        # First poll only establishes where this page starts
+        return jsonify({'status': 'success', 'events': [], 'resync': False, 'waited': False,
+                        'cursor': live_events.broker.latest_cursor()})
+    
+    waited = live_events.slots.acquire(blocking=False)
+    try:
+        if waited:
+            events, resync = live_events.broker.wait(after, LIVE_POLL_SECONDS)
+        else:
+            # No slot free: answer now and let the page come back after its poll interval
+            events, resync = live_events.broker.events_after(after)
+    finally:
+        if waited:
+            live_events.slots.release()
+    
+    if events:
+        cursor = events[-1]['id']
+    else:
+        cursor = live_events.broker.latest_cursor() if resync else after
+    return jsonify({'status': 'success', 'events': events, 'resync': resync, 'waited': waited, 'cursor': cursor})
+
 
 
 @app.route('/webhook/reply', methods=['POST'])
@@ -35366,10 +34222,8 @@ def webhook_reply():
             # Save attachments to reply
             all_attachments = attachments + file_attachments
             if all_attachments:
-                db.replies.update_one(
-                    {'_id': reply_id},
-                    {'$set': {'attachments': all_attachments}}
-                )
+                # Payloads go to GridFS like create_reply's, not inline on the reply
+                db.set_reply_attachments(reply_id, all_attachments)
             
             # Update ticket status
             update_data = {
@@ -35444,7 +34298,7 @@ def get_simple_attachment(attachment_id):
         db = get_db()
         
         # Get ticket data
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         if not ticket:
             app.logger.error(f"Ticket not found: {ticket_id}")
             return jsonify({'error': 'Ticket not found'}), 404
@@ -35461,6 +34315,13 @@ def get_simple_attachment(attachment_id):
                 filename = attachment.get('filename', 'unknown_file')
                 file_data = attachment.get('data', '')
                 
+                if attachment.get('gridfs_id'):
+                    response = send_stored_attachment(
+                        attachment['gridfs_id'], filename, as_attachment=request.args.get('preview') != 'true'
+                    )
+                    if response is not None:
+                        return response
+                
                 app.logger.info(f"? Processing attachment: {filename}, data length: {len(file_data)}")
                 
                 if file_data:
@@ -35547,7 +34408,7 @@ def download_attachment(ticket_id, attachment_index):
         db = get_db()
         
         # Get ticket data
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True, hydrate_blobs=False)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
@@ -35562,6 +34423,12 @@ def download_attachment(ticket_id, attachment_index):
                 attachment = attachments[attachment_index]
                 filename = attachment.get('filename', attachment.get('original_name', 'unknown_file'))
                 
+                # Attachments moved to GridFS are streamed in chunks
+                if attachment.get('gridfs_id'):
+                    response = send_stored_attachment(attachment['gridfs_id'], filename)
+                    if response is not None:
+                        return response
+                
                 # FIXED: PRIORITY 1 - Check for base64 data first (most reliable)
                 file_data = attachment.get('data', '')
                 if file_data:
@@ -35682,16 +34549,10 @@ def download_attachment(ticket_id, attachment_index):
                 app.logger.warning(f" Reply file not found: {file_path}")
         
         # METHOD 3: Check metadata collection for file attachments (both email and manual tickets)
-        ticket_metadata = db.get_ticket_metadata(ticket_id)
-        attachment_files = []
-        
-        for metadata_entry in ticket_metadata:
-            if metadata_entry['key'].startswith('attachment_'):
-                try:
-                    attachment_data = json.loads(metadata_entry['value'])
-                    attachment_files.append(attachment_data)
-                except:
-                    continue
+        attachment_files = [
+            attachment_data for key, attachment_data in db.get_ticket_metadata_fields(ticket_id).items()
+            if key.startswith('attachment_') and isinstance(attachment_data, dict)
+        ]
         
         app.logger.info(f"Found {len(attachment_files)} metadata attachments")
         
@@ -35806,6 +34667,39 @@ def get_mime_type(filename):
     
     return mime_types.get(ext, 'application/octet-stream')
 
+def send_stored_attachment(gridfs_id, filename, as_attachment=True, mimetype=None):
+    """Stream an attachment from the GridFS store with Range, ETag and Last-Modified support"""
+    db = get_db()
+    grid_out = db.attachment_store.open(gridfs_id)
+    if grid_out is None:
+        return None
+    
+    # Office documents keep the "cannot be previewed" page instead of an inline stream
+    if not as_attachment and filename.lower().endswith(('.doc', '.docx', '.xls', '.xlsx')):
+        grid_out.close()
+        return create_preview_response(b'', filename)
+    
+    # Read one GridFS chunk at a time; werkzeug seeks the file for Range requests
+    response = Response(
+        FileWrapper(grid_out, buffer_size=grid_out.chunk_size),
+        mimetype=mimetype or get_mime_type(filename),
+        direct_passthrough=True
+    )
+    response.content_length = grid_out.length
+    response.last_modified = grid_out.upload_date
+    response.set_etag(str(grid_out._id))
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    disposition = 'attachment' if as_attachment else 'inline'
+    response.headers['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=grid_out.length)
+    except RequestedRangeNotSatisfiable as e:
+        grid_out.close()
+        return e.get_response()
+
 @app.route('/api/tickets/<ticket_id>/attachments')
 def get_ticket_attachments(ticket_id):
     """
@@ -35946,7 +34840,7 @@ def get_single_ticket(ticket_id):
     
     try:
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         
         if not ticket:
             return jsonify({'status': 'error', 'message': 'Ticket not found'}), 404
@@ -35978,8 +34872,11 @@ def get_all_tickets():
         db = get_db()
         
         # Get all tickets with attachment info
-        tickets = list(db.tickets.find({}).sort([('_id', -1)]).limit(50))
+        tickets = list(db.tickets.find({}, ticket_projection()).sort([('_id', -1)]).limit(50))
         
+        # Load metadata for every ticket on the page in one query instead of per ticket
+        metadata_by_ticket = db.get_metadata_fields_for_tickets([t.get('ticket_id') for t in tickets])
+
         # Convert to frontend-friendly format
         formatted_tickets = []
         for ticket in tickets:
@@ -36007,13 +34904,12 @@ def get_all_tickets():
                     attachments.append(attachment)
             
             # METHOD 2: Also check metadata collection (manual tickets)
-            ticket_metadata = db.get_ticket_metadata(ticket['ticket_id'])
+            ticket_metadata = metadata_by_ticket.get(ticket['ticket_id'], {})
             metadata_attachments = []
             
-            for metadata_entry in ticket_metadata:
-                if metadata_entry['key'].startswith('attachment_'):
+            for meta_key, attachment_data in ticket_metadata.items():
+                if meta_key.startswith('attachment_'):
                     try:
-                        attachment_data = json.loads(metadata_entry['value'])
                         # Convert metadata back to attachment format
                         attachment = {
                             'index': len(attachments) + len(metadata_attachments),
@@ -36026,8 +34922,8 @@ def get_all_tickets():
                             'source': 'manual'  # Mark as manual attachment
                         }
                         metadata_attachments.append(attachment)
-                    except (json.JSONDecodeError, KeyError) as e:
-                        app.logger.warning(f"Failed to parse attachment metadata for {ticket['ticket_id']}: {e}")
+                    except (AttributeError, KeyError) as e:
+                        app.logger.warning(f"Failed to read attachment metadata for {ticket['ticket_id']}: {e}")
             
             # Combine both types of attachments
             attachments.extend(metadata_attachments)
@@ -36608,13 +35504,10 @@ def cleanup_old_data():
         deleted_count = 0
         
         # Clean up old ticket metadata
-        result = db.ticket_metadata.delete_many({
-            'created_at': {'$lt': cutoff_date}
-        })
-        deleted_count += result.deleted_count
+        deleted_count += db.delete_ticket_metadata_before(cutoff_date)
         
         # Clean up old replies for deleted tickets
-        result = db.replies.delete_many({
+        result = db.delete_replies({
             'created_at': {'$lt': cutoff_date},
             'ticket_id': {'$regex': '^deleted_'}
         })
@@ -36954,7 +35847,7 @@ def regenerate_attachment_base64_data(ticket_id):
     try:
         app.logger.info(f"🔄 REGENERATING BASE64 DATA FOR TICKET {ticket_id}")
         db = get_db()
-        ticket = db.get_ticket_by_id(ticket_id)
+        ticket = db.get_ticket_by_id(ticket_id, include_blobs=True)
         
         if not ticket:
             app.logger.error(f"❌ TICKET NOT FOUND: {ticket_id}")
@@ -36975,7 +35868,7 @@ def regenerate_attachment_base64_data(ticket_id):
         for meta in metadata:
             if meta.get('key', '').startswith('attachment_'):
                 try:
-                    attachment_data = json.loads(meta.get('value', '{}'))
+                    attachment_data = decode_value(meta.get('value', '{}'))
                     if attachment_data and isinstance(attachment_data, dict):
                         attachment_name = attachment_data.get('original_name', attachment_data.get('filename', 'Unknown File'))
                         
@@ -37113,7 +36006,7 @@ def regenerate_webhook_attachments(ticket_id):
                 app.logger.info(f"🔄 Checking reply {reply_id} with {len(attachments)} attachments")
                 
                 for i, attachment in enumerate(attachments):
-                    if attachment.get('type') == 'file':
+                    if attachment.get('type') == 'file' and not attachment.get('gridfs_id'):
                         # Check if attachment has malformed base64 data or is missing data
                         existing_data = attachment.get('data', '')
                         file_path = attachment.get('path', '')
@@ -37130,13 +36023,11 @@ def regenerate_webhook_attachments(ticket_id):
                                 # Try to fix the malformed data
                                 fixed_data, error = fix_malformed_base64_data(existing_data)
                                 if fixed_data:
-                                    # Update with fixed base64 data
-                                    db.replies.update_one(
-                                        {'_id': reply_id, f'attachments.{i}.path': file_path},
-                                        {'$set': {
-                                            f'attachments.{i}.data': fixed_data,
-                                            f'attachments.{i}.has_data': True
-                                        }}
+                                    # Store the repaired bytes in GridFS in place of the malformed inline data
+                                    db.store_reply_attachment(
+                                        reply_id, i, base64.b64decode(fixed_data),
+                                        attachment.get('filename') or attachment.get('name'),
+                                        match={f'attachments.{i}.path': file_path}
                                     )
                                     app.logger.info(f"✅ Fixed malformed base64 data for attachment {i} in reply {reply_id}")
                                     regenerated_count += 1
@@ -37149,16 +36040,11 @@ def regenerate_webhook_attachments(ticket_id):
                                 # Read file and convert to base64
                                 with open(file_path, 'rb') as f:
                                     file_content = f.read()
-                                    base64_data = base64.b64encode(file_content).decode('utf-8')
                                 
-                                # Update attachment with base64 data
-                                db.replies.update_one(
-                                    {'_id': reply_id, f'attachments.{i}.path': file_path},
-                                    {'$set': {
-                                        f'attachments.{i}.data': base64_data,
-                                        f'attachments.{i}.has_data': True,
-                                        f'attachments.{i}.size': len(file_content)
-                                    }}
+                                # Point the attachment at the file's bytes in GridFS
+                                db.store_reply_attachment(
+                                    reply_id, i, file_content, attachment.get('filename') or attachment.get('name'),
+                                    match={f'attachments.{i}.path': file_path}
                                 )
                                 
                                 app.logger.info(f"✅ Regenerated base64 data for attachment {i} in reply {reply_id}")
@@ -0,0 +1,271 @@
+"""
+GridFS Attachment Store for AutoAssistGroup Support System
+
+Attachment bytes are stored once in a GridFS bucket instead of as base64
+strings inside ticket, reply and common document records. Records keep a
+small reference (gridfs_id) and downloads stream the file back chunk by
+chunk, so large PDFs never have to be decoded into memory in one piece.
+
+Files are content addressed: the GridFS file id is the SHA-256 of the bytes,
+so a warranty form re-sent on every reply or a common document attached to
+many tickets is stored once. A reference count per digest (attachment_refs)
+decides when the bytes can be deleted.
+
+Key Features:
+- Raw bytes stored once in the 'attachments' GridFS bucket, keyed by SHA-256
+- Reference counting across tickets, replies and common documents
+- Offload/hydrate helpers for embedded attachment dictionaries
+- Seekable readers for HTTP Range and conditional downloads
+
+Author: AutoAssistGroup Development Team
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+
+import gridfs
+import pymongo
+from bson.objectid import ObjectId
+from gridfs.errors import FileExists, NoFile
+
+ATTACHMENT_BUCKET = 'attachments'
+ATTACHMENT_REFS_COLLECTION = 'attachment_refs'
+
+_SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+
+# Files stored before content addressing have ObjectId (24 hex character) ids
+LEGACY_FILE_ID_FILTER = {'gridfs_id': {'$regex': '^[0-9a-f]{24}$'}}
+
+# How long put_stream waits for a release that is deleting the same bytes before treating it as abandoned
+RELEASE_WAIT = timedelta(seconds=30)
+RELEASE_POLL_SECONDS = 0.05
+
+# Fields that hold a base64 payload on embedded attachment dictionaries
+# (tickets use 'data', replies use 'data' or 'fileData')
+ATTACHMENT_BLOB_KEYS = ('data', 'content', 'fileData', 'file_data')
+
+
+def _as_file_id(file_id):
+    """Normalize a stored gridfs_id: SHA-256 digests stay strings, older ids become ObjectIds"""
+    if isinstance(file_id, ObjectId):
+        return file_id
+    if isinstance(file_id, str):
+        if _SHA256_HEX.match(file_id):
+            return file_id
+        if ObjectId.is_valid(file_id):
+            return ObjectId(file_id)
+    return None
+
+
+def attachment_blob_filter(field='attachments'):
+    """Query matching records whose attachments still carry a base64 payload or a pre-digest file id"""
+    return {field: {'$elemMatch': {
+        '$or': [{key: {'$type': 'string', '$ne': ''}} for key in ATTACHMENT_BLOB_KEYS] + [LEGACY_FILE_ID_FILTER]
+    }}}
+
+
+class AttachmentStore:
+    def __init__(self, database, bucket_name=ATTACHMENT_BUCKET):
+        self.bucket = gridfs.GridFSBucket(database, bucket_name=bucket_name)
+        self.files = database[f'{bucket_name}.files']
+        self.refs = database[ATTACHMENT_REFS_COLLECTION]
+
+    def put(self, data, filename, content_type=None, metadata=None):
+        """Store raw bytes (once per SHA-256) and take a reference; returns the digest used as file id"""
+        return self.put_stream(io.BytesIO(data), hashlib.sha256(data).hexdigest(), len(data),
+                               filename, content_type, metadata)
+
+    def put_stream(self, source, digest, length, filename, content_type=None, metadata=None):
+        """Store bytes read from a file object whose SHA-256 and length the caller computed; returns the digest"""
+        # Once this reference is counted no release can start deleting the bytes (release() only claims a
+        # ref at zero); one that claimed them earlier is waited for, and the bytes re-uploaded if it deleted them
+        ref = self.refs.find_one_and_update(
+            {'_id': digest},
+            {'$inc': {'refcount': 1}, '$setOnInsert': {'length': length, 'created_at': datetime.now()}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if ref.get('deleting'):
+            self._wait_for_release(digest, ref['deleting'])
+        if self.files.find_one({'_id': digest}, {'_id': 1}) is None:
+            file_metadata = dict(metadata or {})
+            if content_type:
+                file_metadata['contentType'] = content_type
+            file_metadata.setdefault('stored_at', datetime.now())
+            try:
+                self.bucket.upload_from_stream_with_id(digest, filename or 'attachment', source, metadata=file_metadata)
+            except FileExists:
+                # Another worker stored the same bytes first
+                pass
+        return digest
+
+    def _wait_for_release(self, digest, claimed_at):
+        """Wait until the release that claimed digest's bytes has finished (or is presumed dead)"""
+        deadline = claimed_at + RELEASE_WAIT
+        while datetime.now() < deadline:
+            if self.refs.find_one({'_id': digest, 'deleting': claimed_at}, {'_id': 1}) is None:
+                return
+            time.sleep(RELEASE_POLL_SECONDS)
+        logging.warning(f"[ATTACHMENTS] Release of {digest} did not finish; taking over its claim")
+        self.refs.update_one({'_id': digest, 'deleting': claimed_at}, {'$unset': {'deleting': ''}})
+
+    def put_base64(self, base64_data, filename, content_type=None, metadata=None):
+        """Decode a base64 payload and store it; returns (file_id, size)"""
+        raw = base64.b64decode(base64_data)
+        return self.put(raw, filename, content_type, metadata), len(raw)
+
+    def open(self, file_id):
+        """Open a stored file for streaming, or None if it does not exist"""
+        stored_id = _as_file_id(file_id)
+        if stored_id is None:
+            return None
+        try:
+            return self.bucket.open_download_stream(stored_id)
+        except NoFile:
+            logging.warning(f"[ATTACHMENTS] Stored file {file_id} not found")
+            return None
+
+    def is_legacy_id(self, file_id):
+        """True for files stored under an ObjectId before content addressing"""
+        return isinstance(_as_file_id(file_id), ObjectId)
+
+    def rekey(self, file_id):
+        """Re-store a pre-digest file under its SHA-256 digest; returns the new file id"""
+        grid_out = self.open(file_id)
+        if grid_out is None:
+            return file_id
+        with grid_out:
+            digest = self.put(grid_out.read(), grid_out.filename, metadata=grid_out.metadata)
+        self._delete_file(grid_out._id)
+        return digest
+
+    def read_base64(self, file_id):
+        """Read a stored file back as a base64 string (for email and webhook payloads)"""
+        grid_out = self.open(file_id)
+        if grid_out is None:
+            return None
+        with grid_out:
+            return base64.b64encode(grid_out.read()).decode('utf-8')
+
+    def release(self, file_id):
+        """Drop one reference to a stored file, deleting the bytes when nothing references them"""
+        stored_id = _as_file_id(file_id)
+        if stored_id is None:
+            return False
+        if isinstance(stored_id, ObjectId):
+            # Files stored before content addressing were never shared
+            return self._delete_file(stored_id)
+        ref = self.refs.find_one_and_update(
+            {'_id': stored_id},
+            {'$inc': {'refcount': -1}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if ref is None:
+            # Stored without a reference count: nothing else can be using it
+            return self._delete_file(stored_id)
+        if ref.get('refcount', 0) > 0:
+            return False
+        # Claim the deletion while the count is still zero; a put_stream that counts a new reference
+        # from here on waits for the claim to end and re-uploads the bytes if they are gone
+        claimed_at = datetime.now()
+        claimed = self.refs.update_one(
+            {'_id': stored_id, 'refcount': {'$lte': 0}, 'deleting': {'$exists': False}},
+            {'$set': {'deleting': claimed_at}}
+        )
+        if claimed.modified_count == 0:
+            return False
+        deleted = self._delete_file(stored_id)
+        if self.refs.delete_one({'_id': stored_id, 'refcount': {'$lte': 0}, 'deleting': claimed_at}).deleted_count == 0:
+            # Referenced again meanwhile: end the claim so the waiting put_stream stores the bytes again
+            self.refs.update_one({'_id': stored_id, 'deleting': claimed_at}, {'$unset': {'deleting': ''}})
+        return deleted
+
+    def release_attachments(self, attachments):
+        """Release the stored files referenced by a list of attachments; returns the number of files deleted"""
+        if not isinstance(attachments, list):
+            return 0
+        return sum(1 for att in attachments
+                   if isinstance(att, dict) and att.get('gridfs_id') and self.release(att['gridfs_id']))
+
+    def _delete_file(self, stored_id):
+        try:
+            self.bucket.delete(stored_id)
+            return True
+        except NoFile:
+            return False
+
+    def dedup_stats(self):
+        """Unique bytes stored versus bytes referenced by tickets, replies and documents"""
+        result = list(self.refs.aggregate([
+            {'$group': {
+                '_id': None,
+                'unique_files': {'$sum': 1},
+                'references': {'$sum': '$refcount'},
+                'stored_bytes': {'$sum': '$length'},
+                'referenced_bytes': {'$sum': {'$multiply': ['$length', '$refcount']}}
+            }}
+        ]))
+        stats = result[0] if result else {'unique_files': 0, 'references': 0, 'stored_bytes': 0, 'referenced_bytes': 0}
+        stats.pop('_id', None)
+        stats['dedup_ratio'] = round(stats['referenced_bytes'] / stats['stored_bytes'], 2) if stats['stored_bytes'] else 0
+        return stats
+
+    def offload_attachment(self, attachment, metadata=None):
+        """Move an embedded attachment's base64 payload into the store; returns True if moved"""
+        if not isinstance(attachment, dict):
+            return False
+        if attachment.get('gridfs_id'):
+            # Payload was hydrated from the store and written back; the stored copy already holds it
+            changed = bool([key for key in ATTACHMENT_BLOB_KEYS if attachment.pop(key, None) is not None])
+            if self.is_legacy_id(attachment['gridfs_id']):
+                attachment['gridfs_id'] = self.rekey(attachment['gridfs_id'])
+                changed = True
+            return changed
+        blob_key = next((key for key in ATTACHMENT_BLOB_KEYS
+                         if isinstance(attachment.get(key), str) and attachment.get(key)), None)
+        if not blob_key:
+            return False
+        filename = attachment.get('filename') or attachment.get('name') or attachment.get('original_name')
+        try:
+            file_id, size = self.put_base64(
+                attachment[blob_key],
+                filename,
+                content_type=attachment.get('content_type') or attachment.get('mimeType'),
+                metadata=metadata,
+            )
+        except (binascii.Error, ValueError) as e:
+            logging.warning(f"[ATTACHMENTS] Leaving undecodable payload for {filename} inline: {e}")
+            return False
+        for key in ATTACHMENT_BLOB_KEYS:
+            attachment.pop(key, None)
+        attachment['gridfs_id'] = file_id
+        attachment['blob_field'] = blob_key
+        attachment.setdefault('size', size)
+        return True
+
+    def offload_attachments(self, attachments, metadata=None):
+        """Offload every embedded payload in a list of attachments; returns (attachments, moved_count)"""
+        if not isinstance(attachments, list):
+            return attachments, 0
+        offloaded = [dict(att) if isinstance(att, dict) else att for att in attachments]
+        moved = sum(1 for att in offloaded if self.offload_attachment(att, metadata))
+        return offloaded, moved
+
+    def hydrate_attachments(self, attachments):
+        """Put base64 payloads back on attachments that reference the store (in place)"""
+        if not isinstance(attachments, list):
+            return attachments
+        for att in attachments:
+            if isinstance(att, dict) and att.get('gridfs_id'):
+                blob_field = att.get('blob_field', 'data')
+                if not att.get(blob_field):
+                    base64_data = self.read_base64(att['gridfs_id'])
+                    if base64_data is not None:
+                        att[blob_field] = base64_data
+        return attachments
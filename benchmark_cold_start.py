@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark
+
+Measures time-to-first-response of a fresh worker: each run starts a new
+Python process, imports the app (as wsgi.py / api/index.py do) and serves
+GET /health through the Flask test client, which opens the first database
+connection.
+
+  legacy   - startup as before: ping, then MongoDB.init_database() (index
+             builds plus seed-data checks) in every worker
+  current  - startup now: one schema-version read; provisioning is left to
+             `python migrate.py`
+
+Run it against a database that has already been provisioned with
+`python migrate.py` so both modes see the same indexes and seed data.
+
+Usage:
+    MONGODB_URI=... python benchmark_cold_start.py [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+WORKER = r'''
+import json, sys, time
+started = time.perf_counter()
+if sys.argv[1] == 'legacy':
+    import database
+    check_schema_version = database.MongoDB.check_schema_version
+
+    def legacy_startup(self):
+        self.client.admin.command('ping')
+        self.init_database()
+        return check_schema_version(self)
+
+    database.MongoDB.check_schema_version = legacy_startup
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get('/health')
+responded = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (responded - imported) * 1000,
+    'total_ms': (responded - started) * 1000,
+}))
+'''
+
+
+def cold_start(mode):
+    env = dict(os.environ, FLASK_ENV='production')
+    result = subprocess.run(
+        [sys.executable, '-c', WORKER, mode],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True
+    )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    if sample['status'] != 200:
+        raise SystemExit(f"{mode}: /health returned {sample['status']}\n{result.stderr}")
+    return sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    if not os.environ.get('MONGODB_URI'):
+        raise SystemExit("MONGODB_URI environment variable is required")
+
+    print(f"{'mode':<8} {'import ms':>10} {'first response ms':>18} {'total ms':>9}   (median of {args.runs})")
+    for mode in ('legacy', 'current'):
+        samples = [cold_start(mode) for _ in range(args.runs)]
+        import_ms, first_ms, total_ms = (
+            statistics.median(sample[key] for sample in samples)
+            for key in ('import_ms', 'first_response_ms', 'total_ms')
+        )
+        print(f"{mode:<8} {import_ms:>10.1f} {first_ms:>18.1f} {total_ms:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
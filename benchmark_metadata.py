@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Ticket metadata benchmark
+
+Compares the legacy key/value ticket_metadata rows with the one-document-
+per-ticket layout in metadata_store.py for the two read paths that matter:
+
+  detail  - all metadata of one ticket (ticket detail page)
+  list    - all metadata of a 50-ticket page (GET /api/tickets)
+
+For each it reports documents examined (from explain), json.loads/json.dumps
+calls made while reading (counted, not assumed), and median wall time. The
+documents layout is read the way the views read it now: the calls behind
+MongoDB.get_metadata_for_tickets / get_ticket_metadata (get_many, then
+metadata_rows), then decode_value on each attachment value. Synthetic rows are
+written to a scratch database (dropped afterwards), never to support_tickets.
+
+Usage:
+    MONGODB_URI=... python benchmark_metadata.py [--tickets 2000] [--runs 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import time
+from datetime import datetime
+
+from pymongo import MongoClient
+
+from metadata_store import METADATA_DOCS_COLLECTION, TicketMetadataStore, decode_value, metadata_rows
+
+SCALAR_KEYS = ['customer_title', 'customer_first_name', 'customer_surname', 'type_of_claim', 'vehicle_registration',
+               'service_date', 'claim_date', 'vhc_link', 'technician_id', 'technician_name', 'advisories_followed',
+               'within_warranty', 'new_fault_codes', 'outcome_category']
+ATTACHMENTS_PER_TICKET = 3
+LIST_PAGE_SIZE = 50
+
+
+def legacy_rows(ticket_id):
+    now = datetime.now()
+    rows = [{'ticket_id': ticket_id, 'key': key, 'value': ''.join(random.choices(string.ascii_letters, k=12)),
+             'created_at': now} for key in SCALAR_KEYS]
+    for i in range(ATTACHMENTS_PER_TICKET):
+        attachment = {'original_name': f'file_{i}.pdf', 'size': 2048, 'file_path': f'/uploads/{ticket_id}/{i}',
+                      'is_warranty': i == 0, 'data': ''.join(random.choices(string.ascii_letters, k=2048))}
+        value = json.dumps(attachment)
+        # Some stored values carry the trailing comma readers had to repair
+        rows.append({'ticket_id': ticket_id, 'key': f'attachment_{i}',
+                     'value': value[:-1] + ',}' if i == 1 else value, 'created_at': now})
+    return rows
+
+
+def legacy_read(db, ticket_ids):
+    """What list and detail views did before: every row, then json.loads per attachment value"""
+    by_ticket = {}
+    for row in db.ticket_metadata.find({'ticket_id': {'$in': ticket_ids}}):
+        value = row['value']
+        if row['key'].startswith('attachment_'):
+            clean_json = value.strip()
+            if clean_json.endswith(',}'):
+                clean_json = clean_json[:-2] + '}'
+            value = json.loads(clean_json)
+        by_ticket.setdefault(row['ticket_id'], {})[row['key']] = value
+    return by_ticket
+
+
+def documents_read(store, ticket_ids):
+    """What list and detail views do now: get_metadata_for_tickets' rows, then decode_value per attachment value"""
+    by_ticket = {}
+    for ticket_id, fields in store.get_many(ticket_ids).items():
+        for row in metadata_rows(ticket_id, fields):
+            value = row['value']
+            if row['key'].startswith('attachment_'):
+                value = decode_value(value)
+            by_ticket.setdefault(ticket_id, {})[row['key']] = value
+    return by_ticket
+
+
+def json_calls(fn):
+    """Number of json.loads and json.dumps calls made while running fn"""
+    calls = 0
+    loads, dumps = json.loads, json.dumps
+
+    def counted(original):
+        def wrapper(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            return original(*args, **kwargs)
+        return wrapper
+
+    json.loads, json.dumps = counted(loads), counted(dumps)
+    try:
+        fn()
+    finally:
+        json.loads, json.dumps = loads, dumps
+    return calls
+
+
+def docs_examined(db, collection, query_filter):
+    explain = db.command('explain', {'find': collection, 'filter': query_filter}, verbosity='executionStats')
+    return explain['executionStats']['totalDocsExamined']
+
+
+def median_ms(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--database', default='support_tickets_metadata_benchmark')
+    args = parser.parse_args()
+
+    connection_string = os.environ.get('MONGODB_URI')
+    if not connection_string:
+        raise SystemExit("MONGODB_URI environment variable is required")
+
+    client = MongoClient(connection_string)
+    client.drop_database(args.database)
+    db = client[args.database]
+    db.ticket_metadata.create_index([('ticket_id', 1), ('key', 1)])
+
+    try:
+        ticket_ids = [f'BM{n:05d}' for n in range(args.tickets)]
+        for start in range(0, len(ticket_ids), 200):
+            db.ticket_metadata.insert_many([row for ticket_id in ticket_ids[start:start + 200]
+                                            for row in legacy_rows(ticket_id)], ordered=False)
+
+        store = TicketMetadataStore(db)
+        migrated = store.migrate()
+        store.legacy_migrated = True
+        print(f"{args.tickets} tickets, {db.ticket_metadata.estimated_document_count()} legacy rows, "
+              f"{migrated} metadata documents\n")
+
+        detail_ids = [random.choice(ticket_ids)]
+        list_ids = random.sample(ticket_ids, LIST_PAGE_SIZE)
+        print(f"{'view':<7} {'layout':<10} {'docs examined':>14} {'json calls':>12} {'median ms':>10}")
+        for view, ids in (('detail', detail_ids), ('list', list_ids)):
+            print(f"{view:<7} {'rows':<10} "
+                  f"{docs_examined(db, 'ticket_metadata', {'ticket_id': {'$in': ids}}):>14} "
+                  f"{json_calls(lambda: legacy_read(db, ids)):>12} "
+                  f"{median_ms(lambda: legacy_read(db, ids), args.runs):>10.2f}")
+            print(f"{view:<7} {'documents':<10} "
+                  f"{docs_examined(db, METADATA_DOCS_COLLECTION, {'_id': {'$in': ids}}):>14} "
+                  f"{json_calls(lambda: documents_read(store, ids)):>12} "
+                  f"{median_ms(lambda: documents_read(store, ids), args.runs):>10.2f}")
+    finally:
+        client.drop_database(args.database)
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
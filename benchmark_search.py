@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Ticket search benchmark
+
+Compares the old unanchored case-insensitive $regex search (newest first)
+with the ranked search tickets now run (ticket_search.ranked_search: prefix
+hits, then text hits sorted by text score) as the number of tickets grows. Synthetic tickets
+are written to a scratch database (dropped afterwards), never to
+support_tickets.
+
+Usage:
+    MONGODB_URI=... python benchmark_search.py [--sizes 1000 10000 50000] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import string
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from ticket_search import (
+    SEARCH_KEYS_FIELD, TICKET_TEXT_INDEX_FIELDS, TICKET_TEXT_INDEX_NAME, TICKET_TEXT_INDEX_WEIGHTS,
+    ranked_search, ticket_search_keys,
+)
+
+WORDS = ['gearbox', 'clutch', 'engine', 'warranty', 'claim', 'turbo', 'leak', 'noise', 'brake', 'battery',
+         'invoice', 'repair', 'garage', 'coolant', 'sensor', 'injector', 'refund', 'inspection', 'oil', 'fault']
+
+PAGE_SIZE = 50
+
+QUERIES = {
+    'ticket id prefix': 'EW12',
+    'registration prefix': 'ab12',
+    'subject word': 'gearbox',
+    'customer name': 'taylor',
+}
+
+
+def legacy_regex_filter(query):
+    """The search filter tickets used before the search index"""
+    return {"$or": [
+        {"ticket_id": {"$regex": query, "$options": "i"}},
+        {"subject": {"$regex": query, "$options": "i"}},
+        {"body": {"$regex": query, "$options": "i"}},
+        {"name": {"$regex": query, "$options": "i"}},
+        {"email": {"$regex": query, "$options": "i"}}
+    ]}
+
+
+def synthetic_ticket(n):
+    letters = string.ascii_uppercase
+    registration = f"{random.choice(letters)}{random.choice(letters)}{random.randint(10, 99)} " \
+                   f"{''.join(random.choices(letters, k=3))}"
+    name = random.choice(['Sam', 'Alex', 'Jo', 'Chris', 'Pat']) + ' ' + \
+        random.choice(['Taylor', 'Smith', 'Jones', 'Brown', 'Patel'])
+    ticket = {
+        'ticket_id': f"{random.choice(['EW', 'EG', 'MW'])}{random.randint(0, 9999):04d}",
+        'subject': ' '.join(random.choices(WORDS, k=5)),
+        'body': ' '.join(random.choices(WORDS, k=80)),
+        'name': name,
+        'email': f"{name.split()[0].lower()}{n}@example.com",
+        'vehicle_registration': registration,
+        'status': 'New',
+        'created_at': datetime.now() - timedelta(minutes=n),
+    }
+    ticket[SEARCH_KEYS_FIELD] = ticket_search_keys(ticket)
+    return ticket
+
+
+def time_query(search, runs):
+    """Median milliseconds to fetch the first page of results"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        search()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def legacy_search(collection, query):
+    return list(collection.find(legacy_regex_filter(query), {'_id': 1}).sort('created_at', -1).limit(PAGE_SIZE))
+
+
+def indexed_search(collection, query):
+    return ranked_search(collection, query, projection={'_id': 1}, limit=PAGE_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--database', default='support_tickets_search_benchmark')
+    args = parser.parse_args()
+
+    connection_string = os.environ.get('MONGODB_URI')
+    if not connection_string:
+        raise SystemExit("MONGODB_URI environment variable is required")
+
+    client = MongoClient(connection_string)
+    db = client[args.database]
+    db.tickets.drop()
+    db.tickets.create_index(TICKET_TEXT_INDEX_FIELDS, name=TICKET_TEXT_INDEX_NAME, weights=TICKET_TEXT_INDEX_WEIGHTS)
+    db.tickets.create_index([(SEARCH_KEYS_FIELD, 1)])
+    db.tickets.create_index([('created_at', -1)])
+
+    try:
+        inserted = 0
+        print(f"{'tickets':>8}  {'query':<20} {'regex ms':>9} {'indexed ms':>11}")
+        for size in sorted(args.sizes):
+            batch = [synthetic_ticket(n) for n in range(inserted, size)]
+            if batch:
+                db.tickets.insert_many(batch, ordered=False)
+            inserted = size
+            for label, query in QUERIES.items():
+                regex_ms = time_query(lambda: legacy_search(db.tickets, query), args.runs)
+                indexed_ms = time_query(lambda: indexed_search(db.tickets, query), args.runs)
+                print(f"{size:>8}  {label:<20} {regex_ms:>9.2f} {indexed_ms:>11.2f}")
+    finally:
+        client.drop_database(args.database)
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
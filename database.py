@@ -17,13 +17,34 @@ Author: AutoAssistGroup Development Team
 """
 
 import os
+import copy
 import pymongo
 import base64
-from pymongo import MongoClient
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from werkzeug.security import generate_password_hash
 import uuid
+import json
 import logging
+import analytics
+from attachment_store import AttachmentStore, LEGACY_FILE_ID_FILTER, attachment_blob_filter
+from metadata_store import TicketMetadataStore, metadata_rows
+from migrations import (
+    ASSIGNMENT_TICKET_INDEX_NAME, METADATA_DOCUMENTS_MIGRATION, SCHEMA_MIGRATIONS_COLLECTION, SCHEMA_VERSION,
+)
+from mongo_connection import connections
+import request_cache
+import live_events
+from throttle import THROTTLE_COLLECTION
+from ttl_cache import APP_CACHE_COLLECTION
+from ticket_changes import TicketChangeFeed
+from ticket_stats import TICKET_STATS_FIELDS, TICKET_STATS_PROJECTION, TicketStats, apply_update
+from ticket_search import (
+    SEARCH_KEYS_FIELD, TICKET_LIST_SORT, TICKET_TEXT_INDEX_FIELDS, TICKET_TEXT_INDEX_NAME, TICKET_TEXT_INDEX_WEIGHTS,
+    ranked_search, ticket_search_filter, ticket_search_keys,
+)
 
 # Reduce PyMongo logging verbosity
 logging.getLogger('pymongo').setLevel(logging.WARNING)
@@ -48,6 +69,236 @@ try:
 except Exception:
     pass
 
+# Metadata keys mirrored onto the ticket document so list views can render
+# technician and registration details without reading ticket_metadata
+TICKET_READ_MODEL_KEYS = ('technician_id', 'technician_name', 'vehicle_registration')
+
+# Ticket fields holding base64 attachment payloads or long generated drafts.
+# Ticket reads leave them out unless the caller asks for include_blobs=True.
+TICKET_BLOB_FIELDS = (
+    'attachments.data',
+    'attachments.content',
+    'attachments.fileData',
+    'attachments.file_data',
+    'draft',
+    'draft_body',
+    'n8n_draft',
+)
+TICKET_SUMMARY_PROJECTION = {field: 0 for field in TICKET_BLOB_FIELDS}
+
+# Generated ticket IDs are exactly 6 characters: a prefix ('E' or 'M' plus a type
+# code, or 'W') followed by a code derived from an atomic per-prefix counter
+TICKET_ID_LENGTH = 6
+# Warranty IDs keep their format of 5 uppercase hex characters; the others use digits
+TICKET_ID_HEX_PREFIXES = ('W',)
+# Odd prime not divisible by 5 (coprime with every power of ten and of sixteen): the
+# counter maps onto a permutation of the codes, so consecutive tickets don't get
+# consecutive numbers, and once the counter wraps the same permutation repeats
+TICKET_ID_STRIDE = 7919
+# Taken codes skipped per allocation (tickets from before the counter, or still open
+# after the code space wrapped) before giving up
+TICKET_ID_MAX_PROBES = 1000
+
+
+def encode_ticket_cursor(ticket):
+    """Opaque 'after' token for the ticket list, pointing just past the given ticket"""
+    created_at = ticket.get('created_at')
+    position = {
+        'u': bool(ticket.get('has_unread_reply', False)),
+        'i': ticket.get('is_important'),
+        'c': created_at.isoformat() if isinstance(created_at, datetime) else None,
+        # Legacy tickets store created_at as a string (analytics.LEGACY_DATE_FORMAT)
+        's': created_at if isinstance(created_at, str) else None,
+        'id': str(ticket.get('_id')),
+    }
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _after_in_descending_order(value):
+    """Condition for flag values that sort after `value` in a descending sort (missing sorts last)"""
+    if value is True:
+        return {"$ne": True}
+    if value is False:
+        return {"$nin": [True, False]}
+    return None
+
+
+def _ticket_cursor_match(after):
+    """Keyset condition selecting the tickets that follow an 'after' token in TICKET_LIST_SORT order"""
+    from bson.objectid import ObjectId
+    padded = after + '=' * (-len(after) % 4)
+    position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    ticket_id = position['id']
+    if ObjectId.is_valid(ticket_id):
+        ticket_id = ObjectId(ticket_id)
+    created_at = datetime.fromisoformat(position['c']) if position.get('c') else position.get('s')
+
+    clauses = []
+    equal = {}
+    for field, value in (("has_unread_reply", position.get('u')), ("is_important", position.get('i'))):
+        after_value = _after_in_descending_order(value)
+        if after_value is not None:
+            clauses.append({**equal, field: after_value})
+        equal[field] = value
+    # Descending created_at puts dates first, then legacy string dates, then missing values;
+    # $lt only compares within one type, so each later type needs its own clause
+    if created_at is not None:
+        clauses.append({**equal, "created_at": {"$lt": created_at}})
+        if isinstance(created_at, datetime):
+            clauses.append({**equal, "created_at": {"$type": "string"}})
+        clauses.append({**equal, "created_at": None})
+    equal["created_at"] = created_at
+    clauses.append({**equal, "_id": {"$lt": ticket_id}})
+    return {"$or": clauses}
+
+
+def ticket_projection(include_blobs=False):
+    """Projection for ticket reads: the summary projection unless blobs are requested"""
+    return None if include_blobs else dict(TICKET_SUMMARY_PROJECTION)
+
+
+def _metadata_value_is_warranty(value):
+    """Return True if a metadata value describes a warranty attachment"""
+    if isinstance(value, str):
+        clean_json = value.strip()
+        if not clean_json.startswith('{'):
+            return False
+        # Same trailing comma repair the dashboards used to apply on every render
+        if clean_json.endswith(',}'):
+            clean_json = clean_json[:-2] + '}'
+        try:
+            value = json.loads(clean_json)
+        except ValueError:
+            return False
+    return isinstance(value, dict) and bool(value.get('is_warranty', False))
+
+
+class AssignmentConflictError(Exception):
+    """The ticket's assignment changed after the caller read it"""
+    pass
+
+
+# Reference data namespaces held by ReferenceCache
+MEMBERS_CACHE = 'members'
+TECHNICIANS_CACHE = 'technicians'
+ROLES_CACHE = 'roles'
+TICKET_STATUSES_CACHE = 'ticket_statuses'
+REFERENCE_CACHE_NAMESPACES = (MEMBERS_CACHE, TECHNICIANS_CACHE, ROLES_CACHE, TICKET_STATUSES_CACHE)
+# One {_id: namespace, generation: n} document per namespace, bumped on every write
+REFERENCE_CACHE_GENERATIONS_COLLECTION = 'reference_cache_generations'
+
+
+class ReferenceCache:
+    """Process-wide TTL cache for members, technicians, roles and ticket statuses
+
+    These collections change a few times a week but are read on nearly every page. Entries
+    expire after `ttl` seconds and at most `max_entries` are kept (least recently used go
+    first). Write paths call invalidate(), which drops the namespace here and bumps its
+    generation in MongoDB; other gunicorn workers compare generations at most every
+    `sync_seconds` and drop namespaces that changed elsewhere. Callers get deep copies, so
+    converting ObjectIds to strings for JSON does not alter the cached documents.
+    """
+
+    def __init__(self, generations, ttl=None, sync_seconds=None, max_entries=2048):
+        self.generations = generations
+        self.ttl = ttl if ttl is not None else float(os.environ.get('REFERENCE_CACHE_TTL', 300))
+        self.sync_seconds = sync_seconds if sync_seconds is not None else float(os.environ.get('REFERENCE_CACHE_SYNC_SECONDS', 2))
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (namespace, key) -> (expires_at, value)
+        self._generations = {}  # namespace -> last generation seen in MongoDB
+        self._epochs = {}  # namespace -> local count of invalidations, guards loads racing a write
+        self._synced_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    def get(self, namespace, key, loader):
+        """Cached value for (namespace, key), calling loader() on a miss; loader errors are not cached"""
+        self._sync()
+        cache_key = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+            epoch = self._epochs.get(namespace, 0)
+        value = loader()
+        if value is not None:
+            with self._lock:
+                # Do not cache a value read before a write that landed while it was loading
+                if self._epochs.get(namespace, 0) == epoch:
+                    self._entries[cache_key] = (time.monotonic() + self.ttl, value)
+                    self._entries.move_to_end(cache_key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return copy.deepcopy(value)
+
+    def _drop(self, namespace):
+        """Forget every entry of a namespace (caller holds the lock)"""
+        for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == namespace]:
+            del self._entries[cache_key]
+        self._epochs[namespace] = self._epochs.get(namespace, 0) + 1
+
+    def invalidate(self, *namespaces):
+        """Drop namespaces here and signal the other workers to drop them too"""
+        for namespace in namespaces:
+            with self._lock:
+                self._drop(namespace)
+                self.invalidations += 1
+            try:
+                signal = self.generations.find_one_and_update(
+                    {"_id": namespace},
+                    {"$inc": {"generation": 1}, "$set": {"updated_at": datetime.now()}},
+                    upsert=True,
+                    return_document=pymongo.ReturnDocument.AFTER
+                )
+                with self._lock:
+                    self._generations[namespace] = signal["generation"]
+            except Exception as e:
+                # Other workers fall back to the TTL for this change
+                logging.warning(f"[DATABASE] Failed to signal {namespace} cache invalidation: {e}")
+
+    def _sync(self):
+        """Drop namespaces whose generation another worker has bumped (at most every sync_seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._synced_at < self.sync_seconds:
+                return
+            self._synced_at = now
+        try:
+            generations = {doc["_id"]: doc.get("generation", 0) for doc in self.generations.find({}, {"generation": 1})}
+        except Exception as e:
+            logging.warning(f"[DATABASE] Failed to read reference cache generations: {e}")
+            return
+        with self._lock:
+            for namespace in REFERENCE_CACHE_NAMESPACES:
+                generation = generations.get(namespace, 0)
+                if self._generations.get(namespace, 0) != generation:
+                    self._drop(namespace)
+                    self._generations[namespace] = generation
+                    self.remote_invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'sync_seconds': self.sync_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'invalidations': self.invalidations,
+                'remote_invalidations': self.remote_invalidations,
+                'generations': dict(self._generations),
+            }
+
+
 class MongoDB:
     def __init__(self):
         # MongoDB connection with optimized serverless configuration
@@ -56,28 +307,10 @@ class MongoDB:
         if not self.connection_string:
             raise ValueError("MONGODB_URI environment variable is required")
         
-        # Serverless-optimized connection settings
-        try:
-            self.client = MongoClient(
-                self.connection_string,
-                # Serverless optimizations
-                maxPoolSize=10,  # Smaller pool for serverless
-                minPoolSize=1,   # Minimal idle connections
-                maxIdleTimeMS=30000,  # 30 seconds idle time
-                serverSelectionTimeoutMS=5000,  # Faster timeout
-                connectTimeoutMS=10000,  # Faster connection timeout
-                socketTimeoutMS=20000,   # Shorter socket timeout
-                heartbeatFrequencyMS=60000,  # Less frequent heartbeats
-                retryWrites=True,
-                retryReads=True,
-                w='majority',
-                readPreference='primaryPreferred',
-                # Critical for serverless: don't maintain connections
-                maxConnecting=2
-            )
+        try:
+            # Fork-safe, per-process client sized for this worker's request threads (see mongo_connection)
+            self.client = connections.client(self.connection_string)
             
-            # Test the connection immediately
-            self.client.admin.command('ping')
             self.db = self.client.support_tickets
             
             # Collections
@@ -91,18 +324,39 @@ class MongoDB:
             self.roles = self.db.roles  # Role management collection
             self.common_documents = self.db.common_documents  # Common documents collection
             self.common_document_metadata = self.db.common_document_metadata  # 🚀 NEW: Common document metadata collection
+            self.attachment_store = AttachmentStore(self.db)  # GridFS bucket holding attachment bytes
+            self.ticket_id_counters = self.db.ticket_id_counters  # Atomic ticket ID sequences per prefix
+            self.ticket_stats = TicketStats(self.db)  # Materialized dashboard counters
+            self.ticket_changes = TicketChangeFeed(self.db)  # Tickets changed since a cursor (updated_at + tombstones)
+            self.ticket_metadata_store = TicketMetadataStore(self.db)  # One metadata document per ticket
+            self.reference_cache = ReferenceCache(self.db[REFERENCE_CACHE_GENERATIONS_COLLECTION])  # Members, technicians, roles, statuses
             
-            # Initialize database with indexes and admin user
-            self.init_database()
+            # Indexes and seed data are provisioned by `python migrate.py`, not on every worker start;
+            # this one indexed read also tests the connection
+            self.schema_version = self.check_schema_version()
+            self.ticket_metadata_store.legacy_migrated = self.schema_version >= METADATA_DOCUMENTS_MIGRATION
             
         except Exception as e:
             logging.error(f"Database connection failed: {e}")
             raise
     
+    def check_schema_version(self):
+        """Highest applied migration version; warns when the database needs `python migrate.py`"""
+        latest = self.db[SCHEMA_MIGRATIONS_COLLECTION].find_one(
+            {"_id": {"$type": "number"}}, {"_id": 1}, sort=[("_id", -1)]
+        )
+        version = latest["_id"] if latest else 0
+        if version < SCHEMA_VERSION:
+            logging.warning(
+                f"[DATABASE] Schema version {version} is behind {SCHEMA_VERSION}; "
+                f"run 'python migrate.py' to create indexes, seed data and apply migrations"
+            )
+        return version
+    
     def init_database(self):
-        """Initialize database with indexes and default admin user"""
+        """Create indexes and seed the default users, technicians, statuses and roles (run by migrate.py)"""
         try:
-            # Create indexes for better performance (with background=False for faster startup)
+            # Create indexes for better performance
             try:
                 self.tickets.create_index("ticket_id", unique=True, background=False)
             except pymongo.errors.DuplicateKeyError:
@@ -140,6 +394,11 @@ class MongoDB:
             self.tickets.create_index([("status", 1), ("priority", 1)], background=False)
             self.replies.create_index([("ticket_id", 1), ("created_at", 1)], background=False)
             self.ticket_assignments.create_index([("ticket_id", 1), ("member_id", 1)], background=False)
+            try:
+                # One assignment per ticket; assign_ticket relies on it to reject racing inserts
+                self.ticket_assignments.create_index("ticket_id", unique=True, name=ASSIGNMENT_TICKET_INDEX_NAME, background=False)
+            except pymongo.errors.OperationFailure as e:
+                logging.warning(f"Could not create unique ticket assignment index (duplicates are removed by a migration): {e}")
             self.ticket_metadata.create_index([("ticket_id", 1), ("key", 1)], background=False)
             
             # Enhanced indexes for warranty detection and attachment support
@@ -150,6 +409,35 @@ class MongoDB:
             self.tickets.create_index([("processing_method", 1)], background=False)
             self.tickets.create_index([("has_warranty", 1), ("created_at", -1)], background=False)
             self.tickets.create_index([("has_attachments", 1), ("status", 1)], background=False)
+
+            # Main ticket list: sort (and keyset pagination) served from the index, with or without a status filter
+            self.tickets.create_index(list(TICKET_LIST_SORT.items()), background=False)
+            self.tickets.create_index([("status", 1)] + list(TICKET_LIST_SORT.items()), background=False)
+            
+            # Dashboard counters: date-range reads over the daily rollups
+            self.ticket_stats.collection.create_index([("day", 1)], background=False)
+            
+            # Incremental dashboard updates: updated_at range scans and expiring delete tombstones
+            self.ticket_changes.create_indexes()
+            
+            # Search: weighted text index plus prefix keys for ticket IDs and registrations (see ticket_search)
+            try:
+                self.tickets.create_index(
+                    TICKET_TEXT_INDEX_FIELDS,
+                    name=TICKET_TEXT_INDEX_NAME,
+                    weights=TICKET_TEXT_INDEX_WEIGHTS,
+                    default_language="english",
+                    background=False
+                )
+                self.tickets.create_index([(SEARCH_KEYS_FIELD, 1)], background=False)
+            except pymongo.errors.OperationFailure as e:
+                # A collection can only have one text index
+                logging.warning(f"Could not create ticket search indexes: {e}")
+            
+            # Shared app cache entries (ttl_cache.MongoCacheBackend) expire on their own
+            self.db[APP_CACHE_COLLECTION].create_index("expires_at", expireAfterSeconds=0, background=False)
+            # Rate limit windows and duplicate-submission claims (throttle.MongoThrottleBackend)
+            self.db[THROTTLE_COLLECTION].create_index("expires_at", expireAfterSeconds=0, background=False)
             
             # Create admin user if it doesn't exist
             admin_exists = self.members.find_one({"user_id": "admin001"})
@@ -213,20 +501,34 @@ class MongoDB:
             
             # Initialize default roles
             self.initialize_default_roles()
+            
+            # Seed data may have changed reference collections under running workers
+            self.reference_cache.invalidate(*REFERENCE_CACHE_NAMESPACES)
+            return True
                 
         except pymongo.errors.DuplicateKeyError:
             # Index already exists, ignore
-            pass
+            return True
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Database operation failed during initialization: {e}")
+            return False
         except Exception as e:
             logging.error(f"Database initialization error: {e}")
+            return False
     
     def migrate_has_unread_reply_field(self):
         """Migrate existing tickets to ensure they all have the has_unread_reply field"""
         try:
             logging.info("[DATABASE] Starting migration of has_unread_reply field for existing tickets...")
-            
+
+            # The ticket list sorts on is_important before its lookups; missing values would sort last
+            important_result = self.tickets.update_many(
+                {"is_important": {"$exists": False}},
+                {"$set": {"is_important": False}}
+            )
+            if important_result.modified_count:
+                logging.info(f"[DATABASE] Defaulted is_important=False on {important_result.modified_count} tickets")
+
             # Find all tickets that don't have the has_unread_reply field
             tickets_missing_field = list(self.tickets.find(
                 {"has_unread_reply": {"$exists": False}},
@@ -260,8 +562,11 @@ class MongoDB:
             logging.error(f"[DATABASE] Error during has_unread_reply migration: {e}")
             return False
 
-    def get_tickets_with_assignments(self, page=1, per_page=20, status_filter=None, priority_filter=None, search_query=None):
-        """Get tickets with assignment information and technician data - PAGINATED VERSION"""
+    def get_tickets_with_assignments(self, page=1, per_page=20, status_filter=None, priority_filter=None, search_query=None, after=None):
+        """Get tickets with assignment information and technician data - PAGINATED VERSION
+
+        Pass an 'after' token from encode_ticket_cursor() for keyset pagination; page is then ignored.
+        """
         try:
             # Build match stage for filtering
             match_stage = {}
@@ -270,12 +575,15 @@ class MongoDB:
             if priority_filter and priority_filter != 'All':
                 match_stage["priority"] = priority_filter
             if search_query:
-                match_stage["$or"] = [
-                    {"ticket_id": {"$regex": search_query, "$options": "i"}},
-                    {"subject": {"$regex": search_query, "$options": "i"}},
-                    {"name": {"$regex": search_query, "$options": "i"}},
-                    {"email": {"$regex": search_query, "$options": "i"}}
-                ]
+                match_stage.update(ticket_search_filter(search_query))
+            
+            if after:
+                try:
+                    cursor_match = _ticket_cursor_match(after)
+                    match_stage = {"$and": [match_stage, cursor_match]} if match_stage else cursor_match
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.warning(f"[DATABASE] Ignoring invalid ticket list cursor {after!r}: {e}")
+                    after = None
             
             pipeline = []
             
@@ -283,6 +591,16 @@ class MongoDB:
             if match_stage:
                 pipeline.append({"$match": match_stage})
             
+            # Sort and cut the page before the lookups so only one page of tickets is joined.
+            # has_unread_reply first for proper alert priority; _id makes the order total.
+            pipeline.append({"$sort": TICKET_LIST_SORT})
+            if not after:
+                pipeline.append({"$skip": (page - 1) * per_page})
+            pipeline.append({"$limit": per_page})
+            
+            # Never carry attachment payloads through the lookups
+            pipeline.append({"$project": ticket_projection()})
+            
             # Add the existing lookup stages
             pipeline.extend([
                 # First lookup: Get assignment data
@@ -319,15 +637,6 @@ class MongoDB:
                         "as": "forwarded_from_member"
                     }
                 },
-                # Fourth lookup: Get technician metadata
-                {
-                    "$lookup": {
-                        "from": "ticket_metadata",
-                        "localField": "ticket_id",
-                        "foreignField": "ticket_id",
-                        "as": "technician_metadata"
-                    }
-                },
                 # CRITICAL FIX: Ensure has_unread_reply field is preserved and has default value
                 {
                     "$addFields": {
@@ -340,30 +649,16 @@ class MongoDB:
                         }
                     }
                 },
-                # Remove temporary fields
+                # Remove temporary fields ($lookup keeps the sorted order, no re-sort needed)
                 {
                     "$project": {
                         "assignment_member_id": 0,
-                        "assignment_forwarded_from": 0,
-                        "technician_metadata": 0
+                        "assignment_forwarded_from": 0
                     }
-                },
-                # Sort results - has_unread_reply first for proper alert priority
-                {
-                    "$sort": {"has_unread_reply": -1, "is_important": -1, "created_at": -1}
                 }
             ])
             
-            # Calculate pagination
-            skip = (page - 1) * per_page
-            
-            # Add pagination stages
-            pipeline.extend([
-                {"$skip": skip},
-                {"$limit": per_page}
-            ])
-            
-            logging.info(f"[DATABASE] Running PAGINATED tickets aggregation: page={page}, per_page={per_page}")
+            logging.info(f"[DATABASE] Running PAGINATED tickets aggregation: page={page}, per_page={per_page}, keyset={bool(after)}")
             result = list(self.tickets.aggregate(pipeline, allowDiskUse=True))
             logging.info(f"[DATABASE] Paginated aggregation returned {len(result)} tickets")
             
@@ -396,27 +691,9 @@ class MongoDB:
             
             logging.info(f"[DATABASE] Found {assigned_count} tickets with assignments in first 5 results")
             
-            # Now add technician information to each ticket
-            logging.info("[DATABASE] Adding technician information to tickets...")
-            for ticket in result:
-                ticket_id = ticket.get('ticket_id')
-                if ticket_id:
-                    # Get technician metadata for this ticket
-                    try:
-                        tech_metadata = list(self.ticket_metadata.find({"ticket_id": ticket_id}))
-                        if tech_metadata:
-                            for meta in tech_metadata:
-                                if meta.get('key') == 'technician_id':
-                                    ticket['technician_id'] = meta.get('value')
-                                elif meta.get('key') == 'technician_name':
-                                    ticket['technician_name'] = meta.get('value')
-                    except Exception as e:
-                        logging.warning(f"[DATABASE] Error getting technician metadata for ticket {ticket_id}: {e}")
-                        continue
-            
-            # Count tickets with technicians
+            # Technician fields are denormalized onto the ticket document (see _sync_ticket_read_model)
             technician_count = sum(1 for ticket in result if ticket.get('technician_name'))
-            logging.info(f"[DATABASE] Added technician information: {technician_count} tickets now have technicians")
+            logging.info(f"[DATABASE] {technician_count} tickets have technicians")
             
             # FINAL VALIDATION: Log summary of has_unread_reply field status
             final_unread_count = sum(1 for ticket in result if ticket.get('has_unread_reply'))
@@ -441,12 +718,7 @@ class MongoDB:
             if priority_filter and priority_filter != 'All':
                 match_stage["priority"] = priority_filter
             if search_query:
-                match_stage["$or"] = [
-                    {"ticket_id": {"$regex": search_query, "$options": "i"}},
-                    {"subject": {"$regex": search_query, "$options": "i"}},
-                    {"name": {"$regex": search_query, "$options": "i"}},
-                    {"email": {"$regex": search_query, "$options": "i"}}
-                ]
+                match_stage.update(ticket_search_filter(search_query))
             
             # Count documents with the same filters
             count = self.tickets.count_documents(match_stage)
@@ -471,11 +743,40 @@ class MongoDB:
             # Don't assume ID exists on database errors - raise exception to handle properly  
             raise Exception(f"Database error while checking ticket ID: {e}")
 
-    def get_ticket_by_id(self, ticket_id):
-        """Get ticket by ticket_id with assignment info"""
+    def allocate_ticket_id(self, prefix):
+        """Allocate a free 6-character ticket ID for prefix from an atomic per-prefix counter"""
+        width = TICKET_ID_LENGTH - len(prefix)
+        hex_code = prefix in TICKET_ID_HEX_PREFIXES
+        capacity = (16 if hex_code else 10) ** width
+        for _ in range(TICKET_ID_MAX_PROBES):
+            counter = self.ticket_id_counters.find_one_and_update(
+                {"_id": prefix},
+                {"$inc": {"seq": 1}},
+                upsert=True,
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+            code = (counter["seq"] * TICKET_ID_STRIDE) % capacity
+            ticket_id = f"{prefix}{code:0{width}X}" if hex_code else f"{prefix}{code:0{width}d}"
+            # Skip IDs still in use; one inserted after this check fails the caller's insert on the
+            # unique ticket_id index (ValueError "Ticket ID already exists") and the caller retries
+            if not self.ticket_id_exists(ticket_id):
+                return ticket_id
+        raise ValueError(f"No free ticket ID for prefix {prefix} after {TICKET_ID_MAX_PROBES} attempts")
+
+    def get_ticket_by_id(self, ticket_id, include_blobs=False, hydrate_blobs=True):
+        """Get ticket by ticket_id with assignment info (attachment payloads only if include_blobs)"""
+        return request_cache.get_or_load(
+            request_cache.TICKET, (ticket_id, include_blobs, hydrate_blobs),
+            lambda: self._load_ticket_by_id(ticket_id, include_blobs, hydrate_blobs)
+        )
+    
+    def _load_ticket_by_id(self, ticket_id, include_blobs, hydrate_blobs):
+        """get_ticket_by_id without the request identity map"""
         try:
-            pipeline = [
-                {"$match": {"ticket_id": ticket_id}},
+            pipeline = [{"$match": {"ticket_id": ticket_id}}]
+            if not include_blobs:
+                pipeline.append({"$project": ticket_projection()})
+            pipeline += [
                 {
                     "$lookup": {
                         "from": "ticket_assignments",
@@ -502,7 +803,13 @@ class MongoDB:
                 }
             ]
             result = list(self.tickets.aggregate(pipeline))
-            return result[0] if result else None
+            if not result:
+                return None
+            ticket = result[0]
+            # Load GridFS payloads back as base64 unless the caller streams them itself
+            if include_blobs and hydrate_blobs:
+                self.attachment_store.hydrate_attachments(ticket.get('attachments'))
+            return ticket
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to get ticket {ticket_id}: {e}")
             return None
@@ -518,8 +825,17 @@ class MongoDB:
             ticket_data.setdefault('status', 'Open')
             ticket_data.setdefault('is_important', False)
             ticket_data.setdefault('has_unread_reply', False)
-            
-            result = self.tickets.insert_one(ticket_data)
+            ticket_data[SEARCH_KEYS_FIELD] = ticket_search_keys(ticket_data)
+            
+            # Attachment bytes go to GridFS; the caller's dict keeps its base64 data
+            stored_ticket = self._with_offloaded_attachments(ticket_data)
+            result = self.tickets.insert_one(stored_ticket)
+            ticket_data['_id'] = result.inserted_id
+            request_cache.forget(request_cache.TICKET, ticket_data.get('ticket_id'))
+            live_events.record(live_events.TICKET_CREATED, {
+                key: ticket_data.get(key) for key in ('ticket_id', 'subject', 'name', 'status', 'priority')
+            })
+            self.ticket_stats.record_created(ticket_data)
             return result.inserted_id
         except pymongo.errors.DuplicateKeyError as e:
             # Check which field caused the duplicate key error
@@ -543,11 +859,29 @@ class MongoDB:
     def update_ticket(self, ticket_id, update_data):
         """Update ticket by ticket_id"""
         try:
+            request_cache.forget(request_cache.TICKET, ticket_id)
             update_data['updated_at'] = datetime.now()
-            result = self.tickets.update_one(
-                {"ticket_id": ticket_id},
-                {"$set": update_data}
-            )
+            if 'vehicle_registration' in update_data:
+                update_data[SEARCH_KEYS_FIELD] = ticket_search_keys({**update_data, 'ticket_id': ticket_id})
+            replaced = None
+            if isinstance(update_data.get('attachments'), list):
+                # Attachment bytes go to GridFS, as in create_ticket; the attachments being replaced are released below
+                replaced = self.tickets.find_one({"ticket_id": ticket_id}, {"attachments.gridfs_id": 1})
+                kept = {att.get('gridfs_id') for att in update_data['attachments'] if isinstance(att, dict)}
+                update_data = self._with_offloaded_attachments(update_data)
+            if any(field in update_data for field in TICKET_STATS_FIELDS):
+                result = self._update_ticket_counted(ticket_id, {"$set": update_data})
+            else:
+                result = self.tickets.update_one(
+                    {"ticket_id": ticket_id},
+                    {"$set": update_data}
+                )
+                self._record_ticket_changes(ticket_id, update_data)
+            if replaced and result.matched_count:
+                self.attachment_store.release_attachments([
+                    att for att in replaced.get('attachments') or []
+                    if isinstance(att, dict) and att.get('gridfs_id') not in kept
+                ])
             return result
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to update ticket {ticket_id}: {e}")
@@ -556,11 +890,46 @@ class MongoDB:
             logging.error(f"Unexpected error updating ticket {ticket_id}: {e}")
             raise
     
+    def _update_ticket_counted(self, ticket_id, update):
+        """update_one on a ticket that also moves its dashboard counters (see ticket_stats)"""
+        request_cache.forget(request_cache.TICKET, ticket_id)
+        # Every change is stamped so the change feed (ticket_changes) picks it up
+        update = {**update, "$set": {"updated_at": datetime.now(), **update.get("$set", {})}}
+        for _ in range(3):
+            before = self.tickets.find_one({"ticket_id": ticket_id}, TICKET_STATS_PROJECTION)
+            if before is None:
+                break
+            # Only apply the update if the counted fields are unchanged since the read
+            guard = {field: before.get(field) for field in TICKET_STATS_FIELDS}
+            result = self.tickets.update_one({"ticket_id": ticket_id, **guard}, update)
+            if result.matched_count:
+                self.ticket_stats.record_change(before, apply_update(before, update))
+                self._record_ticket_changes(ticket_id, update.get("$set", {}))
+                return result
+        # Not found, or lost the race repeatedly: update uncounted and leave it to the reconcile
+        result = self.tickets.update_one({"ticket_id": ticket_id}, update)
+        self._record_ticket_changes(ticket_id, update.get("$set", {}))
+        return result
+    
+    def _record_ticket_changes(self, ticket_id, fields):
+        """Live events for unread-flag and status writes (used when no change stream delivers them)"""
+        if 'has_unread_reply' in fields:
+            live_events.record(live_events.UNREAD_CHANGED, {
+                'ticket_id': ticket_id, 'has_unread_reply': bool(fields['has_unread_reply'])
+            })
+        if 'status' in fields:
+            live_events.record(live_events.STATUS_CHANGED, {'ticket_id': ticket_id, 'status': fields['status']})
+    
     def create_reply(self, reply_data):
         """Create a new reply"""
         try:
             reply_data['created_at'] = datetime.now()
-            result = self.replies.insert_one(reply_data)
+            stored_reply = self._with_offloaded_attachments(reply_data)
+            result = self.replies.insert_one(stored_reply)
+            reply_data['_id'] = result.inserted_id
+            live_events.record(live_events.REPLY_CREATED, {
+                'ticket_id': reply_data.get('ticket_id'), 'sender': reply_data.get('sender')
+            })
             return result.inserted_id
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to create reply: {e}")
@@ -569,6 +938,88 @@ class MongoDB:
             logging.error(f"Unexpected error creating reply: {e}")
             raise
     
+    def _with_offloaded_attachments(self, record):
+        """Copy of a ticket or reply with embedded attachment payloads moved to GridFS"""
+        if not record.get('attachments'):
+            return record
+        attachments, moved = self.attachment_store.offload_attachments(record['attachments'])
+        if not moved:
+            return record
+        stored = dict(record)
+        stored['attachments'] = attachments
+        return stored
+    
+    def set_reply_attachments(self, reply_id, attachments):
+        """Set the attachments of a reply created without any, with embedded payloads moved to GridFS"""
+        stored, _ = self.attachment_store.offload_attachments(attachments)
+        return self.replies.update_one({'_id': reply_id}, {'$set': {'attachments': stored}})
+    
+    def store_reply_attachment(self, reply_id, index, raw, filename, match=None):
+        """Put the bytes of one reply attachment in GridFS and point the attachment at them instead of inline data"""
+        file_id = self.attachment_store.put(raw, filename)
+        prefix = f'attachments.{index}'
+        result = self.replies.update_one(
+            {'_id': reply_id, **(match or {})},
+            {
+                '$set': {f'{prefix}.gridfs_id': file_id, f'{prefix}.blob_field': 'data',
+                         f'{prefix}.has_data': True, f'{prefix}.size': len(raw)},
+                '$unset': {f'{prefix}.data': ''}
+            }
+        )
+        if result.matched_count == 0:
+            self.attachment_store.release(file_id)
+        return result
+    
+    def delete_replies(self, query):
+        """Delete replies matching query and release the stored attachment files they reference"""
+        for reply in self.replies.find(dict(query, **{'attachments.gridfs_id': {'$exists': True}}), {'attachments': 1}):
+            self.attachment_store.release_attachments(reply.get('attachments'))
+        return self.replies.delete_many(query)
+    
+    def get_reply_states(self, ticket_ids, since=None, until=None):
+        """Reply count, last reply time, replies in (since, until] and unread flag per existing ticket, in one aggregation"""
+        try:
+            # Without a since-cursor no reply counts as new
+            new_reply = False
+            if since:
+                new_reply = [{"$gt": ["$created_at", since]}]
+                if until:
+                    new_reply.append({"$lte": ["$created_at", until]})
+                new_reply = {"$and": new_reply}
+            pipeline = [
+                {"$match": {"ticket_id": {"$in": list(ticket_ids)}}},
+                {"$project": {"_id": 0, "ticket_id": 1, "has_unread_reply": 1}},
+                # Each ticket's replies are read from the (ticket_id, created_at) index
+                {"$lookup": {
+                    "from": "replies",
+                    "localField": "ticket_id",
+                    "foreignField": "ticket_id",
+                    "pipeline": [
+                        {"$project": {"_id": 0, "created_at": 1}},
+                        {"$group": {
+                            "_id": None,
+                            "count": {"$sum": 1},
+                            "last_reply_at": {"$max": "$created_at"},
+                            "new": {"$sum": {"$cond": [new_reply, 1, 0]}}
+                        }}
+                    ],
+                    "as": "replies"
+                }}
+            ]
+            states = {}
+            for ticket in self.tickets.aggregate(pipeline):
+                replies = ticket["replies"][0] if ticket["replies"] else {}
+                states[ticket["ticket_id"]] = {
+                    "reply_count": replies.get("count", 0),
+                    "last_reply_at": replies.get("last_reply_at"),
+                    "new_replies": replies.get("new", 0),
+                    "has_unread_reply": bool(ticket.get("has_unread_reply", False)),
+                }
+            return states
+        except pymongo.errors.OperationFailure as e:
+            logging.error(f"Failed to get reply states for {len(ticket_ids)} tickets: {e}")
+            raise
+
     def get_replies_by_ticket(self, ticket_id):
         """Get all replies for a ticket"""
         try:
@@ -595,11 +1046,17 @@ class MongoDB:
     
     def get_member_by_id(self, member_id):
         """Get member by _id"""
+        return request_cache.get_or_load(request_cache.MEMBER, str(member_id), lambda: self._load_member_by_id(member_id))
+    
+    def _load_member_by_id(self, member_id):
+        """get_member_by_id without the request identity map"""
         try:
             from bson.objectid import ObjectId
             if not ObjectId.is_valid(member_id):
                 return None
-            return self.members.find_one({"_id": ObjectId(member_id)})
+            return self.reference_cache.get(
+                MEMBERS_CACHE, str(member_id), lambda: self.members.find_one({"_id": ObjectId(member_id)})
+            )
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to get member by id {member_id}: {e}")
             return None
@@ -610,7 +1067,7 @@ class MongoDB:
     def get_all_members(self):
         """Get all members"""
         try:
-            return list(self.members.find().sort("name", 1))
+            return self.reference_cache.get(MEMBERS_CACHE, 'all', lambda: list(self.members.find().sort("name", 1)))
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to get all members: {e}")
             return []
@@ -623,6 +1080,7 @@ class MongoDB:
         try:
             member_data['created_at'] = datetime.now()
             result = self.members.insert_one(member_data)
+            self.invalidate_members(result.inserted_id)
             return result.inserted_id
         except pymongo.errors.DuplicateKeyError as e:
             logging.error(f"Duplicate user_id: {e}")
@@ -634,86 +1092,134 @@ class MongoDB:
             logging.error(f"Unexpected error creating member: {e}")
             raise
     
-    def assign_ticket(self, assignment_data):
-        """Assign ticket to member with FIXED comprehensive error handling and persistence"""
+    def invalidate_members(self, member_id=None):
+        """Call after writing to the members collection: drops cached members in every worker"""
+        if member_id is not None:
+            request_cache.forget(request_cache.MEMBER, str(member_id))
+        else:
+            request_cache.forget(request_cache.MEMBER)
+        self.reference_cache.invalidate(MEMBERS_CACHE)
+    
+    def get_assignment_context(self, ticket_id, member_ids):
+        """Ticket, its current assignment and the given members in one round trip; None if the ticket does not exist"""
         try:
-            # Ensure required fields are set
-            if 'assigned_at' not in assignment_data:
-                assignment_data['assigned_at'] = datetime.now()
-            
-            # Validate required fields
-            if not assignment_data.get('ticket_id'):
-                raise ValueError("ticket_id is required")
-            if not assignment_data.get('member_id'):
-                raise ValueError("member_id is required")
-            
-            # Log the assignment attempt with detailed info
-            ticket_id = assignment_data.get('ticket_id')
-            member_id = assignment_data.get('member_id')
-            logging.info(f"[TARGET] CREATING ASSIGNMENT: Ticket {ticket_id} -> Member {member_id} (type: {type(member_id).__name__})")
-            logging.info(f"[INFO] Assignment Data: ticket_id={ticket_id}, member_id={member_id}, is_forwarded={assignment_data.get('is_forwarded', False)}")
-            
-            # Check for existing assignment and remove it first (ATOMIC OPERATION)
-            existing = self.ticket_assignments.find_one({"ticket_id": ticket_id})
-            if existing:
-                logging.info(f"[CLEANUP] REMOVING EXISTING ASSIGNMENT for ticket {ticket_id}")
-                self.ticket_assignments.delete_one({"ticket_id": ticket_id})
-            
-            # Ensure default visibility flags
-            try:
-                if assignment_data.get('is_forwarded'):
-                    # Forwarded assignments start as unseen by assignee
-                    assignment_data.setdefault('is_seen', False)
-                    assignment_data.setdefault('seen_at', None)
-                else:
-                    # Takeover assignments are considered seen immediately
-                    assignment_data.setdefault('is_seen', True)
-                    assignment_data.setdefault('seen_at', datetime.now())
-            except Exception:
-                # If anything goes wrong, do not block the assignment flow
-                pass
+            from bson.objectid import ObjectId
+            object_ids = list({ObjectId(str(member_id)) for member_id in member_ids
+                               if member_id and ObjectId.is_valid(str(member_id))})
+            pipeline = [
+                {"$match": {"ticket_id": ticket_id}},
+                {"$limit": 1},
+                {"$project": ticket_projection()},
+                {"$lookup": {
+                    "from": "ticket_assignments",
+                    "localField": "ticket_id",
+                    "foreignField": "ticket_id",
+                    "as": "_assignments"
+                }},
+                {"$lookup": {
+                    "from": "members",
+                    "pipeline": [
+                        {"$match": {"_id": {"$in": object_ids}}},
+                        {"$project": {"password_hash": 0}}
+                    ],
+                    "as": "_members"
+                }}
+            ]
+            result = list(self.tickets.aggregate(pipeline))
+            if not result:
+                return None
+            ticket = result[0]
+            assignments = ticket.pop("_assignments")
+            members = ticket.pop("_members")
+            # Tickets assigned before the unique index may still have several; the latest one wins
+            assignment = max(assignments, key=lambda a: (a.get("assigned_at") or datetime.min, a["_id"]), default=None)
+            return {
+                "ticket": ticket,
+                "assignment": assignment,
+                "members": {str(member["_id"]): member for member in members}
+            }
+        except pymongo.errors.OperationFailure as e:
+            logging.error(f"Failed to load assignment context for ticket {ticket_id}: {e}")
+            raise
+    
+    def assign_ticket(self, assignment_data, expected_version=None):
+        """Create or replace a ticket's assignment in one round trip; returns the stored assignment
 
-            # Insert the new assignment
-            result = self.ticket_assignments.insert_one(assignment_data)
-            
-            # Verify insertion immediately
-            if not result.inserted_id:
-                raise Exception("Assignment insertion failed - no ID returned")
-                
-            # Double-check the assignment was saved correctly
-            verification = self.ticket_assignments.find_one({"_id": result.inserted_id})
-            if not verification:
-                raise Exception("Assignment verification failed - record not found after insert")
-            
-            logging.info(f"[SUCCESS] ASSIGNMENT CREATED & VERIFIED: ID {result.inserted_id}")
-            logging.info(f"[DEBUG] VERIFICATION DATA: {verification}")
-            
-            return result.inserted_id
-                
-        except pymongo.errors.DuplicateKeyError as e:
-            logging.error(f"[ERROR] DUPLICATE ASSIGNMENT ERROR: {e}")
-            # Try to handle duplicate by updating instead of creating
-            try:
-                logging.info(f"[RETRY] ATTEMPTING UPDATE INSTEAD OF INSERT")
-                update_result = self.ticket_assignments.update_one(
-                    {"ticket_id": assignment_data["ticket_id"]},
-                    {"$set": assignment_data}
-                )
-                if update_result.modified_count > 0:
-                    logging.info(f"[SUCCESS] UPDATED EXISTING ASSIGNMENT")
-                    return "updated"
-                else:
-                    raise Exception("Update failed")
-            except Exception as update_error:
-                logging.error(f"[ERROR] UPDATE FAILED: {update_error}")
-                raise ValueError("Assignment already exists and update failed")
+        expected_version is the version the caller last saw (0 for an unassigned ticket). If the
+        assignment changed since, AssignmentConflictError is raised instead of overwriting it.
+        """
+        # Validate required fields
+        if not assignment_data.get('ticket_id'):
+            raise ValueError("ticket_id is required")
+        if not assignment_data.get('member_id'):
+            raise ValueError("member_id is required")
+        
+        ticket_id = assignment_data['ticket_id']
+        member_id = assignment_data['member_id']
+        assignment = {key: value for key, value in assignment_data.items() if key not in ('_id', 'version')}
+        assignment.setdefault('assigned_at', datetime.now())
+        if assignment.get('is_forwarded'):
+            # Forwarded assignments start as unseen by assignee
+            assignment.setdefault('is_seen', False)
+            assignment.setdefault('seen_at', None)
+        else:
+            # Takeover assignments are considered seen immediately
+            assignment.setdefault('is_seen', True)
+            assignment.setdefault('seen_at', datetime.now())
+        
+        logging.info(f"[TARGET] ASSIGNING: Ticket {ticket_id} -> Member {member_id} (forwarded: {assignment.get('is_forwarded', False)})")
+        try:
+            # Without an expected version, retry on concurrent changes (last writer wins)
+            for _ in range(1 if expected_version is not None else 3):
+                version = expected_version
+                if version is None:
+                    current = self.ticket_assignments.find_one({"ticket_id": ticket_id}, {"version": 1})
+                    version = (current or {}).get("version", 0)
+                # Assignments created before versioning have no version field and count as 0
+                query = {"ticket_id": ticket_id, "version": version if version else {"$in": [0, None]}}
+                try:
+                    stored = self.ticket_assignments.find_one_and_replace(
+                        query,
+                        dict(assignment, version=version + 1),
+                        # Only an unassigned ticket may be inserted; the unique ticket_id index rejects a racing insert
+                        upsert=not version,
+                        return_document=pymongo.ReturnDocument.AFTER
+                    )
+                except pymongo.errors.DuplicateKeyError:
+                    stored = None
+                if stored:
+                    request_cache.forget(request_cache.TICKET, ticket_id)
+                    live_events.record(live_events.ASSIGNMENT_CHANGED, live_events.assignment_event(stored))
+                    logging.info(f"[SUCCESS] ASSIGNMENT STORED: ID {stored['_id']}, version {stored['version']}")
+                    return stored
+            raise AssignmentConflictError(
+                f"Assignment for ticket {ticket_id} was changed by someone else (expected version {version})"
+            )
         except pymongo.errors.OperationFailure as e:
             logging.error(f"[ERROR] DATABASE OPERATION FAILED: {e}")
             raise Exception(f"Database error: {str(e)}")
-        except Exception as e:
-            logging.error(f"[ERROR] UNEXPECTED ASSIGNMENT ERROR: {e}")
-            raise Exception(f"Assignment failed: {str(e)}")
-
+    
+    def dedupe_ticket_assignments(self):
+        """Migration: keep only the latest assignment per ticket, then enforce one per ticket with a unique index"""
+        try:
+            duplicates = self.ticket_assignments.aggregate([
+                {"$sort": {"assigned_at": -1, "_id": -1}},
+                {"$group": {"_id": "$ticket_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}}
+            ], allowDiskUse=True)
+            stale_ids = [stale_id for group in duplicates for stale_id in group["ids"][1:]]
+            removed = 0
+            for i in range(0, len(stale_ids), 1000):
+                removed += self.ticket_assignments.delete_many({"_id": {"$in": stale_ids[i:i + 1000]}}).deleted_count
+            if removed:
+                logging.info(f"[DATABASE] Removed {removed} superseded ticket assignments")
+            self.ticket_assignments.create_index("ticket_id", unique=True, name=ASSIGNMENT_TICKET_INDEX_NAME)
+            return removed
+        except Exception as e:
+            # assign_ticket relies on the unique index: without it the migration must not be recorded
+            logging.error(f"[DATABASE] Error de-duplicating ticket assignments: {e}")
+            raise
+    
     def mark_assignment_seen(self, ticket_id, member_id):
         """Mark a forwarded assignment as seen by the assignee"""
         try:
@@ -729,6 +1235,7 @@ class MongoDB:
             if ObjectId.is_valid(str(member_id)):
                 query["member_id"] = ObjectId(str(member_id))
             self.ticket_assignments.update_one(query, update)
+            request_cache.forget(request_cache.TICKET, ticket_id)
             return True
         except Exception as e:
             logging.error(f"Failed to mark assignment seen for ticket {ticket_id}: {e}")
@@ -755,6 +1262,7 @@ class MongoDB:
                 "ticket_id": ticket_id,
                 "member_id": ObjectId(member_id)
             })
+            request_cache.forget(request_cache.TICKET, ticket_id)
             return result
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to remove assignment: {e}")
@@ -764,16 +1272,12 @@ class MongoDB:
             raise
     
     def add_ticket_metadata(self, ticket_id, key, value):
-        """Add metadata for a ticket"""
+        """Add metadata for a ticket (a key holds one value; writing it again replaces it)"""
         try:
-            metadata = {
-                "ticket_id": ticket_id,
-                "key": key,
-                "value": value,
-                "created_at": datetime.now()
-            }
-            result = self.ticket_metadata.insert_one(metadata)
-            return result.inserted_id
+            self.forget_ticket_metadata(ticket_id)
+            self.ticket_metadata_store.set_many(ticket_id, {key: value})
+            self._sync_ticket_read_model(ticket_id, {key: value})
+            return ticket_id
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to add metadata for ticket {ticket_id}: {e}")
             raise
@@ -781,82 +1285,96 @@ class MongoDB:
             logging.error(f"Unexpected error adding metadata: {e}")
             raise
     
-    def get_ticket_metadata(self, ticket_id):
-        """Get all metadata for a ticket"""
+    def get_ticket_metadata_fields(self, ticket_id):
+        """All metadata for a ticket as {key: value}, with attachment metadata as parsed sub-documents"""
+        return request_cache.get_or_load(
+            request_cache.METADATA_FIELDS, ticket_id, lambda: self._load_ticket_metadata_fields(ticket_id)
+        )
+    
+    def _load_ticket_metadata_fields(self, ticket_id):
+        """get_ticket_metadata_fields without the request identity map"""
         try:
-            result = list(self.ticket_metadata.find({"ticket_id": ticket_id}))
-            if result:
-                logging.info(f"✅ Retrieved {len(result)} metadata entries from database for ticket {ticket_id}")
-                # Also sync with in-memory storage
-                for meta in result:
-                    if meta.get('key') in ['technician_id', 'technician_name']:
-                        self._set_in_memory_metadata(ticket_id, meta.get('key'), meta.get('value'))
-                return result
-            else:
-                logging.info(f"📭 No metadata found in database for ticket {ticket_id}, checking in-memory storage")
-                # Check in-memory storage as fallback
-                return self._get_in_memory_metadata(ticket_id)
-        except pymongo.errors.OperationFailure as e:
+            return self.ticket_metadata_store.get(ticket_id)
+        except Exception as e:
             logging.error(f"Failed to get metadata for ticket {ticket_id}: {e}")
             # Fallback to in-memory storage
+            return dict(technician_assignments.get(ticket_id, {}))
+    
+    def get_metadata_fields_for_tickets(self, ticket_ids, keys=None):
+        """{ticket_id: {key: value}} for many tickets in one query"""
+        try:
+            return self.ticket_metadata_store.get_many(ticket_ids, keys)
+        except Exception as e:
+            logging.error(f"Failed to get metadata for {len(ticket_ids or [])} tickets: {e}")
+            return {ticket_id: {} for ticket_id in ticket_ids or [] if ticket_id}
+    
+    def get_ticket_metadata(self, ticket_id):
+        """Get all metadata for a ticket as {ticket_id, key, value} rows (sub-documents stay native, not JSON strings)"""
+        return request_cache.get_or_load(request_cache.METADATA, ticket_id, lambda: self._load_ticket_metadata(ticket_id))
+    
+    def _load_ticket_metadata(self, ticket_id):
+        """get_ticket_metadata without the request identity map"""
+        try:
+            fields = self.ticket_metadata_store.get(ticket_id)
+            if fields:
+                for key in ('technician_id', 'technician_name'):
+                    if key in fields:
+                        self._set_in_memory_metadata(ticket_id, key, fields[key])
+                return metadata_rows(ticket_id, fields)
+            # Check in-memory storage as fallback
             return self._get_in_memory_metadata(ticket_id)
         except Exception as e:
-            logging.error(f"Unexpected error getting metadata: {e}")
+            logging.error(f"Failed to get metadata for ticket {ticket_id}: {e}")
             # Fallback to in-memory storage
             return self._get_in_memory_metadata(ticket_id)
     
+    def get_metadata_for_tickets(self, ticket_ids, keys=None):
+        """Get metadata for many tickets in one query, keyed by ticket_id, as {ticket_id, key, value} rows"""
+        fields_by_ticket = self.get_metadata_fields_for_tickets(ticket_ids, keys)
+        metadata_by_ticket = {ticket_id: metadata_rows(ticket_id, fields) for ticket_id, fields in fields_by_ticket.items()}
+
+        # Same in-memory fallback as get_ticket_metadata for tickets with no stored metadata
+        for ticket_id, rows in metadata_by_ticket.items():
+            if not rows and ticket_id in technician_assignments:
+                metadata_by_ticket[ticket_id] = [
+                    meta for meta in self._get_in_memory_metadata(ticket_id)
+                    if not keys or meta.get('key') in keys
+                ]
+
+        return metadata_by_ticket
+
     def _get_in_memory_metadata(self, ticket_id):
         """Get metadata from in-memory storage when database fails"""
         global technician_assignments
-        logging.info(f"🔍 Looking for ticket {ticket_id} in in-memory storage: {technician_assignments}")
         if ticket_id in technician_assignments:
-            metadata = []
-            for key, value in technician_assignments[ticket_id].items():
-                metadata.append({
-                    "ticket_id": ticket_id,
-                    "key": key,
-                    "value": value,
-                    "updated_at": datetime.now()
-                })
-            logging.info(f"✅ Retrieved {len(metadata)} metadata entries from memory for ticket {ticket_id}")
-            return metadata
-        logging.info(f"❌ No metadata found in memory for ticket {ticket_id}")
+            return [
+                {"ticket_id": ticket_id, "key": key, "value": value, "updated_at": datetime.now()}
+                for key, value in technician_assignments[ticket_id].items()
+            ]
         return []
     
     def set_ticket_metadata(self, ticket_id, key, value):
         """Set or update metadata for a ticket (upsert)"""
+        return self.set_ticket_metadata_many(ticket_id, {key: value})
+    
+    def set_ticket_metadata_many(self, ticket_id, mapping):
+        """Set or update several metadata keys for a ticket in one atomic write"""
+        if not mapping:
+            return 0
+        self.forget_ticket_metadata(ticket_id)
         try:
-            # Use upsert to either update existing or insert new
-            result = self.ticket_metadata.update_one(
-                {"ticket_id": ticket_id, "key": key},
-                {
-                    "$set": {
-                        "value": value,
-                        "updated_at": datetime.now()
-                    }
-                },
-                upsert=True
-            )
-            
-            # Verify the operation was successful
-            if result.upserted_id or result.modified_count > 0:
-                logging.info(f"✅ Successfully saved metadata: {ticket_id}.{key} = {value}")
-                # Also update in-memory storage as backup
-                self._set_in_memory_metadata(ticket_id, key, value)
-                return result.upserted_id or result.modified_count
-            else:
-                logging.warning(f"⚠️ Metadata operation returned no changes: {ticket_id}.{key} = {value}")
-                # Fallback to in-memory storage
-                return self._set_in_memory_metadata(ticket_id, key, value)
-                
+            self.ticket_metadata_store.set_many(ticket_id, mapping)
+            self._sync_ticket_read_model(ticket_id, mapping)
+            logging.info(f"✅ Saved {len(mapping)} metadata keys for ticket {ticket_id}: {', '.join(mapping)}")
+            return len(mapping)
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to set metadata for ticket {ticket_id}: {e}")
-            # Fallback to in-memory storage
-            return self._set_in_memory_metadata(ticket_id, key, value)
         except Exception as e:
             logging.error(f"Unexpected error setting metadata: {e}")
-            # Fallback to in-memory storage
-            return self._set_in_memory_metadata(ticket_id, key, value)
+        # Fallback to in-memory storage
+        for key, value in mapping.items():
+            self._set_in_memory_metadata(ticket_id, key, value)
+        return len(mapping)
     
     def _set_in_memory_metadata(self, ticket_id, key, value):
         """Fallback in-memory metadata storage when database fails"""
@@ -864,15 +1382,17 @@ class MongoDB:
         if ticket_id not in technician_assignments:
             technician_assignments[ticket_id] = {}
         technician_assignments[ticket_id][key] = value
-        logging.info(f"💾 Stored metadata in memory: {ticket_id}.{key} = {value}")
-        logging.info(f"🔍 Current in-memory storage: {technician_assignments}")
         return 1
     
     def delete_ticket_metadata(self, ticket_id, key):
         """Delete specific metadata key for a ticket"""
         try:
-            result = self.ticket_metadata.delete_many({"ticket_id": ticket_id, "key": key})
-            return result.deleted_count
+            self.forget_ticket_metadata(ticket_id)
+            deleted_count = self.ticket_metadata_store.delete(ticket_id, key)
+            technician_assignments.get(ticket_id, {}).pop(key, None)
+            if deleted_count:
+                self.refresh_ticket_read_model(ticket_id)
+            return deleted_count
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to delete metadata for ticket {ticket_id}: {e}")
             raise
@@ -880,6 +1400,135 @@ class MongoDB:
             logging.error(f"Unexpected error deleting metadata: {e}")
             raise
     
+    def forget_ticket_metadata(self, ticket_id=None):
+        """Drop a ticket's metadata (or all tickets' metadata) from the request identity map"""
+        request_cache.forget(request_cache.METADATA, ticket_id)
+        request_cache.forget(request_cache.METADATA_FIELDS, ticket_id)
+    
+    def delete_ticket_metadata_before(self, cutoff):
+        """Delete ticket metadata not written since cutoff"""
+        self.forget_ticket_metadata()
+        return self.ticket_metadata_store.delete_older_than(cutoff)
+    
+    def migrate_ticket_metadata_documents(self):
+        """Migration: copy key/value ticket_metadata rows into one metadata document per ticket"""
+        try:
+            migrated = self.ticket_metadata_store.migrate()
+            logging.info(f"[DATABASE] Migrated metadata for {migrated} tickets into metadata documents")
+            return migrated
+        except Exception as e:
+            logging.error(f"[DATABASE] Error migrating ticket metadata documents: {e}")
+            return 0
+    
+    def _sync_ticket_read_model(self, ticket_id, mapping):
+        """Mirror metadata writes ({key: value}) onto the denormalized fields of the ticket document"""
+        update = {}
+        for key, value in mapping.items():
+            if key in TICKET_READ_MODEL_KEYS:
+                update[key] = value
+            if key == 'vehicle_registration':
+                update[SEARCH_KEYS_FIELD] = ticket_search_keys({'ticket_id': ticket_id, key: value})
+            if _metadata_value_is_warranty(value):
+                update['has_warranty_attachment'] = True
+        if not update:
+            return
+        try:
+            self._update_ticket_counted(ticket_id, {"$set": update})
+        except Exception as e:
+            logging.warning(f"Failed to update read model for ticket {ticket_id}: {e}")
+
+    def _build_ticket_read_model(self, fields, ticket_id=None):
+        """Build the denormalized ticket fields from a ticket's metadata ({key: value})"""
+        read_model = {'has_warranty_attachment': False}
+        for key, value in fields.items():
+            if key in TICKET_READ_MODEL_KEYS:
+                read_model[key] = value
+            if _metadata_value_is_warranty(value):
+                read_model['has_warranty_attachment'] = True
+        if ticket_id:
+            read_model[SEARCH_KEYS_FIELD] = ticket_search_keys({**read_model, 'ticket_id': ticket_id})
+        return read_model
+
+    def _read_model_update(self, read_model):
+        """Turn a read model into a $set/$unset update for the ticket document"""
+        update = {"$set": read_model}
+        missing = {key: "" for key in TICKET_READ_MODEL_KEYS if key not in read_model}
+        if missing:
+            update["$unset"] = missing
+        return update
+
+    def refresh_ticket_read_model(self, ticket_id):
+        """Recompute the denormalized metadata fields stored on one ticket"""
+        try:
+            read_model = self._build_ticket_read_model(self.ticket_metadata_store.get(ticket_id), ticket_id)
+            self._update_ticket_counted(ticket_id, self._read_model_update(read_model))
+            return read_model
+        except Exception as e:
+            logging.warning(f"Failed to refresh read model for ticket {ticket_id}: {e}")
+            return None
+
+    def backfill_ticket_read_model(self, batch_size=500):
+        """Migration: copy technician, registration, warranty flags and search keys from metadata onto every ticket"""
+        try:
+            updated_count = 0
+            ticket_ids = [t['ticket_id'] for t in self.tickets.find({}, {"ticket_id": 1, "_id": 0}) if t.get('ticket_id')]
+            for start in range(0, len(ticket_ids), batch_size):
+                batch_ids = ticket_ids[start:start + batch_size]
+                metadata_by_ticket = self.ticket_metadata_store.get_many(batch_ids)
+                operations = [
+                    pymongo.UpdateOne(
+                        {"ticket_id": ticket_id},
+                        self._read_model_update(self._build_ticket_read_model(metadata_by_ticket.get(ticket_id, {}), ticket_id))
+                    )
+                    for ticket_id in batch_ids
+                ]
+                if operations:
+                    result = self.tickets.bulk_write(operations, ordered=False)
+                    updated_count += result.modified_count
+            logging.info(f"[DATABASE] Ticket read model backfill updated {updated_count} of {len(ticket_ids)} tickets")
+            # Warranty flags changed in bulk; rebuild the dashboard counters
+            self.ticket_stats.reconcile()
+            return updated_count
+        except Exception as e:
+            logging.error(f"[DATABASE] Error backfilling ticket read model: {e}")
+            return 0
+
+    def migrate_attachments_to_gridfs(self, batch_size=100):
+        """Migration: move base64 attachment payloads out of tickets, replies and common documents into GridFS"""
+        moved = {'tickets': 0, 'replies': 0, 'common_documents': 0}
+        try:
+            for name, collection in (('tickets', self.tickets), ('replies', self.replies)):
+                cursor = collection.find(attachment_blob_filter(), {'attachments': 1}).batch_size(batch_size)
+                for record in cursor:
+                    attachments, moved_count = self.attachment_store.offload_attachments(record['attachments'])
+                    if moved_count:
+                        collection.update_one({'_id': record['_id']}, {'$set': {'attachments': attachments}})
+                        moved[name] += moved_count
+
+            document_filter = {'$or': [
+                {'file_data': {'$type': 'string', '$ne': ''}},
+                {'file_content': {'$type': 'string', '$ne': ''}},
+                LEGACY_FILE_ID_FILTER,
+            ]}
+            for document in self.common_documents.find(document_filter).batch_size(batch_size):
+                stored = self._with_offloaded_document_file(document)
+                if stored is not document:
+                    self.common_documents.update_one(
+                        {'_id': document['_id']},
+                        {
+                            '$set': {'gridfs_id': stored['gridfs_id'], 'file_size': stored.get('file_size', 0), 'has_file_data': True},
+                            '$unset': {'file_data': '', 'file_content': ''}
+                        }
+                    )
+                    moved['common_documents'] += 1
+
+            logging.info(f"[DATABASE] Attachment migration moved {moved} payloads to GridFS")
+            return moved
+        except Exception as e:
+            # Raise so the runner does not record a partial run; the next run picks up what is left
+            logging.error(f"[DATABASE] Error migrating attachments to GridFS after moving {moved}: {e}")
+            raise
+
     def add_common_document_metadata(self, document_id, key, value):
         """🚀 NEW: Add metadata to a common document (like ticket system)"""
         try:
@@ -896,20 +1545,11 @@ class MongoDB:
             logging.error(f"❌ Error adding common document metadata: {e}")
             return None
     
-    def search_tickets(self, query=None, status=None, priority=None, classification=None):
-        """Search tickets with filters"""
+    def search_tickets(self, query=None, status=None, priority=None, classification=None, include_blobs=False, limit=1000):
+        """Search tickets with filters, ranked by relevance when a query is given"""
         try:
             search_filter = {}
             
-            if query:
-                search_filter["$or"] = [
-                    {"ticket_id": {"$regex": query, "$options": "i"}},
-                    {"subject": {"$regex": query, "$options": "i"}},
-                    {"body": {"$regex": query, "$options": "i"}},
-                    {"name": {"$regex": query, "$options": "i"}},
-                    {"email": {"$regex": query, "$options": "i"}}
-                ]
-            
             if status and status != 'All':
                 search_filter["status"] = status
             
@@ -919,7 +1559,11 @@ class MongoDB:
             if classification and classification != 'All':
                 search_filter["classification"] = classification
             
-            return list(self.tickets.find(search_filter).sort("created_at", -1).limit(1000))
+            projection = ticket_projection(include_blobs)
+            if not query:
+                return list(self.tickets.find(search_filter, projection).sort("created_at", -1).limit(limit))
+            
+            return ranked_search(self.tickets, query, search_filter, projection, limit)
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to search tickets: {e}")
             return []
@@ -927,10 +1571,10 @@ class MongoDB:
             logging.error(f"Unexpected error searching tickets: {e}")
             return []
     
-    def get_all_tickets(self):
+    def get_all_tickets(self, include_blobs=False):
         """Get all tickets"""
         try:
-            return list(self.tickets.find().sort("created_at", -1))
+            return list(self.tickets.find({}, ticket_projection(include_blobs)).sort("created_at", -1))
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to get all tickets: {e}")
             return []
@@ -953,17 +1597,24 @@ class MongoDB:
             logging.info(f"Deleted assignments for ticket {ticket_id}")
             
             # 2. Delete ticket metadata
-            self.ticket_metadata.delete_many({'ticket_id': ticket_id})
+            self.forget_ticket_metadata(ticket_id)
+            self.ticket_metadata_store.delete_ticket(ticket_id)
             logging.info(f"Deleted metadata for ticket {ticket_id}")
             
-            # 3. Delete ticket replies
-            self.replies.delete_many({'ticket_id': ticket_id})
+            # 3. Delete ticket replies (releasing their stored attachments)
+            self.delete_replies({'ticket_id': ticket_id})
             logging.info(f"Deleted replies for ticket {ticket_id}")
             
-            # 4. Finally delete the ticket itself
+            # 4. Release stored attachment files held by the ticket
+            self.attachment_store.release_attachments(ticket.get('attachments'))
+            
+            # 5. Finally delete the ticket itself
+            request_cache.forget(request_cache.TICKET, ticket_id)
             result = self.tickets.delete_one({'ticket_id': ticket_id})
             
             if result.deleted_count > 0:
+                self.ticket_stats.record_deleted(ticket)
+                self.ticket_changes.record_deleted(ticket_id)
                 logging.info(f"Successfully deleted ticket {ticket_id}")
                 return {'success': True, 'message': 'Ticket deleted successfully'}
             else:
@@ -985,10 +1636,7 @@ class MongoDB:
                 'status': 'Deleted'
             }
             
-            result = self.tickets.update_one(
-                {'ticket_id': ticket_id},
-                {'$set': update_data}
-            )
+            result = self._update_ticket_counted(ticket_id, {'$set': update_data})
             
             if result.modified_count > 0:
                 logging.info(f"Successfully soft-deleted ticket {ticket_id}")
@@ -1004,8 +1652,8 @@ class MongoDB:
     def restore_ticket(self, ticket_id):
         """Restore a soft-deleted ticket"""
         try:
-            result = self.tickets.update_one(
-                {'ticket_id': ticket_id},
+            result = self._update_ticket_counted(
+                ticket_id,
                 {
                     '$set': {'is_deleted': False, 'status': 'Open'},
                     '$unset': {'deleted_at': '', 'deleted_by': ''}
@@ -1023,56 +1671,60 @@ class MongoDB:
             logging.error(f"Error restoring ticket {ticket_id}: {e}")
             return {'success': False, 'message': f'Error restoring ticket: {str(e)}'}
     
-    def get_deleted_tickets(self):
+    def get_deleted_tickets(self, include_blobs=False):
         """Get all soft-deleted tickets"""
         try:
-            return list(self.tickets.find({'is_deleted': True}).sort([("deleted_at", -1)]))
+            return list(self.tickets.find({'is_deleted': True}, ticket_projection(include_blobs)).sort([("deleted_at", -1)]))
         except Exception as e:
             logging.error(f"Failed to get deleted tickets: {e}")
             return []
 
-    def get_dashboard_stats(self):
-        """Get statistics for dashboard"""
+    def get_ticket_changes(self, cursor):
+        """Tickets created, updated and removed since a change cursor, plus the next cursor (see ticket_changes)"""
         try:
-            total_tickets = self.tickets.count_documents({})
-            
-            # Status counts
-            status_pipeline = [
-                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-            ]
-            status_counts = {item["_id"]: item["count"] for item in self.tickets.aggregate(status_pipeline)}
-            
-            # Priority counts
-            priority_pipeline = [
-                {"$group": {"_id": "$priority", "count": {"$sum": 1}}}
-            ]
-            priority_counts = {item["_id"]: item["count"] for item in self.tickets.aggregate(priority_pipeline)}
-            
-            # Classification counts
-            classification_pipeline = [
-                {"$group": {"_id": "$classification", "count": {"$sum": 1}}}
-            ]
-            classification_counts = {item["_id"]: item["count"] for item in self.tickets.aggregate(classification_pipeline)}
-            
-            return {
-                "total_tickets": total_tickets,
-                "status_counts": status_counts,
-                "priority_counts": priority_counts,
-                "classification_counts": classification_counts
-            }
+            return self.ticket_changes.changes_since(cursor)
+        except pymongo.errors.OperationFailure as e:
+            logging.error(f"Failed to get ticket changes since {cursor}: {e}")
+            raise
+
+    def get_dashboard_stats(self, start_date=None, end_date=None):
+        """Get statistics for dashboard from the materialized counters (optionally for a created_at day range)"""
+        try:
+            # Read only: reconciling is a scheduled job (see ticket_stats)
+            stats = self.ticket_stats.read(start_date, end_date)
+            if stats is not None:
+                return stats
+            # Counters not built yet: one $facet pass over the tickets
+            return analytics.dashboard_stats(self.tickets, analytics.ticket_date_match(start_date, end_date))
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to get dashboard stats: {e}")
-            return {"total_tickets": 0, "status_counts": {}, "priority_counts": {}, "classification_counts": {}}
+            return analytics.empty_dashboard_stats()
         except Exception as e:
             logging.error(f"Unexpected error getting dashboard stats: {e}")
-            return {"total_tickets": 0, "status_counts": {}, "priority_counts": {}, "classification_counts": {}}
+            return analytics.empty_dashboard_stats()
+
+    def get_dashboard_kpis(self, start_date=None, end_date=None):
+        """Get live dashboard KPIs (breakdowns, aged claims, resolution time, outcomes) in one aggregation"""
+        try:
+            return analytics.dashboard_kpis(
+                self.tickets,
+                analytics.ticket_date_match(start_date, end_date),
+                breakdowns=self.get_dashboard_stats(start_date, end_date)
+            )
+        except pymongo.errors.OperationFailure as e:
+            logging.error(f"Failed to get dashboard KPIs: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Unexpected error getting dashboard KPIs: {e}")
+            raise
 
     # Status Management Methods
     def get_all_ticket_statuses(self):
         """Get all ticket statuses"""
         try:
-            statuses = list(self.ticket_statuses.find({'is_active': True}).sort('order', 1))
-            return statuses
+            return self.reference_cache.get(
+                TICKET_STATUSES_CACHE, 'active', lambda: list(self.ticket_statuses.find({'is_active': True}).sort('order', 1))
+            )
         except Exception as e:
             logging.error(f"Error getting ticket statuses: {e}")
             return []
@@ -1087,6 +1739,7 @@ class MongoDB:
             status_data['order'] = (max_order['order'] if max_order else 0) + 1
             
             result = self.ticket_statuses.insert_one(status_data)
+            self.reference_cache.invalidate(TICKET_STATUSES_CACHE)
             return result.inserted_id
         except Exception as e:
             logging.error(f"Error creating ticket status: {e}")
@@ -1101,6 +1754,7 @@ class MongoDB:
                 {'_id': ObjectId(status_id)},
                 {'$set': update_data}
             )
+            self.reference_cache.invalidate(TICKET_STATUSES_CACHE)
             return result
         except Exception as e:
             logging.error(f"Error updating ticket status: {e}")
@@ -1114,6 +1768,7 @@ class MongoDB:
                 {'_id': ObjectId(status_id)},
                 {'$set': {'is_active': False, 'updated_at': datetime.now()}}
             )
+            self.reference_cache.invalidate(TICKET_STATUSES_CACHE)
             return result
         except Exception as e:
             logging.error(f"Error deactivating ticket status: {e}")
@@ -1145,10 +1800,10 @@ class MongoDB:
         except Exception as e:
             logging.error(f"Error initializing default statuses: {e}")
 
-    def get_tickets_by_status(self, status):
+    def get_tickets_by_status(self, status, include_blobs=False):
         """Get all tickets with a specific status"""
         try:
-            tickets = list(self.tickets.find({"status": status}).sort("created_at", -1))
+            tickets = list(self.tickets.find({"status": status}, ticket_projection(include_blobs)).sort("created_at", -1))
             return tickets
         except Exception as e:
             logging.error(f"Error getting tickets by status {status}: {e}")
@@ -1160,13 +1815,10 @@ class MongoDB:
         try:
             logging.info(f"[DATABASE] Getting all active technicians from collection: {self.technicians.name}")
             
-            # First check total count
-            total_count = self.technicians.count_documents({})
-            active_count = self.technicians.count_documents({"is_active": True})
-            logging.info(f"[DATABASE] Total technicians: {total_count}, Active technicians: {active_count}")
-            
             # Get active technicians
-            result = list(self.technicians.find({"is_active": True}).sort("name", 1))
+            result = self.reference_cache.get(
+                TECHNICIANS_CACHE, 'active', lambda: list(self.technicians.find({"is_active": True}).sort("name", 1))
+            )
             logging.info(f"[DATABASE] Retrieved {len(result)} active technicians")
             
             # Log first few technicians for debugging
@@ -1198,6 +1850,7 @@ class MongoDB:
             technician_data['created_at'] = datetime.now()
             technician_data['is_active'] = True
             result = self.technicians.insert_one(technician_data)
+            self.reference_cache.invalidate(TECHNICIANS_CACHE)
             return result.inserted_id
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to create technician: {e}")
@@ -1218,6 +1871,7 @@ class MongoDB:
                 {"_id": ObjectId(technician_id)},
                 {"$set": update_data}
             )
+            self.reference_cache.invalidate(TECHNICIANS_CACHE)
             return result
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to update technician {technician_id}: {e}")
@@ -1237,6 +1891,7 @@ class MongoDB:
                 {"_id": ObjectId(technician_id)},
                 {"$set": {"is_active": False, "updated_at": datetime.now()}}
             )
+            self.reference_cache.invalidate(TECHNICIANS_CACHE)
             return result
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to deactivate technician {technician_id}: {e}")
@@ -1256,6 +1911,7 @@ class MongoDB:
                 {"_id": ObjectId(technician_id)},
                 {"$set": {"is_active": True, "updated_at": datetime.now()}}
             )
+            self.reference_cache.invalidate(TECHNICIANS_CACHE)
             return result
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to activate technician {technician_id}: {e}")
@@ -1305,7 +1961,7 @@ class MongoDB:
     def get_all_roles(self):
         """Get all roles"""
         try:
-            return list(self.roles.find().sort("name", 1))
+            return self.reference_cache.get(ROLES_CACHE, 'all', lambda: list(self.roles.find().sort("name", 1)))
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to get all roles: {e}")
             return []
@@ -1318,6 +1974,7 @@ class MongoDB:
         try:
             role_data['created_at'] = datetime.now()
             result = self.roles.insert_one(role_data)
+            self.reference_cache.invalidate(ROLES_CACHE)
             return result.inserted_id
         except pymongo.errors.DuplicateKeyError as e:
             logging.error(f"Duplicate role name: {e}")
@@ -1355,6 +2012,7 @@ class MongoDB:
                 {"_id": ObjectId(role_id)}, 
                 {"$set": update_data}
             )
+            self.reference_cache.invalidate(ROLES_CACHE)
             return result.modified_count > 0
         except pymongo.errors.OperationFailure as e:
             logging.error(f"Failed to update role {role_id}: {e}")
@@ -1376,6 +2034,7 @@ class MongoDB:
                     raise ValueError("Cannot delete role: it is currently assigned to members")
                 
                 result = self.roles.delete_one({"_id": ObjectId(role_id)})
+                self.reference_cache.invalidate(ROLES_CACHE)
                 return result.deleted_count > 0
             except pymongo.errors.OperationFailure as e:
                 logging.error(f"Failed to delete role {role_id}: {e}")
@@ -1429,7 +2088,10 @@ class MongoDB:
                 logging.warning(f"⚠️ file_data present: {'file_data' in document_data}")
                 logging.warning(f"⚠️ file_content present: {'file_content' in document_data}")
             
-            result = self.common_documents.insert_one(document_data)
+            # File bytes go to GridFS; document_data keeps its base64 copy for the caller's webhook
+            stored_document = self._with_offloaded_document_file(document_data)
+            result = self.common_documents.insert_one(stored_document)
+            document_data['_id'] = result.inserted_id
             logging.info(f"✅ Created common document: {document_data.get('name')} with ID: {result.inserted_id}")
             
             # 🚀 ENHANCED DEBUGGING: Verify what was actually stored
@@ -1443,12 +2105,42 @@ class MongoDB:
                     logging.info(f"  - Stored file_data length: {len(stored_doc.get('file_data', ''))}")
                 if 'file_content' in stored_doc:
                     logging.info(f"  - Stored file_content length: {len(stored_doc.get('file_content', ''))}")
+                if 'gridfs_id' in stored_doc:
+                    logging.info(f"  - Stored in GridFS: {stored_doc['gridfs_id']}")
             
             return str(result.inserted_id)
         except Exception as e:
             logging.error(f"❌ Error creating common document: {e}")
             raise
     
+    def _with_offloaded_document_file(self, document):
+        """Copy of a common document with its base64 file moved to GridFS"""
+        base64_data = document.get('file_data') or document.get('file_content')
+        if document.get('gridfs_id'):
+            if not self.attachment_store.is_legacy_id(document['gridfs_id']):
+                return document
+            stored = dict(document)
+            stored['gridfs_id'] = self.attachment_store.rekey(document['gridfs_id'])
+            return stored
+        if not isinstance(base64_data, str) or not base64_data:
+            return document
+        try:
+            file_id, size = self.attachment_store.put_base64(
+                base64_data,
+                document.get('file_name') or document.get('name'),
+                content_type=document.get('file_type')
+            )
+        except Exception as e:
+            logging.warning(f"⚠️ Keeping undecodable file for common document {document.get('name')} inline: {e}")
+            return document
+        stored = dict(document)
+        stored.pop('file_data', None)
+        stored.pop('file_content', None)
+        stored['gridfs_id'] = file_id
+        stored['file_size'] = stored.get('file_size') or size
+        stored['has_file_data'] = True
+        return stored
+    
     def get_all_common_documents(self):
         """Get all common documents"""
         try:
@@ -1467,7 +2159,8 @@ class MongoDB:
                 'file_type': 1,
                 'has_file_data': 1,
                 'file_content': 1,  # Include the actual file content
-                'file_data': 1      # Include the enhanced file data structure
+                'file_data': 1,     # Include the enhanced file data structure
+                'gridfs_id': 1      # File bytes moved to the GridFS attachment store
             }).sort('created_at', -1))
             
             # Convert ObjectId to string for JSON serialization
@@ -1484,8 +2177,8 @@ class MongoDB:
             logging.error(f"❌ Error getting common documents: {e}")
             return []
     
-    def get_common_document_by_id(self, document_id):
-        """Get a specific common document by ID"""
+    def get_common_document_by_id(self, document_id, hydrate_blobs=True):
+        """Get a specific common document by ID (file loaded back from GridFS unless hydrate_blobs=False)"""
         try:
             from bson.objectid import ObjectId
             if not ObjectId.is_valid(document_id):
@@ -1500,6 +2193,12 @@ class MongoDB:
                 if 'updated_at' in result:
                     result['updated_at'] = result['updated_at'].isoformat()
                 
+                if hydrate_blobs and result.get('gridfs_id') and not result.get('file_data'):
+                    file_data = self.attachment_store.read_base64(result['gridfs_id'])
+                    if file_data is not None:
+                        result['file_data'] = file_data
+                        result['file_content'] = file_data
+                
                 # Log file data availability for debugging
                 has_file_content = 'file_content' in result and result['file_content']
                 has_file_data = 'file_data' in result and result['file_data']
@@ -1541,9 +2240,11 @@ class MongoDB:
             if not ObjectId.is_valid(document_id):
                 return False
                 
-            result = self.common_documents.delete_one({'_id': ObjectId(document_id)})
+            document = self.common_documents.find_one_and_delete({'_id': ObjectId(document_id)}, {'gridfs_id': 1})
             
-            if result.deleted_count > 0:
+            if document is not None:
+                if document.get('gridfs_id'):
+                    self.attachment_store.release(document['gridfs_id'])
                 logging.info(f"✅ Deleted common document: {document_id}")
                 return True
             else:
@@ -1607,7 +2308,7 @@ class MongoDB:
             
             result = self.common_documents.find_one(
                 {'_id': ObjectId(document_id)},
-                {'file_content': 1, 'file_data': 1, 'file_name': 1, 'file_type': 1, 'name': 1, 'file_size': 1}
+                {'file_content': 1, 'file_data': 1, 'gridfs_id': 1, 'file_name': 1, 'file_type': 1, 'name': 1, 'file_size': 1}
             )
             
             logging.info(f"Database query result: {result}")
@@ -1627,6 +2328,10 @@ class MongoDB:
                 elif 'file_content' in result and result['file_content']:
                     file_content_base64 = result['file_content']
                     logging.info(f"✅ Using legacy file_content field: {len(file_content_base64)} chars")
+                # Files moved to the GridFS attachment store
+                elif result.get('gridfs_id'):
+                    file_content_base64 = self.attachment_store.read_base64(result['gridfs_id'])
+                    logging.info(f"✅ Loaded file from GridFS: {result['gridfs_id']}")
                 
                 if file_content_base64:
                     # 🚨 CRITICAL VALIDATION: Ensure file_content is not empty
@@ -1709,6 +2414,16 @@ class MongoDB:
             logging.info(f"  - Has file_content: {has_file_content}")
             logging.info(f"  - Has file_data: {has_file_data}")
             
+            # Files moved to GridFS are validated against the stored length
+            if not has_file_content and not has_file_data and document.get('gridfs_id'):
+                grid_out = self.attachment_store.open(document['gridfs_id'])
+                if grid_out is None:
+                    return False, "Stored file missing from attachment store"
+                with grid_out:
+                    if grid_out.length == 0:
+                        return False, "File size is 0 bytes"
+                    return True, f"Document integrity validated: {grid_out.length} bytes stored in GridFS"
+            
             if not has_file_content and not has_file_data:
                 return False, "Document has no file content in either field"
             
@@ -1868,130 +2583,24 @@ class MongoDB:
     def get_warranty_analytics(self):
         """Get comprehensive warranty detection analytics"""
         try:
-            # Basic warranty statistics
-            total_tickets = self.tickets.count_documents({})
-            warranty_tickets = self.tickets.count_documents({"has_warranty": True})
-            attachment_tickets = self.tickets.count_documents({"has_attachments": True})
-            
-            # Warranty forms distribution
-            warranty_forms_pipeline = [
-                {"$match": {"has_warranty": True}},
-                {"$group": {
-                    "_id": "$warranty_forms_count",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"_id": 1}}
-            ]
-            warranty_forms_dist = list(self.tickets.aggregate(warranty_forms_pipeline))
-            
-            # Processing method statistics
-            processing_methods_pipeline = [
-                {"$group": {
-                    "_id": "$processing_method",
-                    "count": {"$sum": 1},
-                    "warranty_count": {
-                        "$sum": {"$cond": [{"$eq": ["$has_warranty", True]}, 1, 0]}
-                    }
-                }}
-            ]
-            processing_methods = list(self.tickets.aggregate(processing_methods_pipeline))
-            
-            # Monthly warranty trend
-            monthly_warranty_pipeline = [
-                {"$match": {"has_warranty": True}},
-                {"$group": {
-                    "_id": {
-                        "year": {"$year": "$created_at"},
-                        "month": {"$month": "$created_at"}
-                    },
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"_id.year": -1, "_id.month": -1}},
-                {"$limit": 12}
-            ]
-            monthly_warranty = list(self.tickets.aggregate(monthly_warranty_pipeline))
-            
-            # Warranty detection by status
-            warranty_by_status_pipeline = [
-                {"$match": {"has_warranty": True}},
-                {"$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"count": -1}}
-            ]
-            warranty_by_status = list(self.tickets.aggregate(warranty_by_status_pipeline))
-            
-            return {
-                "total_tickets": total_tickets,
-                "warranty_tickets": warranty_tickets,
-                "attachment_tickets": attachment_tickets,
-                "warranty_percentage": (warranty_tickets / total_tickets * 100) if total_tickets > 0 else 0,
-                "attachment_percentage": (attachment_tickets / total_tickets * 100) if total_tickets > 0 else 0,
-                "warranty_forms_distribution": warranty_forms_dist,
-                "processing_methods": processing_methods,
-                "monthly_warranty_trend": monthly_warranty,
-                "warranty_by_status": warranty_by_status
-            }
-            
+            return analytics.warranty_analytics(self.tickets)
         except Exception as e:
             logging.error(f"Error getting warranty analytics: {e}")
-            return {
-                "total_tickets": 0,
-                "warranty_tickets": 0,
-                "attachment_tickets": 0,
-                "warranty_percentage": 0,
-                "attachment_percentage": 0,
-                "warranty_forms_distribution": [],
-                "processing_methods": [],
-                "monthly_warranty_trend": [],
-                "warranty_by_status": []
-            }
+            return analytics.empty_warranty_analytics()
     
     def get_attachment_analytics(self):
         """Get comprehensive attachment analytics"""
         try:
-            # Attachment size statistics
-            attachment_size_pipeline = [
-                {"$match": {"has_attachments": True}},
-                {"$group": {
-                    "_id": None,
-                    "total_size": {"$sum": "$attachment_total_size"},
-                    "avg_size": {"$avg": "$attachment_total_size"},
-                    "max_size": {"$max": "$attachment_total_size"},
-                    "total_tickets": {"$sum": 1}
-                }}
-            ]
-            size_stats = list(self.tickets.aggregate(attachment_size_pipeline))
-            
-            # Attachment count distribution
-            attachment_count_pipeline = [
-                {"$match": {"has_attachments": True}},
-                {"$group": {
-                    "_id": "$total_attachments",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"_id": 1}}
-            ]
-            attachment_count_dist = list(self.tickets.aggregate(attachment_count_pipeline))
-            
-            return {
-                "size_statistics": size_stats[0] if size_stats else {},
-                "attachment_count_distribution": attachment_count_dist
-            }
-            
+            return analytics.attachment_analytics(self.tickets)
         except Exception as e:
             logging.error(f"Error getting attachment analytics: {e}")
-            return {
-                "size_statistics": {},
-                "attachment_count_distribution": []
-            }
+            return analytics.empty_attachment_analytics()
     
     def update_ticket_warranty_metadata(self, ticket_id, warranty_data):
         """Update ticket with enhanced warranty metadata"""
         try:
-            result = self.tickets.update_one(
-                {"ticket_id": ticket_id},
+            result = self._update_ticket_counted(
+                ticket_id,
                 {"$set": {
                     "has_warranty": warranty_data.get("has_warranty", False),
                     "has_attachments": warranty_data.get("has_attachments", False),
@@ -2025,6 +2634,13 @@ class MongoDB:
 # Global database instance
 db = None
 
+
+def reset_db():
+    """Drop the database instance and client without closing them (gunicorn post_fork)"""
+    global db
+    db = None
+    connections.reset()
+
 # Temporary in-memory storage for technician assignments (for testing without database)
 technician_assignments = {}
 
@@ -2032,7 +2648,8 @@ def get_db():
     """Get database instance with connection validation"""
     global db
     try:
-        if db is None:
+        # A MongoDB built in another process (inherited across fork) must not be reused
+        if db is None or not connections.owns(db.client):
             db = MongoDB()
         return db
     except Exception as e:
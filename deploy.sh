@@ -286,6 +286,7 @@ deployment_summary() {
     echo
     echo "2. Initialize the database:"
     echo "   sudo -u ${APP_USER} ${APP_DIR}/venv/bin/python ${APP_DIR}/init_database.py"
+    echo "   sudo -u ${APP_USER} --preserve-env=MONGODB_URI ${APP_DIR}/venv/bin/python ${APP_DIR}/migrate.py"
     echo
     echo "3. Restart the application:"
     echo "   sudo systemctl restart ${APP_NAME}"
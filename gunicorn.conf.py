@@ -14,7 +14,9 @@ backlog = 2048
 workers = 4
 # Use 'gthread' worker - stable and doesn't require gevent dependency
 worker_class = "gthread"
-threads = 4
+# Any thread may serve an ordinary request; up to LIVE_STREAM_SLOTS of them (see live_events.py)
+# may instead be parked on live event streams, which hold no database connection
+threads = 12
 worker_connections = 1000
 timeout = 120
 keepalive = 2
@@ -39,7 +41,32 @@ raw_env = [
 ]
 
 # Preload app for better performance
+# MongoClient is not fork-safe: the hooks below make each worker build its own client after fork
 preload_app = True
 
 # Forwarded allow ips (allows all for container network)
 forwarded_allow_ips = "*"
+
+
+# Server hooks: MongoDB client lifecycle (see mongo_connection.py)
+def pre_fork(server, worker):
+    """Close any client the master opened so no connections or monitor threads cross the fork"""
+    from mongo_connection import connections
+    connections.close()
+
+
+def post_fork(server, worker):
+    """Start the worker without the master's client, with a pool sized for this worker's threads"""
+    import database
+    import live_events
+    database.reset_db()
+    # Sized for every thread: with no stream open all of them serve database-backed requests,
+    # and a thread parked on a stream simply leaves its connection unused
+    database.connections.configure(workers=server.cfg.workers, threads=server.cfg.threads)
+    # Watch for live events from the worker's start, not from its first /api/events request
+    live_events.feed.ensure_started(lambda: database.get_db().db)
+
+
+def worker_exit(server, worker):
+    from mongo_connection import connections
+    connections.close()
@@ -18,6 +18,10 @@ from datetime import datetime
 from pymongo import MongoClient
 from werkzeug.security import generate_password_hash
 import logging
+from migrations import ASSIGNMENT_TICKET_INDEX_NAME
+from ticket_search import (
+    SEARCH_KEYS_FIELD, TICKET_LIST_SORT, TICKET_TEXT_INDEX_FIELDS, TICKET_TEXT_INDEX_NAME, TICKET_TEXT_INDEX_WEIGHTS
+)
 
 # Configure logging
 logging.basicConfig(
@@ -54,6 +58,7 @@ def create_collections(db):
         'members',
         'ticket_assignments',
         'ticket_metadata',
+        'ticket_metadata_docs',  # One metadata document per ticket (metadata_store.py)
         'technicians',
         'ticket_statuses',
         'roles',
@@ -87,6 +92,19 @@ def create_indexes(db):
         db.tickets.create_index([("processing_method", 1)], background=False)
         db.tickets.create_index([("has_warranty", 1), ("created_at", -1)], background=False)
         db.tickets.create_index([("has_attachments", 1), ("status", 1)], background=False)
+        # Main ticket list sort / keyset pagination
+        ticket_list_sort = list(TICKET_LIST_SORT.items())
+        db.tickets.create_index(ticket_list_sort, background=False)
+        db.tickets.create_index([("status", 1)] + ticket_list_sort, background=False)
+        # Ticket search (see ticket_search.py): weighted text index and ID/registration prefix keys
+        db.tickets.create_index(
+            TICKET_TEXT_INDEX_FIELDS,
+            name=TICKET_TEXT_INDEX_NAME,
+            weights=TICKET_TEXT_INDEX_WEIGHTS,
+            default_language="english",
+            background=False
+        )
+        db.tickets.create_index([(SEARCH_KEYS_FIELD, 1)], background=False)
         logger.info("  ✅ Created tickets indexes")
     except Exception as e:
         logger.warning(f"  ⚠️  Some tickets indexes already exist: {e}")
@@ -101,10 +119,18 @@ def create_indexes(db):
     # Ticket assignments indexes
     try:
         db.ticket_assignments.create_index([("ticket_id", 1), ("member_id", 1)], background=False)
+        db.ticket_assignments.create_index("ticket_id", unique=True, name=ASSIGNMENT_TICKET_INDEX_NAME, background=False)
         logger.info("  ✅ Created ticket_assignments indexes")
     except Exception as e:
         logger.warning(f"  ⚠️  Some ticket_assignments indexes already exist: {e}")
     
+    # Materialized dashboard counters (daily rollups read by date range)
+    try:
+        db.ticket_stats.create_index([("day", 1)], background=False)
+        logger.info("  ✅ Created ticket_stats indexes")
+    except Exception as e:
+        logger.warning(f"  ⚠️  Some ticket_stats indexes already exist: {e}")
+    
     # Ticket metadata indexes
     try:
         db.ticket_metadata.create_index([("ticket_id", 1), ("key", 1)], background=False)
@@ -287,7 +313,7 @@ def verify_database_setup(db):
     collections = db.list_collection_names()
     expected_collections = [
         'tickets', 'replies', 'members', 'ticket_assignments',
-        'ticket_metadata', 'technicians', 'ticket_statuses', 'roles', 'common_documents',
+        'ticket_metadata', 'ticket_metadata_docs', 'technicians', 'ticket_statuses', 'roles', 'common_documents',
         'common_document_metadata'  # 🚀 NEW: Collection for common document metadata
     ]
     
@@ -345,6 +371,7 @@ def main():
             logger.info("  1. Update your Vercel environment variables with the new MONGODB_URI")
             logger.info("  2. Redeploy your application")
             logger.info("  3. Test the login with the default credentials")
+            logger.info("  4. Run 'python migrate.py' after each deploy to apply schema migrations")
         else:
             logger.error("❌ Database initialization completed with errors")
             sys.exit(1)
@@ -0,0 +1,291 @@
+"""
+Live Event Feed for AutoAssistGroup Support System
+
+Pushes ticket activity to open dashboards and ticket pages instead of
+having every browser poll for it. Events:
+
+  ticket_created      a ticket was inserted
+  reply_created       a reply was added to a ticket
+  unread_changed      a ticket's has_unread_reply flag changed
+  status_changed      a ticket's status changed
+  assignment_changed  a ticket was assigned, taken over or forwarded
+
+Each worker process keeps the most recent events in an in-process broker
+that the SSE (/api/events/stream) and long-poll (/api/events/poll)
+endpoints wait on. The broker is fed by one thread per worker tailing a
+MongoDB change stream, so writes made by any worker (or by n8n webhooks,
+or directly in the shell) reach every subscriber. Change streams need a
+replica set (Atlas always is one); against a standalone server the feed
+falls back to events recorded by database.py's own write paths, which
+only reach subscribers of the worker that made the write.
+
+Event ids are derived from the change's cluster time, so they are ordered
+the same way in every worker and a browser can resume (Last-Event-ID) on
+whichever worker it reconnects to. Each broker knows the position its feed
+has delivered from (the operation time the change stream was opened at,
+moved forward whenever the stream had to be reopened without resuming).
+A cursor older than that, or older than what the broker still holds, gets
+a 'resync' event, telling the page to reload its data. gunicorn starts the
+feed in post_fork, so a fresh worker covers events from its own start.
+
+Streaming responses hold a request thread, so each worker serves at most
+LIVE_STREAM_SLOTS streams and long polls at once; beyond that the stream
+endpoint refuses (the browser falls back to polling) and polls return
+without waiting.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import pymongo
+
+TICKET_CREATED = 'ticket_created'
+REPLY_CREATED = 'reply_created'
+UNREAD_CHANGED = 'unread_changed'
+STATUS_CHANGED = 'status_changed'
+ASSIGNMENT_CHANGED = 'assignment_changed'
+
+EVENT_BUFFER_SIZE = 1000
+# Concurrent streams and long polls per worker process
+LIVE_STREAM_SLOTS = int(os.environ.get('LIVE_STREAM_SLOTS', 8))
+# Error codes: change streams on a standalone server, resume point no longer in the oplog
+CHANGE_STREAMS_UNSUPPORTED = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Only the changes pages care about, trimmed to the fields the events carry
+CHANGE_STREAM_PIPELINE = [
+    {"$match": {"$or": [
+        {"ns.coll": {"$in": ["tickets", "replies"]}, "operationType": "insert"},
+        {"ns.coll": "tickets", "operationType": "update", "$or": [
+            {"updateDescription.updatedFields.has_unread_reply": {"$exists": True}},
+            {"updateDescription.updatedFields.status": {"$exists": True}},
+        ]},
+        {"ns.coll": "ticket_assignments", "operationType": {"$in": ["insert", "replace", "update"]}},
+    ]}},
+    {"$project": {
+        "operationType": 1,
+        "ns": 1,
+        "clusterTime": 1,
+        "updateDescription.updatedFields.has_unread_reply": 1,
+        "updateDescription.updatedFields.status": 1,
+        "fullDocument.ticket_id": 1,
+        "fullDocument.subject": 1,
+        "fullDocument.name": 1,
+        "fullDocument.status": 1,
+        "fullDocument.priority": 1,
+        "fullDocument.has_unread_reply": 1,
+        "fullDocument.sender": 1,
+        "fullDocument.member_id": 1,
+        "fullDocument.is_forwarded": 1,
+        "fullDocument.version": 1,
+    }},
+]
+
+
+def format_cursor(position):
+    return '-'.join(str(part) for part in position)
+
+
+def parse_cursor(cursor):
+    """(seconds, increment, index) from an event id, or None if it is not one"""
+    try:
+        parts = tuple(int(part) for part in str(cursor).split('-'))
+    except (TypeError, ValueError):
+        return None
+    return parts if len(parts) == 3 else None
+
+
+class LiveEventBroker:
+    """Recent events of this worker process, with blocking waits for subscribers"""
+
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=buffer_size)  # (position, event), ascending position
+        self._covered_from = None  # position the feed delivers events from; None until it is running
+        self._local_sequence = 0
+        self.published = 0
+
+    def publish(self, event_type, data, position=None):
+        """Add an event; position is (cluster time seconds, increment, index) for change stream events"""
+        with self._condition:
+            if position is None:
+                # Write-path events: ordered by wall clock, then by arrival within the second
+                self._local_sequence += 1
+                position = (int(time.time()), 0, self._local_sequence)
+            if self._events and position <= self._events[-1][0]:
+                # Changes committed together share a cluster time; keep them in arrival order
+                latest = self._events[-1][0]
+                position = latest[:2] + (latest[2] + 1,)
+            event = dict(data, type=event_type, id=format_cursor(position))
+            self._events.append((position, event))
+            self.published += 1
+            self._condition.notify_all()
+
+    def restart(self, position):
+        """The feed delivers events from position on: drop what was buffered before the gap, wake waiters to resync"""
+        with self._condition:
+            self._events.clear()
+            self._covered_from = position
+            self._condition.notify_all()
+
+    def latest_cursor(self):
+        with self._condition:
+            if self._events:
+                return format_cursor(self._events[-1][0])
+            position = (int(time.time()), 0, 0)
+            if self._covered_from is not None and self._covered_from > position:
+                position = self._covered_from
+            return format_cursor(position)
+
+    def _after(self, position):
+        """(events after position, whether events the caller has not seen may have been dropped)"""
+        if position is None:
+            return [], True
+        if self._covered_from is None:
+            # The feed is not delivering yet; restart() wakes waiters once it knows what it covers
+            return [], False
+        # Older than this process's memory: either buffered events were dropped or the feed started after it
+        oldest = self._events[0][0] if len(self._events) == self._events.maxlen else self._covered_from
+        if position < oldest:
+            return [], True
+        events = []
+        for event_position, event in reversed(self._events):
+            if event_position <= position:
+                break
+            events.append(event)
+        events.reverse()
+        return events, False
+
+    def events_after(self, cursor):
+        with self._condition:
+            return self._after(parse_cursor(cursor))
+
+    def wait(self, cursor, timeout):
+        """Events after cursor, waiting up to timeout seconds for the first one"""
+        position = parse_cursor(cursor)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events, resync = self._after(position)
+                remaining = deadline - time.monotonic()
+                if events or resync or remaining <= 0:
+                    return events, resync
+                self._condition.wait(remaining)
+
+
+class ChangeStreamFeed:
+    """One thread per worker process publishing MongoDB change stream events to the broker"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        # None until the first watch attempt; False on a standalone server (write paths publish instead)
+        self.supported = None
+
+    def ensure_started(self, database_factory):
+        """Start the watcher in this process if it is not running (threads do not survive fork)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                self.supported = None
+            if self.supported is False:
+                return
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, args=(database_factory,), name='live-events', daemon=True)
+            self._thread.start()
+
+    def _run(self, database_factory):
+        resume_token = None
+        backoff = 1
+        while True:
+            try:
+                database = database_factory()
+                start_at = None
+                if resume_token is None:
+                    # Not resuming: watch from the server's current time, which becomes the broker's coverage
+                    start_at = database.command('ping').get('operationTime')
+                with database.watch(
+                    CHANGE_STREAM_PIPELINE, full_document='updateLookup',
+                    resume_after=resume_token, start_at_operation_time=start_at
+                ) as stream:
+                    self.supported = True
+                    if resume_token is None:
+                        # Whatever happened before start_at was missed: cursors from before it must resync
+                        self.broker.restart((start_at.time, start_at.inc, 0) if start_at else (int(time.time()), 0, 0))
+                    resume_token = stream.resume_token
+                    backoff = 1
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self._publish(change)
+            except pymongo.errors.OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    self.supported = False
+                    self.broker.restart((int(time.time()), 0, 0))
+                    logging.info("[LIVE] Change streams need a replica set; live events come from this worker's writes only")
+                    return
+                logging.warning(f"[LIVE] Change stream failed: {e}")
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    resume_token = None
+            except Exception as e:
+                logging.warning(f"[LIVE] Change stream interrupted: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _publish(self, change):
+        collection = change['ns']['coll']
+        operation = change['operationType']
+        document = change.get('fullDocument') or {}
+        ticket_id = document.get('ticket_id')
+        if not ticket_id:
+            return
+        at = (change['clusterTime'].time, change['clusterTime'].inc)
+
+        if collection == 'tickets' and operation == 'insert':
+            self.broker.publish(TICKET_CREATED, {
+                key: document.get(key) for key in ('ticket_id', 'subject', 'name', 'status', 'priority')
+            }, at + (0,))
+        elif collection == 'tickets':
+            updated = change.get('updateDescription', {}).get('updatedFields', {})
+            if 'has_unread_reply' in updated:
+                self.broker.publish(UNREAD_CHANGED, {
+                    'ticket_id': ticket_id, 'has_unread_reply': bool(updated['has_unread_reply'])
+                }, at + (0,))
+            if 'status' in updated:
+                self.broker.publish(STATUS_CHANGED, {'ticket_id': ticket_id, 'status': updated['status']}, at + (1,))
+        elif collection == 'replies':
+            self.broker.publish(REPLY_CREATED, {'ticket_id': ticket_id, 'sender': document.get('sender')}, at + (0,))
+        elif collection == 'ticket_assignments':
+            self.broker.publish(ASSIGNMENT_CHANGED, assignment_event(document), at + (0,))
+
+
+def assignment_event(assignment):
+    return {
+        'ticket_id': assignment.get('ticket_id'),
+        'member_id': str(assignment['member_id']) if assignment.get('member_id') else None,
+        'is_forwarded': bool(assignment.get('is_forwarded')),
+        'version': assignment.get('version'),
+    }
+
+
+broker = LiveEventBroker()
+feed = ChangeStreamFeed(broker)
+# Held by each open stream or waiting long poll in this worker process
+slots = threading.BoundedSemaphore(LIVE_STREAM_SLOTS)
+
+
+def record(event_type, data):
+    """Publish an event from a database.py write path when no change stream is delivering it"""
+    # Until the first watch attempt answers, a change stream may still deliver this write
+    if feed.supported is False:
+        broker.publish(event_type, data)
@@ -0,0 +1,204 @@
+"""
+Ticket Metadata Documents for AutoAssistGroup Support System
+
+Stores a ticket's metadata as one document in 'ticket_metadata_docs' instead
+of one 'ticket_metadata' row per (ticket, key):
+
+    {'_id': ticket_id, 'fields': {key: value, ...}, 'updated_at': datetime, 'migrated': True}
+
+Values are native BSON. JSON object strings (attachment metadata, warranty
+flags) are parsed once when written, with the same trailing-comma repair the
+readers used to apply, so list and detail views no longer json.loads every
+value on every request. A detail view reads one document by _id and a list
+page one document per ticket, instead of one row per key.
+
+Until migration 6 has copied a ticket's legacy rows (its document is marked
+'migrated'), reads merge those rows underneath the document's fields.
+metadata_rows() lays fields out in the old {ticket_id, key, value} row format
+for callers that iterate rows; values stay native, so callers take
+sub-documents as they are (decode_value() still parses a legacy JSON string).
+
+A document's updated_at is its last write (for migrated tickets, the newest
+legacy row's), which is what delete_older_than() ages it by.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import json
+import logging
+from datetime import datetime
+
+import pymongo
+
+METADATA_DOCS_COLLECTION = 'ticket_metadata_docs'
+
+
+def _encode_key(key):
+    """Metadata keys become field names, which may not contain '.' or start with '$'"""
+    key = str(key).replace('.', '\uff0e')
+    return '\uff04' + key[1:] if key.startswith('$') else key
+
+
+def _decode_key(key):
+    key = key.replace('\uff0e', '.')
+    return '$' + key[1:] if key.startswith('\uff04') else key
+
+
+def _storable(value):
+    """Whether a parsed JSON value can be stored as-is (no '.' or '$' field names)"""
+    if isinstance(value, dict):
+        return all('.' not in key and not key.startswith('$') and _storable(item) for key, item in value.items())
+    if isinstance(value, list):
+        return all(_storable(item) for item in value)
+    return True
+
+
+def decode_value(value):
+    """Native value for a metadata value: JSON object strings become sub-documents, anything else is kept"""
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    if not text.startswith('{'):
+        return value
+    # Same trailing comma repair the readers used to apply on every read
+    if text.endswith(',}'):
+        text = text[:-2] + '}'
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return value
+    return parsed if isinstance(parsed, dict) and _storable(parsed) else value
+
+
+def metadata_rows(ticket_id, fields):
+    """Fields in the old get_ticket_metadata row format, with native values"""
+    return [{"ticket_id": ticket_id, "key": key, "value": value} for key, value in fields.items()]
+
+
+class TicketMetadataStore:
+    def __init__(self, database):
+        self.collection = database[METADATA_DOCS_COLLECTION]
+        self.legacy = database.ticket_metadata
+        # Set once migration 6 is recorded; legacy rows are then never read
+        self.legacy_migrated = False
+
+    def _legacy_fields(self, ticket_ids, keys=None):
+        """Fields from legacy rows, the most recently written row winning for repeated keys"""
+        query = {"ticket_id": {"$in": ticket_ids}}
+        if keys:
+            query["key"] = {"$in": list(keys)}
+        rows = sorted(
+            self.legacy.find(query, {"_id": 0, "ticket_id": 1, "key": 1, "value": 1, "created_at": 1, "updated_at": 1}),
+            key=lambda row: row.get("updated_at") or row.get("created_at") or datetime.min
+        )
+        fields = {}
+        for row in rows:
+            if row.get("key") is not None:
+                fields.setdefault(row["ticket_id"], {})[row["key"]] = decode_value(row.get("value"))
+        return fields
+
+    def get_many(self, ticket_ids, keys=None):
+        """{ticket_id: {key: value}} for many tickets in one query (plus one for unmigrated legacy rows)"""
+        ticket_ids = [ticket_id for ticket_id in dict.fromkeys(ticket_ids or []) if ticket_id]
+        if not ticket_ids:
+            return {}
+        projection = {"migrated": 1}
+        if keys:
+            projection.update({f"fields.{_encode_key(key)}": 1 for key in keys})
+        else:
+            projection["fields"] = 1
+        docs = {doc["_id"]: doc for doc in self.collection.find({"_id": {"$in": ticket_ids}}, projection)}
+
+        unmigrated = [] if self.legacy_migrated else [
+            ticket_id for ticket_id in ticket_ids if not docs.get(ticket_id, {}).get("migrated")
+        ]
+        legacy = self._legacy_fields(unmigrated, keys) if unmigrated else {}
+
+        result = {}
+        for ticket_id in ticket_ids:
+            fields = legacy.get(ticket_id, {})
+            fields.update({_decode_key(key): value for key, value in (docs.get(ticket_id, {}).get("fields") or {}).items()})
+            result[ticket_id] = fields
+        return result
+
+    def get(self, ticket_id):
+        """{key: value} for one ticket"""
+        return self.get_many([ticket_id]).get(ticket_id, {})
+
+    def set_many(self, ticket_id, mapping):
+        """Set several keys on the ticket's document in one atomic upsert"""
+        if not ticket_id or not mapping:
+            return
+        update = {f"fields.{_encode_key(key)}": decode_value(value) for key, value in mapping.items()}
+        update["updated_at"] = datetime.now()
+        self.collection.update_one({"_id": ticket_id}, {"$set": update}, upsert=True)
+
+    def delete(self, ticket_id, key):
+        """Remove one key; returns how many entries (document field or legacy rows) were removed"""
+        result = self.collection.update_one(
+            {"_id": ticket_id, f"fields.{_encode_key(key)}": {"$exists": True}},
+            {"$unset": {f"fields.{_encode_key(key)}": ""}, "$set": {"updated_at": datetime.now()}}
+        )
+        # Legacy rows would otherwise reappear underneath an unmigrated document
+        return result.modified_count + self.legacy.delete_many({"ticket_id": ticket_id, "key": key}).deleted_count
+
+    def delete_ticket(self, ticket_id):
+        self.collection.delete_one({"_id": ticket_id})
+        self.legacy.delete_many({"ticket_id": ticket_id})
+
+    def delete_older_than(self, cutoff):
+        """Remove metadata not written since cutoff; returns the number of documents and rows removed"""
+        return (self.collection.delete_many({"updated_at": {"$lt": cutoff}}).deleted_count +
+                self.legacy.delete_many({"$expr": {"$lt": [{"$ifNull": ["$updated_at", "$created_at"]}, cutoff]}}).deleted_count)
+
+    def _legacy_ticket_ids(self):
+        return [row["_id"] for row in self.legacy.aggregate([{"$group": {"_id": "$ticket_id"}}], allowDiskUse=True)
+                if row["_id"]]
+
+    def _legacy_written(self, ticket_ids):
+        """{ticket_id: time of the ticket's newest legacy row}"""
+        return {row["_id"]: row["written"] for row in self.legacy.aggregate([
+            {"$match": {"ticket_id": {"$in": ticket_ids}}},
+            {"$group": {"_id": "$ticket_id", "written": {"$max": {"$ifNull": ["$updated_at", "$created_at"]}}}}
+        ])}
+
+    def _migrated_ids(self, ticket_ids):
+        return {doc["_id"] for doc in self.collection.find({"_id": {"$in": ticket_ids}, "migrated": True}, {"_id": 1})}
+
+    def unmigrated_count(self, batch_size=1000):
+        """Tickets that still have legacy rows not copied into a document"""
+        ticket_ids = self._legacy_ticket_ids()
+        return sum(
+            len(batch) - len(self._migrated_ids(batch))
+            for batch in (ticket_ids[i:i + batch_size] for i in range(0, len(ticket_ids), batch_size))
+        )
+
+    def migrate(self, batch_size=500):
+        """Copy legacy rows into per-ticket documents; fields already written to a document win"""
+        ticket_ids = self._legacy_ticket_ids()
+        migrated = 0
+        for start in range(0, len(ticket_ids), batch_size):
+            batch = ticket_ids[start:start + batch_size]
+            done = self._migrated_ids(batch)
+            pending = [ticket_id for ticket_id in batch if ticket_id not in done]
+            if not pending:
+                continue
+            legacy = self._legacy_fields(pending)
+            written = self._legacy_written(pending)
+            now = datetime.now()
+            operations = [
+                pymongo.UpdateOne({"_id": ticket_id}, [{"$set": {
+                    "fields": {"$mergeObjects": [
+                        {"$literal": {_encode_key(key): value for key, value in legacy.get(ticket_id, {}).items()}},
+                        {"$ifNull": ["$fields", {}]}
+                    ]},
+                    # The rows' own age, so delete_older_than() treats migrated tickets like legacy rows
+                    "updated_at": {"$ifNull": ["$updated_at", written.get(ticket_id) or now]},
+                    "migrated": True
+                }}], upsert=True)
+                for ticket_id in pending
+            ]
+            self.collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+            logging.info(f"[METADATA] Migrated metadata for {migrated} tickets so far")
+        return migrated
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+AutoAssistGroup Schema Migration Script
+
+Provisions indexes and seed data, then applies pending schema/data
+migrations (see migrations.py) to the database in MONGODB_URI. Run it on
+every deploy: app workers no longer build indexes or seed data at startup.
+Each migration runs once per database; a lock prevents two deploys from
+running them at the same time.
+
+Usage:
+    python migrate.py              # provision, then apply all pending migrations
+    python migrate.py status       # list applied and pending migrations
+    python migrate.py up --to 3    # apply migrations up to version 3
+    python migrate.py reconcile-stats  # rebuild the dashboard counters (schedule hourly, e.g. from cron)
+
+Author: AutoAssistGroup Development Team
+"""
+
+import argparse
+import logging
+import sys
+
+from database import get_db
+from migrations import MigrationError, MigrationRunner
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """Apply pending migrations or show migration status"""
+    parser = argparse.ArgumentParser(description="AutoAssistGroup schema migrations")
+    parser.add_argument('command', nargs='?', choices=['up', 'status', 'reconcile-stats'], default='up')
+    parser.add_argument('--to', type=int, default=None, help="apply migrations up to this version")
+    parser.add_argument('--skip-provision', action='store_true', help="do not create indexes or seed data")
+    args = parser.parse_args()
+
+    try:
+        runner = MigrationRunner(get_db())
+    except Exception as e:
+        logger.error(f"❌ Could not connect to the database: {e}")
+        sys.exit(1)
+
+    if args.command == 'status':
+        for migration in runner.status():
+            state = f"applied {migration['applied_at']:%Y-%m-%d %H:%M}" if migration['applied_at'] else "pending"
+            logger.info(f"  {migration['version']:>4}  {state:<24} {migration['name']}")
+        return
+
+    if args.command == 'reconcile-stats':
+        corrected = runner.db.ticket_stats.reconcile()
+        logger.info(f"✅ Dashboard counters reconciled ({corrected} documents corrected)")
+        return
+
+    try:
+        applied = runner.run(target=args.to, provision=not args.skip_provision)
+    except MigrationError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    if applied:
+        logger.info(f"🎉 Applied migrations {', '.join(str(version) for version in applied)}")
+    else:
+        logger.info("✅ Database schema is up to date")
+
+    if not runner.db.ticket_stats.is_built():
+        # First deploy with materialized counters: build them here rather than on a dashboard request
+        corrected = runner.db.ticket_stats.reconcile()
+        logger.info(f"✅ Built dashboard counters ({corrected} documents)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Schema Migrations for AutoAssistGroup Support System
+
+Ordered, idempotent data migrations that run once per database instead of
+on every request. Applied versions are recorded in the 'schema_migrations'
+collection, and a lease-based lock document in the same collection makes
+sure only one process (a deploy hook, the CLI or an admin request) runs
+migrations at a time.
+
+Each run first provisions the schema (indexes, default users, technicians,
+statuses and roles - MongoDB.init_database) so worker startup never has to;
+at connect time MongoDB only compares the applied version with
+SCHEMA_VERSION.
+
+Run pending migrations with:
+    python migrate.py
+
+Adding a migration: append a Migration with the next version number to
+MIGRATIONS. Steps must be safe to re-run; a step whose 'remaining' check
+still finds unmigrated records is not recorded and runs again next time.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import logging
+import os
+import socket
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pymongo
+
+from ticket_search import SEARCH_KEYS_FIELD
+
+SCHEMA_MIGRATIONS_COLLECTION = 'schema_migrations'
+# Unique ticket_id index on ticket_assignments (migration 5) that assign_ticket relies on
+ASSIGNMENT_TICKET_INDEX_NAME = 'ticket_id_unique'
+# Once applied, ticket metadata is read from metadata documents only (see metadata_store)
+METADATA_DOCUMENTS_MIGRATION = 6
+LOCK_ID = 'lock'
+LOCK_LEASE = timedelta(minutes=30)
+
+# apply(db) does the work; remaining(db), if given, counts records still to migrate
+Migration = namedtuple('Migration', ['version', 'name', 'apply', 'remaining'])
+
+
+class MigrationError(Exception):
+    pass
+
+
+class MigrationLockError(MigrationError):
+    pass
+
+
+def _tickets_missing_list_flags(db):
+    return db.tickets.count_documents({"$or": [
+        {"has_unread_reply": {"$exists": False}},
+        {"is_important": {"$exists": False}}
+    ]})
+
+
+def _replies_missing_sender(db):
+    return db.replies.count_documents({"sender": {"$exists": False}})
+
+
+def _tickets_missing_read_model(db):
+    return db.tickets.count_documents({SEARCH_KEYS_FIELD: {"$exists": False}})
+
+
+def _tickets_with_duplicate_assignments(db):
+    duplicates = len(list(db.ticket_assignments.aggregate([
+        {"$group": {"_id": "$ticket_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)))
+    if duplicates:
+        return duplicates
+    # A duplicate inserted between the clean-up and create_index leaves the unique index missing
+    return 0 if ASSIGNMENT_TICKET_INDEX_NAME in db.ticket_assignments.index_information() else 1
+
+
+MIGRATIONS = [
+    Migration(1, 'Default has_unread_reply and is_important on tickets',
+              lambda db: db.migrate_has_unread_reply_field(), _tickets_missing_list_flags),
+    Migration(2, "Add 'sender' to replies",
+              lambda db: db.update_replies_add_sender_field(), _replies_missing_sender),
+    Migration(3, 'Denormalize technician, registration, warranty flag and search keys onto tickets',
+              lambda db: db.backfill_ticket_read_model(), _tickets_missing_read_model),
+    # Undecodable payloads are deliberately left inline, so there is no remaining check; a failed
+    # run raises instead of being recorded
+    Migration(4, 'Move attachment payloads to GridFS',
+              lambda db: db.migrate_attachments_to_gridfs(), None),
+    Migration(5, 'Keep one assignment per ticket and add a unique ticket_id index',
+              lambda db: db.dedupe_ticket_assignments(), _tickets_with_duplicate_assignments),
+    Migration(METADATA_DOCUMENTS_MIGRATION, 'Move ticket_metadata key/value rows into one document per ticket',
+              lambda db: db.migrate_ticket_metadata_documents(), lambda db: db.ticket_metadata_store.unmigrated_count()),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+class MigrationRunner:
+    def __init__(self, db, migrations=MIGRATIONS):
+        self.db = db
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.collection = db.db[SCHEMA_MIGRATIONS_COLLECTION]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def applied(self):
+        """Applied migration records keyed by version"""
+        return {doc['_id']: doc for doc in self.collection.find({'_id': {'$type': 'number'}})}
+
+    def current_version(self):
+        return max(self.applied(), default=0)
+
+    def pending(self):
+        applied = self.applied()
+        return [migration for migration in self.migrations if migration.version not in applied]
+
+    def status(self):
+        """Every known migration with when (if ever) it was applied"""
+        applied = self.applied()
+        return [{
+            'version': migration.version,
+            'name': migration.name,
+            'applied_at': applied.get(migration.version, {}).get('applied_at'),
+        } for migration in self.migrations]
+
+    def _acquire_lock(self):
+        now = datetime.now()
+        try:
+            self.collection.find_one_and_update(
+                {'_id': LOCK_ID, '$or': [{'expires_at': {'$lt': now}}, {'owner': self.owner}]},
+                {'$set': {'owner': self.owner, 'acquired_at': now, 'expires_at': now + LOCK_LEASE}},
+                upsert=True
+            )
+            return True
+        except pymongo.errors.DuplicateKeyError:
+            # The lock document exists and another owner's lease has not expired
+            return False
+
+    def _release_lock(self):
+        self.collection.delete_one({'_id': LOCK_ID, 'owner': self.owner})
+
+    def run(self, target=None, provision=True):
+        """Provision the schema, then apply pending migrations (up to target if given); returns the versions applied"""
+        if not self._acquire_lock():
+            holder = self.collection.find_one({'_id': LOCK_ID}) or {}
+            raise MigrationLockError(
+                f"Migrations are locked by {holder.get('owner')} until {holder.get('expires_at')}"
+            )
+        applied_versions = []
+        try:
+            if provision:
+                logging.info("[MIGRATIONS] Provisioning indexes and seed data")
+                if not self.db.init_database():
+                    raise MigrationError("Provisioning indexes and seed data failed; see the log for details")
+            for migration in self.pending():
+                if target is not None and migration.version > target:
+                    break
+                # Keep the lease alive across long migrations; stop if another runner took it over
+                if not self._acquire_lock():
+                    raise MigrationLockError(f"Lost the migration lock before applying {migration.version}")
+                logging.info(f"[MIGRATIONS] Applying {migration.version}: {migration.name}")
+                started = datetime.now()
+                try:
+                    result = migration.apply(self.db)
+                except MigrationError:
+                    raise
+                except Exception as e:
+                    raise MigrationError(f"Migration {migration.version} failed: {e}; not recorded") from e
+                remaining = migration.remaining(self.db) if migration.remaining else 0
+                if remaining:
+                    raise MigrationError(
+                        f"Migration {migration.version} left {remaining} records unmigrated; not recorded"
+                    )
+                self.collection.insert_one({
+                    '_id': migration.version,
+                    'name': migration.name,
+                    'applied_at': datetime.now(),
+                    'duration_ms': int((datetime.now() - started).total_seconds() * 1000),
+                    'applied_by': self.owner,
+                    'result': result if isinstance(result, (bool, int, float, str, dict)) else str(result),
+                })
+                applied_versions.append(migration.version)
+                logging.info(f"[MIGRATIONS] Applied {migration.version} in {datetime.now() - started}")
+            return applied_versions
+        finally:
+            self._release_lock()
@@ -0,0 +1,229 @@
+"""
+MongoDB Connection Management for AutoAssistGroup Support System
+
+Owns the process-wide MongoClient. A MongoClient is not fork-safe, so with
+gunicorn's preload_app the master must not hand its client to the workers:
+the gunicorn hooks (gunicorn.conf.py) call close() in the master before
+forking and reset() in each worker after it, and the client is built lazily
+in the worker on first use. A client created in another process (any other
+fork) is detected by PID and replaced.
+
+The pool is sized from the server's concurrency: each request thread holds
+at most one connection at a time, so a worker needs one connection per
+thread plus a little headroom for background work. PoolMetrics records
+checkouts and how long threads waited for a connection, so queueing on
+the pool shows up in /api/admin/db-pool.
+
+Key Features:
+- Fork-safe lazy client creation
+- Pool size derived from gunicorn workers x threads
+- Connection pool wait-time and checkout metrics
+
+Author: AutoAssistGroup Development Team
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from pymongo import MongoClient, monitoring
+
+# Serverless / single-threaded default, as before
+DEFAULT_MAX_POOL_SIZE = 10
+# Connections beyond one per request thread (background threads, change streams, GridFS reads)
+POOL_HEADROOM = 2
+# Waits longer than this count as "slow" checkouts
+SLOW_CHECKOUT_MS = 50
+# Number of recent checkout waits kept for percentiles
+WAIT_SAMPLE_SIZE = 1000
+
+
+def pool_size_for(threads):
+    """maxPoolSize for a worker process serving requests on the given number of threads"""
+    return max(int(threads), 1) + POOL_HEADROOM
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool listener counting checkouts and measuring how long each one waited"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = Counter()
+            self.slow_checkouts = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.total_wait_ms = 0.0
+            self.max_wait_ms = 0.0
+            self.recent_waits_ms = deque(maxlen=WAIT_SAMPLE_SIZE)
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.pool_clears = 0
+            self.since = time.time()
+
+    def _wait_ms(self):
+        started = getattr(self._local, 'checkout_started', None)
+        self._local.checkout_started = None
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    # Checkout events are published on the thread that requested the connection
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.recent_waits_ms.append(wait_ms)
+            if wait_ms > SLOW_CHECKOUT_MS:
+                self.slow_checkouts += 1
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.checkout_failures[event.reason] += 1
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            logging.warning(f"[DATABASE] Timed out after {wait_ms:.0f}ms waiting for a pooled connection to {event.address}")
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self.recent_waits_ms)
+            return {
+                'since': self.since,
+                'checkouts': self.checkouts,
+                'checkout_failures': dict(self.checkout_failures),
+                'slow_checkouts': self.slow_checkouts,
+                'slow_checkout_ms': SLOW_CHECKOUT_MS,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'avg_wait_ms': self.total_wait_ms / self.checkouts if self.checkouts else 0,
+                'p95_wait_ms': waits[int(len(waits) * 0.95)] if waits else 0,
+                'max_wait_ms': self.max_wait_ms,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'pool_clears': self.pool_clears,
+            }
+
+
+class MongoConnectionManager:
+    """Builds the MongoClient on first use in each process, sized for that process's request threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self.metrics = PoolMetrics()
+        self.workers = 1
+        self.threads = 1
+        self.max_pool_size = int(os.environ.get('MONGODB_MAX_POOL_SIZE', DEFAULT_MAX_POOL_SIZE))
+
+    def configure(self, workers, threads):
+        """Size the pool for a server running `workers` processes of `threads` request threads each"""
+        self.workers = max(int(workers), 1)
+        self.threads = max(int(threads), 1)
+        self.max_pool_size = int(os.environ.get('MONGODB_MAX_POOL_SIZE', pool_size_for(self.threads)))
+        logging.info(
+            f"[DATABASE] Pool sized for {self.workers} workers x {self.threads} threads: "
+            f"maxPoolSize={self.max_pool_size} per worker, up to {self.workers * self.max_pool_size} connections"
+        )
+
+    def client(self, connection_string):
+        """The MongoClient for this process, created on first use (and again after a fork)"""
+        pid = os.getpid()
+        if self._client is not None and self._pid == pid:
+            return self._client
+        with self._lock:
+            if self._client is None or self._pid != pid:
+                # Never close a client inherited across fork: its sockets belong to the parent
+                self.metrics.reset()
+                self._client = MongoClient(
+                    connection_string,
+                    maxPoolSize=self.max_pool_size,
+                    minPoolSize=1,   # Minimal idle connections
+                    maxIdleTimeMS=30000,  # 30 seconds idle time
+                    waitQueueTimeoutMS=10000,  # Fail (and log) instead of queueing forever for a connection
+                    serverSelectionTimeoutMS=5000,  # Faster timeout
+                    connectTimeoutMS=10000,  # Faster connection timeout
+                    socketTimeoutMS=20000,   # Shorter socket timeout
+                    heartbeatFrequencyMS=60000,  # Less frequent heartbeats
+                    retryWrites=True,
+                    retryReads=True,
+                    w='majority',
+                    readPreference='primaryPreferred',
+                    maxConnecting=2,
+                    event_listeners=[self.metrics]
+                )
+                self._pid = pid
+        return self._client
+
+    def owns(self, client):
+        """Whether client is this process's current client"""
+        return client is self._client and self._pid == os.getpid()
+
+    def reset(self):
+        """Forget the current client without closing it (gunicorn post_fork)"""
+        with self._lock:
+            self._client = None
+            self._pid = None
+
+    def close(self):
+        """Close this process's client (gunicorn pre_fork in the master, worker_exit in workers)"""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'connected': self._client is not None and self._pid == os.getpid(),
+            'workers': self.workers,
+            'threads': self.threads,
+            'max_pool_size': self.max_pool_size,
+            'metrics': self.metrics.snapshot(),
+        }
+
+
+# Process-wide connection manager used by database.MongoDB
+connections = MongoConnectionManager()
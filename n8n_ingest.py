@@ -0,0 +1,416 @@
+"""
+Streaming n8n Payload Ingestion for AutoAssistGroup Support System
+
+/api/n8n/email-tickets receives whole emails from n8n, attachments
+included, as one JSON body. Loading it with request.json holds the body,
+the parsed document and (for n8n's double-encoded items) a second parse of
+each nested JSON string in memory at once, before every attachment is
+base64-decoded yet again.
+
+parse_stream() reads the body in CHUNK_SIZE pieces through an incremental
+JSON parser instead. Short values are built as usual; a string under one
+of the attachment payload keys (ATTACHMENT_BLOB_KEYS) that grows past
+STREAM_THRESHOLD_CHARS is handled as it arrives:
+
+- base64 text is decoded quad by quad into a spool file while its SHA-256
+  and size are computed, then stored in the attachment store, and the
+  value becomes a StoredBlob reference ({'gridfs_id', 'size', 'sha256'})
+- a nested JSON document (n8n's {"data": "{\"fileName\": ...}"} items) is
+  fed to a nested parser, and the value becomes the parsed document
+- anything else is kept as an ordinary string
+
+Memory per request is bounded by the chunk size and the spool's in-memory
+limit rather than by the payload, so the route's size limit
+(N8N_MAX_PAYLOAD_MB) can sit well above Flask's MAX_CONTENT_LENGTH.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import base64
+import binascii
+import codecs
+import hashlib
+import json
+import logging
+import re
+import tempfile
+
+from attachment_store import ATTACHMENT_BLOB_KEYS
+
+# Bytes read from the request per parser step
+CHUNK_SIZE = 64 * 1024
+# Payload strings longer than this are streamed instead of built in memory
+STREAM_THRESHOLD_CHARS = 8 * 1024
+# Decoded bytes of one attachment kept in memory before the spool moves to disk
+SPOOL_MEMORY_BYTES = 1024 * 1024
+MAX_NESTING_DEPTH = 64
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_LITERAL_END = re.compile(r'[^0-9A-Za-z.+\-]')
+_BASE64_TEXT = re.compile(r'[A-Za-z0-9+/=\s]*')
+_NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+_WHITESPACE = ' \t\r\n'
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+# Parser states: what the next token may be
+_VALUE, _FIRST_VALUE, _KEY, _FIRST_KEY, _COLON, _COMMA, _DONE = range(7)
+
+
+class PayloadError(ValueError):
+    """The request body is not a JSON document"""
+
+
+class StoredBlob(dict):
+    """An attachment payload decoded into the attachment store while the request was parsed"""
+
+
+def _release(store, blobs):
+    for blob in blobs:
+        try:
+            store.release(blob['gridfs_id'])
+        except Exception as e:
+            logging.warning(f"[N8N_INGEST] Could not release stored payload {blob['gridfs_id']}: {e}")
+
+
+def parse_stream(stream, store, chunk_size=CHUNK_SIZE):
+    """Parse a UTF-8 JSON body read from a file-like stream; returns (document, stored blobs)
+
+    Each StoredBlob holds one attachment_store reference. The caller owns them
+    and releases (release_unused) the ones that end up on no record.
+    """
+    parser = _JSONParser(store, [])
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            parser.write(decoder.decode(chunk))
+        parser.write(decoder.decode(b'', final=True))
+        return parser.close(), parser.blobs
+    except UnicodeDecodeError as e:
+        _release(store, parser.blobs)
+        raise PayloadError(f'body is not UTF-8: {e}')
+    except BaseException:
+        _release(store, parser.blobs)
+        raise
+
+
+def release_unused(store, blobs, records):
+    """Release the stored blobs not referenced by an attachment of the given records"""
+    kept = {}
+    for record in records:
+        for attachment in record.get('attachments') or []:
+            if isinstance(attachment, dict) and attachment.get('gridfs_id'):
+                kept[attachment['gridfs_id']] = kept.get(attachment['gridfs_id'], 0) + 1
+    unused = []
+    for blob in blobs:
+        if kept.get(blob['gridfs_id']):
+            kept[blob['gridfs_id']] -= 1
+        else:
+            unused.append(blob)
+    _release(store, unused)
+    return len(unused)
+
+
+def load_embedded_json(value):
+    """The document in a double-encoded n8n value; values streamed by parse_stream arrive parsed already"""
+    if isinstance(value, StoredBlob):
+        raise ValueError('value is an attachment payload, not JSON')
+    if isinstance(value, (dict, list)):
+        return value
+    return json.loads(value)
+
+
+class _TextValue:
+    """A string value built in memory"""
+
+    def __init__(self, text=''):
+        self.parts = [text] if text else []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def close(self):
+        return ''.join(self.parts)
+
+
+class _Base64Value:
+    """A base64 string decoded into a spool file as it arrives, then stored"""
+
+    def __init__(self, store):
+        self.store = store
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.pending = ''
+        self.error = None
+
+    def _decode(self, quads):
+        try:
+            raw = base64.b64decode(quads)
+        except (binascii.Error, ValueError) as e:
+            self.error = e
+            return
+        self.spool.write(raw)
+        self.sha256.update(raw)
+        self.size += len(raw)
+
+    def write(self, text):
+        if self.error is not None:
+            return
+        text = self.pending + _NOT_BASE64.sub('', text)
+        whole = len(text) - len(text) % 4
+        self.pending = text[whole:]
+        if whole:
+            self._decode(text[:whole])
+
+    def close(self):
+        try:
+            if self.pending and self.error is None:
+                self._decode(self.pending + '=' * (-len(self.pending) % 4))
+            if self.error is not None:
+                # Same outcome as an undecodable inline payload: the attachment is kept without data
+                logging.warning(f"[N8N_INGEST] Dropping undecodable attachment payload: {self.error}")
+                return ''
+            digest = self.sha256.hexdigest()
+            self.spool.seek(0)
+            file_id = self.store.put_stream(self.spool, digest, self.size, 'attachment')
+        finally:
+            self.spool.close()
+        return StoredBlob(gridfs_id=file_id, size=self.size, sha256=digest)
+
+
+class _PayloadValue:
+    """Value of an attachment payload key: decided by its first STREAM_THRESHOLD_CHARS characters"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.head = []
+        self.head_length = 0
+        self.target = None
+
+    def write(self, text):
+        if self.target is not None:
+            self.target.write(text)
+            return
+        self.head.append(text)
+        self.head_length += len(text)
+        if self.head_length < STREAM_THRESHOLD_CHARS:
+            return
+        head = ''.join(self.head)
+        self.head = None
+        if head.lstrip().startswith('{'):
+            self.target = _JSONParser(self.parser.store, self.parser.blobs, self.parser.depth + 1)
+        elif _BASE64_TEXT.fullmatch(head):
+            self.target = _Base64Value(self.parser.store)
+        else:
+            self.target = _TextValue()
+        self.target.write(head)
+
+    def close(self):
+        if self.target is None:
+            return ''.join(self.head)
+        value = self.target.close()
+        if isinstance(value, StoredBlob):
+            self.parser.blobs.append(value)
+        return value
+
+
+class _JSONParser:
+    """Push parser: write() text as it arrives, close() for the document"""
+
+    def __init__(self, store, blobs, depth=0):
+        self.store = store
+        self.blobs = blobs
+        self.depth = depth
+        self.stack = []  # [container, pending key] of the open objects and arrays
+        self.result = None
+        self.state = _VALUE
+        self.string = None  # value being read while inside a string
+        self.string_is_key = False
+        self.escape = None  # characters after a backslash, across chunks
+        self.high_surrogate = None
+        self.literal = None  # number, true, false or null being read, across chunks
+
+    def write(self, text):
+        i, end = 0, len(text)
+        while i < end:
+            if self.string is not None:
+                i = self._read_string(text, i)
+                continue
+            if self.literal is not None:
+                match = _LITERAL_END.search(text, i)
+                stop = match.start() if match else end
+                self.literal += text[i:stop]
+                i = stop
+                if match:
+                    self._end_literal()
+                continue
+            char = text[i]
+            if char in _WHITESPACE:
+                i += 1
+                continue
+            self._token(char)
+            if self.literal is None:
+                i += 1
+
+    def close(self):
+        if self.literal is not None:
+            self._end_literal()
+        if self.string is not None or self.stack or self.state != _DONE:
+            raise PayloadError('unexpected end of JSON input')
+        return self.result
+
+    # Structure
+
+    def _token(self, char):
+        state = self.state
+        if state in (_VALUE, _FIRST_VALUE):
+            if char == '{':
+                self._open({}, _FIRST_KEY)
+            elif char == '[':
+                self._open([], _FIRST_VALUE)
+            elif char == '"':
+                self._start_string(key=False)
+            elif char == ']' and state == _FIRST_VALUE:
+                self._close_container(list)
+            elif char == '-' or char.isdigit() or char in 'tfn':
+                self.literal = ''
+            else:
+                raise PayloadError(f'unexpected {char!r} where a value was expected')
+        elif state in (_KEY, _FIRST_KEY):
+            if char == '"':
+                self._start_string(key=True)
+            elif char == '}' and state == _FIRST_KEY:
+                self._close_container(dict)
+            else:
+                raise PayloadError(f'unexpected {char!r} where a key was expected')
+        elif state == _COLON:
+            if char != ':':
+                raise PayloadError(f"expected ':' but found {char!r}")
+            self.state = _VALUE
+        elif state == _COMMA:
+            container = self.stack[-1][0]
+            if char == ',':
+                self.state = _KEY if isinstance(container, dict) else _VALUE
+            elif char == '}':
+                self._close_container(dict)
+            elif char == ']':
+                self._close_container(list)
+            else:
+                raise PayloadError(f"expected ',' but found {char!r}")
+        else:
+            raise PayloadError(f'unexpected {char!r} after the JSON document')
+
+    def _open(self, container, state):
+        if self.depth + len(self.stack) >= MAX_NESTING_DEPTH:
+            raise PayloadError('JSON nested too deeply')
+        self._value(container)
+        self.stack.append([container, None])
+        self.state = state
+
+    def _close_container(self, kind):
+        if not isinstance(self.stack[-1][0], kind):
+            raise PayloadError('mismatched closing bracket')
+        self.stack.pop()
+        self.state = _COMMA if self.stack else _DONE
+
+    def _value(self, value):
+        if not self.stack:
+            self.result = value
+            self.state = _DONE
+            return
+        container, key = self.stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+        self.state = _COMMA
+
+    def _end_literal(self):
+        literal, self.literal = self.literal, None
+        if literal in _LITERALS:
+            self._value(_LITERALS[literal])
+            return
+        try:
+            value = json.loads(literal)
+        except ValueError:
+            raise PayloadError(f'invalid literal {literal[:40]!r}')
+        if not isinstance(value, (int, float)):
+            raise PayloadError(f'invalid literal {literal[:40]!r}')
+        self._value(value)
+
+    # Strings
+
+    def _start_string(self, key):
+        self.string_is_key = key
+        if not key and self.stack and self.stack[-1][1] in ATTACHMENT_BLOB_KEYS:
+            self.string = _PayloadValue(self)
+        else:
+            self.string = _TextValue()
+
+    def _emit(self, text):
+        if self.high_surrogate is not None:
+            self.string.write(chr(self.high_surrogate))
+            self.high_surrogate = None
+        self.string.write(text)
+
+    def _read_string(self, text, i):
+        end = len(text)
+        while i < end:
+            if self.escape is not None:
+                i = self._read_escape(text, i)
+                continue
+            match = _STRING_SPECIAL.search(text, i)
+            if match is None:
+                self._emit(text[i:])
+                return end
+            j = match.start()
+            if j > i:
+                self._emit(text[i:j])
+            if text[j] == '"':
+                self._end_string()
+                return j + 1
+            self.escape = ''
+            i = j + 1
+        return i
+
+    def _read_escape(self, text, i):
+        needed = 5 if self.escape.startswith('u') or (not self.escape and text[i] == 'u') else 1
+        take = text[i:i + needed - len(self.escape)]
+        self.escape += take
+        i += len(take)
+        if len(self.escape) < needed:
+            return i
+        escape, self.escape = self.escape, None
+        if escape[0] != 'u':
+            if escape not in _ESCAPES:
+                raise PayloadError(f'invalid escape \\{escape}')
+            self._emit(_ESCAPES[escape])
+            return i
+        try:
+            code = int(escape[1:], 16)
+        except ValueError:
+            raise PayloadError(f'invalid escape \\{escape}')
+        if 0xDC00 <= code <= 0xDFFF and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self.high_surrogate = None
+            self.string.write(chr(code))
+        elif 0xD800 <= code <= 0xDBFF:
+            self._emit('')
+            self.high_surrogate = code
+        else:
+            self._emit(chr(code))
+        return i
+
+    def _end_string(self):
+        self._emit('')
+        value = self.string.close()
+        self.string = None
+        if self.string_is_key:
+            self.stack[-1][1] = value
+            self.state = _COLON
+        else:
+            self._value(value)
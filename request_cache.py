@@ -0,0 +1,141 @@
+"""
+Request-Scoped Identity Map for AutoAssistGroup Support System
+
+One request often loads the same ticket, member or ticket metadata several
+times (ticket_detail, safe_member_lookup plus the route, email templates
+rendering the subject and then the body). The data-access getters in
+database.py consult this map first, so within one request each entity is
+read from MongoDB once.
+
+Entries live on flask.g and disappear with the request; outside a request
+(migrate.py, background threads) nothing is cached. The map holds the
+document as first loaded and every lookup returns a shallow copy of it, so a
+route that reassigns a top-level field does not change what the next lookup
+sees. Writes made through database.py forget the affected entries.
+
+Counters record hits (fetches saved) and misses per request and for the
+worker process; /api/admin/request-cache reports the process totals.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import logging
+import threading
+
+from flask import g, has_app_context
+
+# Entity kinds held in the map
+TICKET = 'ticket'
+MEMBER = 'member'
+METADATA = 'metadata'
+METADATA_FIELDS = 'metadata_fields'
+
+_MISSING = object()
+
+
+class _ProcessTotals:
+    """Identity map counters summed over every request served by this worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.requests_with_hits = 0
+        self.hits = {}
+        self.misses = {}
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.requests += 1
+            if hits:
+                self.requests_with_hits += 1
+            for kind, count in hits.items():
+                self.hits[kind] = self.hits.get(kind, 0) + count
+            for kind, count in misses.items():
+                self.misses[kind] = self.misses.get(kind, 0) + count
+
+    def snapshot(self):
+        with self._lock:
+            total_hits = sum(self.hits.values())
+            total_lookups = total_hits + sum(self.misses.values())
+            return {
+                'requests': self.requests,
+                'requests_with_hits': self.requests_with_hits,
+                'fetches_saved': total_hits,
+                'hit_rate': total_hits / total_lookups if total_lookups else 0,
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+            }
+
+
+totals = _ProcessTotals()
+
+
+def _state():
+    """This request's map and counters, or None outside a request"""
+    if not has_app_context():
+        return None
+    state = g.get('_identity_map')
+    if state is None:
+        state = g._identity_map = {'entries': {}, 'hits': {}, 'misses': {}}
+    return state
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    return value
+
+
+def get_or_load(kind, key, loader):
+    """The entity cached under (kind, key) in this request, loading it with loader() on first use"""
+    state = _state()
+    if state is None:
+        return loader()
+    entries = state['entries']
+    value = entries.get((kind, key), _MISSING)
+    if value is not _MISSING:
+        state['hits'][kind] = state['hits'].get(kind, 0) + 1
+        return _copy(value)
+    state['misses'][kind] = state['misses'].get(kind, 0) + 1
+    value = loader()
+    entries[(kind, key)] = value
+    return _copy(value)
+
+
+def forget(kind, entity_id=None):
+    """Drop cached entries of one kind, for one entity id (every variant of it) or all of them"""
+    state = _state()
+    if state is None:
+        return
+    entries = state['entries']
+    for cache_key in [cache_key for cache_key in entries if cache_key[0] == kind and (
+            entity_id is None or _entity_id(cache_key[1]) == entity_id)]:
+        del entries[cache_key]
+
+
+def _entity_id(key):
+    """Keys are an entity id or (entity id, variant...) tuples"""
+    return key[0] if isinstance(key, tuple) else key
+
+
+def request_stats():
+    """Hits and misses so far in the current request"""
+    state = _state()
+    if state is None:
+        return {'hits': {}, 'misses': {}}
+    return {'hits': dict(state['hits']), 'misses': dict(state['misses'])}
+
+
+def finish_request():
+    """Fold this request's counters into the process totals (teardown_request)"""
+    if not has_app_context():
+        return
+    state = g.pop('_identity_map', None)
+    if state is None or not (state['hits'] or state['misses']):
+        return
+    totals.record(state['hits'], state['misses'])
+    saved = sum(state['hits'].values())
+    if saved:
+        logging.debug(f"[DATABASE] Identity map saved {saved} fetches in this request: {state['hits']}")
@@ -0,0 +1,99 @@
+/*
+ * Live ticket events for AutoAssistGroup Support System pages.
+ *
+ * LiveEvents.subscribe(handler) calls handler(type, event) for every
+ * ticket_created, reply_created, unread_changed, status_changed and
+ * assignment_changed event, and handler('resync', {}) when events may have
+ * been missed and the page should reload its data.
+ *
+ * Uses the Server-Sent Events stream (/api/events/stream) and falls back to
+ * long polling (/api/events/poll) when EventSource is unavailable or the
+ * stream keeps failing (proxies that buffer, no free stream slot).
+ */
+(function () {
+    'use strict';
+
+    var EVENT_TYPES = ['ticket_created', 'reply_created', 'unread_changed', 'status_changed', 'assignment_changed'];
+    var MAX_STREAM_FAILURES = 3;
+    var POLL_RETRY_MS = 10000;
+
+    var handlers = [];
+    var cursor = null;
+    var started = false;
+
+    function dispatch(type, event) {
+        handlers.forEach(function (handler) {
+            try {
+                handler(type, event);
+            } catch (error) {
+                console.error('Live event handler failed:', error);
+            }
+        });
+    }
+
+    function startPolling() {
+        function poll() {
+            var url = '/api/events/poll' + (cursor ? '?after=' + encodeURIComponent(cursor) : '');
+            fetch(url, { credentials: 'same-origin' })
+                .then(function (response) {
+                    if (!response.ok) throw new Error('HTTP ' + response.status);
+                    return response.json();
+                })
+                .then(function (data) {
+                    var first = cursor === null;
+                    if (data.resync) dispatch('resync', {});
+                    (data.events || []).forEach(function (event) { dispatch(event.type, event); });
+                    cursor = data.cursor || cursor;
+                    // Come straight back after a held poll or a burst of events; wait when the server was busy
+                    var again = first || data.waited || (data.events && data.events.length);
+                    setTimeout(poll, again ? 0 : POLL_RETRY_MS);
+                })
+                .catch(function (error) {
+                    console.warn('Live events poll failed:', error);
+                    setTimeout(poll, POLL_RETRY_MS);
+                });
+        }
+        poll();
+    }
+
+    function startStream() {
+        var failures = 0;
+        var source = new EventSource('/api/events/stream');
+
+        function onEvent(message) {
+            failures = 0;
+            cursor = message.lastEventId || cursor;
+            dispatch(message.type, message.type === 'resync' ? {} : JSON.parse(message.data));
+        }
+
+        EVENT_TYPES.concat(['resync']).forEach(function (type) {
+            source.addEventListener(type, onEvent);
+        });
+        source.onopen = function () { failures = 0; };
+        source.onerror = function () {
+            failures += 1;
+            // A refused stream (503) closes the source; repeated errors mean it is not getting through
+            if (source.readyState === EventSource.CLOSED || failures >= MAX_STREAM_FAILURES) {
+                source.close();
+                startPolling();
+            }
+        };
+    }
+
+    function start() {
+        if (started) return;
+        started = true;
+        if (window.EventSource) {
+            startStream();
+        } else {
+            startPolling();
+        }
+    }
+
+    window.LiveEvents = {
+        subscribe: function (handler) {
+            handlers.push(handler);
+            start();
+        }
+    };
+})();
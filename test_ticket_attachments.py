@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test script for attachment storage on newly created tickets
+
+Creates a ticket the way the manual ticket form does (create_ticket, then
+update_ticket with the uploaded attachments) and checks that the stored
+ticket document only references GridFS instead of holding base64 data.
+
+Needs MONGODB_URI; the test ticket is deleted again afterwards.
+"""
+
+import base64
+import os
+import uuid
+
+from database import get_db
+
+
+def test_created_ticket_has_no_inline_attachment_data():
+    """Attachments written by create_ticket and update_ticket are stored in GridFS"""
+    if not os.environ.get('MONGODB_URI'):
+        print("⚠️ SKIPPED: MONGODB_URI is not set")
+        return
+
+    db = get_db()
+    ticket_id = f"TEST{uuid.uuid4().hex[:8].upper()}"
+    payload = base64.b64encode(b'attachment bytes ' + ticket_id.encode()).decode('utf-8')
+
+    try:
+        db.create_ticket({
+            'ticket_id': ticket_id,
+            'subject': 'Attachment storage test',
+            'attachments': [{'filename': 'created.txt', 'data': payload}]
+        })
+        db.update_ticket(ticket_id, {
+            'has_attachments': True,
+            'attachments': [{'filename': 'uploaded.txt', 'data': payload, 'source': 'manual_upload'}]
+        })
+
+        stored = db.tickets.find_one({'ticket_id': ticket_id}, {'attachments': 1})
+        assert stored is not None, "ticket was not created"
+        for attachment in stored['attachments']:
+            assert 'data' not in attachment, f"inline data stored for {attachment.get('filename')}"
+            assert attachment.get('gridfs_id'), f"no gridfs_id for {attachment.get('filename')}"
+
+        print("✅ SUCCESS: ticket attachments reference GridFS only")
+    finally:
+        db.delete_ticket(ticket_id)
+
+
+if __name__ == "__main__":
+    test_created_ticket_has_no_inline_attachment_data()
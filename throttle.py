@@ -0,0 +1,187 @@
+"""
+Rate Limiting and Duplicate-Submission Guard for AutoAssistGroup Support System
+
+One component for the two kinds of throttling the app does:
+
+  allow(key, limit, window)  - sliding-window rate limit: at most `limit`
+                               allowed calls per `window` seconds
+  claim(key, ttl)            - duplicate guard: True for the first call with
+                               `key`, False for repeats until `ttl` expires
+
+The sliding window is the usual two-bucket approximation: a key keeps the
+count of the current fixed window and of the previous one, and the previous
+count is weighted by how much of it still overlaps the sliding window.
+Every check is O(1) in the number of keys.
+
+MongoThrottleBackend (the default) keeps that state in the
+'throttle_state' collection, one document per key updated in a single
+round trip and removed by a TTL index, so limits and duplicate checks hold
+across gunicorn workers. MemoryThrottleBackend (THROTTLE_BACKEND=memory)
+keeps it in process and expires keys with a time-bucketed wheel; it is
+also the fallback while MongoDB is unreachable.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pymongo
+
+THROTTLE_COLLECTION = 'throttle_state'
+
+
+def _window_position(now, window):
+    """(current window index, fraction of the current window elapsed)"""
+    bucket = math.floor(now / window)
+    return bucket, now / window - bucket
+
+
+class MemoryThrottleBackend:
+    """Per-process state; keys expire through a wheel of one-second slots swept as time passes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> [bucket, count, previous count, expires_at]
+        self._claims = {}  # key -> expires_at
+        self._wheel = {}  # whole second -> keys due to expire in it
+        self._swept_to = int(time.time())
+
+    def _schedule(self, key, expires_at):
+        self._wheel.setdefault(int(expires_at) + 1, []).append(key)
+
+    def _sweep(self, now):
+        """Drop keys whose slot has passed; each slot is visited once, so this is amortized O(1)"""
+        due = range(self._swept_to, int(now) + 1)
+        if len(due) > len(self._wheel):
+            # After an idle spell visit the filled slots instead of every elapsed second
+            due = sorted(second for second in self._wheel if second <= now)
+        for second in due:
+            for key in self._wheel.pop(second, ()):
+                # The key may have been refreshed and rescheduled since this slot was filled
+                counter = self._counters.get(key)
+                if counter is not None and counter[3] <= now:
+                    del self._counters[key]
+                if key in self._claims and self._claims[key] <= now:
+                    del self._claims[key]
+        self._swept_to = max(self._swept_to, int(now) + 1)
+
+    def allow(self, key, limit, window):
+        now = time.time()
+        bucket, elapsed = _window_position(now, window)
+        with self._lock:
+            self._sweep(now)
+            stored_bucket, count, previous, _ = self._counters.get(key, (None, 0, 0, 0))
+            if stored_bucket == bucket:
+                pass
+            elif stored_bucket == bucket - 1:
+                count, previous = 0, count
+            else:
+                count, previous = 0, 0
+            allowed = previous * (1 - elapsed) + count < limit
+            if allowed:
+                count += 1
+            expires_at = (bucket + 2) * window
+            self._counters[key] = [bucket, count, previous, expires_at]
+            self._schedule(key, expires_at)
+            return allowed
+
+    def claim(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            if self._claims.get(key, 0) > now:
+                return False
+            self._claims[key] = now + ttl
+            self._schedule(key, now + ttl)
+            return True
+
+
+class MongoThrottleBackend:
+    """State shared by every worker: one document per key in a collection expired by a TTL index"""
+
+    def __init__(self, collection_factory):
+        # Resolved on each use so a forked worker picks up its own client (see mongo_connection)
+        self._collection_factory = collection_factory
+
+    def allow(self, key, limit, window):
+        now = time.time()
+        bucket, elapsed = _window_position(now, window)
+        same_bucket = {"$eq": ["$bucket", bucket]}
+        doc = self._collection_factory().find_one_and_update(
+            {"_id": f"rate:{key}"},
+            [
+                # Roll the window forward: the current count becomes the previous one after one window
+                {"$set": {
+                    "previous": {"$switch": {
+                        "branches": [
+                            {"case": same_bucket, "then": {"$ifNull": ["$previous", 0]}},
+                            {"case": {"$eq": ["$bucket", bucket - 1]}, "then": {"$ifNull": ["$count", 0]}},
+                        ],
+                        "default": 0
+                    }},
+                    "count": {"$cond": [same_bucket, {"$ifNull": ["$count", 0]}, 0]},
+                    "bucket": bucket
+                }},
+                {"$set": {"allowed": {"$lt": [
+                    {"$add": [{"$multiply": ["$previous", 1 - elapsed]}, "$count"]}, limit
+                ]}}},
+                {"$set": {
+                    "count": {"$cond": ["$allowed", {"$add": ["$count", 1]}, "$count"]},
+                    "expires_at": datetime.fromtimestamp((bucket + 2) * window, timezone.utc)
+                }}
+            ],
+            projection={"allowed": 1},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        return bool(doc["allowed"])
+
+    def claim(self, key, ttl):
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches an expired claim the TTL monitor has not removed yet; otherwise inserts,
+            # which fails with a duplicate key while an unexpired claim exists
+            self._collection_factory().update_one(
+                {"_id": f"claim:{key}", "expires_at": {"$lte": now}},
+                {"$set": {"expires_at": datetime.fromtimestamp(now.timestamp() + ttl, timezone.utc)}},
+                upsert=True
+            )
+            return True
+        except pymongo.errors.DuplicateKeyError:
+            return False
+
+
+class Throttle:
+    """Rate limits and duplicate-submission checks against a shared backend, falling back to process memory"""
+
+    def __init__(self, backend=None):
+        self.fallback = MemoryThrottleBackend()
+        self.backend = backend or self.fallback
+
+    def _call(self, operation, *args):
+        if self.backend is not self.fallback:
+            try:
+                return getattr(self.backend, operation)(*args)
+            except Exception as e:
+                logging.warning(f"[THROTTLE] Shared {operation} failed, using per-process state: {e}")
+        return getattr(self.fallback, operation)(*args)
+
+    def allow(self, key, limit=10, window=60):
+        """Whether another call for key fits within limit calls per window seconds (and count it if so)"""
+        return self._call('allow', key, limit, window)
+
+    def claim(self, key, ttl):
+        """True the first time key is seen within ttl seconds, False for duplicates"""
+        return self._call('claim', key, ttl)
+
+
+def throttle_from_environment(collection_factory):
+    """Throttle on the backend named by THROTTLE_BACKEND ('mongodb', the default, or 'memory')"""
+    if os.environ.get('THROTTLE_BACKEND', 'mongodb').lower() == 'memory':
+        return Throttle()
+    return Throttle(MongoThrottleBackend(collection_factory))
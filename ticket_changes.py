@@ -0,0 +1,112 @@
+"""
+Ticket Change Feed for AutoAssistGroup Support System
+
+Answers "which tickets were created, changed or removed since my last
+look" (/api/dashboard/updates) without reading the whole tickets
+collection: every ticket write in database.py stamps updated_at, and an
+index on it turns the question into a range scan over the changed tickets
+only. Hard deletes leave a tombstone in 'ticket_tombstones', removed by a
+TTL index after TOMBSTONE_TTL; soft-deleted tickets are reported as
+removed when their update comes through.
+
+Cursors are millisecond timestamps. A call reads the window
+(cursor, now - CHANGE_FEED_LAG] and hands back its upper bound as the next
+cursor, so cursors only move forward. updated_at comes from the clock of
+the worker making the write, which can stamp a write just before another
+worker reads the window and commit it just after; holding back the last
+few seconds puts such writes in a later window instead of behind the
+cursor.
+
+A caller is told to resync (reload its list) when its cursor is older than
+the tombstones still kept, or when more than CHANGE_FEED_LIMIT tickets
+changed, which is cheaper than shipping them all as a delta.
+
+Author: AutoAssistGroup Development Team
+"""
+
+from datetime import datetime, timedelta
+
+TICKET_TOMBSTONES_COLLECTION = 'ticket_tombstones'
+TOMBSTONE_TTL = timedelta(days=7)
+CHANGE_FEED_LAG = timedelta(seconds=2)
+CHANGE_FEED_LIMIT = 200
+
+# Fields the ticket list needs to add or update a card
+CHANGE_FEED_PROJECTION = {
+    '_id': 0, 'ticket_id': 1, 'name': 1, 'subject': 1, 'body': 1, 'priority': 1, 'classification': 1,
+    'status': 1, 'has_attachments': 1, 'has_warranty': 1, 'has_unread_reply': 1, 'is_important': 1,
+    'is_deleted': 1, 'technician_name': 1, 'created_at': 1, 'updated_at': 1,
+}
+
+
+def encode_change_cursor(moment):
+    return str(int(moment.timestamp() * 1000))
+
+
+def decode_change_cursor(cursor):
+    """datetime of a cursor (stored timestamps are naive local time, like datetime.now()), or None"""
+    try:
+        return datetime.fromtimestamp(int(cursor) / 1000)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class TicketChangeFeed:
+    """Tickets created, updated and removed within a cursor window"""
+
+    def __init__(self, db):
+        self.tickets = db.tickets
+        self.tombstones = db[TICKET_TOMBSTONES_COLLECTION]
+
+    def create_indexes(self):
+        self.tickets.create_index([('updated_at', 1)], background=False)
+        self.tombstones.create_index([('deleted_at', 1)], expireAfterSeconds=int(TOMBSTONE_TTL.total_seconds()),
+                                     background=False)
+
+    def record_deleted(self, ticket_id):
+        self.tombstones.update_one({'_id': ticket_id}, {'$set': {'deleted_at': datetime.now()}}, upsert=True)
+
+    def changes_since(self, cursor):
+        """{'new_tickets', 'updated_tickets', 'removed_tickets', 'resync', 'cursor'} for changes after cursor"""
+        now = datetime.now()
+        upper = now - CHANGE_FEED_LAG
+        since = decode_change_cursor(cursor)
+        changes = {'new_tickets': [], 'updated_tickets': [], 'removed_tickets': [], 'resync': False}
+
+        if since is None or since > now:
+            # No (usable) cursor: only establish where this client starts
+            changes['cursor'] = encode_change_cursor(upper)
+            return changes
+        if since < now - TOMBSTONE_TTL:
+            changes.update(resync=True, cursor=encode_change_cursor(upper))
+            return changes
+
+        upper = max(upper, since)
+        changes['cursor'] = encode_change_cursor(upper)
+        if since == upper:
+            return changes
+        window = {'$gt': since, '$lte': upper}
+
+        changed = list(self.tickets.find({'updated_at': window}, CHANGE_FEED_PROJECTION).limit(CHANGE_FEED_LIMIT + 1))
+        deleted = list(self.tombstones.find({'deleted_at': window}, {'_id': 1}).limit(CHANGE_FEED_LIMIT + 1))
+        if len(changed) + len(deleted) > CHANGE_FEED_LIMIT:
+            changes['resync'] = True
+            return changes
+
+        for ticket in changed:
+            if ticket.get('is_deleted'):
+                changes['removed_tickets'].append(ticket['ticket_id'])
+                continue
+            created_at = ticket.get('created_at')
+            ticket['created_at'] = ticket['date'] = _isoformat(created_at)
+            ticket['updated_at'] = _isoformat(ticket.get('updated_at'))
+            if isinstance(created_at, datetime) and created_at > since:
+                changes['new_tickets'].append(ticket)
+            else:
+                changes['updated_tickets'].append(ticket)
+        changes['removed_tickets'].extend(tombstone['_id'] for tombstone in deleted)
+        return changes
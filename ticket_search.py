@@ -0,0 +1,101 @@
+"""
+Ticket Search for AutoAssistGroup Support System
+
+Builds index-backed search filters for tickets instead of unanchored,
+case-insensitive $regex scans over every ticket field.
+
+Free text (subject, customer name, email, body) is served by a weighted
+MongoDB text index and ranked by text score. Ticket IDs and vehicle
+registrations are matched by prefix against a normalized 'search_keys'
+array kept on each ticket, so "EW12", "ew12" and "EW 12" all find EW1234
+through an anchored, case-sensitive regex that walks the index.
+
+Key Features:
+- Weighted text index with relevance ranking
+- Prefix matching on ticket IDs and registrations
+- User input is never interpreted as a regular expression
+
+Author: AutoAssistGroup Development Team
+"""
+
+import re
+
+TICKET_TEXT_INDEX_NAME = 'ticket_text_search'
+TICKET_TEXT_INDEX_FIELDS = [('subject', 'text'), ('name', 'text'), ('email', 'text'), ('body', 'text')]
+TICKET_TEXT_INDEX_WEIGHTS = {'subject': 10, 'name': 5, 'email': 5, 'body': 1}
+
+# Order of the main ticket list (unread replies first, then important, newest first).
+# _id breaks ties so every ticket has a unique position for keyset pagination.
+# Kept here, free of app dependencies, so init_database.py can build the same index.
+TICKET_LIST_SORT = {"has_unread_reply": -1, "is_important": -1, "created_at": -1, "_id": -1}
+
+# Ticket fields whose normalized values are prefix searchable
+SEARCH_KEYS_FIELD = 'search_keys'
+SEARCH_KEY_SOURCE_FIELDS = ('ticket_id', 'vehicle_registration')
+
+_NON_KEY_CHARACTERS = re.compile(r'[^0-9A-Z]')
+
+
+def normalize_search_key(value):
+    """Uppercase alphanumerics only, so 'ab12 cde' and 'AB12CDE' are the same key"""
+    if not value:
+        return ''
+    return _NON_KEY_CHARACTERS.sub('', str(value).upper())
+
+
+def ticket_search_keys(ticket):
+    """Prefix-searchable keys for a ticket (ticket ID and vehicle registration)"""
+    keys = {normalize_search_key(ticket.get(field)) for field in SEARCH_KEY_SOURCE_FIELDS}
+    keys.discard('')
+    return sorted(keys)
+
+
+def prefix_search_filter(query):
+    """Anchored prefix match on search_keys, or None if the query has no key characters"""
+    key = normalize_search_key(query)
+    if not key:
+        return None
+    return {SEARCH_KEYS_FIELD: {'$regex': f'^{re.escape(key)}'}}
+
+
+def text_search_filter(query):
+    """$text match for the query, with phrase quotes and negation dashes treated as plain text"""
+    terms = [term.lstrip('-') for term in (query or '').replace('"', ' ').split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return None
+    return {'$text': {'$search': ' '.join(terms)}}
+
+
+def ticket_search_filter(query):
+    """Filter matching tickets by ID/registration prefix or by free text"""
+    clauses = [clause for clause in (prefix_search_filter(query), text_search_filter(query)) if clause]
+    if not clauses:
+        # Nothing searchable in the query (e.g. only punctuation)
+        return {SEARCH_KEYS_FIELD: {'$in': []}}
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def ranked_search(collection, query, base_filter=None, projection=None, limit=1000):
+    """Tickets matching query: ID / registration prefix hits first (newest first), then free-text hits by text score"""
+    base_filter = base_filter or {}
+    results = []
+    seen = set()
+    prefix_filter = prefix_search_filter(query)
+    if prefix_filter:
+        for ticket in collection.find({**base_filter, **prefix_filter}, projection).sort("created_at", -1).limit(limit):
+            seen.add(ticket['_id'])
+            results.append(ticket)
+    text_filter = text_search_filter(query)
+    if text_filter and len(results) < limit:
+        score_projection = dict(projection or {})
+        score_projection["search_score"] = {"$meta": "textScore"}
+        text_hits = collection.find({**base_filter, **text_filter}, score_projection).sort(
+            [("search_score", {"$meta": "textScore"})]
+        ).limit(limit)
+        for ticket in text_hits:
+            ticket.pop("search_score", None)
+            if ticket['_id'] not in seen:
+                seen.add(ticket['_id'])
+                results.append(ticket)
+    return results[:limit]
@@ -0,0 +1,207 @@
+"""
+Materialized Ticket Counters for AutoAssistGroup Support System
+
+Keeps the dashboard breakdowns (total, per-status, per-priority and
+per-classification ticket counts) in a small 'ticket_stats' collection so
+dashboard loads read one document instead of aggregating every ticket.
+
+Documents:
+- {'_id': 'global', 'total': n, 'status': {...}, 'priority': {...},
+   'classification': {...}, 'reconciled_at': datetime}
+- {'_id': 'day:YYYY-MM-DD', 'day': datetime, ...same counters...} holding the
+  current breakdown of the tickets created on that day (date-range reads)
+
+Ticket writes in database.py apply $inc deltas; reconcile() recomputes
+everything from the tickets collection to correct any drift (writes made
+outside database.py, failed increments). It is a full pass over the
+tickets, so it never runs on a request: schedule
+`python migrate.py reconcile-stats` (e.g. hourly from cron).
+`python migrate.py` builds the counters the first time.
+
+Author: AutoAssistGroup Development Team
+"""
+
+import logging
+from datetime import datetime
+
+import pymongo
+
+from analytics import DEFAULT_CLASSIFICATION, DEFAULT_PRIORITY, DEFAULT_STATUS, DISPLAY_CLASSIFICATION
+
+TICKET_STATS_COLLECTION = 'ticket_stats'
+GLOBAL_STATS_ID = 'global'
+DAY_STATS_PREFIX = 'day:'
+
+# Ticket fields that decide which counters a ticket contributes to
+TICKET_STATS_FIELDS = ('status', 'priority', 'classification', 'has_warranty', 'has_warranty_attachment', 'created_at')
+TICKET_STATS_PROJECTION = {field: 1 for field in TICKET_STATS_FIELDS}
+
+COUNTER_GROUPS = ('status', 'priority', 'classification')
+
+
+def _encode_key(value):
+    """Counter values become field names, which may not contain '.' or start with '$'"""
+    key = str(value).replace('.', '\uff0e')
+    return '\uff04' + key[1:] if key.startswith('$') else key
+
+
+def _decode_key(key):
+    key = key.replace('\uff0e', '.')
+    return '$' + key[1:] if key.startswith('\uff04') else key
+
+
+def _day_start(value):
+    if not isinstance(value, datetime):
+        return None
+    return datetime(value.year, value.month, value.day)
+
+
+def _day_id(day):
+    return f"{DAY_STATS_PREFIX}{day.strftime('%Y-%m-%d')}"
+
+
+def ticket_dimensions(ticket):
+    """The status, priority and display classification a ticket is counted under"""
+    if ticket.get('has_warranty_attachment') is True or ticket.get('has_warranty') is True:
+        classification = 'Warranty Claim'
+    else:
+        classification = ticket.get('classification')
+        classification = DEFAULT_CLASSIFICATION if classification is None else classification
+    status = ticket.get('status')
+    priority = ticket.get('priority')
+    return {
+        'status': DEFAULT_STATUS if status is None else status,
+        'priority': DEFAULT_PRIORITY if priority is None else priority,
+        'classification': classification,
+    }
+
+
+def apply_update(ticket, update):
+    """A ticket's stats fields after a $set/$unset update"""
+    after = dict(ticket)
+    after.update({key: value for key, value in update.get('$set', {}).items() if key in TICKET_STATS_FIELDS})
+    for key in update.get('$unset', {}):
+        after.pop(key, None)
+    return after
+
+
+class TicketStats:
+    def __init__(self, database):
+        self.collection = database[TICKET_STATS_COLLECTION]
+        self.tickets = database.tickets
+
+    def _contribution(self, ticket, sign):
+        counters = {'total': sign}
+        for group, value in ticket_dimensions(ticket).items():
+            counters[f'{group}.{_encode_key(value)}'] = sign
+        return counters
+
+    def _inc(self, ticket, counters):
+        counters = {path: n for path, n in counters.items() if n}
+        if not counters:
+            return
+        try:
+            self.collection.update_one({'_id': GLOBAL_STATS_ID}, {'$inc': counters}, upsert=True)
+            day = _day_start(ticket.get('created_at'))
+            if day is not None:
+                self.collection.update_one(
+                    {'_id': _day_id(day)}, {'$inc': counters, '$set': {'day': day}}, upsert=True
+                )
+        except Exception as e:
+            # Counters are derived data; the next reconcile corrects them
+            logging.warning(f"[TICKET_STATS] Failed to update counters: {e}")
+
+    def record_created(self, ticket):
+        self._inc(ticket, self._contribution(ticket, 1))
+
+    def record_deleted(self, ticket):
+        self._inc(ticket, self._contribution(ticket, -1))
+
+    def record_change(self, before, after):
+        """Move a ticket's counts from its old status/priority/classification to the new ones"""
+        counters = self._contribution(after, 1)
+        for path, n in self._contribution(before, -1).items():
+            counters[path] = counters.get(path, 0) + n
+        self._inc(after, counters)
+
+    def _as_stats(self, documents):
+        stats = {'total_tickets': 0, 'status_counts': {}, 'priority_counts': {}, 'classification_counts': {}}
+        for doc in documents:
+            stats['total_tickets'] += doc.get('total', 0)
+            for group in COUNTER_GROUPS:
+                counts = stats[f'{group}_counts']
+                for key, n in (doc.get(group) or {}).items():
+                    counts[_decode_key(key)] = counts.get(_decode_key(key), 0) + n
+        for group in COUNTER_GROUPS:
+            stats[f'{group}_counts'] = {key: n for key, n in stats[f'{group}_counts'].items() if n > 0}
+        return stats
+
+    def read(self, start_date=None, end_date=None):
+        """Counters for all tickets, or for tickets created in a (whole day) date range; None if never built"""
+        if not start_date and not end_date:
+            doc = self.collection.find_one({'_id': GLOBAL_STATS_ID})
+            return self._as_stats([doc]) if doc and 'reconciled_at' in doc else None
+        if not self.is_built():
+            return None
+        day_range = {}
+        if start_date:
+            day_range['$gte'] = _day_start(start_date)
+        if end_date:
+            day_range['$lte'] = _day_start(end_date)
+        return self._as_stats(self.collection.find({'day': day_range}))
+
+    def is_built(self):
+        """True once reconcile() has built the counters"""
+        return self.collection.find_one({'_id': GLOBAL_STATS_ID, 'reconciled_at': {'$exists': True}}, {'_id': 1}) is not None
+
+    def reconcile(self):
+        """Recompute every counter from the tickets collection; returns the number of documents corrected"""
+        pipeline = [
+            {'$group': {
+                '_id': {
+                    'day': {'$cond': [
+                        {'$eq': [{'$type': '$created_at'}, 'date']},
+                        {'$dateFromParts': {
+                            'year': {'$year': '$created_at'},
+                            'month': {'$month': '$created_at'},
+                            'day': {'$dayOfMonth': '$created_at'}
+                        }},
+                        None
+                    ]},
+                    'status': {'$ifNull': ['$status', DEFAULT_STATUS]},
+                    'priority': {'$ifNull': ['$priority', DEFAULT_PRIORITY]},
+                    'classification': DISPLAY_CLASSIFICATION,
+                },
+                'count': {'$sum': 1}
+            }}
+        ]
+        documents = {GLOBAL_STATS_ID: {'total': 0, 'status': {}, 'priority': {}, 'classification': {}}}
+        for row in self.tickets.aggregate(pipeline, allowDiskUse=True):
+            group = row['_id']
+            targets = [documents[GLOBAL_STATS_ID]]
+            if group.get('day') is not None:
+                targets.append(documents.setdefault(_day_id(group['day']), {
+                    'day': group['day'], 'total': 0, 'status': {}, 'priority': {}, 'classification': {}
+                }))
+            for doc in targets:
+                doc['total'] += row['count']
+                for name in COUNTER_GROUPS:
+                    key = _encode_key(group[name])
+                    doc[name][key] = doc[name].get(key, 0) + row['count']
+
+        corrected = 0
+        existing = {doc['_id']: doc for doc in self.collection.find({})}
+        documents[GLOBAL_STATS_ID]['reconciled_at'] = datetime.now()
+        operations = []
+        for doc_id, doc in documents.items():
+            current = existing.pop(doc_id, {})
+            if any(current.get(field) != doc[field] for field in ('total',) + COUNTER_GROUPS):
+                corrected += 1
+            operations.append(pymongo.ReplaceOne({'_id': doc_id}, doc, upsert=True))
+        # Days with no tickets left
+        operations.extend(pymongo.DeleteOne({'_id': doc_id}) for doc_id in existing)
+        corrected += len(existing)
+        self.collection.bulk_write(operations, ordered=False)
+        if corrected:
+            logging.info(f"[TICKET_STATS] Reconcile corrected {corrected} counter documents")
+        return corrected
@@ -0,0 +1,241 @@
+"""
+Bounded LRU + TTL Cache for AutoAssistGroup Support System
+
+Replaces the cache_get/cache_set helpers in app.py, which kept an unbounded
+dict on a function attribute with no locking. TTLCache holds at most
+`max_entries` values in least-recently-used order, each with its own expiry,
+and is safe to share between gunicorn's request threads.
+
+get_or_load() is single-flight: when several threads miss the same key at
+once, one runs the loader and the others wait for its result instead of
+running the same aggregation in parallel.
+
+An optional shared backend (MongoCacheBackend, enabled with
+APP_CACHE_BACKEND=mongodb) lets workers share entries: local misses fall
+back to the 'app_cache' collection and loaded values are written to it.
+Values are stored as Extended JSON and removed by a TTL index. Backend
+errors are logged and treated as misses.
+
+Key Features:
+- Max size with LRU eviction
+- Per-entry TTL
+- Single-flight loading
+- Hit, miss, eviction and load statistics
+
+Author: AutoAssistGroup Development Team
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from bson import json_util
+
+APP_CACHE_COLLECTION = 'app_cache'
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 300
+# How long a thread waits for another thread's load of the same key before loading itself
+LOAD_WAIT_SECONDS = 10
+
+_MISSING = object()
+
+
+class MongoCacheBackend:
+    """Cache entries shared by every worker, in a MongoDB collection expired by a TTL index"""
+
+    def __init__(self, collection_factory):
+        # Resolved on each use so a forked worker picks up its own client (see mongo_connection)
+        self._collection_factory = collection_factory
+
+    def get(self, key):
+        """(value, expires_at) for an unexpired entry, or None"""
+        doc = self._collection_factory().find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        if doc is None:
+            return None
+        # Stored as UTC; pymongo returns naive datetimes
+        return json_util.loads(doc["value"]), doc["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+
+    def set(self, key, value, expires_at):
+        self._collection_factory().replace_one(
+            {"_id": key},
+            {"value": json_util.dumps(value), "expires_at": datetime.fromtimestamp(expires_at, timezone.utc)},
+            upsert=True
+        )
+
+    def delete(self, key):
+        self._collection_factory().delete_one({"_id": key})
+
+    def clear(self):
+        self._collection_factory().delete_many({})
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL, single-flight loads and an optional shared backend"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=DEFAULT_TTL_SECONDS, backend=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._loading = {}  # key -> threading.Event set when the in-flight load finishes
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+            self.loads = 0
+            self.load_errors = 0
+            self.load_waits = 0
+            self.backend_errors = 0
+
+    def _store(self, key, value, expires_at):
+        """Insert locally, evicting least recently used entries beyond max_entries (caller holds the lock)"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, key):
+        """Cached value (local first, then the shared backend) or _MISSING; counts hits and misses"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+                self.expirations += 1
+        if self.backend is not None:
+            try:
+                shared = self.backend.get(key)
+            except Exception as e:
+                shared = None
+                with self._lock:
+                    self.backend_errors += 1
+                logging.warning(f"[CACHE] Shared cache read failed for {key}: {e}")
+            if shared is not None:
+                value, expires_at = shared
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.shared_hits += 1
+                return copy.deepcopy(value)
+        with self._lock:
+            self.misses += 1
+        return _MISSING
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None):
+        """Cache value for ttl seconds (default_ttl when not given)"""
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expires_at)
+            except Exception as e:
+                with self._lock:
+                    self.backend_errors += 1
+                logging.warning(f"[CACHE] Shared cache write failed for {key}: {e}")
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                logging.warning(f"[CACHE] Shared cache delete failed for {key}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            try:
+                self.backend.clear()
+            except Exception as e:
+                logging.warning(f"[CACHE] Shared cache clear failed: {e}")
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Cached value for key, or loader()'s result cached for ttl seconds; one thread loads a missing key"""
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            in_flight = self._loading.get(key)
+            if in_flight is None:
+                done = self._loading[key] = threading.Event()
+        if in_flight is not None:
+            with self._lock:
+                self.load_waits += 1
+            # Another thread is loading this key; use its result unless it failed or took too long
+            if in_flight.wait(LOAD_WAIT_SECONDS):
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[0] > time.time():
+                        return copy.deepcopy(entry[1])
+            return loader()
+
+        try:
+            with self._lock:
+                self.loads += 1
+            try:
+                value = loader()
+            except Exception:
+                with self._lock:
+                    self.load_errors += 1
+                raise
+            # The cache keeps its own copy, so the caller may modify what it gets back
+            self.set(key, value, ttl)
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            done.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'default_ttl_seconds': self.default_ttl,
+                'shared_backend': type(self.backend).__name__ if self.backend is not None else None,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'loads': self.loads,
+                'load_errors': self.load_errors,
+                'load_waits': self.load_waits,
+                'backend_errors': self.backend_errors,
+            }
+
+
+def cache_from_environment(collection_factory):
+    """TTLCache configured from APP_CACHE_MAX_ENTRIES, APP_CACHE_TTL and APP_CACHE_BACKEND"""
+    backend = None
+    if os.environ.get('APP_CACHE_BACKEND', '').lower() == 'mongodb':
+        backend = MongoCacheBackend(collection_factory)
+    return TTLCache(
+        max_entries=int(os.environ.get('APP_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        default_ttl=float(os.environ.get('APP_CACHE_TTL', DEFAULT_TTL_SECONDS)),
+        backend=backend
+    )